@@ -1,3 +1,10 @@
 from django.contrib import admin
+from .models import ScopeVerdict
 
 # Register your models here.
+
+class ScopeVerdictAdmin(admin.ModelAdmin):
+    list_display = ('id', 'utterance', 'in_scope', 'source', 'classifier_proba', 'created_at')
+    list_filter = ('in_scope', 'source')
+
+admin.site.register(ScopeVerdict, ScopeVerdictAdmin)
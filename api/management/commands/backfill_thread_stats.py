@@ -0,0 +1,44 @@
+# api/management/commands/backfill_thread_stats.py
+# ChatThread 비정규화 통계(message_count / last_message_at / last_message_preview)를 메시지 테이블에서 다시 계산한다.
+# 배포 시 처음 값은 마이그레이션(chat 0010)이 채우고, 이후에는 chat_service.record_messages 가 저장 때마다 갱신한다.
+# 이 명령은 값이 어긋났을 때 다시 맞추는 용도다. (실행 중에 저장된 메시지가 덮어써지면 다시 돌리면 맞춰진다.)
+#
+# 사용법 : python manage.py backfill_thread_stats [--batch-size 500]
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+
+from api.services import chat_service
+from chat.models import ChatMessage, ChatThread
+
+
+class Command(BaseCommand):
+    help = "채팅 스레드의 메시지 수 / 마지막 메시지 시각 / 미리보기를 다시 채웁니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="한 번에 갱신하는 스레드 수")
+
+    def handle(self, *args, **opts):
+        batch_size = opts["batch_size"]
+        last_message = ChatMessage.objects.filter(thread=OuterRef("pk")).order_by("-id").values("message")[:1]
+        total = 0
+        last_id = 0
+        while True:
+            # 스레드 batch_size 개의 개수/최근 시각/마지막 본문을 쿼리 한 번으로 읽는다.
+            rows = list(
+                ChatThread.objects.filter(id__gt=last_id).order_by("id")
+                .annotate(n=Count("messages"), last_at=Max("messages__timestamp"), last_text=Subquery(last_message))
+                .only("id", "created_at")[:batch_size]
+            )
+            if not rows:
+                break
+            for thread in rows:
+                thread.message_count = thread.n
+                thread.last_message_at = thread.last_at or thread.created_at
+                thread.last_message_preview = chat_service.preview(thread.last_text)
+            with transaction.atomic():
+                ChatThread.objects.bulk_update(rows, ["message_count", "last_message_at", "last_message_preview"])
+            total += len(rows)
+            last_id = rows[-1].id
+        self.stdout.write(self.style.SUCCESS(f"스레드 {total}개 통계 갱신 완료"))
@@ -0,0 +1,37 @@
+# api/management/commands/build_similar_personas.py
+# 비슷한 페르소나 검색용 가중 특성 행렬(.npy) 미리 만들기. 배포 때 한 번 돌려 두면 첫 요청이 빌드를 기다리지 않는다.
+#
+# 사용법 : python manage.py build_similar_personas [--source 경로] [--prune]
+
+import os
+import shutil
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.services import similar_persona_service
+
+
+class Command(BaseCommand):
+    help = "가중 특성 JSONL 로 비슷한 페르소나 검색 행렬을 만듭니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", default=None, help="원본 JSONL (기본 SIMILAR_PERSONA_SOURCE)")
+        parser.add_argument("--prune", action="store_true", help="현재 버전이 아닌 이전 행렬 디렉터리를 지운다")
+
+    def handle(self, *args, **opts):
+        source = opts["source"] or similar_persona_service.source_path()
+        if not os.path.exists(source):
+            raise CommandError(f"원본 파일이 없습니다: {source}")
+        path = similar_persona_service.build(source)
+        index = similar_persona_service.SimilarityIndex(path)
+        clusters = {int(c): int(index.offsets[i + 1] - index.offsets[i]) for i, c in enumerate(index.cluster_ids)}
+        self.stdout.write(f"personas={len(index)} clusters={clusters}")
+
+        if opts["prune"]:
+            root = os.path.dirname(path)
+            for name in os.listdir(root):
+                old = os.path.join(root, name)
+                if old != path and os.path.isdir(old):
+                    shutil.rmtree(old, ignore_errors=True)
+                    self.stdout.write(f"removed {old}")
+        self.stdout.write(self.style.SUCCESS(f"저장: {path}"))
@@ -0,0 +1,19 @@
+# api/management/commands/rebuild_chat_search_index.py
+# 채팅 검색 2-gram 역색인(ChatMessageTerm) 전체 재생성. 색인 도입 전 메시지를 채우거나 색인 규칙을 바꿨을 때 돌린다.
+#
+# 사용법 : python manage.py rebuild_chat_search_index [--batch-size 500]
+
+from django.core.management.base import BaseCommand
+
+from api.services import chat_search
+
+
+class Command(BaseCommand):
+    help = "채팅 메시지 검색 색인을 처음부터 다시 만듭니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="한 번에 읽는 메시지 수")
+
+    def handle(self, *args, **opts):
+        total = chat_search.rebuild(batch_size=opts["batch_size"], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"색인 완료: 메시지 {total}개"))
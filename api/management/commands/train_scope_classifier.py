@@ -0,0 +1,107 @@
+# api/management/commands/train_scope_classifier.py
+# 로컬 도메인(scope) 분류기 재학습 + LLM 판정 대비 정확도/기권율 리포트
+#
+# 사용법 : python manage.py train_scope_classifier [--holdout 0.2] [--report-only]
+
+import random
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import ScopeVerdict
+from api.services import llm_service, scope_classifier
+from chat.models import ChatMessage
+
+# 대화 기록에서 뽑은 약한 라벨(weak label)의 가중치. LLM 판정 로그보다 덜 믿는다.
+WEAK_LABEL_WEIGHT = 0.5
+# 이 길이 이상인 페르소나 답변은 본 답변(IN)으로 본다. 짧은 답변은 인사/소개/취향 응답일 수 있어 제외.
+FULL_ANSWER_MIN_LEN = 80
+
+
+def _verdict_samples():
+    rows = ScopeVerdict.objects.filter(source__in=llm_service.LLM_VERDICT_SOURCES).order_by("id")
+    return [(v.utterance, int(v.in_scope)) for v in rows.only("utterance", "in_scope").iterator()]
+
+
+def _chat_samples():
+    # 사용자 발화 바로 다음 페르소나 답변으로 라벨을 추정한다: 거절 문구 → OUT, 본 답변 → IN
+    out = []
+    prev = None
+    qs = ChatMessage.objects.order_by("thread_id", "id").only("thread_id", "sender", "message")
+    for m in qs.iterator():
+        if prev is not None and prev.thread_id == m.thread_id and prev.sender == "user" and m.sender == "persona":
+            text = prev.message or ""
+            if not (llm_service.GREETING_PAT.match(text.strip()) or any(k in text for k in llm_service.SELF_INTRO_TRIGGERS)):
+                if llm_service._is_refusal_msg(m.message):
+                    out.append((text, 0))
+                elif len(m.message or "") >= FULL_ANSWER_MIN_LEN:
+                    out.append((text, 1))
+        prev = m
+    return out
+
+
+class Command(BaseCommand):
+    help = "ChatMessage 기록과 LLM 판정 로그로 로컬 scope 분류기를 재학습하고 리포트를 출력합니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--holdout", type=float, default=0.2, help="평가용으로 떼어둘 LLM 판정 로그 비율")
+        parser.add_argument("--epochs", type=int, default=300)
+        parser.add_argument("--min-samples", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--report-only", action="store_true", help="학습 없이 현재 모델을 LLM 판정 로그로 평가")
+
+    def handle(self, *args, **options):
+        if not scope_classifier.HAS_NUMPY:
+            raise CommandError("numpy 가 설치되어 있지 않습니다.")
+
+        verdicts = _verdict_samples()
+        if options["report_only"]:
+            model = scope_classifier.load()
+            if model is None:
+                raise CommandError("학습된 모델 파일이 없습니다.")
+            self._report(model, verdicts)
+            return
+
+        rng = random.Random(options["seed"])
+        rng.shuffle(verdicts)
+        n_holdout = int(len(verdicts) * options["holdout"])
+        holdout, train_verdicts = verdicts[:n_holdout], verdicts[n_holdout:]
+
+        # 같은 발화는 LLM 판정 로그를 우선한다 (평가용 발화는 학습에서 제외)
+        seen = {scope_classifier._normalize(t) for t, _ in verdicts}
+        samples = [(t, y, 1.0) for t, y in train_verdicts]
+        for text, label in _chat_samples():
+            key = scope_classifier._normalize(text)
+            if key in seen:
+                continue
+            seen.add(key)
+            samples.append((text, label, WEAK_LABEL_WEIGHT))
+
+        if len(samples) < options["min_samples"]:
+            raise CommandError(f"학습 샘플이 부족합니다: {len(samples)}개 (최소 {options['min_samples']}개)")
+        if len({y for _, y, _ in samples}) < 2:
+            raise CommandError("IN/OUT 두 라벨이 모두 있어야 학습할 수 있습니다.")
+
+        texts, labels, weights = zip(*samples)
+        model = scope_classifier.train(texts, labels, weights, epochs=options["epochs"])
+        report = self._report(model, holdout) if holdout else {}
+        path = scope_classifier.save(model, meta={
+            "trained_at": datetime.now().isoformat(timespec="seconds"),
+            "n_verdicts": len(train_verdicts),
+            "n_weak": len(samples) - len(train_verdicts),
+            "holdout": report,
+        })
+        self.stdout.write(self.style.SUCCESS(f"모델 저장: {path} (학습 샘플 {len(samples)}개)"))
+
+    def _report(self, model, verdicts):
+        if not verdicts:
+            self.stdout.write("평가할 LLM 판정 로그가 없습니다.")
+            return {}
+        texts, labels = zip(*verdicts)
+        probas = scope_classifier.predict_proba_batch(model, texts)
+        report = scope_classifier.evaluate(probas, labels)
+        low, high = scope_classifier._band()
+        self.stdout.write(f"[LLM 판정 대비 평가] 밴드=({low}, {high}) 샘플={report['total']}")
+        for key in ("decided", "abstention_rate", "accuracy_on_decided", "precision_in", "recall_in"):
+            self.stdout.write(f"  {key:<20} {report[key]}")
+        return report
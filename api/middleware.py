@@ -0,0 +1,46 @@
+# api/middleware.py
+# 요청마다 request id 를 정해 telemetry 로그에 실어 보낸다.
+# 클라이언트/프록시가 X-Request-ID 를 보내면 그대로 쓰고, 없으면 새로 만든다. 응답 헤더에도 돌려준다.
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .services import telemetry
+
+_VALID_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class RequestIdMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _request_id(self, request):
+        rid = request.headers.get("X-Request-ID", "")
+        return rid if _VALID_ID.match(rid) else telemetry.new_request_id()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.request_id = self._request_id(request)
+        token = telemetry.request_id_var.set(request.request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            telemetry.request_id_var.reset(token)
+        response["X-Request-ID"] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        request.request_id = self._request_id(request)
+        token = telemetry.request_id_var.set(request.request_id)
+        try:
+            response = await self.get_response(request)
+        finally:
+            telemetry.request_id_var.reset(token)
+        response["X-Request-ID"] = request.request_id
+        return response
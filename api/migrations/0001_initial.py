@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-19 01:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScopeVerdict',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('utterance', models.TextField()),
+                ('in_scope', models.BooleanField()),
+                ('source', models.CharField(max_length=20)),
+                ('model_name', models.CharField(blank=True, max_length=50)),
+                ('classifier_proba', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': '도메인 판별 로그',
+            },
+        ),
+    ]
@@ -1,3 +1,30 @@
 from django.db import models
 
 # Create your models here.
+
+
+class ScopeVerdict(models.Model):
+    # LLM 도메인 판별 결과 로그 - 로컬 scope 분류기의 학습/평가 데이터로 사용
+
+    # 판별 대상 발화
+    utterance = models.TextField()
+
+    # 판별 결과 (True: 식품 수요예측 관련)
+    in_scope = models.BooleanField()
+
+    # 판별 주체 (예: fused, legacy)
+    source = models.CharField(max_length=20)
+
+    # 판별에 사용한 모델명
+    model_name = models.CharField(max_length=50, blank=True)
+
+    # 로컬 분류기가 함께 낸 확률 (없으면 null)
+    classifier_proba = models.FloatField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{'IN' if self.in_scope else 'OUT'} ({self.source}) {self.utterance[:30]}"
+
+    class Meta:
+        verbose_name_plural = "도메인 판별 로그"
@@ -0,0 +1,244 @@
+# api/services/chat_search.py
+# 채팅 기록 검색 (ChatSearchView). 글자 2-gram 역색인(ChatMessageTerm)으로 찾는다.
+#   - 색인: 메시지 본문을 NFKC + 소문자로 맞추고 공백/구두점으로 나눈 토큰마다 2-gram 을 만든다.
+#           한국어는 띄어쓰기/조사가 제각각이라 형태소 대신 2-gram 을 쓴다 ("참치캔을" 도 "참치" 로 찾힌다).
+#           ChatMessage 저장 시 signals 에서 커밋 후(on_commit) 해당 메시지 행만 다시 쓰고, 삭제는 CASCADE 로 따라간다.
+#           긴 답변이 색인 행을 크게 늘리지 않도록 앞 CHAT_SEARCH_INDEX_MAX_CHARS 글자만 색인한다 (스니펫은 본문 전체에서 찾는다).
+#   - 검색: 질의의 2-gram 을 모두 가진 메시지만 후보 (사용자 단위 (user, term) 인덱스).
+#           점수 = Σ tf x idf (사용자 색인 기준), 스레드 점수는 가장 높은 메시지 점수.
+#           쿼리 수는 결과 수와 무관하게 고정이다: df 1 + 후보 점수 1 + 본문 1 + 스레드/페르소나 1.
+#   - 페이지: 스레드 (점수, id) 내림차순 keyset. next_cursor 를 그대로 다시 보내면 다음 스레드들을 준다.
+# 한 글자 토큰만 있는 질의는 색인을 쓸 수 없어 icontains 로 최근 메시지 CHAT_SEARCH_MAX_CANDIDATES 개만 본다.
+from __future__ import annotations
+
+import base64
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+
+from . import telemetry
+
+TOKEN_SPLIT = re.compile(r"[^\w]+")
+SNIPPET_CHARS = 60
+
+
+def _setting(name: str, default):
+    val = getattr(settings, name, None)
+    return default if val is None else val
+
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def tokens(text: str) -> List[str]:
+    return [t for t in TOKEN_SPLIT.split(normalize(text)) if t]
+
+
+def bigrams(text: str) -> Counter:
+    """토큰 안에서만 2-gram 을 만든다 (토큰 경계를 넘는 2-gram 은 만들지 않는다)."""
+    grams: Counter = Counter()
+    for token in tokens(text):
+        for i in range(len(token) - 1):
+            grams[token[i:i + 2]] += 1
+    return grams
+
+
+def index_terms(text: str) -> Counter:
+    """색인할 2-gram (앞 CHAT_SEARCH_INDEX_MAX_CHARS 글자)."""
+    return bigrams((text or "")[:int(_setting("CHAT_SEARCH_INDEX_MAX_CHARS", 2000))])
+
+
+# 함수명 : index_message
+# input : message(ChatMessage), created(새 메시지 여부)
+# output : 없음
+# 함수 설명 : 해당 메시지의 2-gram 행을 다시 쓴다. 새 메시지는 지울 행이 없으므로 INSERT 한 번이다.
+def index_message(message, created: bool = False) -> None:
+    from chat.models import ChatMessage, ChatMessageTerm, ChatThread
+
+    if not created:
+        ChatMessageTerm.objects.filter(message_id=message.pk).delete()
+    grams = index_terms(message.message)
+    if not grams:
+        return
+    if ChatMessage.thread.is_cached(message):
+        user_id = message.thread.user_id
+    else:
+        user_id = ChatThread.objects.filter(pk=message.thread_id).values_list("user_id", flat=True).first()
+    ChatMessageTerm.objects.bulk_create([
+        ChatMessageTerm(term=term, message_id=message.pk, thread_id=message.thread_id, user_id=user_id, tf=min(tf, 32767))
+        for term, tf in grams.items()
+    ])
+
+
+def rebuild(batch_size: int = 500, stdout=None) -> int:
+    """전체 메시지 재색인 (배포 후 한 번, 또는 색인 규칙을 바꿨을 때)."""
+    from chat.models import ChatMessage, ChatMessageTerm
+
+    total = 0
+    last_id = 0
+    # 다시 만드는 동안 검색이 빈 색인을 보지 않도록 한 트랜잭션으로 바꾼다.
+    with transaction.atomic():
+        ChatMessageTerm.objects.all().delete()
+        while True:
+            batch = list(
+                ChatMessage.objects.filter(id__gt=last_id).order_by("id")
+                .values_list("id", "thread_id", "thread__user_id", "message")[:batch_size]
+            )
+            if not batch:
+                break
+            rows = [
+                ChatMessageTerm(term=term, message_id=mid, thread_id=tid, user_id=uid, tf=min(tf, 32767))
+                for mid, tid, uid, text in batch
+                for term, tf in index_terms(text).items()
+            ]
+            ChatMessageTerm.objects.bulk_create(rows, batch_size=2000)
+            total += len(batch)
+            last_id = batch[-1][0]
+            if stdout is not None:
+                stdout.write(f"indexed {total} messages")
+    return total
+
+
+def encode_cursor(score: float, thread_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{score!r}:{thread_id}".encode("ascii")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[float, int]]:
+    """잘못된 cursor 는 ValueError."""
+    if not cursor:
+        return None
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+    score, thread_id = raw.split(":")
+    return float(score), int(thread_id)
+
+
+def snippet(text: str, needles: List[str], width: int = SNIPPET_CHARS) -> Tuple[str, List[List[int]]]:
+    """첫 일치 위치 주변 width 글자와 그 안의 일치 구간 [[시작, 끝]...]."""
+    text = text or ""
+    lowered = text.lower()
+    hits = sorted(
+        (m.start(), m.start() + len(n))
+        for n in needles if n
+        for m in re.finditer(re.escape(n), lowered)
+    )
+    start = 0
+    if hits:
+        start = max(0, min(hits[0][0] - width // 3, len(text) - width))
+    end = min(len(text), start + width)
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(text) else ""
+    highlights = [[a - start + len(prefix), b - start + len(prefix)] for a, b in hits if a >= start and b <= end]
+    return prefix + text[start:end] + suffix, highlights
+
+
+def _candidates(user_id, grams: List[str], limit: int) -> List[Tuple[int, int, float]]:
+    """(message_id, thread_id, 점수) — 질의 2-gram 을 모두 가진 메시지, 점수 높은 순 최대 limit 개."""
+    from chat.models import ChatMessageTerm
+
+    postings = ChatMessageTerm.objects.filter(user_id=user_id, term__in=grams)
+    df = dict(postings.values_list("term").annotate(n=Count("id")).order_by())
+    if len(df) < len(grams):
+        return []
+    # 전체 메시지 수 대신 질의 2-gram 중 가장 흔한 것의 df 를 기준으로 한 상대 idf (COUNT 쿼리 없이 순위만 맞춘다)
+    base = max(df.values())
+    idf = {term: math.log(1.0 + base / df[term]) for term in grams}
+    weight = Case(*[When(term=t, then=Value(w)) for t, w in idf.items()], output_field=FloatField())
+    rows = (
+        postings.values("message_id", "thread_id")
+        .annotate(hits=Count("id"), score=Sum(F("tf") * weight, output_field=FloatField()))
+        .filter(hits=len(grams))
+        .order_by("-score", "-message_id")
+        .values_list("message_id", "thread_id", "score")[:limit]
+    )
+    return [(mid, tid, round(float(score), 6)) for mid, tid, score in rows]
+
+
+def _scan_candidates(user_id, needles: List[str], limit: int) -> List[Tuple[int, int, float]]:
+    """색인을 못 쓰는 짧은 질의: 최근 메시지부터 본문 검색 (점수는 일치 횟수)."""
+    from chat.models import ChatMessage
+
+    qs = ChatMessage.objects.filter(thread__user_id=user_id)
+    for needle in needles:
+        qs = qs.filter(message__icontains=needle)
+    rows = qs.order_by("-id").values_list("id", "thread_id", "message")[:limit]
+    scored = [(mid, tid, float(sum(text.lower().count(n) for n in needles))) for mid, tid, text in rows]
+    return sorted(scored, key=lambda row: -row[2])
+
+
+# 함수명 : search
+# input : user_id, query, cursor(이전 응답의 next_cursor), page_size(스레드 수)
+# output : {"results": [스레드별 결과], "next_cursor": str | None}
+# 함수 설명 : 결과 항목은 기존 화면과 같은 키(thread_id, persona_id, persona_name, last_message_date, messages)에
+#               score, match_count 를 더한다. messages 의 message 는 본문 전체 대신 일치 부분 주변 스니펫이다.
+def search(user_id, query: str, cursor: Optional[str] = None, page_size: Optional[int] = None) -> Dict[str, Any]:
+    from chat.models import ChatMessage, ChatThread
+
+    page_size = int(page_size or _setting("CHAT_SEARCH_PAGE_SIZE", 10))
+    per_thread = int(_setting("CHAT_SEARCH_MESSAGES_PER_THREAD", 3))
+    limit = int(_setting("CHAT_SEARCH_MAX_CANDIDATES", 5000))
+    after = decode_cursor(cursor)
+    needles = tokens(query)
+    if not needles:
+        return {"results": [], "next_cursor": None}
+    grams = sorted({token[i:i + 2] for token in needles for i in range(len(token) - 1)})
+
+    with telemetry.span("chat_search") as fields:
+        if grams:
+            candidates = _candidates(user_id, grams, limit)
+        else:
+            candidates = _scan_candidates(user_id, needles, limit)
+
+        # 스레드별로 묶기: 후보는 점수 내림차순이라 처음 본 메시지가 스레드 최고 점수다.
+        threads: Dict[int, Dict[str, Any]] = {}
+        for mid, tid, score in candidates:
+            entry = threads.get(tid)
+            if entry is None:
+                threads[tid] = entry = {"score": score, "count": 0, "message_ids": []}
+            entry["count"] += 1
+            if len(entry["message_ids"]) < per_thread:
+                entry["message_ids"].append(mid)
+        ranked = sorted(threads.items(), key=lambda item: (item[1]["score"], item[0]), reverse=True)
+        if after is not None:
+            ranked = [(tid, e) for tid, e in ranked if (e["score"], tid) < after]
+        page, rest = ranked[:page_size], ranked[page_size:]
+
+        message_ids = [mid for _, entry in page for mid in entry["message_ids"]]
+        messages = ChatMessage.objects.only("id", "thread_id", "sender", "message", "timestamp").in_bulk(message_ids)
+        thread_rows = (
+            ChatThread.objects.filter(id__in=[tid for tid, _ in page])
+            .select_related("persona").only("id", "last_message_at", "persona__id", "persona__name")
+            .in_bulk()
+        )
+        fields["candidates"] = len(candidates)
+        fields["threads"] = len(threads)
+
+    results = []
+    for tid, entry in page:
+        thread = thread_rows.get(tid)
+        if thread is None:
+            continue
+        found = []
+        # 스레드 안에서는 시간 순
+        for mid in sorted(entry["message_ids"]):
+            msg = messages.get(mid)
+            if msg is None:
+                continue
+            text, highlights = snippet(msg.message, needles)
+            found.append({
+                "message_id": msg.id, "sender": msg.sender, "message": text, "highlights": highlights,
+                "timestamp": msg.timestamp.strftime("%Y년 %m월 %d일 %H:%M"),
+            })
+        results.append({
+            "thread_id": tid, "persona_id": thread.persona.id, "persona_name": thread.persona.name,
+            "last_message_date": thread.last_message_at.strftime("%Y년 %m월 %d일 %H:%M"),
+            "score": entry["score"], "match_count": entry["count"], "messages": found,
+        })
+    next_cursor = encode_cursor(page[-1][1]["score"], page[-1][0]) if page and rest else None
+    return {"results": results, "next_cursor": next_cursor}
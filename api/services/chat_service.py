@@ -1,6 +1,11 @@
 from chat.models import ChatThread, ChatMessage
-from . import persona_service
+from . import persona_service, summary_service, telemetry
+from .history_cache import history_cache
 from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from asgiref.sync import sync_to_async
 from datetime import datetime
 
 # 함수명 : get_chat_start_data
@@ -59,12 +64,16 @@ def get_chat_start_data(request, persona_id, thread_id):
 #               1. thread 생성 or  업데이트 및 저장
 #               2. chatmessage 생성 및 저장
 #               3. 결과 반환
-@transaction.atomic # 하나의 트랜잭션
 def save_chat_messsage(request, user_input, persona_id, thread_id, llm_output):
+    with telemetry.span("save"):
+        return _save_chat_messsage(request, user_input, persona_id, thread_id, llm_output)
+
+
+@transaction.atomic # 하나의 트랜잭션
+def _save_chat_messsage(request, user_input, persona_id, thread_id, llm_output):
     if thread_id:
        try:
            chat_thread = ChatThread.objects.get(id=thread_id)
-           chat_thread.save()
        except ChatThread.DoesNotExist:
            return None, "존재하지 않는 대화입니다."
     
@@ -75,7 +84,58 @@ def save_chat_messsage(request, user_input, persona_id, thread_id, llm_output):
        user = request.user if request.user.is_authenticated else None
        chat_thread = ChatThread.objects.create(persona=persona, user=user)
     # fk인 thread_id 에 chat_thread 객체 할당
-    ChatMessage.objects.create(thread=chat_thread, sender='user', message=user_input)
-    ChatMessage.objects.create(thread=chat_thread, sender='persona', message=llm_output)
+    user_msg = ChatMessage.objects.create(thread=chat_thread, sender='user', message=user_input)
+    persona_msg = ChatMessage.objects.create(thread=chat_thread, sender='persona', message=llm_output)
+    # 스레드 통계(개수/마지막 시각/미리보기)와 last_updated 를 UPDATE 한 번으로 갱신
+    record_messages(chat_thread.id, (user_msg, persona_msg))
+    # 커밋된 뒤에만 히스토리 캐시에 반영 (롤백 시 캐시 오염 방지)
+    transaction.on_commit(lambda: history_cache.record(chat_thread.id, (user_msg, persona_msg)))
+    # 누적 요약은 요약에 아직 없는 메시지(보통 이번 한 쌍)만으로 커밋 후 갱신
+    summary_service.schedule_update(chat_thread.id, persona_msg.id)
     
     return chat_thread, None
+
+
+# 함수명 : record_messages
+# input : thread_id, messages(방금 저장한 ChatMessage 들, 시간 순)
+# output : 갱신된 행 수
+# 함수 설명 : ChatThread 의 message_count / last_message_at / last_message_preview 를 F() 로 한 번에 갱신한다.
+#               개수는 DB 에서 더하므로 같은 스레드에 동시에 저장해도 잃어버리는 값이 없다. 호출 측 트랜잭션 안에서 부른다.
+#               마지막 시각/미리보기는 저장된 값보다 새 메시지가 늦을 때만 바꾼다.
+def record_messages(thread_id, messages):
+    return ChatThread.objects.filter(pk=thread_id).update(**_stats_update(messages))
+
+
+async def arecord_messages(thread_id, messages):
+    return await ChatThread.objects.filter(pk=thread_id).aupdate(**_stats_update(messages))
+
+
+def _stats_update(messages):
+    last = messages[-1]
+    # 늦게 커밋된 이전 메시지가 더 최근 값을 덮어쓰지 않도록 시각/미리보기는 앞으로만 움직인다.
+    # (미리보기 조건의 last_message_at 은 UPDATE 이전 값이다)
+    return {
+        "message_count": F("message_count") + len(messages),
+        "last_message_at": Greatest(F("last_message_at"), Value(last.timestamp)),
+        "last_message_preview": Case(
+            When(last_message_at__lte=last.timestamp, then=Value(preview(last.message))),
+            default=F("last_message_preview"),
+        ),
+        "last_updated": timezone.now(),
+    }
+
+
+def preview(text):
+    text = " ".join((text or "").split())
+    limit = ChatThread.PREVIEW_CHARS
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+# 함수명 : asave_chat_messsage
+# input : request, user_input, persona_id, thread_id, llm_output
+# output : (chat_thread, None) 또는 (None, error_message)
+# 함수 설명 : save_chat_messsage 의 비동기 버전 (ASGI 채팅 경로용).
+#               async ORM 은 transaction.atomic 을 지원하지 않으므로
+#               동기 함수를 sync_to_async 로 감싸 같은 트랜잭션 경계를 유지한다.
+async def asave_chat_messsage(request, user_input, persona_id, thread_id, llm_output):
+    return await sync_to_async(save_chat_messsage)(request, user_input, persona_id, thread_id, llm_output)
@@ -0,0 +1,235 @@
+# api/services/demand_service.py
+# 결정적(deterministic) 로컬 수요 추정 엔진. 수량 질문에 LLM 계산 없이 한 달 예상 구매 수량과
+# 보수/기준/공격 범위를 낸다.
+#   입력: 페르소나 특성 점수(traits), 가구 구간, 제품 카테고리, 가격 vs 카테고리 기준가, 프로모션 여부
+#   - 카테고리 x 가구 구간의 일반 범위(TYPICAL_MONTHLY_RANGE) 안에서 특성 점수로 위치를 정하고 (성향)
+#   - 가격 탄력성(가격 민감도가 높을수록 크게, 프리미엄 지향이 높을수록 작게)과 프로모션 상승률을 곱한다.
+#   - NumPy 로 벡터화돼 있어 여러 페르소나(n x 특성 행렬)를 한 번에 계산할 수 있다 (설문 fan-out 용).
+# 범위 상/하한은 llm_service 의 수량 가드와 같은 quantity_bounds() 를 써서, 추정값이 가드에 다시 잘리지 않는다.
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from . import persona_profile
+
+TRAIT_KEYS = persona_profile.TRAIT_KEYS
+BUCKETS = ("single", "small", "large")
+
+TYPICAL_MONTHLY_RANGE = {
+    "canned_ham": {"single": (1, 4), "small": (2, 8)},
+    "canned_tuna": {"single": (2, 8), "small": (4, 12)},
+    "sauce": {"single": (1, 3), "small": (1, 5)},
+    "beverage": {"single": (2, 12), "small": (6, 24)},
+    "hmr": {"single": (2, 12), "small": (6, 24)},
+    "default": {"single": (1, 10), "small": (2, 12)},
+}
+
+# 카테고리 기준가(원, 대표 규격 1개). 가격 비율 = 제시 가격 / 기준가
+REFERENCE_PRICE = {
+    "canned_ham": 4500,
+    "canned_tuna": 2500,
+    "sauce": 3500,
+    "beverage": 1500,
+    "hmr": 2000,
+    "default": 3000,
+}
+
+# 카테고리별 특성 가중치 (TRAIT_KEYS 순서). 성향 = 0.5 + Σ w * (특성 - 0.5)
+TRAIT_WEIGHTS = {
+    "canned_ham": (0.10, 0.25, -0.30, 0.15, -0.05, 0.05, 0.05),
+    "canned_tuna": (0.10, 0.25, 0.15, 0.10, 0.00, 0.05, 0.05),
+    "sauce": (0.15, 0.20, 0.00, 0.05, 0.05, 0.00, 0.10),
+    "beverage": (0.10, 0.10, 0.05, 0.05, 0.05, 0.05, 0.15),
+    "hmr": (0.05, 0.30, -0.05, 0.35, 0.00, 0.05, 0.05),
+    "default": (0.10, 0.20, 0.00, 0.15, 0.00, 0.05, 0.05),
+}
+_IDX = {k: i for i, k in enumerate(TRAIT_KEYS)}
+
+# 카테고리별 기본 프로모션 상승률 (참고 제품 데이터가 없을 때)
+PROMOTION_UPLIFT = {"canned_ham": 0.35, "canned_tuna": 0.3, "sauce": 0.15, "beverage": 0.3, "hmr": 0.3, "default": 0.25}
+
+MODES = ("llm", "guided", "fast")
+CONSERVATIVE_FACTOR = 0.7
+AGGRESSIVE_FACTOR = 1.35
+
+QUANTITY_QUESTION_RE = re.compile(r"몇\s*개|몇\s*캔|몇\s*병|얼마나\s*(?:사|살|구매)|수량|개수")
+PROMOTION_RE = re.compile(r"1\s*\+\s*1|2\s*\+\s*1|행사|할인|프로모션|세일|증정|묶음")
+
+
+def _setting(name: str, default):
+    val = getattr(settings, name, None)
+    return default if val is None else val
+
+
+def quantity_bounds(category: str, bucket: str) -> Tuple[int, int]:
+    """카테고리 x 가구 구간의 한 달 일반 범위 (수량 가드와 같은 기준)."""
+    low, high = TYPICAL_MONTHLY_RANGE.get(category, TYPICAL_MONTHLY_RANGE["default"]).get(bucket, (1, 10))
+    if bucket == "large":
+        high = int(round(high * 1.5))
+    return low, high
+
+
+def is_quantity_question(text: str) -> bool:
+    return bool(QUANTITY_QUESTION_RE.search(text or ""))
+
+
+def has_promotion(text: str) -> bool:
+    return bool(PROMOTION_RE.search(text or ""))
+
+
+def trait_vector(traits: Dict[str, float]) -> np.ndarray:
+    return np.array([float(traits.get(k, 0.5)) for k in TRAIT_KEYS], dtype=np.float32)
+
+
+# 함수명 : estimate_many
+# input : traits(n x 7 특성 행렬), buckets(가구 구간 이름 n개), category, price(원, 선택), promotion(bool), uplift(선택)
+# output : {"expected", "conservative", "base", "aggressive"} 각 int32[n]
+# 함수 설명 : 페르소나 n 명의 한 달 예상 구매 수량을 한 번에 계산한다.
+#               1. 성향 = 0.5 + 특성 가중합 → 일반 범위 [low, high] 안의 위치
+#               2. 가격 배수 = (가격/기준가) ^ -탄력성, 탄력성 = (0.5 + 1.5*가격민감도) * (1 - 0.5*프리미엄지향)
+#               3. 프로모션 배수 = 1 + 상승률 * (0.5 + 가격민감도)
+#               4. 기준값은 [low, high] 로 자르고, 보수/공격은 기준값의 0.7배/1.35배
+def estimate_many(
+    traits: np.ndarray,
+    buckets: Sequence[str],
+    category: str,
+    price: Optional[float] = None,
+    promotion: bool = False,
+    uplift: Optional[float] = None,
+) -> Dict[str, np.ndarray]:
+    traits = np.atleast_2d(np.asarray(traits, dtype=np.float32))
+    n = traits.shape[0]
+    category = category if category in TYPICAL_MONTHLY_RANGE else "default"
+    bounds = {b: quantity_bounds(category, b) for b in BUCKETS}
+    codes = np.array([BUCKETS.index(b) if b in BUCKETS else 0 for b in buckets], dtype=np.int8)
+    low = np.array([bounds[b][0] for b in BUCKETS], dtype=np.float32)[codes]
+    high = np.array([bounds[b][1] for b in BUCKETS], dtype=np.float32)[codes]
+
+    weights = np.array(TRAIT_WEIGHTS[category], dtype=np.float32)
+    propensity = np.clip(0.5 + (traits - 0.5) @ weights, 0.0, 1.0)
+    base = low + (high - low) * propensity
+
+    sensitivity = traits[:, _IDX["price_sensitivity"]]
+    premium = traits[:, _IDX["premium_orientation"]]
+    multiplier = np.ones(n, dtype=np.float32)
+    if price:
+        ratio = max(float(price), 1.0) / REFERENCE_PRICE[category]
+        elasticity = (0.5 + 1.5 * sensitivity) * (1.0 - 0.5 * premium)
+        multiplier *= np.clip(np.power(ratio, -elasticity), 0.4, 1.8)
+    if promotion:
+        rate = PROMOTION_UPLIFT[category] if uplift is None else float(uplift)
+        multiplier *= 1.0 + rate * (0.5 + sensitivity)
+
+    expected = np.clip(base * multiplier, low, high)
+    base_q = np.maximum(1, np.rint(expected)).astype(np.int32)
+    return {
+        "expected": expected.astype(np.float32),
+        "conservative": np.maximum(1, np.rint(expected * CONSERVATIVE_FACTOR)).astype(np.int32),
+        "base": base_q,
+        "aggressive": np.maximum(base_q, np.rint(expected * AGGRESSIVE_FACTOR)).astype(np.int32),
+    }
+
+
+class Estimate:
+    __slots__ = ("category", "price", "promotion", "conservative", "base", "aggressive", "low", "high")
+
+    def __init__(self, category, price, promotion, conservative, base, aggressive, low, high):
+        self.category = category
+        self.price = price
+        self.promotion = promotion
+        self.conservative = conservative
+        self.base = base
+        self.aggressive = aggressive
+        self.low = low
+        self.high = high
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+def estimate_profiles(
+    profiles: Sequence[Any], category: str, price: Optional[float] = None, promotion: bool = False, uplift: Optional[float] = None,
+) -> List[Estimate]:
+    """여러 페르소나(PersonaProfile 목록)를 한 번의 행렬 연산으로 추정 (설문 fan-out 용)."""
+    if not profiles:
+        return []
+    traits = np.vstack([trait_vector(p.traits) for p in profiles])
+    buckets = [p.household_bucket for p in profiles]
+    res = estimate_many(traits, buckets, category, price, promotion, uplift)
+    cat = category if category in TYPICAL_MONTHLY_RANGE else "default"
+    out = []
+    for i, bucket in enumerate(buckets):
+        low, high = quantity_bounds(cat, bucket)
+        out.append(Estimate(
+            category, price, promotion,
+            int(res["conservative"][i]), int(res["base"][i]), int(res["aggressive"][i]), low, high,
+        ))
+    return out
+
+
+def estimate_profile(profile, category: str, price: Optional[float] = None, promotion: bool = False, uplift: Optional[float] = None) -> Estimate:
+    """페르소나 한 명(PersonaProfile)의 추정."""
+    return estimate_profiles([profile], category, price, promotion, uplift)[0]
+
+
+CATEGORY_LABELS = {
+    "canned_ham": "통조림 햄", "canned_tuna": "참치캔", "sauce": "소스", "beverage": "음료", "hmr": "간편식", "default": "이 제품",
+}
+HOUSEHOLD_LABELS = {"single": "1인 가구라 한 번에 조금씩 사요", "small": "식구가 있어 넉넉히 사 두는 편이에요", "large": "대가족이라 한 번에 많이 사요"}
+
+
+def prompt_note(est: Estimate) -> str:
+    """LLM 이 수치를 그대로 말하도록 넣는 [수요 추정] 블록."""
+    cond = []
+    if est.price:
+        cond.append(f"가격 {int(est.price):,}원(기준가 {REFERENCE_PRICE.get(est.category, REFERENCE_PRICE['default']):,}원)")
+    if est.promotion:
+        cond.append("프로모션 적용")
+    cond_text = f" / 조건: {', '.join(cond)}" if cond else ""
+    return (
+        f"한 달 기준 {est.base}개 (보수 {est.conservative}개 · 기준 {est.base}개 · 공격 {est.aggressive}개){cond_text}. "
+        "첫 줄의 수량은 기준값을 그대로 쓰고, 숫자를 다시 계산하지 마라."
+    )
+
+
+# 함수명 : render_answer
+# input : profile(PersonaProfile), est(Estimate)
+# output : LLM 없이 바로 돌려줄 답변 (응답 형식의 첫 줄 + 내 기준)
+def render_answer(profile, est: Estimate) -> str:
+    label = CATEGORY_LABELS.get(est.category, CATEGORY_LABELS["default"])
+    tr = profile.traits
+    taste = []
+    if tr.get("health_orientation", 0.5) >= 0.6:
+        taste.append("건강")
+    if tr.get("hmr_preference", 0.5) >= 0.6 or tr.get("cooking_convenience", 0.5) >= 0.6:
+        taste.append("간편")
+    if tr.get("premium_orientation", 0.5) >= 0.6:
+        taste.append("품질")
+    lines = [
+        f"저는 한 달에 {est.base}개({label} 기준)를 구매할 것 같아요!",
+        "내 기준:",
+        f"   · 취향/식단: {'·'.join(taste) + ' 위주로 골라요' if taste else '무난하게 자주 먹는 편이에요'}",
+        f"   · 가구/생활: {HOUSEHOLD_LABELS.get(profile.household_bucket, HOUSEHOLD_LABELS['single'])}",
+    ]
+    if est.price:
+        ref = REFERENCE_PRICE.get(est.category, REFERENCE_PRICE["default"])
+        feel = "부담돼서 조금 줄일 것 같아요" if est.price > ref * 1.1 else ("싸서 조금 더 살 것 같아요" if est.price < ref * 0.9 else "적당한 가격이에요")
+        lines.append(f"   · 예산: {int(est.price):,}원이면 {feel}")
+    if est.promotion:
+        lines.append("   · 행사: 프로모션이 있으면 평소보다 더 사 둘 것 같아요")
+    lines.append(f"   · 범위: 보수 {est.conservative}개 · 기준 {est.base}개 · 공격 {est.aggressive}개")
+    return "\n".join(lines)
+
+
+def quantity_mode() -> str:
+    """llm: LLM 이 계산 / guided: 추정값을 프롬프트에 넣고 LLM 은 표현만 / fast: 수량 질문은 LLM 없이 바로 답변."""
+    mode = str(_setting("LLM_QUANTITY_MODE", "guided") or "guided").strip().lower()
+    return mode if mode in MODES else "guided"
+
+
+def stats() -> Dict[str, Any]:
+    return {"mode": quantity_mode()}
@@ -0,0 +1,146 @@
+# api/services/history_cache.py
+# 스레드별 최근 메시지 링 버퍼 (워커 프로세스 단위, LRU).
+#   - 미스: id 역순 + LIMIT 쿼리로 꼬리 N건만 읽는다 (스레드 전체를 읽지 않음)
+#   - 히트: 마지막으로 본 id 이후(id > watermark)만 조회해 이어 붙인다. 다른 워커가 쓴 메시지도 여기서 따라잡는다.
+#   - save_chat_messsage 가 쓴 메시지는 커밋 후 바로 버퍼에 추가된다.
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict, deque, namedtuple
+from typing import Deque, Iterable, List, Optional
+
+from django.conf import settings
+
+try:
+    from chat.models import ChatMessage
+    HAS_CHAT_MODELS = True
+except Exception:
+    ChatMessage = None
+    HAS_CHAT_MODELS = False
+
+HistoryRow = namedtuple("HistoryRow", ("id", "sender", "message", "token_count"))
+
+_FIELDS = ("id", "sender", "message", "token_count")
+
+
+class _Entry:
+    __slots__ = ("rows", "watermark")
+
+    def __init__(self, rows: Iterable[HistoryRow], maxlen: int):
+        self.rows: Deque[HistoryRow] = deque(rows, maxlen=maxlen)
+        self.watermark = self.rows[-1].id if self.rows else 0
+
+
+class ThreadHistoryCache:
+    def __init__(self, max_threads: int = 1024, rows_per_thread: int = 32):
+        self.max_threads = max_threads
+        self.rows_per_thread = rows_per_thread
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # --- 내부 헬퍼 ---
+    def _tail_query(self, thread_id: int, limit: int):
+        return ChatMessage.objects.filter(thread_id=thread_id).order_by("-id").values_list(*_FIELDS)[:limit]
+
+    def _delta_query(self, thread_id: int, after_id: int):
+        return ChatMessage.objects.filter(thread_id=thread_id, id__gt=after_id).order_by("id").values_list(*_FIELDS)
+
+    def _lookup(self, thread_id: int, count: bool = False) -> Optional[_Entry]:
+        # count=True 면 조회 결과를 hits/misses 에 같은 잠금 안에서 센다 (record 의 조회는 세지 않는다).
+        with self._lock:
+            entry = self._entries.get(thread_id)
+            if entry is not None:
+                self._entries.move_to_end(thread_id)
+            if count:
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            return entry
+
+    def _store(self, thread_id: int, entry: _Entry) -> None:
+        with self._lock:
+            self._entries[thread_id] = entry
+            self._entries.move_to_end(thread_id)
+            while len(self._entries) > self.max_threads:
+                self._entries.popitem(last=False)
+
+    def _extend(self, entry: _Entry, rows: Iterable[HistoryRow]) -> None:
+        with self._lock:
+            for row in rows:
+                if row.id > entry.watermark:
+                    entry.rows.append(row)
+                    entry.watermark = row.id
+
+    def _snapshot(self, entry: _Entry, limit: int) -> List[HistoryRow]:
+        with self._lock:
+            rows = list(entry.rows)
+        return rows[-limit:] if limit else []
+
+    # --- 공개 API ---
+    def get(self, thread_id: Optional[int], limit: int = 16) -> List[HistoryRow]:
+        """스레드의 최근 메시지 최대 limit 건을 id 오름차순으로 반환."""
+        if not (HAS_CHAT_MODELS and thread_id) or limit <= 0:
+            return []
+        if limit > self.rows_per_thread:
+            rows = [HistoryRow(*r) for r in self._tail_query(thread_id, limit)]
+            return rows[::-1]
+        entry = self._lookup(thread_id, count=True)
+        if entry is None:
+            rows = [HistoryRow(*r) for r in self._tail_query(thread_id, self.rows_per_thread)]
+            entry = _Entry(rows[::-1], self.rows_per_thread)
+            self._store(thread_id, entry)
+        else:
+            self._extend(entry, (HistoryRow(*r) for r in self._delta_query(thread_id, entry.watermark)))
+        return self._snapshot(entry, limit)
+
+    async def aget(self, thread_id: Optional[int], limit: int = 16) -> List[HistoryRow]:
+        if not (HAS_CHAT_MODELS and thread_id) or limit <= 0:
+            return []
+        if limit > self.rows_per_thread:
+            rows = [HistoryRow(*r) async for r in self._tail_query(thread_id, limit)]
+            return rows[::-1]
+        entry = self._lookup(thread_id, count=True)
+        if entry is None:
+            rows = [HistoryRow(*r) async for r in self._tail_query(thread_id, self.rows_per_thread)]
+            entry = _Entry(rows[::-1], self.rows_per_thread)
+            self._store(thread_id, entry)
+        else:
+            self._extend(entry, [HistoryRow(*r) async for r in self._delta_query(thread_id, entry.watermark)])
+        return self._snapshot(entry, limit)
+
+    def record(self, thread_id: Optional[int], messages: Iterable) -> None:
+        """방금 저장한 ChatMessage 들을 버퍼에 추가한다. 캐시에 없는 스레드는 다음 조회 때 읽는다.
+
+        같은 스레드에 두 워커가 동시에 쓰면 다른 워커의 메시지가 빠질 수 있지만,
+        순차적인 턴에서는 다음 조회의 id > watermark 쿼리가 다른 워커의 메시지를 따라잡는다.
+        """
+        if not thread_id:
+            return
+        entry = self._lookup(thread_id)
+        if entry is None:
+            return
+        self._extend(entry, sorted(
+            (HistoryRow(m.id, m.sender, m.message, m.token_count) for m in messages), key=lambda r: r.id,
+        ))
+
+    def invalidate(self, thread_id: Optional[int]) -> None:
+        with self._lock:
+            self._entries.pop(thread_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"threads": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+history_cache = ThreadHistoryCache(
+    max_threads=int(getattr(settings, "HISTORY_CACHE_THREADS", 1024)),
+    rows_per_thread=int(getattr(settings, "HISTORY_CACHE_ROWS", 32)),
+)
@@ -0,0 +1,61 @@
+# api/services/keyword_matcher.py
+# Aho-Corasick 다중 패턴 매처.
+# 여러 키워드 그룹(카테고리)을 한 번에 컴파일해 두고, 텍스트를 한 번만 훑어서
+# 어떤 카테고리의 키워드가 하나라도 등장했는지 집합으로 돌려준다.
+from __future__ import annotations
+
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List
+
+
+class KeywordMatcher:
+    """카테고리별 키워드를 Aho-Corasick 오토마톤으로 컴파일한 매처 (대소문자 무시)."""
+
+    __slots__ = ("_goto", "_fail", "_out", "categories")
+
+    def __init__(self, groups: Dict[str, Iterable[str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        out: List[set] = [set()]
+        for category, words in groups.items():
+            for word in words:
+                word = (word or "").lower()
+                if not word:
+                    continue
+                node = 0
+                for ch in word:
+                    nxt = self._goto[node].get(ch)
+                    if nxt is None:
+                        nxt = len(self._goto)
+                        self._goto[node][ch] = nxt
+                        self._goto.append({})
+                        out.append(set())
+                    node = nxt
+                out[node].add(category)
+
+        # BFS 로 실패 링크를 만들고, 실패 링크 쪽 출력도 합쳐 둔다.
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                cand = self._goto[f].get(ch, 0)
+                self._fail[nxt] = cand if cand != nxt else 0
+                out[nxt] |= out[self._fail[nxt]]
+        self._out: List[FrozenSet[str]] = [frozenset(o) for o in out]
+        self.categories = frozenset(groups)
+
+    def scan(self, text: str) -> FrozenSet[str]:
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        hits: set = set()
+        for ch in (text or "").lower():
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                hits |= out[node]
+        return frozenset(hits)
@@ -0,0 +1,139 @@
+# api/services/llm_cache.py
+# LLM 결과 캐시 (워커 프로세스 단위, TTL + LRU).
+# 네임스페이스별로 따로 관리한다.
+#   - scope    : 도메인 판별 결과 (모델, 정규화 발화, 히스토리 컨텍스트 해시)
+#   - snapshot : 컨텍스트 스냅샷 (위와 같은 키)
+#   - answer   : 최종 답변 (페르소나 id, 정규화 발화, 스냅샷, 모델)
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from django.conf import settings
+
+NAMESPACES = ("scope", "snapshot", "answer")
+MISS = object()
+
+_WS_RE = re.compile(r"\s+")
+_TRAIL_PUNCT_RE = re.compile(r"[\s?!.~…]+$")
+
+
+def _setting(name: str, default):
+    val = getattr(settings, name, None)
+    return default if val is None else val
+
+
+def enabled() -> bool:
+    return bool(_setting("LLM_CACHE_ENABLED", True))
+
+
+def answers_enabled() -> bool:
+    # 같은 질문에도 temperature 에 따른 다양한 답을 원하면 LLM_CACHE_ANSWERS=False 로 답변 캐시만 끈다.
+    return enabled() and bool(_setting("LLM_CACHE_ANSWERS", True))
+
+
+def normalize(text: str) -> str:
+    """대소문자/공백/끝 문장부호 차이를 없앤 발화 (캐시 키용)."""
+    t = _WS_RE.sub(" ", (text or "").strip().lower())
+    return _TRAIL_PUNCT_RE.sub("", t)
+
+
+def digest(text: str) -> str:
+    return hashlib.blake2b((text or "").encode("utf-8"), digest_size=12).hexdigest()
+
+
+class TTLCache:
+    """OrderedDict 기반 TTL + LRU 캐시. 만료 항목은 조회 시점에 지운다."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return MISS
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+_lock = threading.Lock()
+_caches: Dict[str, TTLCache] = {}
+
+
+def _cache(namespace: str) -> TTLCache:
+    cache = _caches.get(namespace)
+    if cache is None:
+        with _lock:
+            cache = _caches.get(namespace)
+            if cache is None:
+                ns = namespace.upper()
+                cache = _caches[namespace] = TTLCache(
+                    maxsize=int(_setting(f"LLM_CACHE_{ns}_MAXSIZE", _setting("LLM_CACHE_MAXSIZE", 2048))),
+                    ttl=float(_setting(f"LLM_CACHE_{ns}_TTL", _setting("LLM_CACHE_TTL", 3600))),
+                )
+    return cache
+
+
+def get(namespace: str, key: Optional[Hashable]):
+    if key is None or not enabled():
+        return MISS
+    return _cache(namespace).get(key)
+
+
+def put(namespace: str, key: Optional[Hashable], value: Any) -> None:
+    if key is None or not enabled():
+        return
+    _cache(namespace).set(key, value)
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    return {ns: _cache(ns).stats() for ns in NAMESPACES}
+
+
+def reset() -> None:
+    """설정 변경이나 테스트 후 캐시와 카운터를 비운다 (크기/TTL 설정도 다시 읽음)."""
+    with _lock:
+        _caches.clear()
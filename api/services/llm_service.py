@@ -1,12 +1,19 @@
 # api/services/llm_service.py
 from __future__ import annotations
 
-import os
+import asyncio
+import json
 import re
-from typing import Optional, List, Dict
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional, List, Dict, Any, Iterator, AsyncIterator, Tuple, FrozenSet
 
-from dotenv import load_dotenv
-from . import persona_service
+from django.conf import settings
+from . import demand_service, llm_cache, openai_pool, persona_profile, persona_service, rag_service, rate_limiter, scope_classifier, summary_service, telemetry, token_budget
+from .history_cache import history_cache
+from .keyword_matcher import KeywordMatcher
 
 try:
     from chat.models import ChatMessage, ChatThread
@@ -15,15 +22,37 @@ except Exception:
     ChatMessage = ChatThread = None
     HAS_CHAT_MODELS = False
 
+try:
+    from api.models import ScopeVerdict
+    HAS_API_MODELS = True
+except Exception:
+    ScopeVerdict = None
+    HAS_API_MODELS = False
+
 
 def _get_openai_client():
-    from openai import OpenAI, APIError
-    load_dotenv()
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY 환경 변수가 설정되지 않았습니다.")
-    client = OpenAI(api_key=api_key)
-    return client, APIError
+    from openai import APIError
+    return openai_pool.get_client(), APIError
+
+
+def _get_async_openai_client():
+    from openai import APIError
+    return openai_pool.get_async_client(), APIError
+
+
+def _llm_create(client, stage: str, model_name: str, request: Dict[str, Any]):
+    # 모든 비스트리밍 LLM 호출은 여기를 거쳐 단계별 지연/토큰 사용량을 남긴다 (속도 제한기 경유).
+    with telemetry.span(stage, model_name):
+        res = rate_limiter.create(client, model_name, request)
+    telemetry.record_usage(stage, model_name, getattr(res, "usage", None))
+    return res
+
+
+async def _allm_create(client, stage: str, model_name: str, request: Dict[str, Any]):
+    with telemetry.span(stage, model_name):
+        res = await rate_limiter.acreate(client, model_name, request)
+    telemetry.record_usage(stage, model_name, getattr(res, "usage", None))
+    return res
 
 
 GREETING_PAT = re.compile(r"^(안녕하세요|안녕|하이|hello|hi)[!,\.\s]*$", re.IGNORECASE)
@@ -77,11 +106,8 @@ def _parse_yes_no(token: str) -> Optional[bool]:
 
 
 def _heuristic_food_in_scope(text: str) -> bool:
-    t = (text or "").lower()
-    has_food = any(k in t for k in FOOD_HINTS)
-    has_intent = any(k in t for k in INTENT_HINTS)
-    compare_follow = any(k in t for k in (" vs ", "vs", "대비", "비교"))
-    return has_food and (has_intent or compare_follow)
+    hits = _keyword_hits(text)
+    return "food" in hits and ("intent" in hits or "compare" in hits)
 
 
 def _is_refusal_msg(text: str) -> bool:
@@ -96,71 +122,87 @@ def _should_include_user_history(text: str) -> bool:
         return True
     if _heuristic_food_in_scope(t):
         return True
-    if any(k in t for k in LIKE_TRIGGERS) or any(k in t for k in DISLIKE_TRIGGERS):
+    if _keyword_hits(t) & {"like", "dislike"}:
         return True
     if LIKE_RE.search(t) or DISLIKE_RE.search(t):
         return True
     return False
 
 
-def _load_history_text(thread_id: Optional[int], limit: int = 10, char_limit: int = 1800) -> str:
-    if not (HAS_CHAT_MODELS and thread_id):
-        return ""
-    qs = (
-        ChatMessage.objects.filter(thread_id=thread_id)
-        .order_by("id").only("sender", "message")
-    )
-    items = list(qs)[-limit:]
-    lines: List[str] = []
+def _preflight_history_tokens() -> int:
+    return int(getattr(settings, "LLM_PREFLIGHT_HISTORY_TOKENS", 800))
+
+
+def _eligible_history_rows(items) -> list:
+    # 거절 응답과 도메인 밖 사용자 발화는 히스토리에서 뺀다.
+    out = []
     for m in items:
         if m.sender == "persona":
             if _is_refusal_msg(m.message):
                 continue
-            who = "페르소나"
-        else:
-            if not _should_include_user_history(m.message):
-                continue
-            who = "사용자"
-        lines.append(f"{who}: {m.message}")
-    return "\n".join(lines)[-char_limit:]
+        elif not _should_include_user_history(m.message):
+            continue
+        out.append(m)
+    return out
 
 
-def _load_history_messages(thread_id: Optional[int], limit: int = 16) -> List[Dict[str, str]]:
+def _history_text_from_rows(items, token_limit: Optional[int] = None) -> str:
+    limit = _preflight_history_tokens() if token_limit is None else token_limit
+    # "사용자: " / "페르소나: " 접두어 + 줄바꿈 몫으로 행당 3토큰
+    rows = token_budget.fit_rows(_eligible_history_rows(items), limit, per_row_overhead=3)
+    return "\n".join(f"{'페르소나' if m.sender == 'persona' else '사용자'}: {m.message}" for m in rows)
+
+
+def _history_messages_from_rows(items) -> List[Dict[str, str]]:
+    return [
+        {"role": "assistant" if m.sender == "persona" else "user", "content": m.message}
+        for m in _eligible_history_rows(items)
+    ]
+
+
+def _history_row_limit() -> int:
+    return history_cache.rows_per_thread
+
+
+def _load_history_rows(thread_id: Optional[int], limit: Optional[int] = None) -> list:
+    # 스레드 꼬리 limit 건만 읽는다 (history_cache: 링 버퍼 + 역순 LIMIT 쿼리)
     if not (HAS_CHAT_MODELS and thread_id):
         return []
-    qs = (
-        ChatMessage.objects.filter(thread_id=thread_id)
-        .order_by("id").only("sender", "message")
-    )
-    items = list(qs)[-limit:]
-    out: List[Dict[str, str]] = []
-    for m in items:
-        if m.sender == "persona":
-            if _is_refusal_msg(m.message):
-                continue
-            out.append({"role": "assistant", "content": m.message})
-        else:
-            if not _should_include_user_history(m.message):
-                continue
-            out.append({"role": "user", "content": m.message})
-    return out
+    return history_cache.get(thread_id, limit or _history_row_limit())
 
 
-def _classify_food_scope(client, model_name: str, question: str) -> bool:
-    if _heuristic_food_in_scope(question):
-        return True
+def _load_history_text(thread_id: Optional[int], limit: Optional[int] = None, token_limit: Optional[int] = None) -> str:
+    return _history_text_from_rows(_load_history_rows(thread_id, limit), token_limit)
+
+
+def _load_history_messages(thread_id: Optional[int], limit: Optional[int] = None) -> List[Dict[str, str]]:
+    return _history_messages_from_rows(_load_history_rows(thread_id, limit))
+
+
+async def _aload_history_rows(thread_id: Optional[int], limit: Optional[int] = None) -> list:
+    if not (HAS_CHAT_MODELS and thread_id):
+        return []
+    return await history_cache.aget(thread_id, limit or _history_row_limit())
+
+
+def _classify_request(question: str) -> Dict[str, Any]:
     sys = """다음 문장이 '식품/가공식품/음료' 제품의 판매량·수요예측 또는 그것을 늘리는 전략과 직접적으로 관련이 있는지 판정하라.
 - IN-SCOPE: 식품류 전반에 관한 질문으로서, 구매 개수/월별 패턴/가격·프로모션/계절성/채널/번들/구독/재구매 전략, 또는 **제품 간 비교·선호·추천**.
 - OUT-OF-SCOPE: 비식품, 일상대화, 맞춤법/번역/일반 글쓰기 등.
 반드시 한 단어로만 출력: 예 또는 아니오."""
     user = f"문장: {question}"
+    return {
+        "messages": [{"role": "system", "content": sys}, {"role": "user", "content": user}],
+        "temperature": 0,
+        "max_tokens": 2,
+    }
+
+
+def _classify_food_scope(client, model_name: str, question: str) -> bool:
+    if _heuristic_food_in_scope(question):
+        return True
     try:
-        res = client.chat.completions.create(
-            model=model_name,
-            messages=[{"role": "system", "content": sys}, {"role": "user", "content": user}],
-            temperature=0,
-            max_tokens=2,
-        )
+        res = _llm_create(client, "scope", model_name, _classify_request(question))
         val = _parse_yes_no(res.choices[0].message.content)
     except Exception:
         val = None
@@ -171,8 +213,7 @@ def _classify_food_scope(client, model_name: str, question: str) -> bool:
     return False
 
 
-def _llm_scope_decider(client, model_name: str, thread_id: Optional[int], new_utterance: str) -> Optional[bool]:
-    history = _load_history_text(thread_id, limit=12, char_limit=1600)
+def _scope_decider_request(history: str, new_utterance: str) -> Dict[str, Any]:
     text = (new_utterance or "").strip()
     system = """너는 '도메인/후속 판별기'다. 다음 대화의 최근 흐름과 새 발화를 보고, 주제가 '식품/가공식품/음료' 제품과 관련된
 구매·수요·가격·프로모션·계절성·채널·번들·구독·재구매·월별 패턴 또는 **제품 간 비교/선호/추천** 의사결정인지 판정하라.
@@ -187,21 +228,26 @@ OUT은 비식품 주제/일상대화/정치/날씨/맞춤법·번역·글쓰기
 문장: 오늘 날씨 어때? → 아니오
 문장: 전자레인지 고장났어. → 아니오
 """
-    user = f"[히스토리]\n{history}\n\n{examples}[새 발화]\n{text}\n답:"
+    user = f"[히스토리]\n{history[-1600:]}\n\n{examples}[새 발화]\n{text}\n답:"
+    return {
+        "messages": [{"role": "system", "content": system}, {"role": "user", "content": user}],
+        "temperature": 0,
+        "max_tokens": 2,
+    }
+
+
+def _llm_scope_decider(client, model_name: str, thread_id: Optional[int], new_utterance: str, history: Optional[str] = None) -> Optional[bool]:
+    if history is None:
+        history = _load_history_text(thread_id)
     try:
-        res = client.chat.completions.create(
-            model=model_name,
-            messages=[{"role": "system", "content": system}, {"role": "user", "content": user}],
-            temperature=0,
-            max_tokens=2,
-        )
+        res = _llm_create(client, "scope", model_name, _scope_decider_request(history, new_utterance))
         return _parse_yes_no(res.choices[0].message.content)
     except Exception:
         return None
 
 
-def _is_in_scope_food(user_input: str, thread_id: Optional[int], client, model_name: str) -> bool:
-    val = _llm_scope_decider(client, model_name, thread_id, user_input)
+def _is_in_scope_food(user_input: str, thread_id: Optional[int], client, model_name: str, history: Optional[str] = None) -> bool:
+    val = _llm_scope_decider(client, model_name, thread_id, user_input, history)
     if val is not None:
         return val
     if _heuristic_food_in_scope(user_input):
@@ -209,29 +255,267 @@ def _is_in_scope_food(user_input: str, thread_id: Optional[int], client, model_n
     return _classify_food_scope(client, model_name, user_input)
 
 
-def _extract_context_snapshot(client, model_name: str, thread_id: Optional[int], user_input: str) -> str:
-    hist = _load_history_text(thread_id, limit=12, char_limit=1800)
+def _snapshot_request(hist: str, user_input: str) -> Dict[str, Any]:
     system = (
         "다음 대화 히스토리와 최신 발화를 보고, 현재 논의 중인 식품 제품의 "
         "'상품명/규격', '가격(있으면 숫자)', '기간(예: 1개월)', '특성(예: 락토프리, 친환경 포장)'을 "
         "한두 문장으로 요약하라. 모르면 추정하지 말고 생략하라. "
         "예: '현재 대상: 초코우유 250ml 락토프리, 기간 1개월, 가격 1,500원 가정, 친환경 포장 언급됨.'"
     )
+    return {
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": f"[히스토리]\n{hist}\n\n[최신]\n{user_input}"},
+        ],
+        "temperature": 0,
+        "max_tokens": 120,
+    }
+
+
+def _extract_context_snapshot(client, model_name: str, thread_id: Optional[int], user_input: str, history: Optional[str] = None) -> str:
+    hist = _load_history_text(thread_id) if history is None else history
     try:
-        resp = client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": f"[히스토리]\n{hist}\n\n[최신]\n{user_input}"},
-            ],
-            temperature=0,
-            max_tokens=120,
-        )
+        resp = _llm_create(client, "snapshot", model_name, _snapshot_request(hist, user_input))
         return (resp.choices[0].message.content or "").strip()
     except Exception:
         return ""
 
 
+PRODUCT_CATEGORIES = ("canned_ham", "canned_tuna", "sauce", "beverage", "hmr", "default")
+
+PREFLIGHT_SCHEMA = {
+    "name": "preflight",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "in_scope": {"type": "boolean"},
+            "snapshot": {"type": "string"},
+            "prices": {"type": "array", "items": {"type": "integer"}},
+            "product_category": {"type": "string", "enum": list(PRODUCT_CATEGORIES)},
+        },
+        "required": ["in_scope", "snapshot", "prices", "product_category"],
+        "additionalProperties": False,
+    },
+}
+
+
+def _preflight_mode() -> str:
+    mode = str(getattr(settings, "LLM_PREFLIGHT_MODE", "fused") or "fused").strip().lower()
+    return mode if mode in ("fused", "legacy") else "fused"
+
+
+def _preflight_messages(history: str, user_input: str) -> List[Dict[str, str]]:
+    system = """너는 '식품 수요예측 대화'의 사전 판별기다. 대화 히스토리와 새 발화를 보고 아래 JSON 필드를 채워라.
+- in_scope: 주제가 '식품/가공식품/음료' 제품의 구매·수요·가격·프로모션·계절성·채널·번들·구독·재구매·월별 패턴
+  또는 **제품 간 비교/선호/추천** 의사결정이면 true. 후속 축약형(예: '그럼 초코가 낫지?', '어때?', 'vs?')도 true.
+  비식품 주제/일상대화/정치/날씨/맞춤법·번역·글쓰기·코딩 같은 일반 작업이면 false.
+- snapshot: in_scope가 true일 때만, 현재 논의 중인 식품 제품의 '상품명/규격', '가격(있으면 숫자)', '기간(예: 1개월)',
+  '특성(예: 락토프리, 친환경 포장)'을 한두 문장으로 요약. 모르면 추정하지 말고 생략. false이면 빈 문자열.
+  예: '현재 대상: 초코우유 250ml 락토프리, 기간 1개월, 가격 1,500원 가정, 친환경 포장 언급됨.'
+- prices: 히스토리와 새 발화에서 언급된 제품 가격(원 단위 정수). '2천원'은 2000. 없으면 빈 배열.
+- product_category: canned_ham(햄/스팸), canned_tuna(참치캔), sauce(소스/양념), beverage(우유/음료/커피),
+  hmr(즉석밥/밀키트/냉동), default(그 외 또는 불명) 중 하나."""
+    examples = """[예시]
+문장: 민트커피 vs 초코커피 뭐가 더 잘 팔릴까? → in_scope=true
+문장: 가격 2천원이면 몇 개 사게 될까? → in_scope=true
+문장: 맞춤법 맞춰줘. → in_scope=false
+문장: 오늘 날씨 어때? → in_scope=false
+"""
+    user = f"[히스토리]\n{history}\n\n{examples}[새 발화]\n{(user_input or '').strip()}"
+    return [{"role": "system", "content": system}, {"role": "user", "content": user}]
+
+
+def _parse_preflight(content: Optional[str]) -> Optional[Dict[str, Any]]:
+    try:
+        data = json.loads(content or "")
+    except Exception:
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("in_scope"), bool):
+        return None
+    prices: List[int] = []
+    for p in data.get("prices") or []:
+        try:
+            n = int(p)
+        except Exception:
+            continue
+        if n > 0:
+            prices.append(n)
+    category = data.get("product_category")
+    return {
+        "in_scope": data["in_scope"],
+        "snapshot": str(data.get("snapshot") or "").strip() if data["in_scope"] else "",
+        "prices": prices,
+        "category": category if category in PRODUCT_CATEGORIES else "default",
+        "source": "fused",
+    }
+
+
+def _preflight_request(hist: str, user_input: str) -> Dict[str, Any]:
+    return {
+        "messages": _preflight_messages(hist, user_input),
+        "temperature": 0,
+        "max_tokens": 200,
+        "response_format": {"type": "json_schema", "json_schema": PREFLIGHT_SCHEMA},
+    }
+
+
+def _fused_preflight(client, model_name: str, thread_id: Optional[int], user_input: str, history: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    hist = _load_history_text(thread_id) if history is None else history
+    try:
+        res = _llm_create(client, "preflight", model_name, _preflight_request(hist, user_input))
+        return _parse_preflight(res.choices[0].message.content)
+    except Exception:
+        return None
+
+
+def _legacy_preflight(
+    client, model_name: str, thread_id: Optional[int], user_input: str,
+    history: Optional[str] = None, pool: Optional[ThreadPoolExecutor] = None,
+) -> Dict[str, Any]:
+    if pool is None:
+        in_scope = _is_in_scope_food(user_input, thread_id, client, model_name, history)
+        snapshot = _extract_context_snapshot(client, model_name, thread_id, user_input, history) if in_scope else ""
+    else:
+        # 판별과 스냅샷을 동시에 시작하고, OUT이면 스냅샷은 버린다.
+        snap_future = pool.submit(telemetry.bind(_extract_context_snapshot), client, model_name, thread_id, user_input, history)
+        in_scope = _is_in_scope_food(user_input, thread_id, client, model_name, history)
+        if not in_scope:
+            snap_future.cancel()
+        snapshot = snap_future.result() if in_scope else ""
+    return {"in_scope": in_scope, "snapshot": snapshot, "prices": [], "category": "default", "source": "legacy"}
+
+
+def _run_preflight(
+    client, model_name: str, thread_id: Optional[int], user_input: str,
+    history: Optional[str] = None, pool: Optional[ThreadPoolExecutor] = None,
+    known_in_scope: Optional[bool] = None,
+) -> Dict[str, Any]:
+    if known_in_scope:
+        # 로컬 분류기가 IN 으로 확신하면 판별 호출 없이 스냅샷만 받는다.
+        snapshot = _extract_context_snapshot(client, model_name, thread_id, user_input, history)
+        return {"in_scope": True, "snapshot": snapshot, "prices": [], "category": "default", "source": "classifier"}
+    if _preflight_mode() == "fused":
+        result = _fused_preflight(client, model_name, thread_id, user_input, history)
+        if result is not None:
+            return result
+    return _legacy_preflight(client, model_name, thread_id, user_input, history, pool)
+
+
+def _preflight_history_text(rolling: Optional[Dict[str, Any]], rows) -> str:
+    # 누적 요약이 있으면 원문 히스토리 대신 [요약 + 최근 몇 건]만 넘겨 사전 판별 입력 크기를 일정하게 유지
+    if rolling is not None:
+        return summary_service.preflight_context(rolling, rows, _preflight_history_tokens())
+    return _history_text_from_rows(rows)
+
+
+def _summary_preflight(rolling: Optional[Dict[str, Any]], rows, user_input: str, known_in_scope: Optional[bool]) -> Optional[Dict[str, Any]]:
+    # 로컬 분류기가 IN 으로 확신하고 누적 요약이 있으면 스냅샷 LLM 호출 없이 요약을 그대로 쓴다.
+    if not (known_in_scope and rolling is not None):
+        return None
+    snapshot = summary_service.render_snapshot(rolling, rows, user_input)
+    return {
+        "in_scope": True,
+        "snapshot": snapshot,
+        "prices": _extract_prices(user_input),
+        "category": _product_category_from_text(snapshot + " " + user_input),
+        "source": "summary",
+    }
+
+
+def _preflight_cache_key(model_name: str, user_input: str, history_text: str) -> Tuple[str, str, str]:
+    return (model_name, llm_cache.normalize(user_input), llm_cache.digest(history_text))
+
+
+def _cached_preflight(key) -> Optional[Dict[str, Any]]:
+    # scope / snapshot 네임스페이스가 모두 있어야 사전 판별 LLM 호출을 건너뛴다.
+    verdict = llm_cache.get("scope", key)
+    if verdict is llm_cache.MISS:
+        return None
+    if not verdict["in_scope"]:
+        return {"in_scope": False, "snapshot": "", "prices": [], "category": "default", "source": "cache"}
+    snapshot = llm_cache.get("snapshot", key)
+    if snapshot is llm_cache.MISS:
+        return None
+    return {"in_scope": True, "snapshot": snapshot, "prices": list(verdict["prices"]), "category": verdict["category"], "source": "cache"}
+
+
+def _store_preflight(key, preflight: Dict[str, Any]) -> None:
+    if preflight["source"] in ("cache", "summary"):
+        return
+    llm_cache.put("scope", key, {"in_scope": preflight["in_scope"], "prices": tuple(preflight["prices"]), "category": preflight["category"]})
+    if preflight["in_scope"] and preflight["snapshot"]:
+        llm_cache.put("snapshot", key, preflight["snapshot"])
+
+
+def _answer_cache_key(persona, user_input: str, snapshot: str, model_name: str, reference: str = "") -> Optional[Tuple[int, str, str, str, str, str]]:
+    # 프로필 버전을 키에 넣어 페르소나가 수정되면 이전 답변을 쓰지 않는다. 참고 제품 데이터가 바뀌어도 마찬가지.
+    if not llm_cache.answers_enabled():
+        return None
+    version = persona_profile.get_profile(persona).version
+    return (persona.pk, version, llm_cache.normalize(user_input), snapshot or "", model_name, llm_cache.digest(reference))
+
+
+LLM_VERDICT_SOURCES = ("fused", "legacy")
+
+
+def _scope_verdict_row(user_input: str, preflight: Dict[str, Any], model_name: str, proba: Optional[float]):
+    if not (HAS_API_MODELS and preflight.get("source") in LLM_VERDICT_SOURCES):
+        return None
+    if not getattr(settings, "SCOPE_VERDICT_LOGGING", True):
+        return None
+    return ScopeVerdict(
+        utterance=(user_input or "")[:2000],
+        in_scope=bool(preflight["in_scope"]),
+        source=preflight["source"],
+        model_name=(model_name or "")[:50],
+        classifier_proba=proba,
+    )
+
+
+def _log_scope_verdict(user_input: str, preflight: Dict[str, Any], model_name: str, proba: Optional[float]) -> None:
+    row = _scope_verdict_row(user_input, preflight, model_name, proba)
+    if row is None:
+        return
+    try:
+        row.save()
+    except Exception:
+        pass
+
+
+async def _alog_scope_verdict(user_input: str, preflight: Dict[str, Any], model_name: str, proba: Optional[float]) -> None:
+    row = _scope_verdict_row(user_input, preflight, model_name, proba)
+    if row is None:
+        return
+    try:
+        await row.asave()
+    except Exception:
+        pass
+
+
+def _out_of_scope_reply(persona, user_input: str) -> Dict[str, Any]:
+    pref = _maybe_handle_food_preference(persona, user_input)
+    return {"reply": pref if pref else REFUSAL_TEXT}
+
+
+_SPECULATIVE_POOL: Optional[ThreadPoolExecutor] = None
+_SPECULATIVE_POOL_LOCK = threading.Lock()
+
+
+def _speculative_enabled() -> bool:
+    return bool(getattr(settings, "LLM_SPECULATIVE_ANSWER", False))
+
+
+def _get_speculative_pool() -> ThreadPoolExecutor:
+    global _SPECULATIVE_POOL
+    if _SPECULATIVE_POOL is None:
+        with _SPECULATIVE_POOL_LOCK:
+            if _SPECULATIVE_POOL is None:
+                workers = int(getattr(settings, "LLM_SPECULATIVE_WORKERS", 16) or 16)
+                _SPECULATIVE_POOL = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-speculative")
+    return _SPECULATIVE_POOL
+
+
 PRICE_RE = re.compile(r"(\d{1,3}(?:,\d{3})+|\d+)\s*원")
 
 
@@ -248,13 +532,18 @@ def _extract_prices(*texts: str) -> List[int]:
     return vals
 
 
+PRICE_DRINK_HINTS = ("우유", "요거트", "유제품", "음료", "주스", "생수", "커피", "차", "라떼")
+PRICE_SNACK_HINTS = ("과자", "쿠키", "스낵", "초콜릿", "시리얼", "빵")
+PRICE_MEAL_HINTS = ("햇반", "즉석밥", "hmr", "밀키트", "냉동", "통조림", "참치", "햄", "소시지", "반찬", "소스", "쌀")
+
+
 def _is_unrealistic_price(product_text: str, price: int) -> bool:
-    t = (product_text or "").lower()
-    if any(k in t for k in ("우유", "요거트", "유제품", "음료", "주스", "생수", "커피", "차", "라떼")):
+    hits = _keyword_hits(product_text)
+    if "price_drink" in hits:
         return price > 10000
-    if any(k in t for k in ("과자", "쿠키", "스낵", "초콜릿", "시리얼", "빵")):
+    if "price_snack" in hits:
         return price > 15000
-    if any(k in t for k in ("햇반", "즉석밥", "hmr", "밀키트", "냉동", "통조림", "참치", "햄", "소시지", "반찬", "소스", "쌀")):
+    if "price_meal" in hits:
         return price > 50000
     return price > 100000
 
@@ -271,9 +560,9 @@ def _price_guard_response(persona, product_hint: str, price: int) -> str:
     )
 
 
-def _apply_price_guard(persona, snapshot: str, user_input: str) -> Optional[str]:
+def _apply_price_guard(persona, snapshot: str, user_input: str, extra_prices: Optional[List[int]] = None) -> Optional[str]:
     product_hint = snapshot or user_input
-    prices = _extract_prices(snapshot, user_input)
+    prices = _extract_prices(snapshot, user_input) + list(extra_prices or [])
     if not prices:
         return None
     worst = max(prices)
@@ -291,45 +580,42 @@ BEV_HINTS = ("우유", "요거트", "라떼", "커피", "주스", "음료", "생
 HMR_HINTS = ("햇반", "즉석밥", "HMR", "밀키트", "냉동", "간편식")
 
 
+CATEGORY_PRIORITY = ("canned_ham", "canned_tuna", "sauce", "beverage", "hmr")
+
+
 def _product_category_from_text(text: str) -> str:
-    t = (text or "").lower()
-    if any(k in t for k in (h.lower() for h in HAM_HINTS)):
-        return "canned_ham"
-    if any(k in t for k in (h.lower() for h in TUNA_HINTS)):
-        return "canned_tuna"
-    if any(k in t for k in (h.lower() for h in SAUCE_HINTS)):
-        return "sauce"
-    if any(k in t for k in (h.lower() for h in BEV_HINTS)):
-        return "beverage"
-    if any(k in t for k in (h.lower() for h in HMR_HINTS)):
-        return "hmr"
+    hits = _keyword_hits(text)
+    for cat in CATEGORY_PRIORITY:
+        if cat in hits:
+            return cat
     return "default"
 
 
 def _household_bucket_from_tag(tag: str) -> str:
-    tag = (tag or "")
-    if any(x in tag for x in ("3인", "4인")):
-        return "small"
-    if any(x in tag for x in ("5인", "6인", "대가족")):
-        return "large"
-    if "2인" in tag:
-        return "small"
-    if "1인" in tag:
-        return "single"
-    return "single"
-
-
-TYPICAL_MONTHLY_RANGE = {
-    "canned_ham": {"single": (1, 4), "small": (2, 8)},
-    "canned_tuna": {"single": (2, 8), "small": (4, 12)},
-    "sauce": {"single": (1, 3), "small": (1, 5)},
-    "beverage": {"single": (2, 12), "small": (6, 24)},
-    "hmr": {"single": (2, 12), "small": (6, 24)},
-    "default": {"single": (1, 10), "small": (2, 12)},
-}
+    return persona_profile.household_bucket(tag)
+
+
+TYPICAL_MONTHLY_RANGE = demand_service.TYPICAL_MONTHLY_RANGE
+
+
+def _resolve_category(product_hint: str, fallback: Optional[str] = None) -> str:
+    cat = _product_category_from_text(product_hint)
+    if cat == "default" and fallback in TYPICAL_MONTHLY_RANGE:
+        return fallback
+    return cat
 
 
-def _apply_quantity_guard_text(product_hint: str, persona_tag: str, response_text: str) -> str:
+def _clamp_quantity(product_hint: str, persona_tag: str, n: int, category: Optional[str] = None) -> Tuple[int, str]:
+    cat = _resolve_category(product_hint, category)
+    low, high = demand_service.quantity_bounds(cat, _household_bucket_from_tag(persona_tag))
+    if n > high:
+        return high, f" (일반 가정 기준, {high}개로 잡아 설명 드렸어요)"
+    if n < low:
+        return low, f" (최소 사용량을 고려해 {low}개로 안내했어요)"
+    return n, ""
+
+
+def _apply_quantity_guard_text(product_hint: str, persona_tag: str, response_text: str, category: Optional[str] = None) -> str:
     if not response_text:
         return response_text
     m = FIRST_COUNT_PAT.search(response_text)
@@ -339,18 +625,7 @@ def _apply_quantity_guard_text(product_hint: str, persona_tag: str, response_tex
         n = int(m.group(1))
     except Exception:
         return response_text
-    cat = _product_category_from_text(product_hint)
-    hh = _household_bucket_from_tag(persona_tag)
-    low, high = TYPICAL_MONTHLY_RANGE.get(cat, TYPICAL_MONTHLY_RANGE["default"]).get(hh, (1, 10))
-    if hh == "large":
-        high = int(round(high * 1.5))
-    new_n, note = n, ""
-    if n > high:
-        new_n = high
-        note = f" (일반 가정 기준, {new_n}개로 잡아 설명 드렸어요)"
-    elif n < low:
-        new_n = low
-        note = f" (최소 사용량을 고려해 {new_n}개로 안내했어요)"
+    new_n, note = _clamp_quantity(product_hint, persona_tag, n, category)
     if new_n == n:
         return response_text
     adjusted = FIRST_COUNT_PAT.sub(lambda _: f"{new_n}개", response_text, count=1)
@@ -360,158 +635,135 @@ def _apply_quantity_guard_text(product_hint: str, persona_tag: str, response_tex
     return "\n".join(lines)
 
 
+class QuantityGuardStream:
+    """스트리밍 응답에 수량 가드를 점진적으로 적용한다.
+
+    응답 형식상 수량은 첫 줄에 오므로 첫 줄이 끝날 때까지만 버퍼링하고,
+    첫 줄의 수량을 보정한 뒤부터는 델타를 그대로 흘려보낸다.
+    """
+
+    def __init__(self, product_hint: str, persona_tag: str, category: Optional[str] = None):
+        self.product_hint = product_hint
+        self.persona_tag = persona_tag
+        self.category = category
+        self._buf = ""
+        self._passthrough = False
+
+    def feed(self, delta: str) -> str:
+        if self._passthrough:
+            return delta
+        self._buf += delta
+        if "\n" not in self._buf:
+            return ""
+        return self._release()
+
+    def flush(self) -> str:
+        if self._passthrough:
+            return ""
+        return self._release()
+
+    def _release(self) -> str:
+        self._passthrough = True
+        text, self._buf = self._buf, ""
+        head, sep, rest = text.partition("\n")
+        m = FIRST_COUNT_PAT.search(head)
+        if not m:
+            return text
+        n = int(m.group(1))
+        new_n, note = _clamp_quantity(self.product_hint, self.persona_tag, n, self.category)
+        if new_n == n:
+            return text
+        head = FIRST_COUNT_PAT.sub(lambda _: f"{new_n}개", head, count=1).rstrip() + note
+        return head + sep + rest
+
+
 def _build_system_prompt(persona) -> str:
-    name = _get_persona_name(persona)
-    tag = (getattr(persona, "persona_summary_tag", "") or "").strip()
-    sanity = """수량 현실화 규칙:
-- 기본 대상은 개인 또는 소가구(1~4인) B2C 소매. 특별히 말하지 않으면 이를 기준으로 답하라.
-- 카테고리별 1개월 권장 범위(개인/소가구):
-  · 통조림 햄/스팸/리챔: 개인 1~4개, 소가구 2~8개
-  · 참치캔: 개인 2~8개, 소가구 4~12개
-  · HMR·즉석밥·밀키트/냉동: 개인 2~12개, 소가구 6~24개
-  · 우유/요거트/음료: 개인 2~12개, 소가구 6~24개
-  · 소스/양념: 개인 1~3개, 소가구 1~5개
-- 위 범위를 크게 벗어나면 전제(행사/도매/기업구매/대가족/파티 등)를 밝히고 보수/기준/공격 3단계로 제시."""
-    style = """말투 가이드:
-- 보고서체 금지. 한국어로 부드럽고 자연스럽게, 문장 짧게. 필요하면 이모지 1개까지.
-- 굵게/하이픈/번호 서식 금지, 줄바꿈 또는 '·'만 사용.
-- 가격 질문은 심리가격대(스윗스팟) 범위로, 200g/340g 차등 함께 언급.
-- 반드시 1인칭(저/제/나는)으로, 전문가/도우미 자기소개 금지.
-- '너는 어떤 페르소나야/너는 어떤 소비자야/자기소개' 처럼 물을 때는 2~3문장 소개.
-- 가격이나 용량이 주어지면 단위가격(원/100g·ml)로 간단 비교. 없으면 억지 계산 금지.
-- 규격이 2가지 이상이면 가성비·보관성 기준으로 '규격 추천' 한 줄을 꼭 넣는다."""
-    format_guide = """응답 형식(자연어, 마크다운 서식 금지):
-1) 첫 줄: 저는 한 달에 N개(규격 기준)를 구매할 것 같아요!
-2) 내 기준(핵심 3~5줄):
-   · 취향/식단: 건강·간편/HMR·프리미엄 선호 등 내 취향을 한 줄
-   · 가구/생활: 1인·2인, 주간 요리 빈도
-   · 예산: 월 식료품 예산(모르면 '평균 예산 가정')과 가공식품 비중 10~20% 가정
-   · 가성비/규격: (가능하면) 단위가격 비교 예시 – 150g 2,000원 ≈ 1,333원/100g, 300g 3,200원 ≈ 1,067원/100g
-   · 규격 추천: 소용량/대용량 중 무엇을 왜 고르는지 한 줄
-3) 제품의 장점:
-   · 한 줄씩 2~3개
-4) 제품의 단점:
-   · 한 줄씩 2~3개
-5) 이렇게 되면 더 좋아요:
-   · 제품이 ~하면 더 좋아요(2~3개 제안)
-6) '사는 이유/안 사는 이유/가정·주의' 같은 표현은 사용하지 않는다."""
-    return (
-        f"역할: 너는 가상의 소비자 페르소나 '{name}'이다. 항상 1인칭으로 답하고, 내 취향/예산/가구 규모를 기준으로 현실적인 수량을 말한다.\n\n"
-        f"[내 설정(요약)]\n{tag}\n\n{sanity}\n\n{style}\n\n{format_guide}"
-    )
+    # 페르소나별로 컴파일해 둔 프롬프트를 재사용 (persona_profile)
+    return persona_profile.get_profile(persona).system_prompt
 
 
 def _get_persona_name(persona) -> str:
-    for field in ("name", "display_name", "nickname", "persona_name"):
-        val = getattr(persona, field, None)
-        if val:
-            return str(val)
-    tag = getattr(persona, "persona_summary_tag", "").strip()
-    if tag:
-        token = tag.split()[0]
-        if token and len(token) <= 6:
-            return token
-    return "마케팅 도우미"
+    return persona_profile.get_profile(persona).name
 
 
 def _maybe_handle_greeting(persona, user_input: str) -> Optional[str]:
     if not user_input:
         return None
     if GREETING_PAT.match(user_input.strip()):
-        name = _get_persona_name(persona)
-        return f"안녕하세요! 저는 {name}이에요! 식품 판매에 대한 질문을 해주실래요?"
+        return persona_profile.get_profile(persona).greeting_text
     return None
 
 
 SELF_INTRO_TRIGGERS = ("너는 누구", "누구야", "어떤 페르소나", "자기소개", "이름이 뭐", "프로필 알려줘", "정체가 뭐", "자기 소개", "어떤 소비자", "소비자야")
 
+COMPARE_HINTS = (" vs ", "vs", "대비", "비교")
+SENTIMENT_HINTS = ("좋아", "좋아해", "싫어", "싫어해", "어때")
+PREF_HAM_HINTS = ("햄", "리챔", "스팸", "런천미트", "캔햄")
+PREF_COFFEE_HINTS = ("커피", "라떼")
+PREF_CHOCO_HINTS = ("초코", "초콜릿")
+
+# 모든 휴리스틱 키워드를 import 시점에 한 번 컴파일한다. 텍스트 한 번 스캔으로 전 카테고리 히트를 얻는다.
+KEYWORDS = KeywordMatcher({
+    "food": FOOD_HINTS,
+    "intent": INTENT_HINTS,
+    "compare": COMPARE_HINTS,
+    "like": LIKE_TRIGGERS,
+    "dislike": DISLIKE_TRIGGERS,
+    "self_intro": SELF_INTRO_TRIGGERS,
+    "canned_ham": HAM_HINTS,
+    "canned_tuna": TUNA_HINTS,
+    "sauce": SAUCE_HINTS,
+    "beverage": BEV_HINTS,
+    "hmr": HMR_HINTS,
+    "price_drink": PRICE_DRINK_HINTS,
+    "price_snack": PRICE_SNACK_HINTS,
+    "price_meal": PRICE_MEAL_HINTS,
+    "sentiment": SENTIMENT_HINTS,
+    "tuna_word": ("참치",),
+    "pref_ham": PREF_HAM_HINTS,
+    "pref_coffee": PREF_COFFEE_HINTS,
+    "pref_choco": PREF_CHOCO_HINTS,
+})
+
+
+@lru_cache(maxsize=4096)
+def _scan_keywords(t: str) -> FrozenSet[str]:
+    return KEYWORDS.scan(t)
+
+
+def _keyword_hits(text: str) -> FrozenSet[str]:
+    # 같은 발화가 한 턴에 여러 휴리스틱(히스토리 필터 포함)을 거치므로 스캔 결과를 캐시한다.
+    return _scan_keywords((text or "").lower())
+
 
 def _maybe_handle_persona_intro(persona, user_input: str) -> Optional[str]:
     if not user_input:
         return None
     t = (user_input or "").strip().lower()
-    if not any(key in t for key in SELF_INTRO_TRIGGERS):
+    if "self_intro" not in _keyword_hits(t):
         return None
-    name = _get_persona_name(persona)
-    tag = getattr(persona, "persona_summary_tag", "") or ""
-    def pick(patterns: List[str], text: str) -> Optional[str]:
-        for p in patterns:
-            if p in text:
-                return p
-        return None
-    ages = ["10대", "20대", "30대", "40대", "50대", "60대", "60대 이상"]
-    genders = ["여자", "남자"]
-    households = ["1인 가구", "2인 가구", "3인 가구", "4인 가구", "대가족"]
-    regions = [
-        "서울", "부산", "대구", "인천", "광주", "대전", "울산", "세종", "경기", "강원", "충북", "충남", "전북", "전남", "경북", "경남", "제주",
-        "서울특별시", "부산광역시", "대구광역시", "인천광역시", "광주광역시", "대전광역시", "울산광역시", "세종특별자치시",
-    ]
-    age = pick(ages, tag) or ""
-    gender = pick(genders, tag) or ""
-    household = pick(households, tag) or ""
-    region = pick(regions, tag) or ""
-    h = ("건강" in tag)
-    c = ("편의" in tag) or ("간편" in tag) or ("hmr" in tag) or ("HMR" in tag)
-    premium = ("프리미엄" in tag) or ("품질" in tag)
-    low_price = ("가격" in tag and ("구애받지 않" in tag or ("민감" in tag and ("낮" in tag or "적" in tag)))) or premium
-    parts: List[str] = []
-    if h and c:
-        parts.append("건강·편의 선호가 높고")
-    elif h:
-        parts.append("건강을 특히 중시하고")
-    elif c:
-        parts.append("편의를 특히 중시하고")
-    parts.append("가격 민감도는 낮아 품질을 봐요" if low_price else "가격에도 민감한 편이에요")
-    trait = " ".join(parts)
-    who = f"{region + '에 사는 ' if region else ''}{age}{(' ' + gender) if gender else ''}{(' ' + household) if household else ''}".strip()
-    if who:
-        who += "의 "
-    return f"저는 {who}{name}이고, {trait}."
+    return persona_profile.get_profile(persona).intro_text
 
 
 def _has_purchase_intent(text: str) -> bool:
     t = (text or "").lower()
-    return any(k in t for k in INTENT_HINTS) or bool(NUM_PAT.search(t))
+    return "intent" in _keyword_hits(t) or bool(NUM_PAT.search(t))
 
 
 def _parse_persona_traits(tag: str) -> Dict[str, float]:
-    vals: Dict[str, float] = {}
-    src = tag or ""
-    def _num_after_colon(start_idx: int) -> Optional[float]:
-        cpos = src.find(":", start_idx)
-        if cpos == -1:
-            return None
-        i = cpos + 1
-        n = len(src)
-        while i < n and src[i].isspace():
-            i += 1
-        j = i
-        allowed = "0123456789."
-        while j < n and src[j] in allowed:
-            j += 1
-        try:
-            return float(src[i:j])
-        except Exception:
-            return None
-    for key in ("brand_loyalty", "cooking_convenience", "health_orientation", "hmr_preference", "premium_orientation", "price_sensitivity", "variety_seeking"):
-        kpos = src.find(key)
-        if kpos != -1:
-            v = _num_after_colon(kpos + len(key))
-            if v is not None:
-                vals[key] = v
-    return vals
+    return persona_profile.parse_traits(tag)
 
 
 def _maybe_handle_food_preference(persona, user_input: str) -> Optional[str]:
     t = (user_input or "").strip().lower()
     if _has_purchase_intent(t):
         return None
-    tag = getattr(persona, "persona_summary_tag", "") or ""
-    tr = _parse_persona_traits(tag)
+    tr = persona_profile.get_profile(persona).traits
+    hits = _keyword_hits(t)
     health = tr.get("health_orientation", 0.5)
     hmr = tr.get("hmr_preference", 0.5)
     premium = tr.get("premium_orientation", 0.5)
-    if any(k in t for k in LIKE_TRIGGERS) or LIKE_RE.search(t):
+    if "like" in hits or LIKE_RE.search(t):
         picks = []
         if health >= 0.6:
             picks.append("샐러드나 그릴드 같은 담백한 메뉴")
@@ -523,74 +775,327 @@ def _maybe_handle_food_preference(persona, user_input: str) -> Optional[str]:
             picks.append("집에서 손쉽게 준비할 수 있는 편한 메뉴")
         extra = " 바쁠 땐 HMR도 자주 골라요." if hmr >= 0.6 else ""
         return f"저는 {', '.join(picks)}를 좋아해요.{extra}"
-    if any(k in t for k in DISLIKE_TRIGGERS) or DISLIKE_RE.search(t):
+    if "dislike" in hits or DISLIKE_RE.search(t):
         base = "너무 달거나 기름진 음식, 짠맛이 강한 가공육" if health >= 0.6 else "특별히 가리는 건 많지 않아요"
         return f"저는 {base}는 잘 안 먹어요."
-    sentiment = any(k in t for k in ("좋아", "좋아해", "싫어", "싫어해", "어때"))
-    if sentiment and "참치" in t:
+    sentiment = "sentiment" in hits
+    if sentiment and "tuna_word" in hits:
         note = "저염/물담금이나 올리브오일 타입으로 골라요" if health >= 0.6 else "가성비 좋은 제품이면 괜찮아요"
         qual = "좋아해요" if health >= 0.4 else "가끔 먹어요"
         return f"저는 캔 참치 {qual}. {note}."
-    if sentiment and any(k in t for k in ("햄", "리챔", "스팸", "런천미트", "캔햄")):
+    if sentiment and "pref_ham" in hits:
         return "가끔은 먹지만 저염/저지방 위주로 골라요. 일상적으로는 많이 찾진 않아요." if health >= 0.6 else "가끔 간단한 요리에 쓰는 편이에요."
-    if sentiment and any(k in t for k in ("커피", "라떼")):
+    if sentiment and "pref_coffee" in hits:
         return "커피는 좋아해요. 다만 너무 달지 않은 걸로 마셔요." if health >= 0.6 else "커피 좋아해요! 달달한 라떼도 가끔 즐겨요."
-    if sentiment and any(k in t for k in ("초코", "초콜릿")):
+    if sentiment and "pref_choco" in hits:
         return "초콜릿은 좋아하지만, 보통은 다크로 조금만 먹어요." if health >= 0.6 else "초콜릿 좋아해요. 기분전환용으로 자주 먹는 편이에요."
     return None
 
 
-def _get_llm_response_impl(
-    persona_id: int,
-    user_input: str,
-    model_name: str = "gpt-4o-mini",
-    thread_id: Optional[int] = None,
-    max_history: int = 16,
-    assume_view_pre_saved_user: bool = True,
-) -> str:
-    client, APIError = _get_openai_client()
-    try:
-        pid = int(persona_id)
-    except Exception:
-        return "페르소나 정보를 찾을 수 없습니다."
-    persona = persona_service.get_persona_by_id(pid)
-    if not persona:
-        return "페르소나 정보를 찾을 수 없습니다."
-    greet = _maybe_handle_greeting(persona, user_input)
-    if greet:
-        return greet
-    intro = _maybe_handle_persona_intro(persona, user_input)
-    if intro:
-        return intro
-    in_scope = _is_in_scope_food(user_input, thread_id, client, model_name)
-    if not in_scope:
-        pref = _maybe_handle_food_preference(persona, user_input)
-        return pref if pref else REFUSAL_TEXT
-    snapshot = _extract_context_snapshot(client, model_name, thread_id, user_input)
-    guard = _apply_price_guard(persona, snapshot, user_input)
-    if guard:
-        return guard
-    system_prompt = _build_system_prompt(persona)
+LLM_DELAY_TEXT = "잠시 응답이 지연되고 있어요. 제품명과 기간/가격/프로모션 조건을 한 줄로 알려주시면 바로 추정해드릴게요."
+
+
+def _build_main_messages(
+    system_prompt: str, snapshot: str, history: List[Dict[str, str]], user_input: str,
+    assume_view_pre_saved_user: bool = True, reference: str = "", estimate: str = "",
+) -> List[Dict[str, str]]:
     messages: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
     if snapshot:
         messages.append({"role": "system", "content": f"[컨텍스트 스냅샷]\n{snapshot}"})
-    history = _load_history_messages(thread_id, limit=max_history)
+    if reference:
+        messages.append({"role": "system", "content": f"[참고 제품 데이터]\n{reference}"})
+    if estimate:
+        messages.append({"role": "system", "content": f"[수요 추정]\n{estimate}"})
     messages.extend(history)
     if not assume_view_pre_saved_user or not history or history[-1]["role"] != "user" or history[-1]["content"] != user_input:
         messages.append({"role": "user", "content": user_input})
+    return messages
+
+
+MAIN_MAX_TOKENS = 900
+
+
+def _budgeted_main_messages(
+    profile, snapshot: str, rows, user_input: str, assume_view_pre_saved_user: bool, model_name: str,
+    reference: str = "", estimate: str = "",
+) -> List[Dict[str, str]]:
+    # 시스템 프롬프트 + 스냅샷 + 참고 제품 데이터 + 수요 추정 + 최신 발화 + 답변 예약분을 먼저 잡고, 남는 토큰만큼 최신 히스토리부터 채운다.
+    fixed = profile.prompt_tokens + token_budget.fixed_tokens(
+        _build_main_messages("", snapshot, [], user_input, False, reference, estimate), model_name,
+    )
+    available = token_budget.prompt_budget(model_name, MAIN_MAX_TOKENS) - fixed
+    picked = token_budget.fit_rows(_eligible_history_rows(rows), available) if available > 0 else []
+    history = _history_messages_from_rows(picked)
+    return _build_main_messages(profile.system_prompt, snapshot, history, user_input, assume_view_pre_saved_user, reference, estimate)
+
+
+def _reference_query(user_input: str, history_text: str) -> str:
+    # 후속 질문('3,000원이면?')도 논의 중인 제품을 찾도록 최근 대화 꼬리를 함께 검색한다.
+    return f"{history_text[-300:]} {user_input}".strip()
+
+
+def _demand_conditions(user_input: str, snapshot: str, category: Optional[str], prices: List[int]) -> Tuple[str, Optional[int], bool]:
+    # 가격은 이번 발화에 나온 값을 우선하고, 없으면 스냅샷/사전 점검에서 가장 최근 값을 쓴다.
+    cat = _resolve_category(snapshot or user_input, category)
+    known = _extract_prices(user_input) or _extract_prices(snapshot) + list(prices or [])
+    price = known[-1] if known else None
+    return cat, price, demand_service.has_promotion(f"{snapshot} {user_input}")
+
+
+def _needs_demand_note(user_input: str) -> bool:
+    """질문만 보고도 수량 질문이면 추측 실행하지 않는다 (guided/fast 는 사전 점검 결과로 추정값을 만들어야 함)."""
+    return demand_service.quantity_mode() != "llm" and demand_service.is_quantity_question(user_input)
+
+
+# 함수명 : _demand_estimate
+# input : profile(PersonaProfile), user_input, snapshot, category(사전 점검 카테고리), prices(사전 점검 가격)
+# output : demand_service.Estimate (수량 질문이 아니거나 LLM_QUANTITY_MODE=llm 이면 None)
+def _demand_estimate(profile, user_input: str, snapshot: str, category: Optional[str], prices: List[int]):
+    if demand_service.quantity_mode() == "llm":
+        return None
+    asked = _extract_prices(user_input)
+    if not (demand_service.is_quantity_question(user_input) or (asked and demand_service.is_quantity_question(snapshot))):
+        return None
+    with telemetry.span("demand"):
+        cat, price, promotion = _demand_conditions(user_input, snapshot, category, prices)
+        return demand_service.estimate_profile(profile, cat, price, promotion)
+
+
+def _main_request(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    return {"messages": messages, "temperature": 0.25, "max_tokens": MAIN_MAX_TOKENS}
+
+
+def _complete_main(client, APIError, model_name: str, messages: List[Dict[str, str]]) -> Optional[str]:
     try:
-        resp = client.chat.completions.create(
-            model=model_name, messages=messages, temperature=0.25, max_tokens=900,
-        )
-        text = (resp.choices[0].message.content or "").strip()
+        resp = _llm_create(client, "main", model_name, _main_request(messages))
+        return (resp.choices[0].message.content or "").strip()
     except APIError:
-        return "잠시 응답이 지연되고 있어요. 제품명과 기간/가격/프로모션 조건을 한 줄로 알려주시면 바로 추정해드릴게요."
+        return None
     except Exception as e:
         raise Exception(f"LLM 응답을 가져오는 중 에러가 발생했습니다: {e}") from e
-    persona_tag = getattr(persona, "persona_summary_tag", "") or ""
-    product_hint = snapshot or user_input
-    text = _apply_quantity_guard_text(product_hint, persona_tag, text)
-    return text
+
+
+def _stream_main(
+    client, APIError, model_name: str, messages: List[Dict[str, str]], status: Optional[Dict[str, bool]] = None,
+) -> Iterator[str]:
+    # status 를 넘기면 스트림이 오류 없이 끝났을 때 status["complete"] = True (답변 캐시 저장 여부 판단용)
+    emitted = False
+    usage = None
+    start = time.perf_counter()
+    try:
+        with telemetry.span("main_stream", model_name) as fields:
+            stream = rate_limiter.create(
+                client, model_name, dict(_main_request(messages), stream=True, stream_options={"include_usage": True}),
+            )
+            for chunk in stream:
+                usage = getattr(chunk, "usage", None) or usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                if not emitted:
+                    delta = delta.lstrip()
+                if delta:
+                    if not emitted:
+                        fields["ttft_ms"] = round((time.perf_counter() - start) * 1000.0, 2)
+                    emitted = True
+                    yield delta
+        telemetry.record_usage("main_stream", model_name, usage)
+        if status is not None:
+            status["complete"] = True
+    except APIError:
+        if not emitted:
+            yield LLM_DELAY_TEXT
+    except Exception as e:
+        raise Exception(f"LLM 응답을 가져오는 중 에러가 발생했습니다: {e}") from e
+
+
+PERSONA_NOT_FOUND_TEXT = "페르소나 정보를 찾을 수 없습니다."
+
+
+# 아래 _turn_* 함수들은 _prepare_turn / _aprepare_turn 이 같이 쓰는 판단 단계다 (I/O 없음).
+# 두 함수는 페르소나/히스토리/RAG 조회, 사전 점검 호출, 판정 로그 저장 같은 I/O 만 각자 방식(동기/await)으로 한다.
+def _turn_local_reply(persona, user_input: str) -> Tuple[Optional[Dict[str, Any]], Optional[bool], Optional[float]]:
+    """인사/자기소개/로컬 분류기로 바로 답할 수 있으면 (답변, 판정, 확률), 아니면 (None, 판정, 확률)."""
+    greet = _maybe_handle_greeting(persona, user_input)
+    if greet:
+        return {"reply": greet}, None, None
+    intro = _maybe_handle_persona_intro(persona, user_input)
+    if intro:
+        return {"reply": intro}, None, None
+    with telemetry.span("classifier"):
+        local_verdict, local_proba = scope_classifier.decide(user_input)
+    if local_verdict is False:
+        return _out_of_scope_reply(persona, user_input), local_verdict, local_proba
+    return None, local_verdict, local_proba
+
+
+def _turn_speculative_messages(
+    concurrent: bool, profile, rows, user_input: str, assume_view_pre_saved_user: bool, model_name: str, reference: str,
+) -> Optional[List[Dict[str, str]]]:
+    """추측 실행할 본 답변 메시지 (스냅샷 없음). 추측 실행하지 않으면 None."""
+    if not concurrent or _needs_demand_note(user_input):
+        return None
+    return _budgeted_main_messages(profile, "", rows, user_input, assume_view_pre_saved_user, model_name, reference)
+
+
+def _turn_cached_preflight(rolling, rows, user_input: str, local_verdict: Optional[bool], model_name: str, history_text: str):
+    """(누적 요약 또는 캐시의 사전 점검 결과 | None, 캐시 키). None 이면 호출 후 캐시 키로 저장한다."""
+    preflight = _summary_preflight(rolling, rows, user_input, local_verdict)
+    if preflight is not None:
+        return preflight, None
+    cache_key = _preflight_cache_key(model_name, user_input, history_text)
+    return _cached_preflight(cache_key), cache_key
+
+
+# 함수명 : _turn_after_preflight
+# input : 사전 점검 결과와 본 답변에 필요한 값들, speculative(추측 실행 중인 Future/Task 또는 None)
+# output : {"reply": ...} (바로 답변) 또는 본 답변 호출 정보 dict
+# 함수 설명 : OUT 판정 → 가격 가드 → 수요 추정(fast 면 바로 답변) → 답변 캐시 → 본 답변 메시지 조립.
+#               바로 답하거나 추측 답변을 쓸 수 없으면 speculative 를 cancel 한다.
+def _turn_after_preflight(
+    client, APIError, persona, profile, preflight: Dict[str, Any], rows, user_input: str, model_name: str,
+    reference: str, assume_view_pre_saved_user: bool, speculative, messages,
+) -> Dict[str, Any]:
+    def short_circuit(reply: Dict[str, Any]) -> Dict[str, Any]:
+        if speculative is not None:
+            speculative.cancel()
+        return reply
+
+    if not preflight["in_scope"]:
+        return short_circuit(_out_of_scope_reply(persona, user_input))
+    snapshot = preflight["snapshot"]
+    guard = _apply_price_guard(persona, snapshot, user_input, preflight["prices"])
+    if guard:
+        return short_circuit({"reply": guard})
+    estimate = _demand_estimate(profile, user_input, snapshot, preflight["category"], preflight["prices"])
+    if estimate is not None and demand_service.quantity_mode() == "fast":
+        # 수량 질문은 로컬 추정으로 바로 답한다 (메인 LLM 호출 없음).
+        return short_circuit({"reply": demand_service.render_answer(profile, estimate)})
+    if estimate is not None and speculative is not None:
+        # 스냅샷으로 수량 질문임이 드러난 경우: 추측 답변에는 [수요 추정] 블록이 없으므로 버리고 다시 만든다.
+        speculative.cancel()
+        speculative = None
+    answer_key = _answer_cache_key(persona, user_input, snapshot, model_name, reference)
+    cached = llm_cache.get("answer", answer_key)
+    if cached is not llm_cache.MISS:
+        return short_circuit({"reply": cached})
+    if speculative is None:
+        note = demand_service.prompt_note(estimate) if estimate is not None else ""
+        messages = _budgeted_main_messages(profile, snapshot, rows, user_input, assume_view_pre_saved_user, model_name, reference, note)
+    return {
+        "client": client,
+        "APIError": APIError,
+        "model_name": model_name,
+        "messages": messages,
+        "speculative": speculative,
+        "product_hint": snapshot or user_input,
+        "persona_tag": getattr(persona, "persona_summary_tag", "") or "",
+        "category": preflight["category"],
+        # 추측 실행 답변은 스냅샷 없이 만든 것이라 스냅샷 키로 캐시하면 다른 맥락의 질문에 잘못 재사용된다.
+        "answer_key": answer_key if speculative is None else None,
+    }
+
+
+def _prepare_turn(
+    persona_id: int,
+    user_input: str,
+    model_name: str,
+    thread_id: Optional[int],
+    max_history: Optional[int],
+    assume_view_pre_saved_user: bool,
+    allow_speculative: bool = True,
+) -> Dict[str, Any]:
+    client, APIError = _get_openai_client()
+    pid = _to_int_or_none(persona_id)
+    if pid is None:
+        return {"reply": PERSONA_NOT_FOUND_TEXT}
+    with telemetry.span("persona"):
+        persona = persona_service.get_persona_by_id(pid)
+    if not persona:
+        return {"reply": PERSONA_NOT_FOUND_TEXT}
+    reply, local_verdict, local_proba = _turn_local_reply(persona, user_input)
+    if reply is not None:
+        return reply
+    # DB 조회는 요청 스레드에서 한 번만 하고(스니펫/메인 히스토리 공유), 워커 스레드에는 네트워크 호출만 넘긴다.
+    with telemetry.span("history"):
+        rows = _load_history_rows(thread_id, max_history)
+        rolling = summary_service.load_state(thread_id)
+    history_text = _preflight_history_text(rolling, rows)
+    profile = persona_profile.get_profile(persona)
+    reference = rag_service.get_rag_context(_reference_query(user_input, history_text), getattr(persona, "segment", None))
+    pool = _get_speculative_pool() if allow_speculative and _speculative_enabled() else None
+    messages = _turn_speculative_messages(pool is not None, profile, rows, user_input, assume_view_pre_saved_user, model_name, reference)
+    speculative = None
+    if messages is not None:
+        speculative = pool.submit(telemetry.bind(_complete_main), client, APIError, model_name, messages)
+    with telemetry.span("preflight_total", model_name) as fields:
+        preflight, cache_key = _turn_cached_preflight(rolling, rows, user_input, local_verdict, model_name, history_text)
+        if preflight is None:
+            preflight = _run_preflight(client, model_name, thread_id, user_input, history_text, pool, local_verdict)
+            _store_preflight(cache_key, preflight)
+        fields["source"] = preflight["source"]
+    _log_scope_verdict(user_input, preflight, model_name, local_proba)
+    return _turn_after_preflight(
+        client, APIError, persona, profile, preflight, rows, user_input, model_name,
+        reference, assume_view_pre_saved_user, speculative, messages,
+    )
+
+
+def _get_llm_response_impl(
+    persona_id: int,
+    user_input: str,
+    model_name: str = "gpt-4o-mini",
+    thread_id: Optional[int] = None,
+    max_history: Optional[int] = None,
+    assume_view_pre_saved_user: bool = True,
+) -> str:
+    with telemetry.span("turn", model_name) as fields:
+        turn = _prepare_turn(persona_id, user_input, model_name, thread_id, max_history, assume_view_pre_saved_user)
+        if "reply" in turn:
+            fields["path"] = "short_circuit"
+            return turn["reply"]
+        if turn["speculative"] is not None:
+            with telemetry.span("speculative_wait", model_name):
+                text = turn["speculative"].result()
+        else:
+            text = _complete_main(turn["client"], turn["APIError"], model_name, turn["messages"])
+        if text is None:
+            return LLM_DELAY_TEXT
+        text = _apply_quantity_guard_text(turn["product_hint"], turn["persona_tag"], text, turn["category"])
+        llm_cache.put("answer", turn["answer_key"], text)
+        return text
+
+
+def stream_llm_response(
+    persona_id: int,
+    user_input: str,
+    model_name: str = "gpt-4o-mini",
+    thread_id: Optional[int] = None,
+    max_history: Optional[int] = None,
+    assume_view_pre_saved_user: bool = True,
+) -> Iterator[str]:
+    with telemetry.span("prepare", model_name):
+        turn = _prepare_turn(
+            persona_id, user_input, model_name, thread_id, max_history, assume_view_pre_saved_user,
+            allow_speculative=False,
+        )
+    if "reply" in turn:
+        yield turn["reply"]
+        return
+    guard = QuantityGuardStream(turn["product_hint"], turn["persona_tag"], turn["category"])
+    status: Dict[str, bool] = {}
+    parts: List[str] = []
+    for delta in _stream_main(turn["client"], turn["APIError"], model_name, turn["messages"], status):
+        out = guard.feed(delta)
+        if out:
+            parts.append(out)
+            yield out
+    tail = guard.flush().rstrip()
+    if tail:
+        parts.append(tail)
+        yield tail
+    if status.get("complete") and parts:
+        llm_cache.put("answer", turn["answer_key"], "".join(parts))
 
 
 def _to_int_or_none(x) -> Optional[int]:
@@ -633,3 +1138,200 @@ def get_llm_response(*args, **kwargs):
         thread_id = kwargs.get("thread_id") or _extract_thread_id_from_request(request)
         return _get_llm_response_impl(persona_id, user_input, model_name, thread_id)
     return _get_llm_response_impl(*args, **kwargs)
+
+
+async def _ais_in_scope_food(client, model_name: str, user_input: str, history: str) -> bool:
+    try:
+        res = await _allm_create(client, "scope", model_name, _scope_decider_request(history, user_input))
+        val = _parse_yes_no(res.choices[0].message.content)
+    except Exception:
+        val = None
+    if val is not None:
+        return val
+    if _heuristic_food_in_scope(user_input):
+        return True
+    try:
+        res = await _allm_create(client, "scope", model_name, _classify_request(user_input))
+        return _parse_yes_no(res.choices[0].message.content) is True
+    except Exception:
+        return False
+
+
+async def _aextract_context_snapshot(client, model_name: str, user_input: str, history: str) -> str:
+    try:
+        resp = await _allm_create(client, "snapshot", model_name, _snapshot_request(history, user_input))
+        return (resp.choices[0].message.content or "").strip()
+    except Exception:
+        return ""
+
+
+async def _arun_preflight(
+    client, model_name: str, user_input: str, history: str, concurrent: bool = False,
+    known_in_scope: Optional[bool] = None,
+) -> Dict[str, Any]:
+    if known_in_scope:
+        snapshot = await _aextract_context_snapshot(client, model_name, user_input, history)
+        return {"in_scope": True, "snapshot": snapshot, "prices": [], "category": "default", "source": "classifier"}
+    if _preflight_mode() == "fused":
+        try:
+            res = await _allm_create(client, "preflight", model_name, _preflight_request(history, user_input))
+            result = _parse_preflight(res.choices[0].message.content)
+        except Exception:
+            result = None
+        if result is not None:
+            return result
+    if concurrent:
+        snap_task = asyncio.ensure_future(_aextract_context_snapshot(client, model_name, user_input, history))
+        in_scope = await _ais_in_scope_food(client, model_name, user_input, history)
+        if not in_scope:
+            snap_task.cancel()
+        snapshot = await snap_task if in_scope else ""
+    else:
+        in_scope = await _ais_in_scope_food(client, model_name, user_input, history)
+        snapshot = await _aextract_context_snapshot(client, model_name, user_input, history) if in_scope else ""
+    return {"in_scope": in_scope, "snapshot": snapshot, "prices": [], "category": "default", "source": "legacy"}
+
+
+async def _acomplete_main(client, APIError, model_name: str, messages: List[Dict[str, str]]) -> Optional[str]:
+    try:
+        resp = await _allm_create(client, "main", model_name, _main_request(messages))
+        return (resp.choices[0].message.content or "").strip()
+    except APIError:
+        return None
+    except Exception as e:
+        raise Exception(f"LLM 응답을 가져오는 중 에러가 발생했습니다: {e}") from e
+
+
+async def _astream_main(
+    client, APIError, model_name: str, messages: List[Dict[str, str]], status: Optional[Dict[str, bool]] = None,
+) -> AsyncIterator[str]:
+    # status 를 넘기면 스트림이 오류 없이 끝났을 때 status["complete"] = True (답변 캐시 저장 여부 판단용)
+    emitted = False
+    usage = None
+    start = time.perf_counter()
+    try:
+        with telemetry.span("main_stream", model_name) as fields:
+            stream = await rate_limiter.acreate(
+                client, model_name, dict(_main_request(messages), stream=True, stream_options={"include_usage": True}),
+            )
+            async for chunk in stream:
+                usage = getattr(chunk, "usage", None) or usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                if not emitted:
+                    delta = delta.lstrip()
+                if delta:
+                    if not emitted:
+                        fields["ttft_ms"] = round((time.perf_counter() - start) * 1000.0, 2)
+                    emitted = True
+                    yield delta
+        telemetry.record_usage("main_stream", model_name, usage)
+        if status is not None:
+            status["complete"] = True
+    except APIError:
+        if not emitted:
+            yield LLM_DELAY_TEXT
+    except Exception as e:
+        raise Exception(f"LLM 응답을 가져오는 중 에러가 발생했습니다: {e}") from e
+
+
+async def _aprepare_turn(
+    persona_id: int,
+    user_input: str,
+    model_name: str,
+    thread_id: Optional[int],
+    max_history: Optional[int],
+    assume_view_pre_saved_user: bool,
+    allow_speculative: bool = True,
+) -> Dict[str, Any]:
+    client, APIError = _get_async_openai_client()
+    pid = _to_int_or_none(persona_id)
+    if pid is None:
+        return {"reply": PERSONA_NOT_FOUND_TEXT}
+    with telemetry.span("persona"):
+        persona = await persona_service.aget_persona_by_id(pid)
+    if not persona:
+        return {"reply": PERSONA_NOT_FOUND_TEXT}
+    reply, local_verdict, local_proba = _turn_local_reply(persona, user_input)
+    if reply is not None:
+        return reply
+    with telemetry.span("history"):
+        rows = await _aload_history_rows(thread_id, max_history)
+        rolling = await summary_service.aload_state(thread_id)
+    history_text = _preflight_history_text(rolling, rows)
+    profile = persona_profile.get_profile(persona)
+    reference = await rag_service.aget_rag_context(_reference_query(user_input, history_text), getattr(persona, "segment", None))
+    concurrent = allow_speculative and _speculative_enabled()
+    messages = _turn_speculative_messages(concurrent, profile, rows, user_input, assume_view_pre_saved_user, model_name, reference)
+    speculative = None
+    if messages is not None:
+        speculative = asyncio.create_task(_acomplete_main(client, APIError, model_name, messages))
+    with telemetry.span("preflight_total", model_name) as fields:
+        preflight, cache_key = _turn_cached_preflight(rolling, rows, user_input, local_verdict, model_name, history_text)
+        if preflight is None:
+            preflight = await _arun_preflight(client, model_name, user_input, history_text, concurrent, local_verdict)
+            _store_preflight(cache_key, preflight)
+        fields["source"] = preflight["source"]
+    await _alog_scope_verdict(user_input, preflight, model_name, local_proba)
+    return _turn_after_preflight(
+        client, APIError, persona, profile, preflight, rows, user_input, model_name,
+        reference, assume_view_pre_saved_user, speculative, messages,
+    )
+
+
+async def aget_llm_response(
+    persona_id: int,
+    user_input: str,
+    model_name: str = "gpt-4o-mini",
+    thread_id: Optional[int] = None,
+    max_history: Optional[int] = None,
+    assume_view_pre_saved_user: bool = True,
+) -> str:
+    with telemetry.span("turn", model_name) as fields:
+        turn = await _aprepare_turn(persona_id, user_input, model_name, thread_id, max_history, assume_view_pre_saved_user)
+        if "reply" in turn:
+            fields["path"] = "short_circuit"
+            return turn["reply"]
+        if turn["speculative"] is not None:
+            with telemetry.span("speculative_wait", model_name):
+                text = await turn["speculative"]
+        else:
+            text = await _acomplete_main(turn["client"], turn["APIError"], model_name, turn["messages"])
+        if text is None:
+            return LLM_DELAY_TEXT
+        text = _apply_quantity_guard_text(turn["product_hint"], turn["persona_tag"], text, turn["category"])
+        llm_cache.put("answer", turn["answer_key"], text)
+        return text
+
+
+async def astream_llm_response(
+    persona_id: int,
+    user_input: str,
+    model_name: str = "gpt-4o-mini",
+    thread_id: Optional[int] = None,
+    max_history: Optional[int] = None,
+    assume_view_pre_saved_user: bool = True,
+) -> AsyncIterator[str]:
+    with telemetry.span("prepare", model_name):
+        turn = await _aprepare_turn(
+            persona_id, user_input, model_name, thread_id, max_history, assume_view_pre_saved_user,
+            allow_speculative=False,
+        )
+    if "reply" in turn:
+        yield turn["reply"]
+        return
+    guard = QuantityGuardStream(turn["product_hint"], turn["persona_tag"], turn["category"])
+    status: Dict[str, bool] = {}
+    parts: List[str] = []
+    async for delta in _astream_main(turn["client"], turn["APIError"], model_name, turn["messages"], status):
+        out = guard.feed(delta)
+        if out:
+            parts.append(out)
+            yield out
+    tail = guard.flush().rstrip()
+    if tail:
+        parts.append(tail)
+        yield tail
+    if status.get("complete") and parts:
+        llm_cache.put("answer", turn["answer_key"], "".join(parts))
@@ -0,0 +1,350 @@
+# api/services/llm_transport.py
+# OpenAI 클라이언트(httpx) 아래에 끼우는 기록/재생 트랜스포트.
+#   - passthrough : 그대로 통과 (기본값)
+#   - record      : 요청/응답(메시지, 모델, 파라미터, usage, 지연)을 JSONL 로 남긴다.
+#                   버퍼에 모았다가 묶어서 쓰고, 파일이 LLM_RECORD_MAX_BYTES 를 넘으면 새 파일로 넘긴다.
+#   - replay      : 기록 파일에서 같은 요청(본문 해시)의 응답을 네트워크 없이 돌려준다.
+#                   같은 요청이 여러 번 기록돼 있으면 기록 순서대로 돌아가며 내준다 (결정적).
+# 기록은 워커 프로세스별 파일(llm-<pid>-<시각>-<번호>.jsonl)로 나눠 여러 워커가 섞어 쓰지 않게 한다.
+from __future__ import annotations
+
+import atexit
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+from django.conf import settings
+
+MODES = ("passthrough", "record", "replay")
+# 본문에서 응답에 영향을 주지 않는 필드 (재생 매칭 키에서 뺀다)
+VOLATILE_FIELDS = ("user", "metadata", "store")
+
+_lock = threading.Lock()
+_writer: Optional["RecordWriter"] = None
+_store: Optional["ReplayStore"] = None
+
+
+def _setting(name: str, default):
+    val = getattr(settings, name, None)
+    return default if val is None else val
+
+
+def mode() -> str:
+    val = str(_setting("LLM_TRANSPORT_MODE", "passthrough") or "passthrough").strip().lower()
+    return val if val in MODES else "passthrough"
+
+
+def record_dir() -> str:
+    return str(_setting("LLM_RECORD_DIR", os.path.join(str(settings.BASE_DIR), "var", "llm_records")))
+
+
+def request_key(method: str, path: str, body: Dict[str, Any]) -> str:
+    """재생 매칭 키: 메서드 + 경로 + 정렬된 요청 본문의 해시."""
+    data = {k: v for k, v in body.items() if k not in VOLATILE_FIELDS}
+    raw = json.dumps([method.upper(), path, data], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _parse_body(content: bytes) -> Dict[str, Any]:
+    try:
+        data = json.loads(content or b"{}")
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _extract_usage(content_type: str, text: str) -> Optional[Dict[str, Any]]:
+    if "text/event-stream" in content_type:
+        # 스트리밍은 include_usage 가 켜져 있으면 마지막 청크에 usage 가 온다.
+        for line in reversed(text.splitlines()):
+            if line.startswith("data:") and '"usage"' in line:
+                try:
+                    return json.loads(line[5:].strip()).get("usage")
+                except ValueError:
+                    return None
+        return None
+    try:
+        data = json.loads(text or "{}")
+    except ValueError:
+        return None
+    return data.get("usage") if isinstance(data, dict) else None
+
+
+class RecordWriter:
+    """버퍼링 + 크기 기준 회전 JSONL 기록기 (프로세스 단위)."""
+
+    def __init__(self, directory: str, max_bytes: int, flush_every: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.flush_every = max(1, flush_every)
+        self._buf: List[str] = []
+        self._lock = threading.Lock()
+        self._path: Optional[str] = None
+        self._seq = 0
+        self.written = 0
+        self.files = 0
+
+    def _next_path(self) -> str:
+        self._seq += 1
+        self.files += 1
+        stamp = time.strftime("%Y%m%d%H%M%S")
+        return os.path.join(self.directory, f"llm-{os.getpid()}-{stamp}-{self._seq:04d}.jsonl")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._buf.append(line)
+            if len(self._buf) >= self.flush_every:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._buf:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if self._path is None or (os.path.exists(self._path) and os.path.getsize(self._path) >= self.max_bytes):
+            self._path = self._next_path()
+        with open(self._path, "a", encoding="utf-8") as f:
+            f.write("\n".join(self._buf) + "\n")
+        self.written += len(self._buf)
+        self._buf.clear()
+
+
+class ReplayStore:
+    """기록 파일 전체를 키별로 색인해 두고, 같은 키는 기록 순서대로 돌아가며 내준다."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._records: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._cursor: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        for path in sorted(glob.glob(os.path.join(directory, "*.jsonl"))):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    if rec.get("key"):
+                        self._records[rec["key"]].append(rec)
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._records.values())
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            recs = self._records.get(key)
+            if not recs:
+                self.misses += 1
+                return None
+            idx = self._cursor[key]
+            self._cursor[key] = idx + 1
+            self.hits += 1
+            return recs[idx % len(recs)]
+
+
+def get_writer() -> RecordWriter:
+    global _writer
+    with _lock:
+        if _writer is None:
+            _writer = RecordWriter(
+                record_dir(),
+                int(_setting("LLM_RECORD_MAX_BYTES", 50 * 1024 * 1024)),
+                int(_setting("LLM_RECORD_FLUSH_EVERY", 32)),
+            )
+        return _writer
+
+
+def get_store() -> ReplayStore:
+    global _store
+    with _lock:
+        if _store is None:
+            _store = ReplayStore(record_dir())
+        return _store
+
+
+def _make_record(request: httpx.Request, status: int, content_type: str, text: str, started: float, ttfb_ms: float) -> Dict[str, Any]:
+    body = _parse_body(request.content)
+    return {
+        "ts": round(time.time(), 3),
+        "key": request_key(request.method, request.url.path, body),
+        "method": request.method,
+        "path": request.url.path,
+        "model": body.get("model"),
+        "messages": body.get("messages"),
+        "params": {k: v for k, v in body.items() if k not in ("model", "messages")},
+        "status": status,
+        "content_type": content_type,
+        "latency_ms": round((time.perf_counter() - started) * 1000.0, 2),
+        "ttfb_ms": round(ttfb_ms, 2),
+        "usage": _extract_usage(content_type, text),
+        "body": text,
+    }
+
+
+class _TeeStream(httpx.SyncByteStream):
+    """응답 본문을 읽는 대로 모아 두었다가 스트림이 닫힐 때 한 건으로 기록한다."""
+
+    def __init__(self, inner, on_close):
+        self._inner = inner
+        self._on_close = on_close
+        self._chunks: List[bytes] = []
+
+    def __iter__(self):
+        for chunk in self._inner:
+            self._chunks.append(chunk)
+            yield chunk
+
+    def close(self) -> None:
+        try:
+            self._inner.close()
+        finally:
+            self._on_close(b"".join(self._chunks))
+
+
+class _AsyncTeeStream(httpx.AsyncByteStream):
+    def __init__(self, inner, on_close):
+        self._inner = inner
+        self._on_close = on_close
+        self._chunks: List[bytes] = []
+
+    async def __aiter__(self):
+        async for chunk in self._inner:
+            self._chunks.append(chunk)
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._inner.aclose()
+        finally:
+            self._on_close(b"".join(self._chunks))
+
+
+def _tee(request: httpx.Request, response: httpx.Response, started: float, stream_cls):
+    ttfb_ms = (time.perf_counter() - started) * 1000.0
+    content_type = response.headers.get("content-type", "")
+    writer = get_writer()
+
+    def on_close(raw: bytes) -> None:
+        writer.write(_make_record(request, response.status_code, content_type, raw.decode("utf-8", "replace"), started, ttfb_ms))
+
+    return httpx.Response(
+        response.status_code,
+        headers=response.headers,
+        stream=stream_cls(response.stream, on_close),
+        extensions=response.extensions,
+        request=request,
+    )
+
+
+def _replay_response(request: httpx.Request) -> httpx.Response:
+    key = request_key(request.method, request.url.path, _parse_body(request.content))
+    rec = get_store().lookup(key)
+    if rec is None:
+        # 재시도 대상이 아닌 404 로 돌려 파이프라인의 APIError 처리 경로를 탄다.
+        body = {"error": {"message": f"replay miss: {key}", "type": "replay_miss", "code": "replay_miss"}}
+        return httpx.Response(404, json=body, request=request)
+    return httpx.Response(
+        int(rec.get("status") or 200),
+        headers={"content-type": rec.get("content_type") or "application/json", "x-llm-replay": key},
+        content=(rec.get("body") or "").encode("utf-8"),
+        request=request,
+    )
+
+
+class RecordReplayTransport(httpx.BaseTransport):
+    def __init__(self, inner: Optional[httpx.BaseTransport], mode_name: str):
+        self.inner = inner
+        self.mode = mode_name
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        if self.mode == "replay":
+            return _replay_response(request)
+        if self.mode == "record":
+            # 압축된 본문이 그대로 기록되지 않도록 평문 응답을 요청한다.
+            request.headers["Accept-Encoding"] = "identity"
+        started = time.perf_counter()
+        response = self.inner.handle_request(request)
+        if self.mode != "record":
+            return response
+        return _tee(request, response, started, _TeeStream)
+
+    def close(self) -> None:
+        if self.inner is not None:
+            self.inner.close()
+
+
+class AsyncRecordReplayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, inner: Optional[httpx.AsyncBaseTransport], mode_name: str):
+        self.inner = inner
+        self.mode = mode_name
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        if self.mode == "replay":
+            return _replay_response(request)
+        if self.mode == "record":
+            request.headers["Accept-Encoding"] = "identity"
+        started = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+        if self.mode != "record":
+            return response
+        return _tee(request, response, started, _AsyncTeeStream)
+
+    async def aclose(self) -> None:
+        if self.inner is not None:
+            await self.inner.aclose()
+
+
+# 함수명 : wrap
+# input : inner(httpx 트랜스포트), kind('sync' | 'async')
+# output : 현재 모드에 맞는 트랜스포트. passthrough 면 None (httpx 기본 트랜스포트 사용)
+# 함수 설명 : openai_pool 이 클라이언트를 만들 때 호출한다. replay 는 inner 를 쓰지 않는다.
+def wrap(inner, kind: str = "sync"):
+    mode_name = mode()
+    if mode_name == "passthrough":
+        return None
+    if kind == "async":
+        return AsyncRecordReplayTransport(inner, mode_name)
+    return RecordReplayTransport(inner, mode_name)
+
+
+def flush() -> None:
+    if _writer is not None:
+        _writer.flush()
+
+
+def stats() -> Dict[str, Any]:
+    out: Dict[str, Any] = {"mode": mode()}
+    if _writer is not None:
+        out.update({"recorded": _writer.written, "files": _writer.files})
+    if _store is not None:
+        out.update({"replay_records": len(_store), "replay_hits": _store.hits, "replay_misses": _store.misses})
+    return out
+
+
+def reset() -> None:
+    """버퍼를 비우고 기록기/재생 색인을 버린다 (설정 변경이나 테스트 후)."""
+    global _writer, _store
+    flush()
+    with _lock:
+        _writer = None
+        _store = None
+
+
+atexit.register(flush)
@@ -0,0 +1,174 @@
+# api/services/openai_pool.py
+# 워커 프로세스당 한 번만 만드는 OpenAI 클라이언트 레지스트리.
+# 매 턴마다 .env 파싱 + 새 TLS 연결을 맺던 비용을 없애고, keep-alive 커넥션 풀을 재사용한다.
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import logging
+import os
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+from django.conf import settings
+
+from . import llm_transport, rate_limiter
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_clients: Dict[str, Any] = {}
+# httpx.AsyncClient 의 커넥션은 만들어진 이벤트 루프에 묶이므로 루프별로 하나씩 둔다.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+_owner_pid: Optional[int] = None
+
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "new_connections": 0, "reused_connections": 0}
+_seen_streams: "weakref.WeakSet[Any]" = weakref.WeakSet()
+
+
+def _setting(name: str, default):
+    val = getattr(settings, name, None)
+    return default if val is None else val
+
+
+def _api_key() -> str:
+    api_key = getattr(settings, "OPENAI_API_KEY", None) or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY 환경 변수가 설정되지 않았습니다.")
+    return api_key
+
+
+def _http2_enabled() -> bool:
+    if not _setting("OPENAI_POOL_HTTP2", False):
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("OPENAI_POOL_HTTP2=True 이지만 h2 패키지가 없어 HTTP/1.1 로 연결합니다.")
+        return False
+    return True
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(_setting("OPENAI_POOL_MAX_CONNECTIONS", 100)),
+        max_keepalive_connections=int(_setting("OPENAI_POOL_MAX_KEEPALIVE", 20)),
+        keepalive_expiry=float(_setting("OPENAI_POOL_KEEPALIVE_EXPIRY", 30.0)),
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        float(_setting("OPENAI_POOL_TIMEOUT", 60.0)),
+        connect=float(_setting("OPENAI_POOL_CONNECT_TIMEOUT", 5.0)),
+    )
+
+
+def _record_response(response: httpx.Response) -> None:
+    stream = response.extensions.get("network_stream")
+    with _stats_lock:
+        _stats["requests"] += 1
+        if stream is None:
+            return
+        if stream in _seen_streams:
+            _stats["reused_connections"] += 1
+        else:
+            _seen_streams.add(stream)
+            _stats["new_connections"] += 1
+
+
+async def _arecord_response(response: httpx.Response) -> None:
+    _record_response(response)
+
+
+def _check_pid() -> None:
+    # fork 된 워커는 부모의 소켓을 공유하면 안 되므로 프로세스가 바뀌면 새로 만든다.
+    global _owner_pid
+    pid = os.getpid()
+    if _owner_pid != pid:
+        _clients.clear()
+        _async_clients.clear()
+        _owner_pid = pid
+
+
+def _build(kind: str):
+    from openai import AsyncOpenAI, OpenAI
+
+    common = dict(
+        api_key=_api_key(),
+        # 속도 제한기를 쓰면 재시도는 제한기가 Retry-After/우선순위를 보고 직접 한다 (SDK 재시도와 겹치지 않게).
+        max_retries=0 if rate_limiter.enabled() else int(_setting("OPENAI_MAX_RETRIES", 2)),
+        timeout=_timeout(),
+    )
+    base_url = _setting("OPENAI_BASE_URL", "")
+    if base_url:
+        common["base_url"] = base_url
+    if kind == "async":
+        # 기록/재생 모드면 커넥션 풀 트랜스포트를 llm_transport 로 감싼다 (passthrough 는 기본 트랜스포트).
+        transport = llm_transport.wrap(httpx.AsyncHTTPTransport(limits=_limits(), http2=_http2_enabled()), "async")
+        http_client = httpx.AsyncClient(
+            limits=_limits(), timeout=_timeout(), http2=_http2_enabled(), transport=transport,
+            event_hooks={"response": [_arecord_response]},
+        )
+        return AsyncOpenAI(http_client=http_client, **common)
+    transport = llm_transport.wrap(httpx.HTTPTransport(limits=_limits(), http2=_http2_enabled()), "sync")
+    http_client = httpx.Client(
+        limits=_limits(), timeout=_timeout(), http2=_http2_enabled(), transport=transport,
+        event_hooks={"response": [_record_response]},
+    )
+    return OpenAI(http_client=http_client, **common)
+
+
+def get_client():
+    """프로세스 공용 동기 OpenAI 클라이언트."""
+    with _lock:
+        _check_pid()
+        client = _clients.get("sync")
+        if client is None:
+            client = _clients["sync"] = _build("sync")
+        return client
+
+
+def get_async_client():
+    """현재 이벤트 루프 공용 비동기 OpenAI 클라이언트.
+
+    ASGI 워커는 프로세스당 루프가 하나이므로 사실상 프로세스 공용이다.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = asyncio.get_event_loop()
+    with _lock:
+        _check_pid()
+        client = _async_clients.get(loop)
+        if client is None:
+            client = _async_clients[loop] = _build("async")
+        return client
+
+
+def pool_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats["new_connections"] + stats["reused_connections"]
+    stats["reuse_ratio"] = round(stats["reused_connections"] / total, 4) if total else 0.0
+    stats["clients"] = sorted(_clients) + (["async"] * len(_async_clients))
+    stats["pid"] = os.getpid()
+    return stats
+
+
+def reset() -> None:
+    """설정 변경이나 테스트 후 클라이언트와 통계를 초기화한다."""
+    with _lock:
+        sync_client = _clients.get("sync")
+        if sync_client is not None:
+            try:
+                sync_client.close()
+            except Exception:
+                pass
+        # 비동기 클라이언트는 자기 이벤트 루프 밖에서 닫을 수 없으므로 참조만 버린다.
+        _clients.clear()
+        _async_clients.clear()
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
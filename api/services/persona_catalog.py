@@ -0,0 +1,229 @@
+# api/services/persona_catalog.py
+# 페르소나 카탈로그 API (/api/personas/filter/, /api/personas/facets/) 의 조회 로직.
+#   - 필터: persona/options.FILTER_FIELDS 의 동등 조건 (같은 필드를 여러 번 주면 IN). '랜덤'/빈 값은 조건 없음.
+#   - 페이지: id 기준 keyset(seek) 페이지. "id > cursor ORDER BY id LIMIT n" 이라 뒤 페이지도 앞 페이지와 같은 비용이다.
+#             (필터 컬럼, id) 복합 인덱스(Persona.Meta.indexes)가 조건과 정렬을 같이 처리한다.
+#   - 패싯: 필드별 선택지 개수. 처음 한 번 GROUP BY 로 세고, 같은 워커의 저장/삭제는 signals 에서 증감만 한다.
+#           다른 워커의 추가/삭제는 PERSONA_CATALOG_REFRESH_SECONDS 마다 (개수, 최대 id) 지문으로 확인하고,
+#           값 수정까지 확실히 반영하도록 PERSONA_CATALOG_MAX_AGE 가 지나면 다시 센다.
+#           응답 본문과 ETag 는 개수가 바뀔 때만 다시 만든다 (If-None-Match 면 304).
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from persona import options
+
+from . import telemetry
+
+FIELDS = options.FILTER_FIELDS
+LIST_FIELDS = ("id", "name", "segment", "gender", "age", "household", "job", "income_month", "region")
+
+
+def _setting(name: str, default):
+    val = getattr(settings, name, None)
+    return default if val is None else val
+
+
+def _persona_model():
+    from persona.models import Persona
+    return Persona
+
+
+def parse_filters(params) -> Dict[str, List[str]]:
+    """QueryDict → {필드: [값...]} (조건 없는 필드는 빠진다)."""
+    filters = {}
+    for field in FIELDS:
+        values = [v for v in params.getlist(field) if v not in options.ANY_VALUES]
+        if values:
+            filters[field] = values
+    return filters
+
+
+def filter_queryset(filters: Dict[str, List[str]]):
+    qs = _persona_model().objects.all()
+    for field, values in filters.items():
+        qs = qs.filter(**{field: values[0]}) if len(values) == 1 else qs.filter(**{f"{field}__in": values})
+    return qs
+
+
+def page_size(raw) -> int:
+    size = int(raw or _setting("PERSONA_CATALOG_PAGE_SIZE", 50))
+    return max(1, min(size, int(_setting("PERSONA_CATALOG_MAX_PAGE_SIZE", 200))))
+
+
+# 함수명 : page
+# input : filters(parse_filters 결과), cursor(이전 페이지 마지막 id, 없으면 처음), size
+# output : (행 dict 목록, 다음 cursor 또는 None)
+# 함수 설명 : size+1 개를 읽어 다음 페이지가 있는지 알아내므로 COUNT 쿼리가 없다.
+def page(filters: Dict[str, List[str]], cursor: Optional[int] = None, size: int = 50) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    qs = filter_queryset(filters)
+    if cursor:
+        qs = qs.filter(id__gt=cursor)
+    with telemetry.span("persona_catalog_page") as fields:
+        rows = list(qs.order_by("id").values(*LIST_FIELDS)[:size + 1])
+        fields["rows"] = len(rows)
+    if len(rows) > size:
+        rows = rows[:size]
+        return rows, rows[-1]["id"]
+    return rows, None
+
+
+class FacetCounts:
+    """필드별 값 개수와 그로부터 만든 응답 본문/ETag."""
+
+    def __init__(self, counts: Dict[str, Counter], total: int):
+        self._lock = threading.Lock()
+        self.counts = counts
+        self.total = total
+        self._payload: Optional[Dict[str, Any]] = None
+        self._etag: Optional[str] = None
+
+    @classmethod
+    def count(cls) -> "FacetCounts":
+        Persona = _persona_model()
+        counts = {}
+        for field in FIELDS:
+            rows = Persona.objects.values_list(field).annotate(n=Count("id")).order_by()
+            counts[field] = Counter({value: n for value, n in rows if value})
+        return cls(counts, Persona.objects.count())
+
+    def apply(self, values: Dict[str, Any], delta: int) -> None:
+        with self._lock:
+            for field in FIELDS:
+                value = values.get(field)
+                if not value:
+                    continue
+                counter = self.counts[field]
+                counter[value] += delta
+                if counter[value] <= 0:
+                    del counter[value]
+            self.total += delta
+            self._payload = self._etag = None
+
+    def _render(self) -> Dict[str, Any]:
+        facets = {}
+        for field in FIELDS:
+            counter = self.counts[field]
+            known = options.OPTIONS[field]
+            # 카탈로그 순서대로 (0 개도 포함), 카탈로그에 없는 DB 값은 많은 순으로 뒤에 붙인다.
+            extra = sorted((v for v in counter if v not in known), key=lambda v: (-counter[v], v))
+            facets[field] = [{"value": v, "count": counter.get(v, 0)} for v in list(known) + extra]
+        return {"total": self.total, "facets": facets}
+
+    def snapshot(self) -> Tuple[Dict[str, Any], str]:
+        with self._lock:
+            if self._payload is None:
+                self._payload = self._render()
+                body = json.dumps(self._payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+                self._etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+            return self._payload, self._etag
+
+
+_lock = threading.Lock()
+_facets: Optional[FacetCounts] = None
+_fingerprint: Optional[Tuple[int, Any]] = None
+_checked_at = 0.0
+_built_at = 0.0
+
+
+def _fingerprint_now() -> Tuple[int, Any]:
+    agg = _persona_model().objects.aggregate(n=Count("id"), last=Max("id"))
+    return agg["n"], agg["last"]
+
+
+def get_facets() -> FacetCounts:
+    global _facets, _fingerprint, _checked_at, _built_at
+    now = time.monotonic()
+    with _lock:
+        current = _facets
+        due = current is None or now - _checked_at >= float(_setting("PERSONA_CATALOG_REFRESH_SECONDS", 60))
+        if due:
+            _checked_at = now
+        stale = current is None or now - _built_at >= float(_setting("PERSONA_CATALOG_MAX_AGE", 600))
+    if not due and not stale:
+        return current
+    fingerprint = _fingerprint_now()
+    if not stale and fingerprint == _fingerprint:
+        return current
+    with telemetry.span("persona_catalog_facets") as fields:
+        current = FacetCounts.count()
+        fields["personas"] = current.total
+    with _lock:
+        _facets, _fingerprint, _built_at = current, fingerprint, time.monotonic()
+    return current
+
+
+def facets() -> Tuple[Dict[str, Any], str]:
+    """(응답 본문, ETag)."""
+    return get_facets().snapshot()
+
+
+def facets_etag(request=None) -> str:
+    return facets()[1]
+
+
+def _values(persona) -> Dict[str, Any]:
+    return {field: getattr(persona, field, None) for field in FIELDS}
+
+
+def before_persona_saved(persona) -> None:
+    """수정이면 저장 전 값을 기억해 두었다가 on_persona_saved 에서 뺀다 (패싯이 로드된 워커만 조회)."""
+    with _lock:
+        loaded = _facets is not None
+    if not loaded or persona.pk is None:
+        return
+    persona._catalog_previous = _persona_model().objects.filter(pk=persona.pk).values(*FIELDS).first()
+
+
+def on_persona_saved(persona, created: bool = False) -> None:
+    global _fingerprint
+    with _lock:
+        current = _facets
+    previous = persona.__dict__.pop("_catalog_previous", None)
+    if current is None:
+        return
+    if previous is not None:
+        current.apply(previous, -1)
+    current.apply(_values(persona), +1)
+    if previous is None and created:
+        with _lock:
+            if _fingerprint is not None:
+                n, last = _fingerprint
+                _fingerprint = (n + 1, max(last or 0, persona.pk))
+
+
+def on_persona_deleted(persona) -> None:
+    global _fingerprint
+    with _lock:
+        current = _facets
+    if current is None:
+        return
+    current.apply(_values(persona), -1)
+    with _lock:
+        if _fingerprint is not None:
+            n, last = _fingerprint
+            # 최대 id 가 지워졌으면 새 최대 id 를 모르므로 다음 확인 때 다시 센다.
+            _fingerprint = (n - 1, last) if persona.pk != last else None
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        current = _facets
+    return {"loaded": current is not None, "personas": current.total if current is not None else 0}
+
+
+def reset() -> None:
+    global _facets, _fingerprint, _checked_at, _built_at
+    with _lock:
+        _facets = None
+        _fingerprint = None
+        _checked_at = 0.0
+        _built_at = 0.0
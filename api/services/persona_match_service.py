@@ -0,0 +1,252 @@
+# api/services/persona_match_service.py
+# find_and_chat_view 의 페르소나 매칭을 워커 메모리의 NumPy 인덱스로 처리한다.
+#   - 매칭 속성(성별/연령/직업/가구/월소득/세그먼트)을 필드별 정수 코드 열로 들고 있다 (값 사전은 필드별).
+#   - 질의 한 번에 전체 페르소나를 한 번에 점수화한다: 점수 = Σ 가중치 x (코드 일치), 고정 조건(성별/연령)은 필수.
+#     같은 점수끼리는 무작위로 섞어 기존처럼 매번 다른 페르소나가 뽑힐 수 있게 한다.
+#   - 같은 워커의 저장/삭제는 signals 에서 해당 행만 바꾸고, 다른 워커의 변경은 PERSONA_MATCH_REFRESH_SECONDS 마다
+#     (개수, 최대 id) 지문을 비교해 다시 만든다. 값 수정까지 확실히 반영하도록 PERSONA_MATCH_MAX_AGE 가 지나면 새로 만든다.
+# DB 왕복은 인덱스를 만들 때 한 번뿐이라 매칭 지연은 페르소나 수에 거의 비례하지 않는다 (수십만 행에서도 수 ms).
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+
+from . import telemetry
+
+FIXED_WEIGHTS = {"gender": 5, "age": 5}
+FLEXIBLE_WEIGHTS = {"job": 1, "household": 3, "income_month": 2, "segment": 4}
+FIELDS = tuple(FIXED_WEIGHTS) + tuple(FLEXIBLE_WEIGHTS)
+WEIGHTS = np.array([{**FIXED_WEIGHTS, **FLEXIBLE_WEIGHTS}[f] for f in FIELDS], dtype=np.int32)
+TOTAL_WEIGHT = int(WEIGHTS.sum())
+
+MISSING = -1   # 페르소나 쪽 값 없음
+UNKNOWN = -2   # 질의 값이 인덱스에 없는 값 (어떤 페르소나와도 불일치)
+
+
+def _setting(name: str, default):
+    val = getattr(settings, name, None)
+    return default if val is None else val
+
+
+class Match(NamedTuple):
+    persona_id: int
+    score: int
+    percentage: float
+
+
+class PersonaMatchIndex:
+    """페르소나 n 명 x 매칭 필드의 정수 코드 행렬."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._codes = np.full((0, len(FIELDS)), MISSING, dtype=np.int32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._n = 0
+        self._pos: Dict[int, int] = {}
+        self._vocab: List[Dict[str, int]] = [{} for _ in FIELDS]
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __contains__(self, pk) -> bool:
+        return pk in self._pos
+
+    def _encode(self, values) -> np.ndarray:
+        row = np.full(len(FIELDS), MISSING, dtype=np.int32)
+        for i, val in enumerate(values):
+            if val:
+                row[i] = self._vocab[i].setdefault(val, len(self._vocab[i]))
+        return row
+
+    def _grow(self, need: int) -> None:
+        if need <= self._codes.shape[0]:
+            return
+        cap = max(64, need, self._codes.shape[0] * 2)
+        codes = np.full((cap, len(FIELDS)), MISSING, dtype=np.int32)
+        ids = np.zeros(cap, dtype=np.int64)
+        codes[:self._n] = self._codes[:self._n]
+        ids[:self._n] = self._ids[:self._n]
+        self._codes, self._ids = codes, ids
+
+    @classmethod
+    def from_rows(cls, rows) -> "PersonaMatchIndex":
+        """(pk, 필드값...) 행 목록에서 필드별 값 사전을 만들며 한 번에 코드화한다 (인덱스 생성용)."""
+        index = cls()
+        rows = list(rows)
+        n = len(rows)
+        index._grow(n)
+        if not n:
+            return index
+        columns = list(zip(*rows))
+        index._ids[:n] = np.asarray(columns[0], dtype=np.int64)
+        for i, column in enumerate(columns[1:]):
+            vocab = index._vocab[i]
+            index._codes[:n, i] = np.fromiter(
+                (vocab.setdefault(v, len(vocab)) if v else MISSING for v in column), dtype=np.int32, count=n,
+            )
+        index._n = n
+        index._pos = {int(pk): pos for pos, pk in enumerate(index._ids[:n].tolist())}
+        return index
+
+    def upsert(self, pk: int, values) -> None:
+        with self._lock:
+            row = self._encode(values)
+            pos = self._pos.get(pk)
+            if pos is None:
+                pos = self._n
+                self._grow(pos + 1)
+                self._ids[pos] = pk
+                self._pos[pk] = pos
+                self._n += 1
+            self._codes[pos] = row
+
+    def remove(self, pk: int) -> None:
+        with self._lock:
+            pos = self._pos.pop(pk, None)
+            if pos is None:
+                return
+            last = self._n - 1
+            if pos != last:
+                # 마지막 행을 빈자리로 옮겨 행렬을 촘촘하게 유지한다.
+                self._codes[pos] = self._codes[last]
+                self._ids[pos] = self._ids[last]
+                self._pos[int(self._ids[pos])] = pos
+            self._n -= 1
+
+    def _query(self, criteria: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+        codes = np.full(len(FIELDS), UNKNOWN, dtype=np.int32)
+        given = np.zeros(len(FIELDS), dtype=bool)
+        for i, field in enumerate(FIELDS):
+            val = criteria.get(field)
+            if val:
+                given[i] = True
+                codes[i] = self._vocab[i].get(val, UNKNOWN)
+        return codes, given
+
+    # 함수명 : top_k
+    # input : criteria({필드: 값}), k, rng(동점 섞기용 numpy Generator, 선택)
+    # output : Match 목록 (점수 내림차순). 고정 조건에 맞는 페르소나가 없으면 빈 목록
+    # 함수 설명 : 조건이 없는 필드는 점수에 넣지 않고, 일치율은 기존 화면과 같이 전체 가중치 합 대비 비율로 낸다.
+    def top_k(self, criteria: Dict[str, Any], k: int = 1, rng: Optional[np.random.Generator] = None) -> List[Match]:
+        with self._lock:
+            n = self._n
+            if n == 0:
+                return []
+            q, given = self._query(criteria)
+            hits = self._codes[:n] == q
+            ids = self._ids[:n].copy()
+        fixed = [i for i, f in enumerate(FIELDS) if f in FIXED_WEIGHTS and given[i]]
+        mask = hits[:, fixed].all(axis=1) if fixed else np.ones(n, dtype=bool)
+        candidates = np.flatnonzero(mask)
+        if candidates.size == 0:
+            return []
+        scores = hits[candidates] @ (WEIGHTS * given)
+        # 가중치가 정수이므로 [0, 1) 난수를 더해도 순위는 바뀌지 않고 동점만 무작위로 섞인다.
+        rng = rng or np.random.default_rng()
+        keyed = scores + rng.random(candidates.size)
+        k = min(k, candidates.size)
+        top = np.argpartition(-keyed, k - 1)[:k]
+        top = top[np.argsort(-keyed[top])]
+        return [
+            Match(int(ids[candidates[i]]), int(scores[i]), round(float(scores[i]) / TOTAL_WEIGHT * 100, 1))
+            for i in top
+        ]
+
+
+_lock = threading.Lock()
+_index: Optional[PersonaMatchIndex] = None
+_fingerprint: Optional[Tuple[int, Any]] = None
+_checked_at = 0.0
+_built_at = 0.0
+
+
+def _persona_model():
+    from persona.models import Persona
+    return Persona
+
+
+def _fingerprint_now() -> Tuple[int, Any]:
+    agg = _persona_model().objects.aggregate(n=Count("id"), last=Max("id"))
+    return agg["n"], agg["last"]
+
+
+def build_index() -> PersonaMatchIndex:
+    return PersonaMatchIndex.from_rows(_persona_model().objects.values_list("id", *FIELDS).iterator(chunk_size=5000))
+
+
+def get_index() -> PersonaMatchIndex:
+    global _index, _fingerprint, _checked_at, _built_at
+    now = time.monotonic()
+    with _lock:
+        index = _index
+        due = index is None or now - _checked_at >= float(_setting("PERSONA_MATCH_REFRESH_SECONDS", 60))
+        if due:
+            _checked_at = now
+        stale = index is None or now - _built_at >= float(_setting("PERSONA_MATCH_MAX_AGE", 600))
+    if not due and not stale:
+        return index
+    fingerprint = _fingerprint_now()
+    if not stale and fingerprint == _fingerprint:
+        return index
+    with telemetry.span("persona_match_build") as fields:
+        index = build_index()
+        fields["personas"] = len(index)
+    with _lock:
+        _index, _fingerprint, _built_at = index, fingerprint, time.monotonic()
+    return index
+
+
+def match(criteria: Dict[str, Any], k: Optional[int] = None) -> List[Match]:
+    k = int(k or _setting("PERSONA_MATCH_TOP_K", 5))
+    with telemetry.span("persona_match") as fields:
+        result = get_index().top_k(criteria, k)
+        fields["hits"] = len(result)
+    return result
+
+
+def on_persona_saved(persona) -> None:
+    global _fingerprint
+    with _lock:
+        index = _index
+    if index is None:
+        return
+    is_new = persona.pk not in index
+    index.upsert(persona.pk, [getattr(persona, f, None) for f in FIELDS])
+    with _lock:
+        if _fingerprint is not None and is_new:
+            n, last = _fingerprint
+            _fingerprint = (n + 1, max(last or 0, persona.pk))
+
+
+def on_persona_deleted(persona) -> None:
+    global _fingerprint
+    with _lock:
+        index = _index
+    if index is None or persona.pk not in index:
+        return
+    index.remove(persona.pk)
+    with _lock:
+        if _fingerprint is not None:
+            n, last = _fingerprint
+            # 최대 id 가 지워졌으면 새 최대 id 를 모르므로 다음 확인 때 다시 만든다.
+            _fingerprint = (n - 1, last) if persona.pk != last else None
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        index = _index
+    return {"personas": len(index) if index is not None else 0, "loaded": index is not None}
+
+
+def reset() -> None:
+    global _index, _fingerprint, _checked_at, _built_at
+    with _lock:
+        _index = None
+        _fingerprint = None
+        _checked_at = 0.0
+        _built_at = 0.0
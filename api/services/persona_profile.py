@@ -0,0 +1,242 @@
+# api/services/persona_profile.py
+# 페르소나별로 한 번만 컴파일해 두는 프로필 (워커 프로세스 단위 캐시).
+#   - 이름, 특성 수치(traits), 가구 구간, 시스템 프롬프트(+토큰 수), 인사/자기소개 문구
+#   - 캐시 키: (persona id, 내용 해시 버전). Persona 저장/삭제 시 signals 에서 무효화하고,
+#     다른 워커가 수정한 경우에도 내용 해시가 달라지므로 다시 컴파일된다.
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from . import tokens
+
+TRAIT_KEYS = (
+    "brand_loyalty", "cooking_convenience", "health_orientation", "hmr_preference",
+    "premium_orientation", "price_sensitivity", "variety_seeking",
+)
+NAME_FIELDS = ("name", "display_name", "nickname", "persona_name")
+DEFAULT_NAME = "마케팅 도우미"
+
+INTRO_AGES = ("10대", "20대", "30대", "40대", "50대", "60대", "60대 이상")
+INTRO_GENDERS = ("여자", "남자")
+INTRO_HOUSEHOLDS = ("1인 가구", "2인 가구", "3인 가구", "4인 가구", "대가족")
+INTRO_REGIONS = (
+    "서울", "부산", "대구", "인천", "광주", "대전", "울산", "세종", "경기", "강원", "충북", "충남", "전북", "전남", "경북", "경남", "제주",
+    "서울특별시", "부산광역시", "대구광역시", "인천광역시", "광주광역시", "대전광역시", "울산광역시", "세종특별자치시",
+)
+
+# --- 시스템 프롬프트 정적 블록 (모든 페르소나 공통, import 시 한 번 만든다) ---
+# 1인칭 규칙은 역할 문장에, 서식 금지 규칙은 말투 가이드에 한 번만 둔다.
+SANITY_BLOCK = """수량 현실화 규칙:
+- 기본 대상은 개인 또는 소가구(1~4인) B2C 소매. 특별히 말하지 않으면 이를 기준으로 답하라.
+- 카테고리별 1개월 권장 범위(개인/소가구):
+  · 통조림 햄/스팸/리챔: 개인 1~4개, 소가구 2~8개
+  · 참치캔: 개인 2~8개, 소가구 4~12개
+  · HMR·즉석밥·밀키트/냉동: 개인 2~12개, 소가구 6~24개
+  · 우유/요거트/음료: 개인 2~12개, 소가구 6~24개
+  · 소스/양념: 개인 1~3개, 소가구 1~5개
+- 위 범위를 크게 벗어나면 전제(행사/도매/기업구매/대가족/파티 등)를 밝히고 보수/기준/공격 3단계로 제시."""
+
+STYLE_BLOCK = """말투 가이드:
+- 보고서체 금지. 한국어로 부드럽고 자연스럽게, 문장 짧게. 필요하면 이모지 1개까지.
+- 굵게/하이픈/번호 서식 금지, 줄바꿈 또는 '·'만 사용.
+- 가격 질문은 심리가격대(스윗스팟) 범위로, 200g/340g 차등 함께 언급.
+- '너는 어떤 페르소나야/너는 어떤 소비자야/자기소개' 처럼 물을 때는 2~3문장 소개.
+- 가격이나 용량이 주어지면 단위가격(원/100g·ml)로 간단 비교. 없으면 억지 계산 금지.
+- 규격이 2가지 이상이면 가성비·보관성 기준으로 '규격 추천' 한 줄을 꼭 넣는다."""
+
+FORMAT_BLOCK = """응답 형식:
+1) 첫 줄: 저는 한 달에 N개(규격 기준)를 구매할 것 같아요!
+2) 내 기준(핵심 3~5줄):
+   · 취향/식단: 건강·간편/HMR·프리미엄 선호 등 내 취향을 한 줄
+   · 가구/생활: 1인·2인, 주간 요리 빈도
+   · 예산: 월 식료품 예산(모르면 '평균 예산 가정')과 가공식품 비중 10~20% 가정
+   · 가성비/규격: (가능하면) 단위가격 비교 예시 – 150g 2,000원 ≈ 1,333원/100g, 300g 3,200원 ≈ 1,067원/100g
+   · 규격 추천: 소용량/대용량 중 무엇을 왜 고르는지 한 줄
+3) 제품의 장점:
+   · 한 줄씩 2~3개
+4) 제품의 단점:
+   · 한 줄씩 2~3개
+5) 이렇게 되면 더 좋아요:
+   · 제품이 ~하면 더 좋아요(2~3개 제안)
+6) '사는 이유/안 사는 이유/가정·주의' 같은 표현은 사용하지 않는다."""
+
+ROLE_TEMPLATE = (
+    "역할: 너는 가상의 소비자 페르소나 '{name}'이다. 항상 1인칭(저/제/나는)으로 답하고 전문가/도우미처럼 자기소개하지 않으며, "
+    "내 취향/예산/가구 규모를 기준으로 현실적인 수량을 말한다."
+)
+
+STATIC_PROMPT = f"{SANITY_BLOCK}\n\n{STYLE_BLOCK}\n\n{FORMAT_BLOCK}"
+STATIC_PROMPT_TOKENS = tokens.count_tokens(STATIC_PROMPT)
+
+
+def resolve_name(persona) -> str:
+    for field in NAME_FIELDS:
+        val = getattr(persona, field, None)
+        if val:
+            return str(val)
+    tag = (getattr(persona, "persona_summary_tag", "") or "").strip()
+    if tag:
+        token = tag.split()[0]
+        if token and len(token) <= 6:
+            return token
+    return DEFAULT_NAME
+
+
+def household_bucket(tag: str) -> str:
+    tag = (tag or "")
+    if any(x in tag for x in ("3인", "4인")):
+        return "small"
+    if any(x in tag for x in ("5인", "6인", "대가족")):
+        return "large"
+    if "2인" in tag:
+        return "small"
+    if "1인" in tag:
+        return "single"
+    return "single"
+
+
+def parse_traits(tag: str) -> Dict[str, float]:
+    vals: Dict[str, float] = {}
+    src = tag or ""
+    def _num_after_colon(start_idx: int) -> Optional[float]:
+        cpos = src.find(":", start_idx)
+        if cpos == -1:
+            return None
+        i = cpos + 1
+        n = len(src)
+        while i < n and src[i].isspace():
+            i += 1
+        j = i
+        allowed = "0123456789."
+        while j < n and src[j] in allowed:
+            j += 1
+        try:
+            return float(src[i:j])
+        except Exception:
+            return None
+    for key in TRAIT_KEYS:
+        kpos = src.find(key)
+        if kpos != -1:
+            v = _num_after_colon(kpos + len(key))
+            if v is not None:
+                vals[key] = v
+    return vals
+
+
+def _pick(patterns, text: str) -> str:
+    for p in patterns:
+        if p in text:
+            return p
+    return ""
+
+
+def render_intro(name: str, tag: str) -> str:
+    age = _pick(INTRO_AGES, tag)
+    gender = _pick(INTRO_GENDERS, tag)
+    household = _pick(INTRO_HOUSEHOLDS, tag)
+    region = _pick(INTRO_REGIONS, tag)
+    h = ("건강" in tag)
+    c = ("편의" in tag) or ("간편" in tag) or ("hmr" in tag) or ("HMR" in tag)
+    premium = ("프리미엄" in tag) or ("품질" in tag)
+    low_price = ("가격" in tag and ("구애받지 않" in tag or ("민감" in tag and ("낮" in tag or "적" in tag)))) or premium
+    parts: List[str] = []
+    if h and c:
+        parts.append("건강·편의 선호가 높고")
+    elif h:
+        parts.append("건강을 특히 중시하고")
+    elif c:
+        parts.append("편의를 특히 중시하고")
+    parts.append("가격 민감도는 낮아 품질을 봐요" if low_price else "가격에도 민감한 편이에요")
+    trait = " ".join(parts)
+    who = f"{region + '에 사는 ' if region else ''}{age}{(' ' + gender) if gender else ''}{(' ' + household) if household else ''}".strip()
+    if who:
+        who += "의 "
+    return f"저는 {who}{name}이고, {trait}."
+
+
+def render_system_prompt(name: str, tag: str) -> str:
+    return f"{ROLE_TEMPLATE.format(name=name)}\n\n[내 설정(요약)]\n{tag}\n\n{STATIC_PROMPT}"
+
+
+def profile_version(persona) -> str:
+    """프롬프트/특성에 쓰이는 필드의 내용 해시."""
+    parts = [str(getattr(persona, f, "") or "") for f in NAME_FIELDS]
+    parts.append(getattr(persona, "persona_summary_tag", "") or "")
+    return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=8).hexdigest()
+
+
+class PersonaProfile:
+    """페르소나 한 명분의 컴파일 결과 (읽기 전용으로 취급)."""
+
+    __slots__ = (
+        "persona_id", "version", "name", "tag", "traits", "household_bucket",
+        "system_prompt", "prompt_tokens", "intro_text", "greeting_text",
+    )
+
+    def __init__(self, persona, version: Optional[str] = None):
+        self.persona_id = getattr(persona, "pk", None)
+        self.version = version or profile_version(persona)
+        self.name = resolve_name(persona)
+        self.tag = (getattr(persona, "persona_summary_tag", "") or "").strip()
+        self.traits = parse_traits(self.tag)
+        self.household_bucket = household_bucket(self.tag)
+        self.system_prompt = render_system_prompt(self.name, self.tag)
+        self.prompt_tokens = tokens.count_tokens(self.system_prompt)
+        self.intro_text = render_intro(self.name, self.tag)
+        self.greeting_text = f"안녕하세요! 저는 {self.name}이에요! 식품 판매에 대한 질문을 해주실래요?"
+
+
+class ProfileCache:
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[int, PersonaProfile]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, persona) -> PersonaProfile:
+        pid = getattr(persona, "pk", None)
+        version = profile_version(persona)
+        if pid is None:
+            return PersonaProfile(persona, version)
+        with self._lock:
+            profile = self._data.get(pid)
+            if profile is not None and profile.version == version:
+                self._data.move_to_end(pid)
+                self.hits += 1
+                return profile
+            self.misses += 1
+        profile = PersonaProfile(persona, version)
+        with self._lock:
+            self._data[pid] = profile
+            self._data.move_to_end(pid)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return profile
+
+    def invalidate(self, persona_id) -> None:
+        with self._lock:
+            self._data.pop(persona_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses, "static_prompt_tokens": STATIC_PROMPT_TOKENS}
+
+
+profile_cache = ProfileCache()
+
+
+def get_profile(persona) -> PersonaProfile:
+    return profile_cache.get(persona)
+
+
+def invalidate(persona_id) -> None:
+    profile_cache.invalidate(persona_id)
@@ -12,4 +12,15 @@ def get_persona_by_id(persona_id):
         persona = Persona.objects.get(id=persona_id)
         return persona
     except Persona.DoesNotExist:
-        return None
\ No newline at end of file
+        return None
+
+
+# 함수명 : aget_persona_by_id
+# input : persona_id
+# output : persona 객체 반환. 없으면 None
+# 함수 설명 : get_persona_by_id 의 비동기(async ORM) 버전. ASGI 채팅 경로에서 사용.
+async def aget_persona_by_id(persona_id):
+    try:
+        return await Persona.objects.aget(id=persona_id)
+    except Persona.DoesNotExist:
+        return None
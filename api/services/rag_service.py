@@ -0,0 +1,290 @@
+# api/services/rag_service.py
+# ReferenceProduct 기반 로컬 검색(RAG). 네트워크/외부 모델 없이 CPU 에서만 동작한다.
+#   - 문서: 제품명 + 속성(attributes) + 요약(summary) + 계절성 설명
+#   - 벡터: 글자 2~3-gram + 단어를 해시(crc32)해 고정 차원으로 모은 TF-IDF (한국어 조사/띄어쓰기 변형에 강하다)
+#   - 검색: L2 정규화된 행렬과 질의 벡터의 내적(코사인) 상위 k 개
+#   - 갱신: 같은 워커의 저장/삭제는 signals 에서 해당 행만 바꾸고,
+#           다른 워커의 변경은 RAG_REFRESH_SECONDS 마다 (개수, 최종 수정 시각) 지문을 비교해 다시 만든다.
+from __future__ import annotations
+
+import math
+import re
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from . import sales_features, telemetry
+
+_WORD_RE = re.compile(r"[0-9a-z가-힣]+")
+NGRAM_SIZES = (2, 3)
+
+
+def _setting(name: str, default):
+    val = getattr(settings, name, None)
+    return default if val is None else val
+
+
+def enabled() -> bool:
+    return bool(_setting("RAG_ENABLED", True))
+
+
+def _hash_dim() -> int:
+    return int(_setting("RAG_HASH_DIM", 4096))
+
+
+# 함수명 : featurize
+# input : text, dim(해시 차원)
+# output : (해시 인덱스 배열, 로그 스케일 TF 배열)
+# 함수 설명 : 단어마다 앞뒤 공백을 붙여 글자 n-gram 을 만들고, 단어 자체도 한 토큰으로 더해 해시 버킷별로 센다.
+def featurize(text: str, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    counts: Dict[int, int] = {}
+    for word in _WORD_RE.findall((text or "").lower()):
+        grams = [f"w:{word}"]
+        padded = f" {word} "
+        for n in NGRAM_SIZES:
+            grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        for gram in grams:
+            idx = zlib.crc32(gram.encode("utf-8")) % dim
+            counts[idx] = counts.get(idx, 0) + 1
+    if not counts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    idx = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    tf = np.fromiter((1.0 + math.log(c) for c in counts.values()), dtype=np.float32, count=len(counts))
+    return idx, tf
+
+
+def document_text(product) -> str:
+    attrs = product.attributes if isinstance(product.attributes, dict) else {}
+    attr_text = " ".join(f"{k} {v}" for k, v in attrs.items())
+    return " ".join(filter(None, (product.name, attr_text, product.summary, product.seasonal_trend)))
+
+
+def product_payload(product) -> Dict[str, Any]:
+    return {
+        "id": product.pk,
+        "product_id": product.product_id,
+        "name": product.name,
+        "summary": product.summary or "",
+        "attributes": product.attributes if isinstance(product.attributes, dict) else {},
+        "seasonal_trend": product.seasonal_trend or "",
+        "promotion_effect": product.promotion_effect,
+    }
+
+
+class VectorIndex:
+    """해시 TF-IDF 행렬 (행 = 제품). 행 단위 추가/교체/삭제 후 가중치 행렬은 검색 시 한 번만 다시 계산한다."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._tf = np.zeros((0, dim), dtype=np.float32)
+        self._df = np.zeros(dim, dtype=np.int32)
+        self._ids: List[int] = []
+        self._pos: Dict[int, int] = {}
+        self._payloads: List[Dict[str, Any]] = []
+        self._weighted: Optional[np.ndarray] = None
+        self._idf: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, pk) -> bool:
+        return pk in self._pos
+
+    def _row(self, text: str) -> np.ndarray:
+        row = np.zeros(self.dim, dtype=np.float32)
+        idx, tf = featurize(text, self.dim)
+        row[idx] = tf
+        return row
+
+    def upsert(self, pk: int, text: str, payload: Dict[str, Any]) -> None:
+        row = self._row(text)
+        with self._lock:
+            pos = self._pos.get(pk)
+            if pos is None:
+                pos = len(self._ids)
+                if pos >= self._tf.shape[0]:
+                    grown = np.zeros((max(8, pos * 2), self.dim), dtype=np.float32)
+                    grown[:pos] = self._tf[:pos]
+                    self._tf = grown
+                self._ids.append(pk)
+                self._payloads.append(payload)
+                self._pos[pk] = pos
+            else:
+                self._df -= (self._tf[pos] > 0)
+                self._payloads[pos] = payload
+            self._tf[pos] = row
+            self._df += (row > 0)
+            self._weighted = None
+
+    def remove(self, pk: int) -> None:
+        with self._lock:
+            pos = self._pos.pop(pk, None)
+            if pos is None:
+                return
+            self._df -= (self._tf[pos] > 0)
+            last = len(self._ids) - 1
+            if pos != last:
+                # 마지막 행을 빈자리로 옮겨 행렬을 촘촘하게 유지한다.
+                self._tf[pos] = self._tf[last]
+                self._ids[pos] = self._ids[last]
+                self._payloads[pos] = self._payloads[last]
+                self._pos[self._ids[pos]] = pos
+            self._tf[last] = 0
+            self._ids.pop()
+            self._payloads.pop()
+            self._weighted = None
+
+    def _ensure_weighted(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._weighted is None:
+            n = len(self._ids)
+            idf = (np.log((1.0 + n) / (1.0 + self._df)) + 1.0).astype(np.float32)
+            weighted = self._tf[:n] * idf
+            norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self._weighted = weighted / norms
+            self._idf = idf
+        return self._weighted, self._idf
+
+    def search(self, text: str, k: int = 3, min_score: float = 0.0) -> List[Tuple[Dict[str, Any], float]]:
+        idx, tf = featurize(text, self.dim)
+        with self._lock:
+            if not self._ids or idx.size == 0:
+                return []
+            weighted, idf = self._ensure_weighted()
+            payloads = list(self._payloads)
+        q = np.zeros(self.dim, dtype=np.float32)
+        q[idx] = tf * idf[idx]
+        norm = float(np.linalg.norm(q))
+        if norm == 0.0:
+            return []
+        scores = weighted @ (q / norm)
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(payloads[i], float(scores[i])) for i in top if scores[i] >= min_score]
+
+
+_lock = threading.Lock()
+_index: Optional[VectorIndex] = None
+_fingerprint: Optional[Tuple[int, Any]] = None
+_checked_at = 0.0
+
+
+def _product_model():
+    from chat.models import ReferenceProduct
+    return ReferenceProduct
+
+
+def build_index() -> VectorIndex:
+    index = VectorIndex(_hash_dim())
+    for product in _product_model().objects.all().iterator():
+        index.upsert(product.pk, document_text(product), product_payload(product))
+    return index
+
+
+def get_index() -> VectorIndex:
+    """워커 공용 인덱스. 처음 호출 시 만들고, RAG_REFRESH_SECONDS 마다 다른 워커의 변경 여부를 확인한다."""
+    global _index, _fingerprint, _checked_at
+    now = time.monotonic()
+    with _lock:
+        index = _index
+        due = index is None or now - _checked_at >= float(_setting("RAG_REFRESH_SECONDS", 60))
+        if due:
+            _checked_at = now
+    if not due:
+        return index
+    fingerprint = sales_features.product_fingerprint()
+    if index is not None and fingerprint == _fingerprint:
+        return index
+    with telemetry.span("rag_build") as fields:
+        index = build_index()
+        fields["products"] = len(index)
+    with _lock:
+        _index, _fingerprint = index, fingerprint
+    return index
+
+
+def on_product_saved(product) -> None:
+    """같은 워커에서 저장된 제품은 해당 행만 갱신하고 지문도 맞춰 둔다 (다시 만들지 않도록)."""
+    global _fingerprint
+    with _lock:
+        index = _index
+    if index is None:
+        return
+    is_new = product.pk not in index
+    index.upsert(product.pk, document_text(product), product_payload(product))
+    with _lock:
+        if _fingerprint is not None:
+            n, updated = _fingerprint
+            newest = product.updated_at if updated is None or (product.updated_at and product.updated_at > updated) else updated
+            _fingerprint = (n + (1 if is_new else 0), newest)
+
+
+def on_product_deleted(product) -> None:
+    global _fingerprint
+    with _lock:
+        index = _index
+    if index is None:
+        return
+    existed = product.pk in index
+    index.remove(product.pk)
+    with _lock:
+        if _fingerprint is not None and existed:
+            _fingerprint = (_fingerprint[0] - 1, _fingerprint[1])
+
+
+def search(query: str, k: Optional[int] = None, min_score: Optional[float] = None) -> List[Tuple[Dict[str, Any], float]]:
+    k = int(k or _setting("RAG_TOP_K", 3))
+    min_score = float(_setting("RAG_MIN_SCORE", 0.08) if min_score is None else min_score)
+    with telemetry.span("rag") as fields:
+        hits = get_index().search(query, k, min_score)
+        fields["hits"] = len(hits)
+    return hits
+
+
+def format_fact(payload: Dict[str, Any], segment: Optional[str] = None) -> str:
+    parts = [f"· {payload['name']}: {payload['summary']}".rstrip(": ")]
+    if payload["attributes"]:
+        parts.append("특징 " + ", ".join(f"{k} {v}" for k, v in payload["attributes"].items()))
+    if payload["seasonal_trend"]:
+        parts.append(f"계절성 {payload['seasonal_trend']}")
+    demand = sales_features.describe(sales_features.get_features(payload["id"]), segment)
+    if demand:
+        parts.append(f"수요 {demand}")
+    return " / ".join(parts)
+
+
+# 함수명 : get_rag_context
+# input : query(사용자 발화 또는 스냅샷), segment(페르소나 세그먼트, 선택)
+# output : 프롬프트에 넣을 참고 제품 사실 문자열 (없으면 빈 문자열)
+# 함수 설명 : 상위 k 개 제품을 한 줄씩 정리해 RAG_CONTEXT_CHARS 안으로 자른다.
+#               미리 계산된 수요 수치(sales_features)와 페르소나 세그먼트 점유율을 함께 붙인다.
+def get_rag_context(query: str, segment: Optional[str] = None) -> str:
+    if not enabled() or not (query or "").strip():
+        return ""
+    lines = [format_fact(payload, segment) for payload, _ in search(query)]
+    text = "\n".join(lines)
+    limit = int(_setting("RAG_CONTEXT_CHARS", 600))
+    return text[:limit]
+
+
+aget_rag_context = sync_to_async(get_rag_context)
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        index = _index
+    return {"products": len(index) if index is not None else 0, "dim": _hash_dim(), "loaded": index is not None}
+
+
+def reset() -> None:
+    global _index, _fingerprint, _checked_at
+    with _lock:
+        _index = None
+        _fingerprint = None
+        _checked_at = 0.0
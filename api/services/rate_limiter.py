@@ -0,0 +1,546 @@
+# api/services/rate_limiter.py
+# OpenAI 로 나가는 모든 호출을 통과시키는 전역 속도 제한기.
+#   - 토큰 버킷(분당 요청 수 RPM, 분당 토큰 수 TPM): 모델별로 SQLite 파일 하나에 두어 같은 서버의 모든 워커 프로세스가 공유한다.
+#     토큰은 요청 시 (프롬프트 추정치 + max_tokens) 를 먼저 빼고, 응답의 usage 로 차이를 돌려받는다.
+#   - 적응형 동시성(AIMD): 프로세스별 동시 호출 한도. 429 나 목표 지연 초과 시 절반으로 줄이고, 정상 응답마다 1/한도 씩 늘린다.
+#   - 재시도: 429/408/409/5xx/연결 오류만 재시도한다. Retry-After(-ms) 헤더가 있으면 그 시간만큼, 없으면 지터 지수 백오프.
+#     429 의 Retry-After 는 공유 냉각 시각으로 기록해 다른 프로세스도 그때까지 새 호출을 보내지 않는다.
+#   - 우선순위: 채팅(interactive)이 설문/요약(batch)보다 먼저 슬롯을 잡고, batch 는 버킷의 일부(LLM_LIMITER_BATCH_RESERVE)를 남겨 둔다.
+# LLM_LIMITER_ENABLED=False 면 클라이언트를 그대로 호출한다 (OpenAI SDK 자체 재시도 사용).
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import email.utils
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+from django.conf import settings
+
+from . import telemetry, tokens
+
+PRIORITIES = ("interactive", "batch")
+RETRYABLE_STATUS = (408, 409, 429)
+DEFAULT_COMPLETION_TOKENS = 512
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default="interactive")
+
+
+def _setting(name: str, default):
+    val = getattr(settings, name, None)
+    return default if val is None else val
+
+
+def enabled() -> bool:
+    return bool(_setting("LLM_LIMITER_ENABLED", False))
+
+
+@contextlib.contextmanager
+def priority(name: str):
+    """with priority("batch"): 안의 LLM 호출은 채팅보다 뒤로 밀린다."""
+    token = _priority.set(name if name in PRIORITIES else "interactive")
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def as_batch(fn):
+    """워커 풀에 넘길 함수를 batch 우선순위로 감싼다."""
+    def run(*args, **kwargs):
+        with priority("batch"):
+            return fn(*args, **kwargs)
+    return run
+
+
+# --- 프로세스 공유 토큰 버킷 (SQLite) ---
+
+class TokenBuckets:
+    """모델별 RPM/TPM 버킷. 한 번의 IMMEDIATE 트랜잭션으로 두 버킷을 같이 확인/차감한다."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cooldowns (model TEXT PRIMARY KEY, until REAL NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _refill(row, capacity: float, now: float) -> float:
+        if row is None:
+            return capacity
+        level, updated = row
+        return min(capacity, level + (now - updated) * capacity / 60.0)
+
+    # 함수명 : take
+    # input : model, cost(추정 토큰), reserve(남겨 둘 버킷 비율, batch 용)
+    # output : 0 이면 차감 완료, 양수면 다시 시도하기까지 기다릴 초
+    def take(self, model: str, cost: int, rpm: int, tpm: int, reserve: float = 0.0) -> float:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT until FROM cooldowns WHERE model = ?", (model,)).fetchone()
+            if row is not None and row[0] > now:
+                conn.execute("COMMIT")
+                return row[0] - now
+            names = (f"rpm:{model}", f"tpm:{model}")
+            rows = {name: conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone() for name in names}
+            req_level = self._refill(rows[names[0]], rpm, now)
+            tok_level = self._refill(rows[names[1]], tpm, now)
+            # 한도보다 큰 요청이 영원히 기다리지 않도록 비용은 버킷 크기로 자른다.
+            cost = min(cost, tpm)
+            need_req, need_tok = 1 + reserve * rpm, cost + reserve * tpm
+            wait = max((need_req - req_level) * 60.0 / rpm, (need_tok - tok_level) * 60.0 / tpm, 0.0)
+            if wait <= 0.0:
+                req_level -= 1
+                tok_level -= cost
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                ((names[0], req_level, now), (names[1], tok_level, now)),
+            )
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def adjust(self, model: str, delta: int, tpm: int, requests: int = 0, rpm: int = 0) -> None:
+        """예상보다 적게 쓴 토큰은 돌려주고(+), 많이 쓴 만큼은 더 뺀다(-).
+        requests 를 주면 RPM 버킷에도 그만큼 돌려준다 (호출이 실패했거나 보내지 못한 경우)."""
+        changes = [(f"tpm:{model}", delta, tpm)]
+        if requests:
+            changes.append((f"rpm:{model}", requests, rpm))
+        changes = [change for change in changes if change[1]]
+        if not changes:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            for name, amount, capacity in changes:
+                level = self._refill(conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone(), capacity, now)
+                conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)", (name, min(capacity, level + amount), now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def cool_down(self, model: str, seconds: float) -> None:
+        until = time.time() + seconds
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO cooldowns (model, until) VALUES (?, ?) ON CONFLICT(model) DO UPDATE SET until = MAX(until, excluded.until)",
+            (model, until),
+        )
+
+
+# --- 프로세스별 적응형 동시성 (AIMD) ---
+
+class AdaptiveGate:
+    def __init__(self, initial: float, minimum: int, maximum: int, target_ms: float, cooldown: float = 1.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_ms = target_ms
+        self.cooldown = cooldown
+        self.inflight = 0
+        self.waiting = {p: 0 for p in PRIORITIES}
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def _try_enter(self, prio: str) -> bool:
+        if self.inflight >= int(self.limit):
+            return False
+        if prio == "batch" and self.waiting["interactive"]:
+            return False
+        self.inflight += 1
+        return True
+
+    def enter(self, prio: str, deadline: float) -> bool:
+        with self._cond:
+            self.waiting[prio] += 1
+            try:
+                while not self._try_enter(prio):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(min(remaining, 0.05))
+                return True
+            finally:
+                self.waiting[prio] -= 1
+
+    async def aenter(self, prio: str, deadline: float) -> bool:
+        # 이벤트 루프를 막지 않도록 Condition 대기 대신 짧게 양보하며 다시 확인한다.
+        with self._cond:
+            self.waiting[prio] += 1
+        try:
+            while True:
+                with self._cond:
+                    if self._try_enter(prio):
+                        return True
+                if time.monotonic() >= deadline:
+                    return False
+                await asyncio.sleep(0.02)
+        finally:
+            with self._cond:
+                self.waiting[prio] -= 1
+
+    def leave(self) -> None:
+        with self._cond:
+            self.inflight -= 1
+            self._cond.notify_all()
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        # 같은 혼잡에 대한 연속 응답으로 한도가 한 번에 바닥까지 떨어지지 않게 한다.
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.minimum), self.limit * 0.5)
+        self.decreases += 1
+
+    def on_success(self, latency_ms: float) -> None:
+        with self._cond:
+            if self.target_ms and latency_ms > self.target_ms:
+                self._decrease()
+            else:
+                self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def on_throttle(self) -> None:
+        with self._cond:
+            self._decrease()
+
+
+_lock = threading.Lock()
+_buckets: Optional[TokenBuckets] = None
+_gate: Optional[AdaptiveGate] = None
+_stats = {"calls": 0, "retries": 0, "throttled": 0, "bucket_wait_ms": 0.0, "timeouts": 0}
+
+
+def _get_buckets() -> TokenBuckets:
+    global _buckets
+    with _lock:
+        if _buckets is None:
+            path = str(_setting("LLM_LIMITER_PATH", os.path.join(str(settings.BASE_DIR), "var", "llm_limiter.sqlite3")))
+            _buckets = TokenBuckets(path)
+        return _buckets
+
+
+def _get_gate() -> AdaptiveGate:
+    global _gate
+    with _lock:
+        if _gate is None:
+            _gate = AdaptiveGate(
+                initial=float(_setting("LLM_LIMITER_INITIAL_CONCURRENCY", 8)),
+                minimum=int(_setting("LLM_LIMITER_MIN_CONCURRENCY", 1)),
+                maximum=int(_setting("LLM_LIMITER_MAX_CONCURRENCY", 64)),
+                target_ms=float(_setting("LLM_LIMITER_TARGET_LATENCY_MS", 8000)),
+            )
+        return _gate
+
+
+def _count(key: str, value=1) -> None:
+    with _lock:
+        _stats[key] += value
+
+
+def estimate_cost(model_name: str, request: Dict[str, Any]) -> int:
+    prompt = tokens.count_message_tokens(request.get("messages") or [], model_name)
+    return prompt + int(request.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+
+def _wait_timeout():
+    from openai import APITimeoutError
+    return APITimeoutError(request=httpx.Request("POST", "https://rate-limiter.local/v1/chat/completions"))
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_delay(exc: Exception, attempt: int) -> Optional[float]:
+    """재시도할 오류면 기다릴 초, 아니면 None."""
+    from openai import APIConnectionError, APIStatusError
+
+    if isinstance(exc, APIStatusError):
+        if exc.status_code not in RETRYABLE_STATUS and exc.status_code < 500:
+            return None
+    elif not isinstance(exc, APIConnectionError):
+        return None
+    hinted = _retry_after(exc)
+    if hinted is not None:
+        return min(hinted, float(_setting("LLM_LIMITER_MAX_BACKOFF", 20.0)))
+    # full jitter: [0, min(상한, 기본값 * 2^시도)] 에서 고르게
+    cap = min(float(_setting("LLM_LIMITER_MAX_BACKOFF", 20.0)), float(_setting("LLM_LIMITER_BASE_BACKOFF", 0.5)) * (2 ** attempt))
+    return random.uniform(0.0, cap)
+
+
+class _Lease:
+    """버킷 차감 + 동시성 슬롯 한 건. 응답(스트림이면 스트림 끝)에서 release 한다."""
+
+    def __init__(self, model: str, cost: int, gate: AdaptiveGate):
+        self.model = model
+        self.cost = cost
+        self.gate = gate
+        self.started = time.perf_counter()
+        self._released = False
+
+    def succeeded(self) -> None:
+        self.gate.on_success((time.perf_counter() - self.started) * 1000.0)
+
+    def _throttled(self, exc: Exception, delay: Optional[float]) -> bool:
+        """429 면 동시성 한도를 줄이고, 공유 냉각 시각을 기록해야 하면 True."""
+        if getattr(exc, "status_code", None) != 429:
+            return False
+        self.gate.on_throttle()
+        _count("throttled")
+        return bool(delay)
+
+    def failed(self, exc: Exception, delay: Optional[float]) -> None:
+        if self._throttled(exc, delay):
+            _get_buckets().cool_down(self.model, delay)
+
+    async def afailed(self, exc: Exception, delay: Optional[float]) -> None:
+        if self._throttled(exc, delay):
+            await _in_thread(_get_buckets().cool_down, self.model, delay)
+
+    def _leave(self) -> bool:
+        if self._released:
+            return False
+        self._released = True
+        self.gate.leave()
+        return True
+
+    def _settle(self, usage: Any, refund: bool) -> None:
+        rpm, tpm, _ = _bucket_args("interactive")
+        if refund:
+            # 응답을 못 받은 호출은 토큰을 쓰지 않았으므로 예약한 토큰과 요청 1건을 모두 돌려준다.
+            _get_buckets().adjust(self.model, self.cost, tpm, requests=1, rpm=rpm)
+            return
+        total = getattr(usage, "total_tokens", None)
+        if total is not None:
+            _get_buckets().adjust(self.model, self.cost - int(total), tpm)
+
+    def release(self, usage: Any = None, refund: bool = False) -> None:
+        if self._leave():
+            self._settle(usage, refund)
+
+    async def arelease(self, usage: Any = None, refund: bool = False) -> None:
+        if self._leave():
+            await _in_thread(self._settle, usage, refund)
+
+
+def _in_thread(fn, *args, **kwargs):
+    """SQLite 버킷 조작(BEGIN IMMEDIATE + busy timeout)은 다른 프로세스와 경합하면 몇 초 막힐 수 있으므로
+    비동기 경로에서는 이벤트 루프가 아니라 별도 스레드에서 돌린다."""
+    return asyncio.to_thread(fn, *args, **kwargs)
+
+
+def _bucket_args(prio: str):
+    reserve = float(_setting("LLM_LIMITER_BATCH_RESERVE", 0.2)) if prio == "batch" else 0.0
+    return int(_setting("LLM_LIMITER_RPM", 500)), int(_setting("LLM_LIMITER_TPM", 200000)), reserve
+
+
+def _acquire(model_name: str, cost: int, deadline: float) -> _Lease:
+    prio = _priority.get()
+    rpm, tpm, reserve = _bucket_args(prio)
+    gate = _get_gate()
+    waited = 0.0
+    while True:
+        wait = _get_buckets().take(model_name, cost, rpm, tpm, reserve)
+        if wait <= 0:
+            break
+        if time.monotonic() + wait > deadline:
+            _count("timeouts")
+            raise _wait_timeout()
+        waited += wait
+        time.sleep(wait)
+    if waited:
+        _count("bucket_wait_ms", waited * 1000.0)
+    if not gate.enter(prio, deadline):
+        _get_buckets().adjust(model_name, cost, tpm, requests=1, rpm=rpm)
+        _count("timeouts")
+        raise _wait_timeout()
+    return _Lease(model_name, cost, gate)
+
+
+async def _aacquire(model_name: str, cost: int, deadline: float) -> _Lease:
+    prio = _priority.get()
+    rpm, tpm, reserve = _bucket_args(prio)
+    gate = _get_gate()
+    buckets = _get_buckets()
+    waited = 0.0
+    while True:
+        wait = await _in_thread(buckets.take, model_name, cost, rpm, tpm, reserve)
+        if wait <= 0:
+            break
+        if time.monotonic() + wait > deadline:
+            _count("timeouts")
+            raise _wait_timeout()
+        waited += wait
+        await asyncio.sleep(wait)
+    if waited:
+        _count("bucket_wait_ms", waited * 1000.0)
+    if not await gate.aenter(prio, deadline):
+        await _in_thread(buckets.adjust, model_name, cost, tpm, requests=1, rpm=rpm)
+        _count("timeouts")
+        raise _wait_timeout()
+    return _Lease(model_name, cost, gate)
+
+
+class _LeasedStream:
+    """스트림을 다 읽거나 닫을 때 슬롯을 돌려주고 usage 로 토큰을 정산한다."""
+
+    def __init__(self, stream, lease: _Lease):
+        self._stream = stream
+        self._lease = lease
+
+    def __iter__(self):
+        usage = None
+        try:
+            for chunk in self._stream:
+                usage = getattr(chunk, "usage", None) or usage
+                yield chunk
+        finally:
+            self._lease.release(usage)
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._lease.release()
+
+
+class _AsyncLeasedStream:
+    def __init__(self, stream, lease: _Lease):
+        self._stream = stream
+        self._lease = lease
+
+    async def __aiter__(self):
+        usage = None
+        try:
+            async for chunk in self._stream:
+                usage = getattr(chunk, "usage", None) or usage
+                yield chunk
+        finally:
+            await self._lease.arelease(usage)
+
+    async def close(self) -> None:
+        try:
+            await self._stream.close()
+        finally:
+            await self._lease.arelease()
+
+
+# 함수명 : create
+# input : client(OpenAI), model_name, request(create 인자, stream=True 면 스트리밍)
+# output : client.chat.completions.create 결과 (스트림이면 슬롯을 쥔 채 감싼 이터레이터)
+# 함수 설명 : 버킷 → 동시성 슬롯을 얻은 뒤 호출하고, 재시도 대상 오류는 Retry-After/지터 백오프 후 다시 시도한다.
+#               LLM_LIMITER_MAX_WAIT 안에 슬롯을 못 얻으면 APITimeoutError (호출부의 APIError 처리로 지연 안내 문구).
+def create(client, model_name: str, request: Dict[str, Any]):
+    if not enabled():
+        return client.chat.completions.create(model=model_name, **request)
+    _count("calls")
+    cost = estimate_cost(model_name, request)
+    deadline = time.monotonic() + float(_setting("LLM_LIMITER_MAX_WAIT", 30.0))
+    retries = int(_setting("LLM_LIMITER_MAX_RETRIES", 3))
+    for attempt in range(retries + 1):
+        lease = _acquire(model_name, cost, deadline)
+        try:
+            res = client.chat.completions.create(model=model_name, **request)
+        except Exception as exc:
+            lease.release(refund=True)
+            delay = _retry_delay(exc, attempt)
+            lease.failed(exc, delay)
+            if delay is None or attempt == retries or time.monotonic() + delay > deadline:
+                raise
+            _count("retries")
+            telemetry.emit("llm_retry", model=model_name, attempt=attempt + 1, status=getattr(exc, "status_code", None), delay_ms=round(delay * 1000.0, 1))
+            time.sleep(delay)
+            continue
+        lease.succeeded()
+        if request.get("stream"):
+            return _LeasedStream(res, lease)
+        lease.release(getattr(res, "usage", None))
+        return res
+
+
+async def acreate(client, model_name: str, request: Dict[str, Any]):
+    if not enabled():
+        return await client.chat.completions.create(model=model_name, **request)
+    _count("calls")
+    cost = estimate_cost(model_name, request)
+    deadline = time.monotonic() + float(_setting("LLM_LIMITER_MAX_WAIT", 30.0))
+    retries = int(_setting("LLM_LIMITER_MAX_RETRIES", 3))
+    for attempt in range(retries + 1):
+        lease = await _aacquire(model_name, cost, deadline)
+        try:
+            res = await client.chat.completions.create(model=model_name, **request)
+        except Exception as exc:
+            await lease.arelease(refund=True)
+            delay = _retry_delay(exc, attempt)
+            await lease.afailed(exc, delay)
+            if delay is None or attempt == retries or time.monotonic() + delay > deadline:
+                raise
+            _count("retries")
+            telemetry.emit("llm_retry", model=model_name, attempt=attempt + 1, status=getattr(exc, "status_code", None), delay_ms=round(delay * 1000.0, 1))
+            await asyncio.sleep(delay)
+            continue
+        lease.succeeded()
+        if request.get("stream"):
+            return _AsyncLeasedStream(res, lease)
+        await lease.arelease(getattr(res, "usage", None))
+        return res
+
+
+def stats() -> Dict[str, Any]:
+    out: Dict[str, Any] = {"enabled": enabled()}
+    with _lock:
+        out.update(_stats)
+        gate = _gate
+    out["bucket_wait_ms"] = round(out["bucket_wait_ms"], 2)
+    if gate is not None:
+        out.update({"concurrency_limit": round(gate.limit, 2), "inflight": gate.inflight, "waiting": dict(gate.waiting), "decreases": gate.decreases})
+    return out
+
+
+def reset() -> None:
+    """프로세스 상태(동시성 한도, 통계, 연결)를 버린다. 공유 버킷 파일은 그대로 둔다."""
+    global _buckets, _gate
+    with _lock:
+        _buckets = None
+        _gate = None
+        for key in _stats:
+            _stats[key] = 0
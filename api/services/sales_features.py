@@ -0,0 +1,290 @@
+# api/services/sales_features.py
+# ReferenceProduct.monthly_sales / segment_share(JSON)를 로드 시점에 한 번만 파싱해 NumPy 배열로 미리 계산해 둔다.
+#   - 월평균 판매량, 월별 계절 지수(해당 월 평균 / 전체 평균), 추세 기울기(%/월), 프로모션 상승률, 세그먼트별 점유율
+#   - 제품 묶음 단위로 한 번에(벡터화) 계산하고, 제품 id 로 O(1) 조회한다 (요청마다 JSON 파싱/LLM 계산 없음).
+#   - 갱신 방식은 rag_service 와 같다: 같은 워커의 저장/삭제는 signals 로 해당 제품만, 다른 워커의 변경은 지문 비교로 전체 재계산.
+# monthly_sales 형식: [120, 98, ...] (1월부터) 또는 [{"month": "2024-03", "sales": 120}, ...]
+# segment_share 형식: {"실속형 미식가": 0.18, ...} (합이 1 을 넘으면 백분율로 보고 100 으로 나눈다)
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+
+from . import telemetry
+
+MONTH_NAMES = tuple(f"{m}월" for m in range(1, 13))
+SALES_KEYS = ("sales", "value", "qty", "quantity", "units", "count")
+MONTH_KEYS = ("month", "date", "ym", "period")
+
+
+def _month_of(item: Any, position: int) -> int:
+    """0~11 월 인덱스. 월 정보가 없으면 1월부터 순서대로 본다."""
+    if isinstance(item, dict):
+        for key in MONTH_KEYS:
+            val = item.get(key)
+            if val is None:
+                continue
+            text = str(val).strip()
+            try:
+                month = int(text.replace("/", "-").split("-")[1]) if "-" in text or "/" in text else int(text)
+            except (ValueError, IndexError):
+                continue
+            if 1 <= month <= 12:
+                return month - 1
+    return position % 12
+
+
+def _sales_of(item: Any) -> float:
+    if isinstance(item, dict):
+        for key in SALES_KEYS:
+            if key in item:
+                item = item[key]
+                break
+        else:
+            return float("nan")
+    try:
+        return float(item)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def parse_monthly_sales(raw: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """(판매량 float32 배열, 월 인덱스 int8 배열). 형식이 맞지 않으면 빈 배열."""
+    if isinstance(raw, dict):
+        raw = [{"month": k, "sales": v} for k, v in sorted(raw.items())]
+    if not isinstance(raw, list):
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int8)
+    values = np.array([_sales_of(item) for item in raw], dtype=np.float32)
+    months = np.array([_month_of(item, i) for i, item in enumerate(raw)], dtype=np.int8)
+    return values, months
+
+
+def parse_segment_share(raw: Any) -> Dict[str, float]:
+    if not isinstance(raw, dict):
+        return {}
+    shares: Dict[str, float] = {}
+    for key, val in raw.items():
+        try:
+            shares[str(key).strip()] = float(val)
+        except (TypeError, ValueError):
+            continue
+    if shares and sum(shares.values()) > 1.5:
+        shares = {k: v / 100.0 for k, v in shares.items()}
+    return shares
+
+
+class ProductFeatures:
+    """제품 한 개의 미리 계산된 수요 특성 (읽기 전용으로 취급)."""
+
+    __slots__ = ("product_id", "months", "mean", "seasonal", "trend_pct", "promotion_uplift", "segments", "shares")
+
+    def __init__(self, product_id, months, mean, seasonal, trend_pct, promotion_uplift, segments, shares):
+        self.product_id = product_id
+        self.months = months                    # 유효한 월 데이터 개수
+        self.mean = mean                        # 월평균 판매량
+        self.seasonal = seasonal                # float32[12], 데이터 없는 월은 nan
+        self.trend_pct = trend_pct              # 월평균 대비 월간 추세(%)
+        self.promotion_uplift = promotion_uplift  # 0.3 → 프로모션 시 +30%
+        self.segments = segments                # 세그먼트 이름 튜플
+        self.shares = shares                    # float32[len(segments)]
+
+    def share_for(self, segment: Optional[str]) -> Optional[float]:
+        segment = (segment or "").strip()
+        if not segment or not self.segments:
+            return None
+        for i, name in enumerate(self.segments):
+            if name == segment:
+                return float(self.shares[i])
+        for i, name in enumerate(self.segments):
+            if name in segment or segment in name:
+                return float(self.shares[i])
+        return None
+
+    def peak(self) -> Optional[Tuple[int, float]]:
+        if not np.isfinite(self.seasonal).any():
+            return None
+        m = int(np.nanargmax(self.seasonal))
+        return m, float(self.seasonal[m])
+
+    def trough(self) -> Optional[Tuple[int, float]]:
+        if not np.isfinite(self.seasonal).any():
+            return None
+        m = int(np.nanargmin(self.seasonal))
+        return m, float(self.seasonal[m])
+
+
+# 함수명 : compute_features
+# input : products (ReferenceProduct 목록)
+# output : {제품 pk: ProductFeatures}
+# 함수 설명 : 판매 시계열을 (제품 수 x 최대 길이) 행렬로 쌓아 평균/계절 지수/추세를 한 번에 계산한다.
+#               추세는 결측(nan)을 뺀 최소제곱 기울기를 제품별 평균으로 나눈 값(%/월).
+def compute_features(products: Iterable[Any]) -> Dict[int, ProductFeatures]:
+    products = list(products)
+    if not products:
+        return {}
+    parsed = [parse_monthly_sales(p.monthly_sales) for p in products]
+    width = max(1, max(len(v) for v, _ in parsed))
+    values = np.full((len(products), width), np.nan, dtype=np.float32)
+    months = np.full((len(products), width), -1, dtype=np.int8)
+    for i, (v, m) in enumerate(parsed):
+        values[i, :len(v)] = v
+        months[i, :len(m)] = m
+
+    valid = np.isfinite(values)
+    counts = valid.sum(axis=1)
+    safe = np.where(valid, values, 0.0)
+    means = np.divide(safe.sum(axis=1), counts, out=np.zeros(len(products), dtype=np.float32), where=counts > 0)
+
+    # 월별 계절 지수: 같은 달끼리 평균 / 전체 평균
+    seasonal = np.full((len(products), 12), np.nan, dtype=np.float32)
+    for m in range(12):
+        mask = valid & (months == m)
+        n = mask.sum(axis=1)
+        month_mean = np.divide(np.where(mask, values, 0.0).sum(axis=1), n, out=np.zeros(len(products), dtype=np.float32), where=n > 0)
+        ok = (n > 0) & (means > 0)
+        seasonal[ok, m] = month_mean[ok] / means[ok]
+
+    # 추세: x = 관측 순서, 결측은 제외한 최소제곱 기울기
+    x = np.broadcast_to(np.arange(width, dtype=np.float32), values.shape)
+    x_mean = np.divide(np.where(valid, x, 0.0).sum(axis=1), counts, out=np.zeros(len(products), dtype=np.float32), where=counts > 0)
+    dx = np.where(valid, x - x_mean[:, None], 0.0)
+    dy = np.where(valid, values - means[:, None], 0.0)
+    denom = (dx * dx).sum(axis=1)
+    slope = np.divide((dx * dy).sum(axis=1), denom, out=np.zeros(len(products), dtype=np.float32), where=denom > 0)
+    trend_pct = np.divide(slope * 100.0, means, out=np.zeros(len(products), dtype=np.float32), where=means > 0)
+
+    out: Dict[int, ProductFeatures] = {}
+    for i, product in enumerate(products):
+        shares = parse_segment_share(product.segment_share)
+        uplift = product.promotion_effect
+        out[product.pk] = ProductFeatures(
+            product_id=product.product_id,
+            months=int(counts[i]),
+            mean=float(means[i]),
+            seasonal=seasonal[i].copy(),
+            trend_pct=float(trend_pct[i]),
+            promotion_uplift=float(uplift) if uplift is not None else None,
+            segments=tuple(shares),
+            shares=np.array(list(shares.values()), dtype=np.float32),
+        )
+    return out
+
+
+# 함수명 : describe
+# input : features(ProductFeatures), segment(페르소나 세그먼트, 선택)
+# output : 프롬프트에 인용할 수치 한 줄 (없으면 빈 문자열)
+def describe(features: Optional[ProductFeatures], segment: Optional[str] = None) -> str:
+    if features is None:
+        return ""
+    parts: List[str] = []
+    if features.months:
+        parts.append(f"월평균 판매 {features.mean:,.0f}개")
+        if features.months >= 3:
+            parts.append(f"추세 {features.trend_pct:+.1f}%/월")
+        peak, trough = features.peak(), features.trough()
+        if peak and trough and peak[0] != trough[0]:
+            parts.append(f"성수기 {MONTH_NAMES[peak[0]]}({peak[1]:.2f}배)")
+            parts.append(f"비수기 {MONTH_NAMES[trough[0]]}({trough[1]:.2f}배)")
+    if features.promotion_uplift is not None:
+        parts.append(f"프로모션 시 +{features.promotion_uplift:.0%}")
+    share = features.share_for(segment)
+    if share is not None:
+        parts.append(f"{segment} 점유율 {share:.0%}")
+    return " · ".join(parts)
+
+
+_lock = threading.Lock()
+_table: Optional[Dict[int, ProductFeatures]] = None
+_fingerprint: Optional[Tuple[int, Any]] = None
+_checked_at = 0.0
+
+
+def _setting(name: str, default):
+    val = getattr(settings, name, None)
+    return default if val is None else val
+
+
+def product_fingerprint() -> Tuple[int, Any]:
+    """ReferenceProduct 테이블 지문 (개수, 최종 수정 시각). 워커별 캐시가 다른 워커의 변경을 알아채는 데 쓴다."""
+    from chat.models import ReferenceProduct
+    agg = ReferenceProduct.objects.aggregate(n=Count("id"), updated=Max("updated_at"))
+    return agg["n"], agg["updated"]
+
+
+def get_table() -> Dict[int, ProductFeatures]:
+    global _table, _fingerprint, _checked_at
+    now = time.monotonic()
+    with _lock:
+        table = _table
+        due = table is None or now - _checked_at >= float(_setting("RAG_REFRESH_SECONDS", 60))
+        if due:
+            _checked_at = now
+    if not due:
+        return table
+    fingerprint = product_fingerprint()
+    if table is not None and fingerprint == _fingerprint:
+        return table
+    from chat.models import ReferenceProduct
+    with telemetry.span("sales_features_build") as fields:
+        table = compute_features(ReferenceProduct.objects.only(
+            "id", "product_id", "monthly_sales", "segment_share", "promotion_effect",
+        ).iterator())
+        fields["products"] = len(table)
+    with _lock:
+        _table, _fingerprint = table, fingerprint
+    return table
+
+
+def get_features(product_pk: int) -> Optional[ProductFeatures]:
+    return get_table().get(product_pk)
+
+
+def on_product_saved(product) -> None:
+    global _table, _fingerprint
+    with _lock:
+        if _table is None:
+            return
+        is_new = product.pk not in _table
+    features = compute_features([product]).get(product.pk)
+    with _lock:
+        if _table is None:
+            return
+        # 읽는 쪽이 잠금 없이 쓰도록 사전을 복사해 교체한다.
+        table = dict(_table)
+        table[product.pk] = features
+        _table = table
+        if _fingerprint is not None:
+            n, updated = _fingerprint
+            newest = product.updated_at if updated is None or (product.updated_at and product.updated_at > updated) else updated
+            _fingerprint = (n + (1 if is_new else 0), newest)
+
+
+def on_product_deleted(product) -> None:
+    global _table, _fingerprint
+    with _lock:
+        if _table is None or product.pk not in _table:
+            return
+        table = dict(_table)
+        table.pop(product.pk, None)
+        _table = table
+        if _fingerprint is not None:
+            _fingerprint = (_fingerprint[0] - 1, _fingerprint[1])
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        table = _table
+    return {"products": len(table) if table is not None else 0, "loaded": table is not None}
+
+
+def reset() -> None:
+    global _table, _fingerprint, _checked_at
+    with _lock:
+        _table = None
+        _fingerprint = None
+        _checked_at = 0.0
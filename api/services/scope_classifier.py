@@ -0,0 +1,212 @@
+# api/services/scope_classifier.py
+# 로컬 도메인(scope) 분류기: 문자 n-gram 해싱 + 로지스틱 회귀 (NumPy).
+# 확신 구간 밖(확률이 밴드 아래/위)이면 LLM 판별 없이 바로 결정하고,
+# 밴드 안이면 None 을 돌려 LLM 판별로 넘긴다.
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except Exception:
+    np = None
+    HAS_NUMPY = False
+
+N_FEATURES = 1 << 18
+NGRAM_RANGE = (1, 3)
+_WS_RE = re.compile(r"\s+")
+
+_model_lock = threading.Lock()
+_model: Optional[Dict[str, object]] = None
+_model_mtime: Optional[float] = None
+
+
+def _model_path() -> str:
+    default = os.path.join(str(settings.BASE_DIR), "var", "scope_classifier.npz")
+    return str(getattr(settings, "SCOPE_CLASSIFIER_PATH", None) or default)
+
+
+def _band() -> Tuple[float, float]:
+    low, high = getattr(settings, "SCOPE_CLASSIFIER_BAND", (0.2, 0.85))
+    return float(low), float(high)
+
+
+def enabled() -> bool:
+    return HAS_NUMPY and bool(getattr(settings, "SCOPE_CLASSIFIER_ENABLED", True))
+
+
+def _normalize(text: str) -> str:
+    return " " + _WS_RE.sub(" ", (text or "").strip().lower()) + " "
+
+
+def _hashed_ngrams(text: str) -> Dict[int, float]:
+    t = _normalize(text)
+    counts: Dict[int, float] = {}
+    lo, hi = NGRAM_RANGE
+    for n in range(lo, hi + 1):
+        for i in range(len(t) - n + 1):
+            h = zlib.crc32(t[i:i + n].encode("utf-8")) & (N_FEATURES - 1)
+            counts[h] = counts.get(h, 0.0) + 1.0
+    return counts
+
+
+def featurize(texts: Sequence[str]):
+    """텍스트 목록을 CSR 형태(indices, values, indptr)로 변환한다. 값은 log(1+tf) 후 L2 정규화."""
+    indices: List[int] = []
+    values: List[float] = []
+    indptr = [0]
+    for text in texts:
+        counts = _hashed_ngrams(text)
+        if counts:
+            v = np.log1p(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+            v /= float(np.linalg.norm(v)) or 1.0
+            indices.extend(counts.keys())
+            values.extend(v.tolist())
+        indptr.append(len(indices))
+    return (
+        np.asarray(indices, dtype=np.int64),
+        np.asarray(values, dtype=np.float32),
+        np.asarray(indptr, dtype=np.int64),
+    )
+
+
+def _row_dot(w, b: float, indices, values, indptr):
+    prod = w[indices] * values
+    n_rows = len(indptr) - 1
+    out = np.full(n_rows, b, dtype=np.float64)
+    nonempty = indptr[:-1] < indptr[1:]
+    if prod.size:
+        sums = np.add.reduceat(prod, indptr[:-1][nonempty])
+        out[nonempty] += sums
+    return out
+
+
+def _sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+def train(texts: Sequence[str], labels: Sequence[int], sample_weight: Optional[Sequence[float]] = None,
+          epochs: int = 300, lr: float = 0.5, l2: float = 1e-4) -> Dict[str, object]:
+    """전체 배치 경사하강(AdaGrad)으로 로지스틱 회귀를 학습한다."""
+    indices, values, indptr = featurize(texts)
+    y = np.asarray(labels, dtype=np.float64)
+    sw = np.ones_like(y) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    sw = sw / sw.sum()
+    row_of = np.repeat(np.arange(len(y)), np.diff(indptr))
+    w = np.zeros(N_FEATURES, dtype=np.float64)
+    b = 0.0
+    gw_acc = np.full(N_FEATURES, 1e-8)
+    gb_acc = 1e-8
+    for _ in range(epochs):
+        p = _sigmoid(_row_dot(w, b, indices, values, indptr))
+        r = (p - y) * sw
+        grad = np.zeros(N_FEATURES, dtype=np.float64)
+        np.add.at(grad, indices, r[row_of] * values)
+        grad += l2 * w
+        gb = float(r.sum())
+        gw_acc += grad * grad
+        gb_acc += gb * gb
+        w -= lr * grad / np.sqrt(gw_acc)
+        b -= lr * gb / (gb_acc ** 0.5)
+    return {"w": w.astype(np.float32), "b": float(b), "n_train": int(len(y))}
+
+
+def predict_proba_batch(model: Dict[str, object], texts: Sequence[str]):
+    indices, values, indptr = featurize(texts)
+    return _sigmoid(_row_dot(model["w"], model["b"], indices, values, indptr))
+
+
+def save(model: Dict[str, object], path: Optional[str] = None, meta: Optional[Dict[str, object]] = None) -> str:
+    path = path or _model_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    info = {"b": model["b"], "n_train": model.get("n_train", 0), **(meta or {})}
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, w=model["w"], meta=np.asarray(json.dumps(info)))
+    os.replace(tmp, path)
+    return path
+
+
+def load(path: Optional[str] = None) -> Optional[Dict[str, object]]:
+    """학습된 모델을 읽어 워커에 캐시한다. 파일이 갱신되면(mtime 변경) 다시 읽는다."""
+    global _model, _model_mtime
+    if not HAS_NUMPY:
+        return None
+    path = path or _model_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if _model is not None and _model_mtime == mtime:
+        return _model
+    with _model_lock:
+        if _model is None or _model_mtime != mtime:
+            with np.load(path) as data:
+                info = json.loads(str(data["meta"]))
+                _model = {"w": data["w"].astype(np.float32), "b": float(info["b"]), "meta": info}
+            _model_mtime = mtime
+    return _model
+
+
+def predict_proba(text: str) -> Optional[float]:
+    if not enabled():
+        return None
+    model = load()
+    if model is None:
+        return None
+    counts = _hashed_ngrams(text)
+    if not counts:
+        return None
+    idx = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    v = np.log1p(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    v /= float(np.linalg.norm(v)) or 1.0
+    z = float(np.dot(model["w"][idx], v)) + model["b"]
+    return float(_sigmoid(np.float64(z)))
+
+
+def decide_from_proba(p: Optional[float], band: Optional[Tuple[float, float]] = None) -> Optional[bool]:
+    if p is None:
+        return None
+    low, high = band or _band()
+    if p >= high:
+        return True
+    if p <= low:
+        return False
+    return None
+
+
+def decide(text: str) -> Tuple[Optional[bool], Optional[float]]:
+    """(판정, 확률). 판정이 None 이면 불확실 구간이므로 LLM 으로 넘긴다."""
+    p = predict_proba(text)
+    return decide_from_proba(p), p
+
+
+def evaluate(probas: Iterable[float], labels: Iterable[int], band: Optional[Tuple[float, float]] = None) -> Dict[str, float]:
+    """밴드 기준 정확도/기권율 리포트. 기권한 샘플은 LLM 이 판정한다고 보고 정확도에서 제외한다."""
+    decided = correct = total = 0
+    tp = fp = fn = 0
+    for p, y in zip(probas, labels):
+        total += 1
+        verdict = decide_from_proba(float(p), band)
+        if verdict is None:
+            continue
+        decided += 1
+        correct += int(verdict == bool(y))
+        tp += int(verdict and bool(y))
+        fp += int(verdict and not bool(y))
+        fn += int((not verdict) and bool(y))
+    return {
+        "total": total,
+        "decided": decided,
+        "abstention_rate": round(1 - decided / total, 4) if total else 0.0,
+        "accuracy_on_decided": round(correct / decided, 4) if decided else 0.0,
+        "precision_in": round(tp / (tp + fp), 4) if (tp + fp) else 0.0,
+        "recall_in": round(tp / (tp + fn), 4) if (tp + fn) else 0.0,
+    }
@@ -0,0 +1,249 @@
+# api/services/similar_persona_service.py
+# 07_chat_Persona_attributes_weighted.jsonl 의 가중 특성 벡터로 "비슷한 페르소나" 를 찾는다.
+#   - 벡터: 특성 7개(*_scaled 값) x 해당 속성 가중치. persona_key 는 Persona.id 와 같다.
+#   - 저장: float32 .npy 파일(SIMILAR_PERSONA_DIR/v-<원본 지문>/)로 한 번 만들고 np.load(mmap_mode="r") 로 연다.
+#           읽기 전용 mmap 이라 같은 서버의 워커 프로세스들이 OS 페이지 캐시의 같은 메모리를 공유한다.
+#           행은 meta.cluster 순으로 정렬해 두어 클러스터 한정 검색은 연속 구간만 읽는다.
+#   - 검색: 후보 전체에 대한 정확한 top-k (cosine 또는 가중 L2). 근사/인덱스 구조 없음.
+# 원본 파일이 바뀌면(크기/수정 시각) 새 디렉터리로 다시 만들고, 만들기는 임시 디렉터리 → rename 으로 원자적으로 끝낸다.
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+from django.conf import settings
+
+from . import persona_profile, telemetry
+
+TRAIT_KEYS = persona_profile.TRAIT_KEYS
+METRICS = ("cosine", "weighted_l2")
+FILES = ("keys", "clusters", "vectors", "unit", "offsets", "cluster_ids")
+
+
+def _setting(name: str, default):
+    val = getattr(settings, name, None)
+    return default if val is None else val
+
+
+def source_path() -> str:
+    return str(_setting("SIMILAR_PERSONA_SOURCE", os.path.join(str(settings.BASE_DIR), "07_chat_Persona_attributes_weighted.jsonl")))
+
+
+def store_dir() -> str:
+    return str(_setting("SIMILAR_PERSONA_DIR", os.path.join(str(settings.BASE_DIR), "var", "similar_personas")))
+
+
+def source_digest(path: str) -> str:
+    st = os.stat(path)
+    return hashlib.blake2b(f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}".encode("utf-8"), digest_size=8).hexdigest()
+
+
+def parse_source(path: str):
+    """(persona_key 배열, cluster 배열, 값 행렬, 가중치 행렬, {cluster: label})."""
+    keys: List[int] = []
+    clusters: List[int] = []
+    values: List[List[float]] = []
+    weights: List[List[float]] = []
+    labels: Dict[int, str] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            rec = json.loads(line)
+            attrs = rec.get("attributes") or {}
+            meta = rec.get("meta") or {}
+            cluster = int(meta.get("cluster", -1))
+            keys.append(int(rec["persona_key"]))
+            clusters.append(cluster)
+            values.append([float((attrs.get(f"{k}_scaled") or {}).get("value") or 0.0) for k in TRAIT_KEYS])
+            weights.append([float((attrs.get(f"{k}_scaled") or {}).get("weight") or 0.0) for k in TRAIT_KEYS])
+            if meta.get("label"):
+                labels.setdefault(cluster, str(meta["label"]))
+    return (
+        np.asarray(keys, dtype=np.int64), np.asarray(clusters, dtype=np.int32),
+        np.asarray(values, dtype=np.float32).reshape(-1, len(TRAIT_KEYS)),
+        np.asarray(weights, dtype=np.float32).reshape(-1, len(TRAIT_KEYS)), labels,
+    )
+
+
+# 함수명 : build
+# input : source(JSONL 경로), directory(저장 위치)
+# output : 만든(또는 이미 있는) 버전 디렉터리 경로
+# 함수 설명 : 가중 벡터 / 단위 벡터 / 클러스터 구간(offsets)을 .npy 로 저장한다. 같은 지문 디렉터리가 있으면 그대로 쓴다.
+def build(source: Optional[str] = None, directory: Optional[str] = None) -> str:
+    source = source or source_path()
+    directory = directory or store_dir()
+    final = os.path.join(directory, f"v-{source_digest(source)}")
+    if os.path.isdir(final):
+        return final
+    keys, clusters, values, weights, labels = parse_source(source)
+    order = np.argsort(clusters, kind="stable")
+    keys, clusters = keys[order], clusters[order]
+    vectors = (values * weights)[order]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    cluster_ids, starts = np.unique(clusters, return_index=True)
+    offsets = np.append(starts, len(keys)).astype(np.int64)
+    arrays = {
+        "keys": keys, "clusters": clusters, "vectors": vectors.astype(np.float32),
+        "unit": (vectors / norms).astype(np.float32), "offsets": offsets, "cluster_ids": cluster_ids.astype(np.int32),
+    }
+    os.makedirs(directory, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix="tmp-", dir=directory)
+    try:
+        for name, arr in arrays.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), arr)
+        info = {
+            "source": os.path.abspath(source), "personas": int(len(keys)), "traits": list(TRAIT_KEYS),
+            "labels": {str(k): v for k, v in labels.items()},
+            # 원본에 없는 페르소나(새로 만든 페르소나)를 특성 태그로 검색할 때 쓰는 평균 가중치
+            "mean_weights": weights.mean(axis=0).round(6).tolist() if len(weights) else [0.0] * len(TRAIT_KEYS),
+        }
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False)
+        try:
+            os.rename(tmp, final)
+        except OSError:
+            # 다른 프로세스가 먼저 만들었다.
+            shutil.rmtree(tmp, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return final
+
+
+class Neighbor(NamedTuple):
+    persona_id: int
+    score: float
+    cluster: int
+
+
+class SimilarityIndex:
+    """mmap 으로 연 읽기 전용 벡터 행렬."""
+
+    def __init__(self, path: str):
+        self.path = path
+        for name in FILES:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.labels = {int(k): v for k, v in self.meta.get("labels", {}).items()}
+        self.mean_weights = np.asarray(self.meta["mean_weights"], dtype=np.float32)
+        # persona_key → 행 번호 (작은 사전, 프로세스별)
+        self._row = {int(k): i for i, k in enumerate(np.asarray(self.keys).tolist())}
+
+    def __len__(self) -> int:
+        return len(self._row)
+
+    def __contains__(self, persona_id) -> bool:
+        return persona_id in self._row
+
+    def vector_for(self, persona_id: int) -> Optional[np.ndarray]:
+        row = self._row.get(persona_id)
+        return None if row is None else np.array(self.vectors[row])
+
+    def cluster_for(self, persona_id: int) -> Optional[int]:
+        row = self._row.get(persona_id)
+        return None if row is None else int(self.clusters[row])
+
+    def _span(self, cluster: Optional[int]):
+        if cluster is None:
+            return 0, len(self)
+        pos = np.searchsorted(self.cluster_ids, cluster)
+        if pos >= len(self.cluster_ids) or self.cluster_ids[pos] != cluster:
+            return 0, 0
+        return int(self.offsets[pos]), int(self.offsets[pos + 1])
+
+    # 함수명 : search
+    # input : vector(가중 특성 벡터), k, metric('cosine' | 'weighted_l2'), cluster(같은 클러스터만, 선택), exclude(제외할 persona id)
+    # output : Neighbor 목록 (가까운 순). cosine 은 유사도, weighted_l2 는 거리(작을수록 가까움)
+    def search(self, vector: np.ndarray, k: int = 10, metric: str = "cosine", cluster: Optional[int] = None, exclude=()) -> List[Neighbor]:
+        start, end = self._span(cluster)
+        if end <= start:
+            return []
+        vector = np.asarray(vector, dtype=np.float32)
+        if metric == "weighted_l2":
+            diff = self.vectors[start:end] - vector
+            scores = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+            keyed = scores
+        else:
+            norm = float(np.linalg.norm(vector)) or 1.0
+            scores = self.unit[start:end] @ (vector / norm)
+            keyed = -scores
+        keys = self.keys[start:end]
+        if exclude:
+            keyed = np.where(np.isin(keys, list(exclude)), np.inf, keyed)
+        k = min(k, int(np.isfinite(keyed).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(keyed, k - 1)[:k]
+        top = top[np.argsort(keyed[top])]
+        return [Neighbor(int(keys[i]), round(float(scores[i]), 6), int(self.clusters[start + i])) for i in top]
+
+
+_lock = threading.Lock()
+_index: Optional[SimilarityIndex] = None
+_index_source: Optional[str] = None
+
+
+def get_index() -> Optional[SimilarityIndex]:
+    """원본 파일이 없으면 None. 원본 지문이 바뀌면 새 버전을 만들어 다시 연다."""
+    global _index, _index_source
+    source = source_path()
+    if not os.path.exists(source):
+        return None
+    digest = source_digest(source)
+    with _lock:
+        if _index is not None and _index_source == digest:
+            return _index
+    with telemetry.span("similar_persona_load") as fields:
+        index = SimilarityIndex(build(source))
+        fields["personas"] = len(index)
+    with _lock:
+        _index, _index_source = index, digest
+    return index
+
+
+def query_vector(persona, index: SimilarityIndex) -> np.ndarray:
+    """원본에 있는 페르소나는 저장된 벡터, 없으면 특성 태그 점수 x 평균 가중치."""
+    vec = index.vector_for(persona.pk)
+    if vec is not None:
+        return vec
+    traits = persona_profile.get_profile(persona).traits
+    values = np.array([traits.get(k, 0.5) for k in TRAIT_KEYS], dtype=np.float32)
+    return values * index.mean_weights
+
+
+# 함수명 : similar_to
+# input : persona, k(기본 SIMILAR_PERSONA_TOP_K, 최대 SIMILAR_PERSONA_MAX_K), metric, same_cluster(같은 meta.cluster 안에서만)
+# output : Neighbor 목록 (자기 자신 제외). 원본 파일이 없으면 빈 목록
+def similar_to(persona, k: Optional[int] = None, metric: str = "cosine", same_cluster: bool = False) -> List[Neighbor]:
+    k = min(int(k or _setting("SIMILAR_PERSONA_TOP_K", 10)), int(_setting("SIMILAR_PERSONA_MAX_K", 200)))
+    index = get_index()
+    if index is None:
+        return []
+    cluster = index.cluster_for(persona.pk) if same_cluster else None
+    with telemetry.span("similar_persona") as fields:
+        result = index.search(query_vector(persona, index), k, metric, cluster, exclude=(persona.pk,))
+        fields["hits"] = len(result)
+    return result
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        index = _index
+    return {"personas": len(index) if index is not None else 0, "loaded": index is not None, "path": index.path if index is not None else None}
+
+
+def reset() -> None:
+    global _index, _index_source
+    with _lock:
+        _index = None
+        _index_source = None
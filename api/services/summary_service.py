@@ -0,0 +1,255 @@
+# api/services/summary_service.py
+# ChatThread 누적 요약(rolling summary) + 슬롯 상태 관리.
+#   - 저장 직후 요약에 아직 반영되지 않은 메시지(보통 새 user/persona 한 쌍)만 반영해 요약을 갱신한다 (히스토리 전체 재요약 X)
+#     병합이 늦게/순서가 바뀌어 돌아도 뒤 턴의 병합이 앞 턴 메시지까지 함께 반영하므로 빠지는 턴이 없다.
+#   - 다음 턴에서는 이 요약을 스냅샷으로 그대로 쓰므로, 턴당 스냅샷 비용이 대화 길이와 무관하게 일정하다.
+from __future__ import annotations
+
+import json
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+
+from chat.models import ChatMessage, ChatThread
+
+from . import openai_pool, rate_limiter, telemetry, token_budget, tokens
+
+logger = logging.getLogger(__name__)
+
+SLOT_KEYS = ("product", "size", "price", "period")
+SUMMARY_CHAR_LIMIT = 400
+# 한 번의 병합에 넣는 미반영 메시지 최대 수 (요약이 처음 만들어지는 긴 스레드는 최근 것만)
+MAX_FOLD_MESSAGES = 8
+
+PRICE_SLOT_RE = re.compile(r"(\d{1,3}(?:,\d{3})+|\d+)\s*원")
+SIZE_SLOT_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(kg|g|ml|l|리터|개입|입|캔|봉|팩|병)(?![가-힣a-z])", re.IGNORECASE)
+PERIOD_SLOT_RE = re.compile(r"(하루|일주일|한\s?주|\d+\s?주|한\s?달|\d+\s?(?:개월|달)|일\s?년|\d+\s?년)")
+
+_POOL: Optional[ThreadPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "CHAT_ROLLING_SUMMARY", True))
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = ThreadPoolExecutor(
+                    max_workers=int(getattr(settings, "CHAT_SUMMARY_WORKERS", 2)),
+                    thread_name_prefix="chat-summary",
+                )
+    return _POOL
+
+
+# 함수명 : extract_slots
+# input : text
+# output : {"size": ..., "price": ..., "period": ...} (찾은 것만)
+# 함수 설명 : 발화에서 정규식으로 규격/가격/기간 슬롯을 뽑는다. 제품명은 LLM 병합 결과에 맡긴다.
+def extract_slots(text: str) -> Dict[str, str]:
+    t = text or ""
+    slots: Dict[str, str] = {}
+    m = SIZE_SLOT_RE.search(t)
+    if m:
+        slots["size"] = f"{m.group(1)}{m.group(2)}"
+    m = PRICE_SLOT_RE.search(t)
+    if m:
+        slots["price"] = f"{m.group(1)}원"
+    m = PERIOD_SLOT_RE.search(t)
+    if m:
+        slots["period"] = re.sub(r"\s+", " ", m.group(1))
+    return slots
+
+
+def _merge_slots(base: Dict[str, Any], *updates: Dict[str, Any]) -> Dict[str, str]:
+    out = {k: str(v) for k, v in (base or {}).items() if k in SLOT_KEYS and v}
+    for upd in updates:
+        for k in SLOT_KEYS:
+            v = (upd or {}).get(k)
+            if v:
+                out[k] = str(v).strip()
+    return out
+
+
+def _merge_request(summary: str, slots: Dict[str, str], messages: List[Tuple[str, str]]) -> Dict[str, Any]:
+    system = (
+        "너는 식품 수요예측 인터뷰 기록자다. [이전 요약]과 [슬롯]에 [새 대화]를 순서대로 반영해 갱신하라. "
+        "요약은 지금까지 논의된 제품/조건/페르소나의 답(구매 수량 등)을 3문장 이내로 유지하고, 새 대화와 무관한 내용은 그대로 둔다. "
+        "슬롯은 현재 논의 중인 product(상품명), size(규격), price(가격), period(기간)이며 모르면 빈 문자열. "
+        'JSON 으로만 답하라: {"summary": "...", "product": "", "size": "", "price": "", "period": ""}'
+    )
+    dialogue = "\n".join(
+        f"페르소나: {text[:600]}" if sender == "persona" else f"사용자: {text}" for sender, text in messages
+    )
+    user = (
+        f"[이전 요약]\n{summary or '(없음)'}\n\n[슬롯]\n{json.dumps(slots, ensure_ascii=False)}\n\n"
+        f"[새 대화]\n{dialogue}"
+    )
+    return {
+        "messages": [{"role": "system", "content": system}, {"role": "user", "content": user}],
+        "temperature": 0,
+        "max_tokens": 220,
+        "response_format": {"type": "json_object"},
+    }
+
+
+def _llm_merge(client, model_name: str, summary: str, slots: Dict[str, str], messages: List[Tuple[str, str]]) -> Optional[Dict[str, Any]]:
+    try:
+        # 누적 요약은 답변을 기다리는 사용자가 없으므로 채팅 호출보다 뒤로 민다.
+        with telemetry.span("summary", model_name), rate_limiter.priority("batch"):
+            res = rate_limiter.create(client, model_name, _merge_request(summary, slots, messages))
+        telemetry.record_usage("summary", model_name, getattr(res, "usage", None))
+        data = json.loads(res.choices[0].message.content or "{}")
+    except Exception:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _unsummarized_messages(thread_id: int, after_id: Optional[int], upto_id: int) -> List[Tuple[str, str]]:
+    """요약에 아직 없는 (after_id, upto_id] 메시지의 (sender, message), 시간 순 최대 MAX_FOLD_MESSAGES 건."""
+    qs = ChatMessage.objects.filter(thread_id=thread_id, id__lte=upto_id)
+    if after_id is not None:
+        qs = qs.filter(id__gt=after_id)
+    rows = list(qs.order_by("-id").values_list("sender", "message")[:MAX_FOLD_MESSAGES])
+    return rows[::-1]
+
+
+# 함수명 : update_summary
+# input : thread_id, last_message_id(이번 턴의 마지막 메시지 id), client(선택)
+# output : 갱신했으면 True
+# 함수 설명 : 요약에 아직 반영되지 않은 메시지(summary_message_id 이후 ~ last_message_id)로 요약/슬롯을 증분 갱신한다.
+#               1. 이미 더 최신 메시지까지 반영돼 있으면 건너뜀 (뒤 턴의 병합이 이 턴 메시지까지 반영한 경우)
+#               2. LLM 병합 실패 시 이전 요약은 유지하고 정규식 슬롯만 갱신
+#               3. summary_message_id 가 뒤로 가지 않도록 조건부 UPDATE
+def update_summary(thread_id: int, last_message_id: int, client=None) -> bool:
+    row = ChatThread.objects.filter(id=thread_id).values("summary", "slot_state", "summary_message_id").first()
+    if row is None:
+        return False
+    if row["summary_message_id"] is not None and row["summary_message_id"] >= last_message_id:
+        return False
+    messages = _unsummarized_messages(thread_id, row["summary_message_id"], last_message_id)
+    if not messages:
+        return False
+    summary = row["summary"] or ""
+    slots = _merge_slots(row["slot_state"] or {})
+
+    if client is None:
+        try:
+            client = openai_pool.get_client()
+        except Exception:
+            client = None
+    merged = None
+    if client is not None:
+        model_name = getattr(settings, "CHAT_SUMMARY_MODEL", "gpt-4o-mini")
+        merged = _llm_merge(client, model_name, summary, slots, messages)
+    if merged:
+        summary = str(merged.get("summary") or summary).strip()[:SUMMARY_CHAR_LIMIT]
+    # 사용자가 직접 말한 수치가 가장 정확하므로 정규식 슬롯을 마지막에 덮어쓴다.
+    slots = _merge_slots(slots, merged or {}, *(extract_slots(text) for sender, text in messages if sender == "user"))
+
+    updated = ChatThread.objects.filter(
+        Q(summary_message_id__isnull=True) | Q(summary_message_id__lt=last_message_id), id=thread_id,
+    ).update(summary=summary, slot_state=slots, summary_message_id=last_message_id)
+    return bool(updated)
+
+
+def _run_update(thread_id: int, last_message_id: int) -> None:
+    try:
+        update_summary(thread_id, last_message_id)
+    except Exception:
+        logger.exception("rolling summary update failed (thread=%s)", thread_id)
+    finally:
+        close_old_connections()
+
+
+# 함수명 : schedule_update
+# input : thread_id, last_message_id
+# output : 없음
+# 함수 설명 : 트랜잭션 커밋 후 요약 갱신을 예약한다. CHAT_SUMMARY_BACKGROUND=False 면 커밋 직후 같은 스레드에서 실행.
+#               반영할 메시지는 실행 시점에 DB 에서 읽으므로 예약 순서와 실행 순서가 달라도 된다.
+def schedule_update(thread_id: int, last_message_id: int) -> None:
+    if not enabled():
+        return
+
+    def _submit():
+        if getattr(settings, "CHAT_SUMMARY_BACKGROUND", True):
+            _get_pool().submit(telemetry.bind(_run_update), thread_id, last_message_id)
+        else:
+            update_summary(thread_id, last_message_id)
+
+    transaction.on_commit(_submit)
+
+
+# 함수명 : load_state
+# input : thread_id
+# output : {"summary", "slots", "message_id"} 또는 None (요약이 아직 없을 때)
+def load_state(thread_id: Optional[int]) -> Optional[Dict[str, Any]]:
+    if not (enabled() and thread_id):
+        return None
+    row = ChatThread.objects.filter(id=thread_id).values("summary", "slot_state", "summary_message_id").first()
+    return _state_from_row(row)
+
+
+async def aload_state(thread_id: Optional[int]) -> Optional[Dict[str, Any]]:
+    if not (enabled() and thread_id):
+        return None
+    row = await ChatThread.objects.filter(id=thread_id).values("summary", "slot_state", "summary_message_id").afirst()
+    return _state_from_row(row)
+
+
+def _state_from_row(row) -> Optional[Dict[str, Any]]:
+    if not row or row["summary_message_id"] is None:
+        return None
+    return {"summary": row["summary"] or "", "slots": row["slot_state"] or {}, "message_id": row["summary_message_id"]}
+
+
+def _pending_rows(state: Dict[str, Any], rows: Iterable) -> list:
+    # 요약에 아직 반영되지 않은 메시지 (백그라운드 갱신이 한 턴 늦은 경우)
+    return [r for r in rows if r.id > state["message_id"]]
+
+
+# 함수명 : render_snapshot
+# input : state, rows(최근 메시지), user_input
+# output : 스냅샷 문자열
+# 함수 설명 : 누적 요약 + 슬롯을 기존 스냅샷 형식("현재 대상: ...")으로 만든다. LLM 호출 없음.
+#               아직 요약에 반영되지 않은 사용자 발화와 최신 발화의 정규식 슬롯도 덮어쓴다.
+def render_snapshot(state: Dict[str, Any], rows: Iterable, user_input: str) -> str:
+    pending = [r.message for r in _pending_rows(state, rows) if r.sender == "user"]
+    slots = _merge_slots(state["slots"], *(extract_slots(t) for t in pending + [user_input]))
+    parts = []
+    target = " ".join(x for x in (slots.get("product"), slots.get("size")) if x)
+    if target:
+        parts.append(f"현재 대상: {target}")
+    if slots.get("period"):
+        parts.append(f"기간 {slots['period']}")
+    if slots.get("price"):
+        parts.append(f"가격 {slots['price']} 가정")
+    head = ", ".join(parts)
+    return " ".join(x for x in (f"{head}." if head else "", state["summary"]) if x).strip()
+
+
+# 함수명 : preflight_context
+# input : state, rows, token_limit(전체 토큰 상한)
+# output : 사전 판별(preflight)에 넘길 히스토리 문자열
+# 함수 설명 : 1,800자 원문 히스토리 대신 [누적 요약] + 요약에 없는 최근 메시지(최대 4건, 없으면 직전 한 쌍)만 넘긴다.
+#               요약 줄은 항상 남기고, 남는 토큰 안에서 최신 메시지부터 채운다 (메시지 중간에서 자르지 않는다).
+def preflight_context(state: Dict[str, Any], rows: Iterable, token_limit: int = 800) -> str:
+    header = f"[누적 요약] {render_snapshot(state, [], '')}"
+    rows = list(rows)
+    recent = _pending_rows(state, rows)[-4:] or rows[-2:]
+    # "사용자: " / "페르소나: " 접두어 + 줄바꿈 몫으로 행당 3토큰
+    available = token_limit - tokens.count_tokens(header)
+    lines = [header]
+    for r in token_budget.fit_rows(recent, available, per_row_overhead=3):
+        who = "페르소나" if r.sender == "persona" else "사용자"
+        lines.append(f"{who}: {r.message}")
+    return "\n".join(lines)
@@ -0,0 +1,211 @@
+# api/services/survey_service.py
+# 같은 제품 질문을 여러 페르소나에게 한 번에 묻는 설문(fan-out).
+#   - 페르소나 공통 작업(범위 판별 + 스냅샷 사전 점검, 가격 가드, 수요 추정 조건)은 설문당 한 번만 한다.
+#   - 참고 제품 데이터(RAG)는 세그먼트별로 한 번, 수요 추정은 선택된 페르소나 전체를 한 번의 행렬 연산으로 계산한다.
+#   - 페르소나별 메인 답변만 제한된 워커 풀(SURVEY_WORKERS)에서 병렬로 호출하고, 끝나는 순서대로 결과를 내보낸다.
+#   - DB 조회는 요청 스레드에서 미리 끝내고 워커 스레드에는 네트워크 호출만 넘긴다 (llm_service 와 같은 원칙).
+# 마지막에 세그먼트별 예상 수량 분포(평균/사분위/히스토그램)를 집계한다.
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+from django.conf import settings
+from persona import options
+
+from . import demand_service, llm_cache, llm_service, persona_profile, rag_service, rate_limiter, scope_classifier, telemetry
+
+# 카탈로그 API 와 같은 필터 필드 ('랜덤' 이나 빈 값은 조건 없음)
+FILTER_FIELDS = options.FILTER_FIELDS
+ANY_VALUES = options.ANY_VALUES
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _setting(name: str, default):
+    val = getattr(settings, name, None)
+    return default if val is None else val
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=int(_setting("SURVEY_WORKERS", 8)), thread_name_prefix="survey")
+    return _pool
+
+
+def max_personas() -> int:
+    return int(_setting("SURVEY_MAX_PERSONAS", 100))
+
+
+# 함수명 : select_personas
+# input : criteria({필드: 값 또는 값 목록}), persona_ids(직접 지정, 선택), limit
+# output : Persona 목록 (id 순)
+# 함수 설명 : 값 목록은 IN 조건, '랜덤'/빈 값은 조건 없이 둔다. 개수는 SURVEY_MAX_PERSONAS 를 넘지 않는다.
+def select_personas(criteria: Optional[Dict[str, Any]] = None, persona_ids: Optional[List[int]] = None, limit: Optional[int] = None):
+    from persona.models import Persona
+
+    qs = Persona.objects.all()
+    for field, value in (criteria or {}).items():
+        if field not in FILTER_FIELDS:
+            continue
+        if isinstance(value, (list, tuple)):
+            values = [v for v in value if v not in ANY_VALUES]
+            if values:
+                qs = qs.filter(**{f"{field}__in": values})
+        elif value not in ANY_VALUES and value is not None:
+            qs = qs.filter(**{field: value})
+    if persona_ids:
+        qs = qs.filter(pk__in=[int(pid) for pid in persona_ids])
+    cap = max_personas()
+    limit = min(int(limit), cap) if limit else cap
+    return list(qs.order_by("id")[:limit])
+
+
+def shared_preflight(client, model_name: str, question: str) -> Dict[str, Any]:
+    """설문 전체가 공유하는 사전 점검 (히스토리 없는 새 질문 기준, 일반 채팅과 같은 캐시를 쓴다)."""
+    with telemetry.span("classifier"):
+        local_verdict, _ = scope_classifier.decide(question)
+    if local_verdict is False:
+        return {"in_scope": False, "snapshot": "", "prices": [], "category": "default", "source": "classifier"}
+    key = llm_service._preflight_cache_key(model_name, question, "")
+    preflight = llm_service._cached_preflight(key)
+    if preflight is None:
+        preflight = llm_service._run_preflight(client, model_name, None, question, "", None, local_verdict)
+        llm_service._store_preflight(key, preflight)
+    return preflight
+
+
+def _first_quantity(text: str) -> Optional[int]:
+    m = llm_service.FIRST_COUNT_PAT.search(text or "")
+    return int(m.group(1)) if m else None
+
+
+def _distribution(values: List[int]) -> Dict[str, Any]:
+    arr = np.asarray(values, dtype=np.float64)
+    q25, q50, q75 = np.percentile(arr, [25, 50, 75])
+    counts = np.unique(arr.astype(np.int64), return_counts=True)
+    return {
+        "n": int(arr.size),
+        "mean": round(float(arr.mean()), 2),
+        "p25": float(q25),
+        "median": float(q50),
+        "p75": float(q75),
+        "min": int(arr.min()),
+        "max": int(arr.max()),
+        "histogram": {str(int(q)): int(c) for q, c in zip(*counts)},
+    }
+
+
+def aggregate(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """세그먼트별/전체 예상 수량 분포."""
+    by_segment: Dict[str, List[int]] = {}
+    for row in results:
+        if row.get("quantity") is None:
+            continue
+        by_segment.setdefault(row.get("segment") or "미분류", []).append(int(row["quantity"]))
+    overall = [q for values in by_segment.values() for q in values]
+    return {
+        "segments": {seg: _distribution(values) for seg, values in sorted(by_segment.items())},
+        "overall": _distribution(overall) if overall else None,
+    }
+
+
+# 함수명 : run_survey
+# input : personas(Persona 목록), question, model_name
+# output : 이벤트 dict 이터레이터
+#          {"type": "meta"} → {"type": "result"} x 페르소나 수 (완료 순) → {"type": "summary"}
+# 함수 설명 : 공통 사전 점검이 범위 밖이면 거절 문구 한 건으로 끝나고, 가격 가드에 걸리면 LLM 호출 없이 0개로 답한다.
+#               LLM_QUANTITY_MODE=fast 면 메인 답변도 로컬 추정으로 만든다. 그 외에는 [수요 추정] 블록을 넣어 호출하고
+#               첫 줄 수량은 수량 가드로 보정한다. 호출이 실패한 페르소나는 추정값으로 채운다.
+def run_survey(personas, question: str, model_name: str = "gpt-4o-mini") -> Iterator[Dict[str, Any]]:
+    started = time.perf_counter()
+    client, APIError = llm_service._get_openai_client()
+    # 설문 호출은 모두 batch 우선순위라 같은 시각의 채팅 호출이 먼저 나간다.
+    with telemetry.span("survey_preflight", model_name), rate_limiter.priority("batch"):
+        preflight = shared_preflight(client, model_name, question)
+    yield {"type": "meta", "personas": len(personas), "in_scope": preflight["in_scope"], "snapshot": preflight["snapshot"]}
+    if not preflight["in_scope"]:
+        yield {"type": "summary", "refusal": llm_service.REFUSAL_TEXT, "segments": {}, "overall": None, "elapsed_ms": _elapsed(started)}
+        return
+
+    snapshot = preflight["snapshot"]
+    guard = llm_service._apply_price_guard(None, snapshot, question, preflight["prices"])
+    profiles = [persona_profile.get_profile(p) for p in personas]
+    category, price, promotion = llm_service._demand_conditions(question, snapshot, preflight["category"], preflight["prices"])
+    estimates = demand_service.estimate_profiles(profiles, category, price, promotion)
+    mode = demand_service.quantity_mode()
+    references: Dict[Optional[str], str] = {}
+
+    results: List[Dict[str, Any]] = []
+    pending: Dict[Any, Dict[str, Any]] = {}
+    pool = _get_pool()
+    try:
+        for persona, profile, est in zip(personas, profiles, estimates):
+            row = {
+                "type": "result", "persona_id": persona.pk, "name": profile.name, "segment": persona.segment,
+                "estimate": {"conservative": est.conservative, "base": est.base, "aggressive": est.aggressive},
+            }
+            if guard:
+                row.update(answer=guard, quantity=0, source="price_guard")
+            elif mode == "fast":
+                row.update(answer=demand_service.render_answer(profile, est), quantity=est.base, source="estimate")
+            if "answer" in row:
+                results.append(row)
+                yield row
+                continue
+            if persona.segment not in references:
+                references[persona.segment] = rag_service.get_rag_context(question, persona.segment)
+            reference = references[persona.segment]
+            answer_key = llm_service._answer_cache_key(persona, question, snapshot, model_name, reference)
+            cached = llm_cache.get("answer", answer_key)
+            if cached is not llm_cache.MISS:
+                quantity = _first_quantity(cached)
+                row.update(answer=cached, quantity=est.base if quantity is None else quantity, source="cache")
+                results.append(row)
+                yield row
+                continue
+            note = demand_service.prompt_note(est) if mode == "guided" else ""
+            messages = llm_service._budgeted_main_messages(profile, snapshot, [], question, False, model_name, reference, note)
+            future = pool.submit(telemetry.bind(rate_limiter.as_batch(llm_service._complete_main)), client, APIError, model_name, messages)
+            row["_answer_key"] = answer_key
+            row["_persona_tag"] = profile.tag
+            pending[future] = row
+
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                row = pending.pop(future)
+                answer_key = row.pop("_answer_key")
+                persona_tag = row.pop("_persona_tag")
+                try:
+                    text = future.result()
+                except Exception:
+                    text = None
+                if text is None:
+                    row.update(answer=llm_service.LLM_DELAY_TEXT, quantity=row["estimate"]["base"], source="estimate")
+                else:
+                    text = llm_service._apply_quantity_guard_text(snapshot or question, persona_tag, text, category)
+                    llm_cache.put("answer", answer_key, text)
+                    quantity = _first_quantity(text)
+                    row.update(answer=text, quantity=row["estimate"]["base"] if quantity is None else quantity, source="llm")
+                results.append(row)
+                yield row
+    finally:
+        # 클라이언트가 중간에 끊으면 아직 시작하지 않은 호출은 취소한다.
+        for future in pending:
+            future.cancel()
+
+    summary = aggregate(results)
+    summary.update(type="summary", elapsed_ms=_elapsed(started))
+    yield summary
+
+
+def _elapsed(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000.0, 2)
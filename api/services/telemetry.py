@@ -0,0 +1,202 @@
+# api/services/telemetry.py
+# 채팅 파이프라인 단계별 지연/토큰 계측.
+#   - span(stage, model) 으로 구간 시간을 재고, 요청 id 와 함께 JSON 구조화 로그로 남긴다.
+#   - OpenAI 응답의 usage(prompt/completion 토큰)를 모델별로 집계한다.
+#   - 단계 x 모델별 최근 N건으로 p50/p95/p99 를 계산해 /api/metrics/ 에서 보여준다 (워커 프로세스 단위).
+from __future__ import annotations
+
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from django.conf import settings
+
+from . import token_budget
+
+logger = logging.getLogger("chat.telemetry")
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+_lock = threading.Lock()
+_durations: Dict[Tuple[str, str], Deque[float]] = {}
+_errors: Dict[Tuple[str, str], int] = defaultdict(int)
+_usage: Dict[str, Dict[str, int]] = defaultdict(lambda: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0})
+
+
+def _window() -> int:
+    return int(getattr(settings, "LLM_METRICS_WINDOW", 1024))
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def get_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+
+def bind(fn):
+    """현재 컨텍스트(요청 id)를 복사해 다른 스레드(ThreadPoolExecutor)에서 실행되도록 감싼다."""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def iter_with_request_id(iterable, request_id: Optional[str]):
+    """스트리밍 응답 본문(미들웨어가 끝난 뒤 돈다)을 요청 id 와 함께 돌린다.
+    id 는 본문이 한 단계씩 실행되는 동안에만 설정하고 매번 되돌려, 워커 스레드의 다음 작업에 남지 않게 한다."""
+    iterator = iter(iterable)
+    try:
+        while True:
+            token = request_id_var.set(request_id)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                request_id_var.reset(token)
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            token = request_id_var.set(request_id)
+            try:
+                close()
+            finally:
+                request_id_var.reset(token)
+
+
+async def aiter_with_request_id(aiterable, request_id: Optional[str]):
+    """iter_with_request_id 의 비동기 버전 (ASGI 스트리밍 응답용). __anext__ / aclose 동안에만 id 를 설정한다."""
+    iterator = aiterable.__aiter__()
+    try:
+        while True:
+            token = request_id_var.set(request_id)
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                request_id_var.reset(token)
+            yield item
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            token = request_id_var.set(request_id)
+            try:
+                await aclose()
+            finally:
+                request_id_var.reset(token)
+
+
+def emit(event: str, **fields: Any) -> None:
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    payload = {"event": event, "request_id": get_request_id(), **fields}
+    logger.info(event, extra={"payload": payload})
+
+
+def metric_model(model: Optional[str]) -> str:
+    """집계 키용 모델 이름. 모델은 클라이언트가 보낸 값이라, 모르는 이름은 "other" 하나로 묶어 키 수를 고정한다."""
+    if not model:
+        return "-"
+    known = getattr(settings, "LLM_CONTEXT_WINDOWS", None) or {}
+    return model if model in token_budget.MODEL_CONTEXT_WINDOWS or model in known else "other"
+
+
+def _record(stage: str, model: str, ms: float, ok: bool) -> None:
+    key = (stage, metric_model(model))
+    with _lock:
+        buf = _durations.get(key)
+        if buf is None:
+            buf = _durations[key] = deque(maxlen=_window())
+        buf.append(ms)
+        if not ok:
+            _errors[key] += 1
+
+
+@contextmanager
+def span(stage: str, model: Optional[str] = None, **fields: Any):
+    """with span("preflight", model_name): ... 구간의 소요 시간(ms)을 기록한다. 예외는 그대로 다시 던진다."""
+    start = time.perf_counter()
+    ok = True
+    try:
+        yield fields
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        ms = (time.perf_counter() - start) * 1000.0
+        _record(stage, model, ms, ok)
+        emit("span", stage=stage, model=model, ms=round(ms, 2), ok=ok, **fields)
+
+
+def record_usage(stage: str, model: Optional[str], usage: Any) -> None:
+    if usage is None:
+        return
+    prompt = int(getattr(usage, "prompt_tokens", 0) or 0)
+    completion = int(getattr(usage, "completion_tokens", 0) or 0)
+    total = int(getattr(usage, "total_tokens", 0) or (prompt + completion))
+    with _lock:
+        agg = _usage[metric_model(model)]
+        agg["calls"] += 1
+        agg["prompt_tokens"] += prompt
+        agg["completion_tokens"] += completion
+        agg["total_tokens"] += total
+    emit("usage", stage=stage, model=model, prompt_tokens=prompt, completion_tokens=completion, total_tokens=total)
+
+
+def _percentile(sorted_vals, q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    idx = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+    return round(sorted_vals[idx], 2)
+
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        items = [(k, sorted(v)) for k, v in _durations.items()]
+        errors = dict(_errors)
+        usage = {m: dict(v) for m, v in _usage.items()}
+    stages: Dict[str, Dict[str, Any]] = {}
+    for (stage, model), vals in sorted(items):
+        stages.setdefault(stage, {})[model] = {
+            "count": len(vals),
+            "errors": errors.get((stage, model), 0),
+            "p50_ms": _percentile(vals, 0.50),
+            "p95_ms": _percentile(vals, 0.95),
+            "p99_ms": _percentile(vals, 0.99),
+            "max_ms": round(vals[-1], 2) if vals else 0.0,
+        }
+    return {"window": _window(), "stages": stages, "usage": usage}
+
+
+def reset() -> None:
+    with _lock:
+        _durations.clear()
+        _errors.clear()
+        _usage.clear()
+
+
+class JsonFormatter(logging.Formatter):
+    """payload 가 붙은 레코드는 JSON 한 줄로, 나머지는 message 만 JSON 으로 감싸 출력한다."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        payload = getattr(record, "payload", None)
+        if isinstance(payload, dict):
+            data.update(payload)
+        else:
+            data["message"] = record.getMessage()
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
@@ -0,0 +1,58 @@
+# api/services/token_budget.py
+# 모델별 프롬프트 토큰 예산 관리.
+# 고정 부분(시스템 프롬프트, 스냅샷, 최신 발화)을 먼저 빼고, 남는 토큰 안에서 최신 메시지부터 히스토리를 채운다.
+# 메시지 토큰 수는 ChatMessage.token_count 에 저장돼 있으므로 메시지당 O(1) 로 계산된다.
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+
+from . import tokens
+
+# 모델별 컨텍스트 윈도우 (LLM_CONTEXT_WINDOWS 설정으로 덮어쓸 수 있다)
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o-mini": 128000,
+    "gpt-4o": 128000,
+    "gpt-4.1-mini": 1047576,
+    "gpt-4.1-nano": 1047576,
+    "gpt-4.1": 1047576,
+    "gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_WINDOW = 16385
+
+
+def context_window(model_name: str) -> int:
+    overrides = getattr(settings, "LLM_CONTEXT_WINDOWS", None) or {}
+    if model_name in overrides:
+        return int(overrides[model_name])
+    return MODEL_CONTEXT_WINDOWS.get(model_name, DEFAULT_CONTEXT_WINDOW)
+
+
+def prompt_budget(model_name: str, answer_reserve: int) -> int:
+    """프롬프트에 쓸 수 있는 토큰 수 = min(비용 상한 LLM_PROMPT_TOKEN_BUDGET, 컨텍스트 윈도우 - 답변 예약분)."""
+    cap = int(getattr(settings, "LLM_PROMPT_TOKEN_BUDGET", 3000))
+    return max(0, min(cap, context_window(model_name) - answer_reserve))
+
+
+def row_tokens(row) -> int:
+    n = getattr(row, "token_count", None)
+    return n if n is not None else tokens.count_tokens(row.message)
+
+
+def fixed_tokens(messages: Iterable[Dict[str, str]], model_name: Optional[str] = None) -> int:
+    return tokens.count_message_tokens(messages, model_name)
+
+
+def fit_rows(rows: List, available: int, per_row_overhead: int = tokens.MESSAGE_OVERHEAD) -> List:
+    """최신 행부터 available 토큰 안에 들어가는 만큼 골라 시간순으로 돌려준다."""
+    picked: List = []
+    used = 0
+    for row in reversed(rows):
+        cost = row_tokens(row) + per_row_overhead
+        if used + cost > available:
+            break
+        picked.append(row)
+        used += cost
+    picked.reverse()
+    return picked
@@ -0,0 +1,46 @@
+# api/services/tokens.py
+# 프롬프트 토큰 수 계산.
+# tiktoken 이 설치돼 있으면 모델 인코딩으로 정확히 세고, 없으면 문자 종류별 근사치로 추정한다.
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Dict, Iterable, Optional
+
+try:
+    import tiktoken
+    HAS_TIKTOKEN = True
+except Exception:
+    tiktoken = None
+    HAS_TIKTOKEN = False
+
+# chat 메시지 1건당 role/구분자 오버헤드, 응답 프라이밍 오버헤드 (OpenAI cookbook 기준)
+MESSAGE_OVERHEAD = 4
+REPLY_PRIMING = 2
+
+
+@lru_cache(maxsize=16)
+def _encoding(model_name: str):
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except Exception:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def estimate_tokens(text: str) -> int:
+    """tiktoken 없이 쓰는 근사치. 한글 등 비 ASCII 문자는 글자당 약 1토큰, ASCII 는 4글자당 1토큰."""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ch < "\x80")
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+def count_tokens(text: str, model_name: Optional[str] = None) -> int:
+    if not text:
+        return 0
+    if HAS_TIKTOKEN:
+        return len(_encoding(model_name or "gpt-4o-mini").encode(text))
+    return estimate_tokens(text)
+
+
+def count_message_tokens(messages: Iterable[Dict[str, str]], model_name: Optional[str] = None) -> int:
+    return sum(MESSAGE_OVERHEAD + count_tokens(m.get("content") or "", model_name) for m in messages) + REPLY_PRIMING
@@ -0,0 +1,66 @@
+# api/signals.py
+# 모델 변경 시 워커 캐시를 무효화하고 파생 값(메시지 토큰 수, 검색 색인)을 채우는 시그널 핸들러 (ApiConfig.ready 에서 등록)
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from chat.models import ChatMessage, ReferenceProduct
+from persona.models import Persona
+
+from .services import chat_search, persona_catalog, persona_match_service, persona_profile, rag_service, sales_features, tokens
+
+
+@receiver(post_save, sender=Persona)
+@receiver(post_delete, sender=Persona)
+def invalidate_persona_profile(sender, instance, **kwargs):
+    persona_profile.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Persona)
+def reindex_persona_match(sender, instance, **kwargs):
+    persona_match_service.on_persona_saved(instance)
+
+
+@receiver(post_delete, sender=Persona)
+def unindex_persona_match(sender, instance, **kwargs):
+    persona_match_service.on_persona_deleted(instance)
+
+
+@receiver(pre_save, sender=Persona)
+def remember_persona_facets(sender, instance, **kwargs):
+    persona_catalog.before_persona_saved(instance)
+
+
+@receiver(post_save, sender=Persona)
+def recount_persona_facets(sender, instance, created, **kwargs):
+    persona_catalog.on_persona_saved(instance, created)
+
+
+@receiver(post_delete, sender=Persona)
+def uncount_persona_facets(sender, instance, **kwargs):
+    persona_catalog.on_persona_deleted(instance)
+
+
+@receiver(post_save, sender=ReferenceProduct)
+def reindex_reference_product(sender, instance, **kwargs):
+    rag_service.on_product_saved(instance)
+    sales_features.on_product_saved(instance)
+
+
+@receiver(post_delete, sender=ReferenceProduct)
+def unindex_reference_product(sender, instance, **kwargs):
+    rag_service.on_product_deleted(instance)
+    sales_features.on_product_deleted(instance)
+
+
+@receiver(pre_save, sender=ChatMessage)
+def count_message_tokens(sender, instance, raw=False, **kwargs):
+    if not raw and instance.token_count is None:
+        instance.token_count = tokens.count_tokens(instance.message)
+
+
+@receiver(post_save, sender=ChatMessage)
+def index_chat_message(sender, instance, created, raw=False, **kwargs):
+    # 채팅 저장 트랜잭션을 길게 잡지 않도록 커밋 후에 색인한다. 실패해도 저장은 그대로 두고 로그만 남긴다 (rebuild 로 복구).
+    if not raw:
+        transaction.on_commit(lambda: chat_search.index_message(instance, created), robust=True)
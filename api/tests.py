@@ -1,9 +1,37 @@
 # api/tests.py
 
-from django.test import TestCase, Client
+from django.test import TestCase, SimpleTestCase, Client, override_settings
 from django.urls import reverse
 from persona.models import Persona
+from django.core.management import call_command
+from django.contrib.auth.models import AnonymousUser
+from api.models import ScopeVerdict
+from api.services import llm_service, openai_pool, scope_classifier
+from api.services.keyword_matcher import KeywordMatcher
+from api.services.history_cache import ThreadHistoryCache
+from api.services import chat_search, chat_service, demand_service, llm_cache, llm_transport, persona_catalog, persona_match_service, persona_profile, rag_service, rate_limiter, sales_features, similar_persona_service, summary_service, survey_service, telemetry, tokens
+from django.contrib.auth import get_user_model
+from chat.models import ChatThread, ChatMessage, ChatMessageTerm, ReferenceProduct
+from datetime import timedelta
+import httpx
+import io
 import json
+import numpy as np
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+
+def _make_persona(**overrides):
+    """채팅/LLM 테스트 공통 페르소나 (30대 여자 1인 가구 실속형). 바꿀 필드만 overrides 로 넘긴다."""
+    fields = dict(
+        name="김테스트", segment="실속형 미식가", age="30대", gender="여자", job="사무 종사자", household="1인 가구",
+        persona_summary_tag="김테스트, 여자, 30대, 1인 가구",
+    )
+    fields.update(overrides)
+    return Persona.objects.create(**fields)
+
 
 class PersonaFilterAPITestCase(TestCase):
     # 함수명     : setUp
@@ -12,9 +40,15 @@ class PersonaFilterAPITestCase(TestCase):
     #           2. 여기서는 테스트에 사용할 페르소나 3명을 임시 데이터베이스에 만듭니다.
     @classmethod
     def setUpTestData(cls):
-        Persona.objects.create(name="김테스트", segment="VIP", age_group="30대", gender="여", job="개발자", family_structure="1인 가구", customer_value="VIP", persona_summary_tag="...")
-        Persona.objects.create(name="이테스트", segment="우수고객", age_group="40대", gender="남", job="기획자", family_structure="부부", customer_value="우수고객", persona_summary_tag="...")
-        Persona.objects.create(name="박테스트", segment="신규고객", age_group="30대", gender="여", job="마케터", family_structure="자녀 1명", customer_value="신규고객", persona_summary_tag="...")
+        Persona.objects.create(name="김테스트", segment="실속형 미식가", age="30대", gender="여자", job="사무 종사자", household="1인 가구", persona_summary_tag="...")
+        Persona.objects.create(name="이테스트", segment="건강 추구형 소비자", age="40대", gender="남자", job="관리자", household="1세대가족", persona_summary_tag="...")
+        Persona.objects.create(name="박테스트", segment="트렌드 주도형 소비자", age="30대", gender="여자", job="판매 종사자", household="2세대가족", persona_summary_tag="...")
+
+    def setUp(self):
+        persona_catalog.reset()
+
+    def tearDown(self):
+        persona_catalog.reset()
 
     # 함수명     : test_filter_api_no_params
     # 함수설명   : 
@@ -35,12 +69,1233 @@ class PersonaFilterAPITestCase(TestCase):
     #           1. '30대 여성'이라는 조건으로 API를 호출했을 때, 조건에 맞는 페르소나(2명)만 정확히 반환되는지 테스트합니다.
     def test_filter_api_with_params(self):
         client = Client()
-        # ?age_group=30대&gender=여 라는 파라미터를 붙여서 URL을 호출합니다.
-        url = reverse('api:persona_filter_api') + '?age_group=30대&gender=여'
+        # ?age=30대&gender=여자 라는 파라미터를 붙여서 URL을 호출합니다.
+        url = reverse('api:persona_filter_api') + '?age=30대&gender=여자'
         response = client.get(url)
 
         # 1. 응답 상태 코드가 200 (성공)인지 확인합니다.
         self.assertEqual(response.status_code, 200)
         
         # 2. 반환된 데이터의 개수가 '30대 여성' 조건에 맞는 2개인지 확인합니다.
-        self.assertEqual(len(response.json()), 2)
\ No newline at end of file
+        self.assertEqual(len(response.json()), 2)
+
+    # 함수명     : test_filter_api_keyset_pages
+    # 함수설명   :
+    #           1. size 만큼씩 id 순으로 나눠 주고, 다음 페이지 cursor 를 헤더로 알려주는지 테스트합니다.
+    #           2. 같은 필드를 여러 번 주면 IN 조건으로, '랜덤' 은 조건 없음으로 처리하는지 테스트합니다.
+    def test_filter_api_keyset_pages(self):
+        client = Client()
+        url = reverse('api:persona_filter_api')
+        first = client.get(url, {'size': 2})
+        self.assertEqual([p['name'] for p in first.json()], ["김테스트", "이테스트"])
+        self.assertIn('rel="next"', first['Link'])
+
+        second = client.get(url, {'size': 2, 'cursor': first['X-Next-Cursor']})
+        self.assertEqual([p['name'] for p in second.json()], ["박테스트"])
+        self.assertNotIn('X-Next-Cursor', second)
+
+        response = client.get(url, {'job': ['관리자', '판매 종사자'], 'gender': '랜덤'})
+        self.assertEqual(len(response.json()), 2)
+
+    # 함수명     : test_facets_counts_follow_changes_with_etag
+    # 함수설명   :
+    #           1. 선택지별 개수(0 개 선택지 포함)를 주고, 같은 ETag 로 다시 요청하면 304 인지 테스트합니다.
+    #           2. 페르소나 수정/삭제가 다시 세지 않고 개수에 반영되고 ETag 가 바뀌는지 테스트합니다.
+    def test_facets_counts_follow_changes_with_etag(self):
+        client = Client()
+        url = reverse('api:persona_facets_api')
+        response = client.get(url)
+        body = response.json()
+        age = {f['value']: f['count'] for f in body['facets']['age']}
+        self.assertEqual(body['total'], 3)
+        self.assertEqual((age['30대'], age['40대'], age['20대']), (2, 1, 0))
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        facets = persona_catalog.get_facets()
+        persona = Persona.objects.get(name="이테스트")
+        persona.age = "30대"
+        persona.save()
+        Persona.objects.get(name="박테스트").delete()
+        self.assertIs(persona_catalog.get_facets(), facets)
+
+        changed = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        age = {f['value']: f['count'] for f in changed.json()['facets']['age']}
+        self.assertEqual((changed.json()['total'], age['30대'], age['40대']), (2, 2, 0))
+
+class _FakeCompletions:
+    def __init__(self, contents):
+        self.contents = list(contents)
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        content = self.contents.pop(0) if self.contents else ""
+        message = type("Message", (), {"content": content})()
+        choice = type("Choice", (), {"message": message})()
+        return type("Completion", (), {"choices": [choice], "usage": None})()
+
+
+class _FakeClient:
+    def __init__(self, *contents):
+        self.chat = type("Chat", (), {})()
+        self.chat.completions = _FakeCompletions(contents)
+
+
+class PreflightTestCase(SimpleTestCase):
+    # 함수명     : test_fused_preflight_single_call
+    # 함수설명   :
+    #           1. fused 모드에서는 한 번의 호출로 in_scope/snapshot/가격/카테고리를 모두 받는지 테스트합니다.
+    @override_settings(LLM_PREFLIGHT_MODE="fused")
+    def test_fused_preflight_single_call(self):
+        client = _FakeClient(json.dumps({
+            "in_scope": True,
+            "snapshot": "현재 대상: 참치캔 150g, 가격 2,000원",
+            "prices": [2000],
+            "product_category": "canned_tuna",
+        }, ensure_ascii=False))
+        result = llm_service._run_preflight(client, "gpt-4o-mini", None, "참치캔 2천원이면 몇 개 살래?")
+
+        self.assertTrue(result["in_scope"])
+        self.assertEqual(result["prices"], [2000])
+        self.assertEqual(result["category"], "canned_tuna")
+        self.assertEqual(len(client.chat.completions.calls), 1)
+
+    # 함수명     : test_fused_preflight_falls_back_to_legacy
+    # 함수설명   :
+    #           1. fused 응답이 JSON이 아니면 기존 판별기 → 스냅샷 순차 호출로 넘어가는지 테스트합니다.
+    @override_settings(LLM_PREFLIGHT_MODE="fused")
+    def test_fused_preflight_falls_back_to_legacy(self):
+        client = _FakeClient("not json", "예", "현재 대상: 참치캔")
+        result = llm_service._run_preflight(client, "gpt-4o-mini", None, "참치캔 몇 개 살래?")
+
+        self.assertTrue(result["in_scope"])
+        self.assertEqual(result["snapshot"], "현재 대상: 참치캔")
+        self.assertEqual(len(client.chat.completions.calls), 3)
+
+
+class SpeculativeAnswerTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.persona = _make_persona()
+
+    # 함수명     : test_speculative_answer_discarded_when_out_of_scope
+    # 함수설명   :
+    #           1. 추측 실행 모드에서 사전 판별이 OUT이면, 먼저 시작한 본 답변을 버리고 거절 문구를 반환하는지 테스트합니다.
+    @override_settings(LLM_PREFLIGHT_MODE="fused", LLM_SPECULATIVE_ANSWER=True)
+    def test_speculative_answer_discarded_when_out_of_scope(self):
+        client = _FakeClient(
+            json.dumps({"in_scope": False, "snapshot": "", "prices": [], "product_category": "default"}),
+            "저는 한 달에 3개를 구매할 것 같아요!",
+        )
+        with mock.patch.object(llm_service, "_get_openai_client", return_value=(client, RuntimeError)):
+            text = llm_service.get_llm_response(self.persona.id, "오늘 날씨 어때?")
+
+        self.assertEqual(text, llm_service.REFUSAL_TEXT)
+
+    # 함수명     : test_speculative_answer_not_cached_under_snapshot_key
+    # 함수설명   :
+    #           1. 스냅샷 없이 만든 추측 실행 답변은 스냅샷 키로 답변 캐시에 저장하지 않는지 테스트합니다.
+    @override_settings(LLM_PREFLIGHT_MODE="fused", LLM_SPECULATIVE_ANSWER=True, CHAT_ROLLING_SUMMARY=False)
+    def test_speculative_answer_not_cached_under_snapshot_key(self):
+        llm_cache.reset()
+        self.addCleanup(llm_cache.reset)
+        client = _FakeClient("참치캔은 샐러드에 넣어 먹어요.")
+        preflight = {"in_scope": True, "snapshot": "참치캔 150g", "prices": [], "category": "canned_tuna", "source": "fused"}
+        with mock.patch.object(llm_service, "_get_openai_client", return_value=(client, RuntimeError)), \
+                mock.patch.object(llm_service, "_run_preflight", return_value=preflight), \
+                mock.patch.object(llm_service.scope_classifier, "decide", return_value=(None, None)):
+            text = llm_service.get_llm_response(self.persona.id, "참치캔 어떻게 먹어?")
+
+        self.assertEqual(text, "참치캔은 샐러드에 넣어 먹어요.")
+        self.assertEqual(llm_cache.stats()["answer"]["size"], 0)
+
+
+class QuantityGuardStreamTestCase(SimpleTestCase):
+    # 함수명     : test_stream_guard_matches_full_text_guard
+    # 함수설명   :
+    #           1. 델타를 잘게 나눠 넣어도 스트리밍 수량 가드 결과가 전체 텍스트 가드 결과와 같은지 테스트합니다.
+    def test_stream_guard_matches_full_text_guard(self):
+        text = "저는 한 달에 30개를 구매할 것 같아요!\n내 기준:\n· 참치캔은 샐러드에 자주 넣어요"
+        expected = llm_service._apply_quantity_guard_text("참치캔", "1인 가구", text)
+
+        guard = llm_service.QuantityGuardStream("참치캔", "1인 가구")
+        out = "".join(guard.feed(text[i:i + 3]) for i in range(0, len(text), 3)) + guard.flush()
+
+        self.assertEqual(out, expected)
+        self.assertTrue(out.startswith("저는 한 달에 8개"))
+
+
+class _FakeAsyncCompletions(_FakeCompletions):
+    async def create(self, **kwargs):
+        return _FakeCompletions.create(self, **kwargs)
+
+
+class AsyncChatPathTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.persona = _make_persona()
+
+    # 함수명     : test_aget_llm_response_applies_quantity_guard
+    # 함수설명   :
+    #           1. 비동기 경로(aget_llm_response)도 동기 경로와 같은 사전 판별/수량 가드를 거치는지 테스트합니다.
+    @override_settings(LLM_PREFLIGHT_MODE="fused", LLM_SPECULATIVE_ANSWER=False)
+    async def test_aget_llm_response_applies_quantity_guard(self):
+        client = _FakeClient()
+        client.chat.completions = _FakeAsyncCompletions([
+            json.dumps({"in_scope": True, "snapshot": "참치캔", "prices": [], "product_category": "canned_tuna"}),
+            "저는 한 달에 30개를 구매할 것 같아요!",
+        ])
+        with mock.patch.object(llm_service, "_get_async_openai_client", return_value=(client, RuntimeError)):
+            text = await llm_service.aget_llm_response(self.persona.id, "참치캔 몇 개 살래?")
+
+        self.assertTrue(text.startswith("저는 한 달에 8개"))
+
+
+class OpenAIPoolTestCase(SimpleTestCase):
+    def tearDown(self):
+        openai_pool.reset()
+
+    # 함수명     : test_client_is_shared_per_process
+    # 함수설명   :
+    #           1. get_client()를 여러 번 호출해도 같은 클라이언트(같은 커넥션 풀)를 재사용하는지 테스트합니다.
+    @override_settings(OPENAI_API_KEY="sk-test")
+    def test_client_is_shared_per_process(self):
+        first = openai_pool.get_client()
+        second = openai_pool.get_client()
+
+        self.assertIs(first, second)
+        self.assertEqual(openai_pool.pool_stats()["requests"], 0)
+
+
+class ScopeClassifierTestCase(TestCase):
+    IN_SAMPLES = ["참치캔 2천원이면 몇 개 살래?", "우유 1+1 행사하면 더 살까?", "햄 가격 올리면 구매 줄어들까?", "즉석밥 번들로 팔면 몇 개 사?", "커피 구독하면 한 달에 몇 잔?"]
+    OUT_SAMPLES = ["오늘 날씨 어때?", "맞춤법 맞춰줘", "전자레인지 고장났어", "영어로 번역해줘", "파이썬 코드 짜줘"]
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "scope.npz")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    # 함수명     : test_train_command_and_decide
+    # 함수설명   :
+    #           1. LLM 판정 로그(ScopeVerdict)로 재학습 명령을 실행한 뒤,
+    #           2. 학습된 분류기가 확신 구간에서는 LLM 없이 IN/OUT을 결정하는지 테스트합니다.
+    def test_train_command_and_decide(self):
+        for text in self.IN_SAMPLES * 4:
+            ScopeVerdict.objects.create(utterance=text, in_scope=True, source="fused")
+        for text in self.OUT_SAMPLES * 4:
+            ScopeVerdict.objects.create(utterance=text, in_scope=False, source="fused")
+
+        with override_settings(SCOPE_CLASSIFIER_PATH=self.path, SCOPE_CLASSIFIER_BAND=(0.3, 0.7)):
+            call_command("train_scope_classifier", holdout=0, min_samples=5, stdout=io.StringIO())
+            in_verdict, _ = scope_classifier.decide("참치캔 몇 개 살래?")
+            out_verdict, _ = scope_classifier.decide("내일 날씨 어때?")
+
+        self.assertTrue(in_verdict)
+        self.assertFalse(out_verdict)
+
+
+class KeywordMatcherTestCase(SimpleTestCase):
+    # 함수명     : test_scan_returns_every_category_in_one_pass
+    # 함수설명   :
+    #           1. 한 번의 스캔으로 겹치는 키워드(참치/참치캔, 차/라떼 등)를 포함한 모든 카테고리 히트를 돌려주는지 테스트합니다.
+    def test_scan_returns_every_category_in_one_pass(self):
+        matcher = KeywordMatcher({"tuna": ("참치", "참치캔"), "drink": ("차", "라떼"), "intent": ("몇 개", "가격")})
+
+        self.assertEqual(matcher.scan("참치캔 가격이 오르면 몇 개 살래?"), frozenset({"tuna", "intent"}))
+        self.assertEqual(matcher.scan("녹차라떼"), frozenset({"drink"}))
+        self.assertEqual(matcher.scan(""), frozenset())
+
+
+class HistoryCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.persona = _make_persona()
+        cls.thread = ChatThread.objects.create(persona=cls.persona)
+        for i in range(40):
+            ChatMessage.objects.create(thread=cls.thread, sender="user" if i % 2 == 0 else "persona", message=f"메시지 {i}")
+
+    # 함수명     : test_tail_load_and_delta_refresh
+    # 함수설명   :
+    #           1. 미스일 때 꼬리 N건만 한 번의 쿼리로 읽고, 히트일 때는 그 뒤에 추가된 메시지(다른 워커가 쓴 것 포함)만 따라잡는지 테스트합니다.
+    def test_tail_load_and_delta_refresh(self):
+        cache = ThreadHistoryCache(max_threads=4, rows_per_thread=8)
+        with self.assertNumQueries(1):
+            rows = cache.get(self.thread.id, limit=4)
+        self.assertEqual([r.message for r in rows], ["메시지 36", "메시지 37", "메시지 38", "메시지 39"])
+
+        ChatMessage.objects.create(thread=self.thread, sender="user", message="메시지 40")
+        with self.assertNumQueries(1):
+            rows = cache.get(self.thread.id, limit=2)
+        self.assertEqual([r.message for r in rows], ["메시지 39", "메시지 40"])
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    # 함수명     : test_save_chat_message_appends_after_commit
+    # 함수설명   :
+    #           1. save_chat_messsage 로 저장한 메시지가 커밋 후 캐시에 바로 추가되는지 테스트합니다.
+    def test_save_chat_message_appends_after_commit(self):
+        cache = ThreadHistoryCache(max_threads=4, rows_per_thread=8)
+        cache.get(self.thread.id, limit=4)
+        with mock.patch.object(chat_service, "history_cache", cache), self.captureOnCommitCallbacks(execute=True):
+            chat_service.save_chat_messsage(mock.Mock(), "참치캔 몇 개 살래?", self.persona.id, self.thread.id, "한 달에 4개요")
+
+        with mock.patch.object(cache, "_delta_query", return_value=[]):
+            rows = cache.get(self.thread.id, limit=2)
+        self.assertEqual([(r.sender, r.message) for r in rows], [("user", "참치캔 몇 개 살래?"), ("persona", "한 달에 4개요")])
+
+
+class RollingSummaryTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.persona = _make_persona()
+
+    # 함수명     : test_summary_updated_from_new_pair_and_reused_as_snapshot
+    # 함수설명   :
+    #           1. 저장 후 새 메시지 한 쌍만으로 누적 요약/슬롯이 갱신되는지 테스트합니다.
+    #           2. 다음 턴에서 로컬 분류기가 IN 으로 확신하면 스냅샷 LLM 호출 없이 누적 요약을 스냅샷으로 쓰는지 테스트합니다.
+    @override_settings(CHAT_SUMMARY_BACKGROUND=False, LLM_SPECULATIVE_ANSWER=False)
+    def test_summary_updated_from_new_pair_and_reused_as_snapshot(self):
+        merge_client = _FakeClient(json.dumps({"summary": "참치캔 150g 을 한 달에 4개 산다고 답함.", "product": "참치캔", "size": "", "price": "", "period": "한 달"}))
+        with mock.patch.object(summary_service.openai_pool, "get_client", return_value=merge_client), self.captureOnCommitCallbacks(execute=True):
+            thread, _ = chat_service.save_chat_messsage(mock.Mock(user=AnonymousUser()), "참치캔 150g 3,000원이면 한 달에 몇 개 살래?", self.persona.id, None, "저는 한 달에 4개를 구매할 것 같아요!")
+
+        thread.refresh_from_db()
+        self.assertEqual(thread.slot_state, {"product": "참치캔", "size": "150g", "price": "3,000원", "period": "한 달"})
+        self.assertTrue(thread.summary.startswith("참치캔 150g"))
+
+        main_client = _FakeClient("저는 한 달에 5개를 구매할 것 같아요!")
+        with mock.patch.object(llm_service, "_get_openai_client", return_value=(main_client, RuntimeError)), \
+                mock.patch.object(llm_service.scope_classifier, "decide", return_value=(True, 0.95)):
+            text = llm_service.get_llm_response(self.persona.id, "가격이 2,500원으로 내리면?", thread_id=thread.id)
+
+        self.assertTrue(text.startswith("저는 한 달에 5개"))
+        self.assertEqual(len(main_client.chat.completions.calls), 1)
+        system_msgs = [m["content"] for m in main_client.chat.completions.calls[0]["messages"] if m["role"] == "system"]
+        self.assertTrue(any("참치캔 150g" in c and "2,500원" in c for c in system_msgs))
+
+
+    # 함수명     : test_out_of_order_merges_keep_every_turn
+    # 함수설명   :
+    #           1. 뒤 턴의 요약 병합이 먼저 돌면 앞 턴 메시지까지 함께 반영하고, 늦게 도는 앞 턴 병합은 건너뛰는지 테스트합니다.
+    def test_out_of_order_merges_keep_every_turn(self):
+        thread = ChatThread.objects.create(persona=self.persona)
+        ChatMessage.objects.create(thread=thread, sender="user", message="참치캔 150g 한 달에 몇 개 살래?")
+        first = ChatMessage.objects.create(thread=thread, sender="persona", message="한 달에 4개요")
+        ChatMessage.objects.create(thread=thread, sender="user", message="2,500원이면요?")
+        second = ChatMessage.objects.create(thread=thread, sender="persona", message="그럼 5개요")
+        client = _FakeClient(json.dumps({"summary": "참치캔 150g 4개, 2,500원이면 5개.", "product": "참치캔", "size": "", "price": "", "period": ""}))
+
+        self.assertTrue(summary_service.update_summary(thread.id, second.id, client=client))
+        self.assertFalse(summary_service.update_summary(thread.id, first.id, client=client))
+
+        prompt = client.chat.completions.calls[0]["messages"][-1]["content"]
+        self.assertIn("참치캔 150g 한 달에 몇 개 살래?", prompt)
+        self.assertIn("2,500원이면요?", prompt)
+        thread.refresh_from_db()
+        self.assertEqual(thread.summary_message_id, second.id)
+        self.assertEqual(thread.slot_state, {"product": "참치캔", "size": "150g", "price": "2,500원", "period": "한 달"})
+        self.assertEqual(len(client.chat.completions.calls), 1)
+
+    # 함수명     : test_preflight_context_keeps_summary_header
+    # 함수설명   :
+    #           1. 사전 판별 히스토리가 토큰 상한을 넘으면 [누적 요약] 줄은 남기고 오래된 메시지부터 빼는지 테스트합니다.
+    def test_preflight_context_keeps_summary_header(self):
+        state = {"summary": "참치캔 150g 을 한 달에 4개 산다고 답함.", "slots": {"product": "참치캔"}, "message_id": 0}
+        Row = type("Row", (), {})
+        rows = []
+        for i, (sender, text) in enumerate((("user", "가" * 600), ("persona", "나" * 600), ("user", "2,500원이면요?"))):
+            row = Row()
+            row.id, row.sender, row.message, row.token_count = i + 1, sender, text, tokens.count_tokens(text)
+            rows.append(row)
+
+        text = summary_service.preflight_context(state, rows, token_limit=100)
+        lines = text.split("\n")
+        self.assertTrue(lines[0].startswith("[누적 요약] 현재 대상: 참치캔."))
+        self.assertEqual(lines[1:], ["사용자: 2,500원이면요?"])
+        self.assertLessEqual(tokens.count_tokens(text), 100)
+
+
+class LLMCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.persona = _make_persona()
+
+    def setUp(self):
+        llm_cache.reset()
+
+    def tearDown(self):
+        llm_cache.reset()
+
+    # 함수명     : test_repeated_question_served_from_cache
+    # 함수설명   :
+    #           1. 같은 페르소나에 같은 질문(공백/문장부호만 다름)을 다시 하면 사전 판별/본 답변 LLM 호출 없이 캐시에서 답하는지 테스트합니다.
+    #           2. LLM_CACHE_ANSWERS=False 면 답변은 다시 생성하고, 사전 판별만 캐시를 쓰는지 테스트합니다.
+    @override_settings(LLM_PREFLIGHT_MODE="fused", LLM_SPECULATIVE_ANSWER=False, CHAT_ROLLING_SUMMARY=False)
+    def test_repeated_question_served_from_cache(self):
+        preflight = json.dumps({"in_scope": True, "snapshot": "참치캔 150g", "prices": [], "product_category": "canned_tuna"})
+        client = _FakeClient(preflight, "저는 한 달에 4개를 구매할 것 같아요!", "저는 한 달에 3개를 구매할 것 같아요!")
+        with mock.patch.object(llm_service, "_get_openai_client", return_value=(client, RuntimeError)), \
+                mock.patch.object(llm_service.scope_classifier, "decide", return_value=(None, None)):
+            first = llm_service.get_llm_response(self.persona.id, "참치캔 몇 개 살래?")
+            second = llm_service.get_llm_response(self.persona.id, "  참치캔 몇 개  살래 ")
+            self.assertEqual(len(client.chat.completions.calls), 2)
+            with override_settings(LLM_CACHE_ANSWERS=False):
+                third = llm_service.get_llm_response(self.persona.id, "참치캔 몇 개 살래?")
+
+        self.assertEqual(first, second)
+        self.assertTrue(third.startswith("저는 한 달에 3개"))
+        self.assertEqual(len(client.chat.completions.calls), 3)
+        stats = llm_cache.stats()
+        self.assertEqual(stats["answer"]["hits"], 1)
+        self.assertEqual(stats["scope"]["hits"], 2)
+
+
+class PersonaProfileTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.persona = _make_persona(persona_summary_tag="서울 30대 여자 1인 가구, health_orientation: 0.8, hmr_preference: 0.7")
+
+    def setUp(self):
+        persona_profile.profile_cache.clear()
+
+    # 함수명     : test_profile_compiled_once_and_invalidated_on_save
+    # 함수설명   :
+    #           1. 같은 페르소나의 프로필은 한 번만 컴파일되고(특성/가구 구간/프롬프트 토큰 수/소개 문구 포함) 재사용되는지 테스트합니다.
+    #           2. Persona 저장 시 시그널로 캐시가 무효화되어 바뀐 설정이 프롬프트에 반영되는지 테스트합니다.
+    def test_profile_compiled_once_and_invalidated_on_save(self):
+        first = persona_profile.get_profile(self.persona)
+        second = persona_profile.get_profile(self.persona)
+
+        self.assertIs(first, second)
+        self.assertEqual(first.traits, {"health_orientation": 0.8, "hmr_preference": 0.7})
+        self.assertEqual(first.household_bucket, "single")
+        self.assertGreater(first.prompt_tokens, persona_profile.STATIC_PROMPT_TOKENS)
+        self.assertEqual(first.intro_text, "저는 서울에 사는 30대 여자 1인 가구의 김테스트이고, 편의를 특히 중시하고 가격에도 민감한 편이에요.")
+        self.assertEqual(first.system_prompt.count("1인칭"), 1)
+
+        self.persona.persona_summary_tag = "부산 40대 남자 3인 가구"
+        self.persona.save()
+        self.assertEqual(persona_profile.profile_cache.stats()["size"], 0)
+        third = persona_profile.get_profile(self.persona)
+        self.assertIn("부산 40대 남자 3인 가구", llm_service._build_system_prompt(self.persona))
+        self.assertEqual(third.household_bucket, "small")
+
+
+class TokenBudgetTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.persona = _make_persona()
+        cls.thread = ChatThread.objects.create(persona=cls.persona)
+        for i in range(10):
+            ChatMessage.objects.create(thread=cls.thread, sender="user", message=f"참치캔 {i}번째 질문이에요 " + "가" * 200)
+            ChatMessage.objects.create(thread=cls.thread, sender="persona", message=f"저는 한 달에 {i}개 " + "나" * 200)
+
+    # 함수명     : test_history_fills_token_budget_newest_first
+    # 함수설명   :
+    #           1. 저장 시 메시지 토큰 수가 계산되는지 테스트합니다.
+    #           2. 본 답변 프롬프트가 토큰 예산을 넘지 않도록 최신 메시지부터 히스토리를 채우는지 테스트합니다.
+    @override_settings(LLM_PROMPT_TOKEN_BUDGET=2000)
+    def test_history_fills_token_budget_newest_first(self):
+        self.assertTrue(all(m.token_count for m in ChatMessage.objects.filter(thread=self.thread)))
+
+        rows = llm_service._load_history_rows(self.thread.id)
+        profile = persona_profile.get_profile(self.persona)
+        messages = llm_service._budgeted_main_messages(profile, "참치캔 150g", rows, "가격이 오르면?", False, "gpt-4o-mini")
+
+        self.assertLessEqual(tokens.count_message_tokens(messages), 2000)
+        history = [m for m in messages if m["role"] != "system"][:-1]
+        self.assertTrue(0 < len(history) < 20)
+        self.assertTrue(history[-1]["content"].startswith("저는 한 달에 9개"))
+
+
+class TelemetryTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.persona = _make_persona()
+        cls.staff = get_user_model().objects.create_user(username="staff", password="pw", is_staff=True)
+        cls.user = get_user_model().objects.create_user(username="user", password="pw")
+
+    def setUp(self):
+        telemetry.reset()
+        llm_cache.reset()
+
+    # 함수명     : test_stage_spans_and_usage_exposed_to_staff_only
+    # 함수설명   :
+    #           1. 한 턴의 단계별 구간(사전 판별/본 답변/전체)과 OpenAI usage 토큰이 request id 와 함께 JSON 로그로 남는지 테스트합니다.
+    #           2. /api/metrics/ 가 staff 에게만 단계 x 모델별 p50/p95/p99 를 보여주는지 테스트합니다.
+    @override_settings(LLM_PREFLIGHT_MODE="fused", LLM_SPECULATIVE_ANSWER=False, CHAT_ROLLING_SUMMARY=False)
+    def test_stage_spans_and_usage_exposed_to_staff_only(self):
+        client = _FakeClient(
+            json.dumps({"in_scope": True, "snapshot": "참치캔", "prices": [], "product_category": "canned_tuna"}),
+            "저는 한 달에 4개를 구매할 것 같아요!",
+        )
+        usage = type("Usage", (), {"prompt_tokens": 120, "completion_tokens": 30, "total_tokens": 150})()
+        original_create = client.chat.completions.create
+        def create_with_usage(**kwargs):
+            res = original_create(**kwargs)
+            res.usage = usage
+            return res
+        client.chat.completions.create = create_with_usage
+
+        token = telemetry.request_id_var.set("req-1")
+        try:
+            with mock.patch.object(llm_service, "_get_openai_client", return_value=(client, RuntimeError)), \
+                    mock.patch.object(llm_service.scope_classifier, "decide", return_value=(None, None)), \
+                    self.assertLogs("chat.telemetry", level="INFO") as logs:
+                llm_service.get_llm_response(self.persona.id, "참치캔 몇 개 살래?")
+        finally:
+            telemetry.request_id_var.reset(token)
+
+        payloads = [r.payload for r in logs.records]
+        self.assertTrue(all(p["request_id"] == "req-1" for p in payloads))
+        self.assertEqual({p["stage"] for p in payloads if p["event"] == "usage"}, {"preflight", "main"})
+        self.assertIn("{", telemetry.JsonFormatter().format(logs.records[0]))
+
+        http = Client()
+        http.force_login(self.user)
+        self.assertEqual(http.get(reverse("api:metrics_api")).status_code, 403)
+        http.force_login(self.staff)
+        response = http.get(reverse("api:metrics_api"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header("X-Request-ID"))
+        data = response.json()
+        self.assertEqual(data["telemetry"]["stages"]["main"]["gpt-4o-mini"]["count"], 1)
+        self.assertIn("p99_ms", data["telemetry"]["stages"]["turn"]["gpt-4o-mini"])
+        self.assertEqual(data["telemetry"]["usage"]["gpt-4o-mini"]["total_tokens"], 300)
+
+    # 함수명     : test_unknown_models_share_one_metrics_bucket
+    # 함수설명   :
+    #           1. 클라이언트가 보낸 모르는 모델 이름은 지표 키를 늘리지 않고 "other" 한 칸에 모이는지 테스트합니다.
+    def test_unknown_models_share_one_metrics_bucket(self):
+        usage = type("Usage", (), {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2})()
+        for i in range(50):
+            with telemetry.span("main", f"made-up-model-{i}"):
+                pass
+            telemetry.record_usage("main", f"made-up-model-{i}", usage)
+        with telemetry.span("main", "gpt-4o-mini"):
+            pass
+
+        snap = telemetry.snapshot()
+        self.assertEqual(set(snap["stages"]["main"]), {"gpt-4o-mini", "other"})
+        self.assertEqual(snap["stages"]["main"]["other"]["count"], 50)
+        self.assertEqual(set(snap["usage"]), {"other"})
+        self.assertEqual(snap["usage"]["other"]["total_tokens"], 100)
+
+    # 함수명     : test_stream_request_id_does_not_leak
+    # 함수설명   :
+    #           1. 스트리밍 본문이 도는 동안에만 request id 가 보이고, 단계 사이와 끝난 뒤(중간에 끊겨도)에는 남지 않는지 테스트합니다.
+    def test_stream_request_id_does_not_leak(self):
+        def body():
+            yield telemetry.get_request_id()
+            yield telemetry.get_request_id()
+
+        before = telemetry.get_request_id()
+        stream = telemetry.iter_with_request_id(body(), "req-stream")
+        self.assertEqual(next(stream), "req-stream")
+        self.assertEqual(telemetry.get_request_id(), before)
+        self.assertEqual(list(stream), ["req-stream"])
+        self.assertEqual(telemetry.get_request_id(), before)
+
+        closed = telemetry.iter_with_request_id(body(), "req-closed")
+        next(closed)
+        closed.close()
+        self.assertEqual(telemetry.get_request_id(), before)
+
+    # 함수명     : test_async_stream_request_id_does_not_leak
+    # 함수설명   :
+    #           1. ASGI 스트리밍 본문(async generator)도 단계가 도는 동안에만 request id 가 보이고, 끝나거나 닫힌 뒤에는 남지 않는지 테스트합니다.
+    #           2. chat_stream_async 응답 본문의 본 답변 단계에서 미들웨어가 정한 request id 가 보이는지 테스트합니다.
+    async def test_async_stream_request_id_does_not_leak(self):
+        async def body():
+            yield telemetry.get_request_id()
+            yield telemetry.get_request_id()
+
+        before = telemetry.get_request_id()
+        stream = telemetry.aiter_with_request_id(body(), "req-async")
+        self.assertEqual(await stream.__anext__(), "req-async")
+        self.assertEqual(telemetry.get_request_id(), before)
+        self.assertEqual([item async for item in stream], ["req-async"])
+        self.assertEqual(telemetry.get_request_id(), before)
+
+        closed = telemetry.aiter_with_request_id(body(), "req-async-closed")
+        await closed.__anext__()
+        await closed.aclose()
+        self.assertEqual(telemetry.get_request_id(), before)
+
+        async def answer(*args, **kwargs):
+            yield telemetry.get_request_id() or "none"
+
+        await self.async_client.aforce_login(self.user)
+        with mock.patch.object(llm_service, "astream_llm_response", answer), \
+                mock.patch.object(chat_service, "asave_chat_messsage", mock.AsyncMock(return_value=(None, "저장 안 함"))):
+            response = await self.async_client.post(
+                reverse("chat:chat_stream_async", args=[self.persona.id, 0]),
+                json.dumps({"message": "참치캔", "persona_id": self.persona.id}), content_type="application/json",
+                headers={"X-Request-ID": "req-asgi-view"},
+            )
+            body_text = b"".join([chunk async for chunk in response.streaming_content]).decode("utf-8")
+        self.assertIn('"text": "req-asgi-view"', body_text)
+
+
+class LLMTransportTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        llm_transport.reset()
+
+    def tearDown(self):
+        llm_transport.reset()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _client(self, inner=None):
+        import httpx
+        from openai import OpenAI
+        http_client = httpx.Client(transport=llm_transport.wrap(inner, "sync"))
+        return OpenAI(api_key="sk-test", http_client=http_client, max_retries=0)
+
+    # 함수명     : test_record_then_replay_without_network
+    # 함수설명   :
+    #           1. record 모드에서 요청/응답(메시지, 모델, usage, 지연)이 JSONL 파일로 기록되는지 테스트합니다.
+    #           2. replay 모드에서 같은 요청은 네트워크 없이 기록된 응답을, 기록에 없는 요청은 404(APIError)를 받는지 테스트합니다.
+    def test_record_then_replay_without_network(self):
+        import httpx
+        from openai import NotFoundError
+        calls = []
+
+        def upstream(request):
+            calls.append(request)
+            return httpx.Response(200, json={
+                "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "저는 한 달에 4개를 살 것 같아요!"}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 12, "completion_tokens": 8, "total_tokens": 20},
+            })
+
+        messages = [{"role": "user", "content": "참치캔 몇 개 살래?"}]
+        with override_settings(LLM_TRANSPORT_MODE="record", LLM_RECORD_DIR=self.tmpdir, LLM_RECORD_FLUSH_EVERY=1):
+            res = self._client(httpx.MockTransport(upstream)).chat.completions.create(model="gpt-4o-mini", messages=messages, max_tokens=50)
+        self.assertEqual(res.choices[0].message.content, "저는 한 달에 4개를 살 것 같아요!")
+        records = [json.loads(line) for name in os.listdir(self.tmpdir) for line in open(os.path.join(self.tmpdir, name), encoding="utf-8")]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["messages"], messages)
+        self.assertEqual(records[0]["params"], {"max_tokens": 50})
+        self.assertEqual(records[0]["usage"]["total_tokens"], 20)
+        self.assertIn("latency_ms", records[0])
+
+        llm_transport.reset()
+        with override_settings(LLM_TRANSPORT_MODE="replay", LLM_RECORD_DIR=self.tmpdir):
+            client = self._client()
+            replayed = client.chat.completions.create(model="gpt-4o-mini", messages=messages, max_tokens=50)
+            with self.assertRaises(NotFoundError):
+                client.chat.completions.create(model="gpt-4o-mini", messages=messages, max_tokens=51)
+            self.assertEqual(llm_transport.stats()["replay_hits"], 1)
+        self.assertEqual(replayed.choices[0].message.content, "저는 한 달에 4개를 살 것 같아요!")
+        self.assertEqual(replayed.usage.total_tokens, 20)
+        self.assertEqual(len(calls), 1)
+
+
+class RagServiceTestCase(TestCase):
+    def setUp(self):
+        rag_service.reset()
+        ReferenceProduct.objects.create(
+            product_id="tuna-150", name="동원 살코기 참치 150g", attributes={"원료": "참치", "특징": "저염 고단백"},
+            seasonal_trend="명절 선물세트 시즌에 판매 증가", promotion_effect=0.3, summary="고단백 저염식 참치캔으로 건강을 중시하는 소비자에게 인기",
+        )
+        ReferenceProduct.objects.create(
+            product_id="ham-340", name="리챔 340g", attributes={"원료": "돼지고기", "특징": "통조림 햄"},
+            seasonal_trend="캠핑 시즌 판매 증가", promotion_effect=0.2, summary="도시락 반찬용 통조림 햄",
+        )
+
+    def tearDown(self):
+        rag_service.reset()
+
+    # 함수명     : test_search_ranks_related_product_and_follows_updates
+    # 함수설명   :
+    #           1. 글자 n-gram TF-IDF 인덱스가 띄어쓰기/조사가 달라도 관련 제품을 먼저 찾는지 테스트합니다.
+    #           2. 제품 저장/삭제가 인덱스를 다시 만들지 않고 해당 행만 갱신하는지 테스트합니다.
+    def test_search_ranks_related_product_and_follows_updates(self):
+        hits = rag_service.search("참치캔을 한 달에 몇 개 살래?")
+        self.assertEqual(hits[0][0]["product_id"], "tuna-150")
+        self.assertIn("프로모션 시 +30%", rag_service.get_rag_context("저염 참치"))
+
+        index = rag_service.get_index()
+        ham = ReferenceProduct.objects.get(product_id="ham-340")
+        ham.summary = "라면에 넣어 먹는 부대찌개용 통조림 햄"
+        ham.save()
+        self.assertIs(rag_service.get_index(), index)
+        self.assertEqual(rag_service.search("부대찌개 햄")[0][0]["summary"], ham.summary)
+
+        ham.delete()
+        self.assertEqual(len(index), 1)
+        self.assertEqual(rag_service.search("부대찌개 통조림 햄", min_score=0.3), [])
+
+    # 함수명     : test_chat_api_injects_retrieved_facts
+    # 함수설명   :
+    #           1. /api/chat/send/ 가 하드코딩된 문구 대신 검색된 제품 사실을 시스템 프롬프트에 넣는지 테스트합니다.
+    def test_chat_api_injects_retrieved_facts(self):
+        persona = _make_persona(persona_summary_tag="김테스트, 여자, 30대")
+        thread = ChatThread.objects.create(persona=persona)
+        client = _FakeClient("저는 한 달에 4개를 살 것 같아요!")
+        with mock.patch.object(openai_pool, "get_client", return_value=client):
+            response = Client().post(reverse("api:chat_message_api"), json.dumps({"thread_id": thread.id, "message": "참치캔 몇 개 살래?"}), content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        system_prompt = client.chat.completions.calls[0]["messages"][0]["content"]
+        self.assertIn("동원 살코기 참치 150g", system_prompt)
+        self.assertNotIn("고단백 저염식 참치로, 건강을", system_prompt)
+
+
+class SalesFeaturesTestCase(TestCase):
+    def setUp(self):
+        sales_features.reset()
+        rag_service.reset()
+
+    def tearDown(self):
+        sales_features.reset()
+        rag_service.reset()
+
+    # 함수명     : test_features_precomputed_and_cited_for_segment
+    # 함수설명   :
+    #           1. 월별 판매량 JSON 이 계절 지수/추세/프로모션 상승률/세그먼트 점유율로 미리 계산되는지 테스트합니다.
+    #           2. 참고 제품 데이터에 페르소나 세그먼트 점유율이 수치로 인용되고, 제품 저장 시 해당 제품만 다시 계산되는지 테스트합니다.
+    def test_features_precomputed_and_cited_for_segment(self):
+        sales = [100] * 12
+        sales[11] = 200  # 12월 성수기
+        product = ReferenceProduct.objects.create(
+            product_id="tuna-150", name="살코기 참치 150g", summary="저염 참치캔", promotion_effect=0.25,
+            monthly_sales=[{"month": f"2024-{m:02d}", "sales": v} for m, v in enumerate(sales, start=1)],
+            segment_share={"실속형 미식가": 18, "건강 추구형": 82},
+        )
+        features = sales_features.get_features(product.pk)
+
+        self.assertEqual(features.peak()[0], 11)
+        self.assertAlmostEqual(features.seasonal[11], 200 / (1300 / 12), places=3)
+        self.assertGreater(features.trend_pct, 0)
+        self.assertAlmostEqual(features.share_for("실속형 미식가"), 0.18, places=5)
+        context = rag_service.get_rag_context("참치캔 몇 개 살래?", "실속형 미식가")
+        self.assertIn("성수기 12월", context)
+        self.assertIn("실속형 미식가 점유율 18%", context)
+
+        table = sales_features.get_table()
+        product.segment_share = {"실속형 미식가": 0.4}
+        product.save()
+        self.assertIsNot(sales_features.get_table(), table)
+        self.assertAlmostEqual(sales_features.get_features(product.pk).share_for("실속형 미식가"), 0.4, places=5)
+
+
+class DemandServiceTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.thrifty = Persona.objects.create(name="김절약", segment="실속형 미식가", age="30대", gender="여자", job="사무 종사자", household="1인 가구", persona_summary_tag="김절약, 여자, 30대, 1인 가구, price_sensitivity: 0.9, premium_orientation: 0.1")
+        cls.premium = Persona.objects.create(name="박프리", segment="프리미엄 추구형", age="40대", gender="남자", job="전문직", household="4인 가구", persona_summary_tag="박프리, 남자, 40대, 4인 가구, price_sensitivity: 0.1, premium_orientation: 0.9")
+
+    # 함수명     : test_vectorized_estimate_reacts_to_price_and_promotion
+    # 함수설명   :
+    #           1. 여러 페르소나 일괄 계산(estimate_profiles)이 한 명씩 계산한 값과 같은지 테스트합니다.
+    #           2. 가격이 오르면 가격 민감 페르소나의 수량이 더 크게 줄고, 프로모션이면 늘며, 항상 수량 가드 범위 안인지 테스트합니다.
+    def test_vectorized_estimate_reacts_to_price_and_promotion(self):
+        profiles = [persona_profile.get_profile(p) for p in Persona.objects.order_by("id")]
+        batch = demand_service.estimate_profiles(profiles, "canned_tuna", price=2500)
+        for profile, est in zip(profiles, batch):
+            self.assertEqual(est.as_dict(), demand_service.estimate_profile(profile, "canned_tuna", 2500).as_dict())
+
+        thrifty = persona_profile.get_profile(self.thrifty)
+        premium = persona_profile.get_profile(self.premium)
+        cheap, dear = (demand_service.estimate_profile(thrifty, "canned_tuna", p) for p in (2500, 4000))
+        self.assertLess(dear.base, cheap.base)
+        self.assertLessEqual(dear.conservative, dear.base)
+        self.assertLessEqual(dear.base, dear.aggressive)
+        self.assertGreaterEqual(demand_service.estimate_profile(thrifty, "canned_tuna", 2500, promotion=True).base, cheap.base)
+        drop_thrifty = dear.base / cheap.base
+        drop_premium = demand_service.estimate_profile(premium, "canned_tuna", 4000).base / demand_service.estimate_profile(premium, "canned_tuna", 2500).base
+        self.assertLess(drop_thrifty, drop_premium)
+        for est, tag in ((cheap, self.thrifty.persona_summary_tag), (dear, self.thrifty.persona_summary_tag)):
+            self.assertEqual(llm_service._clamp_quantity("참치캔", tag, est.base)[0], est.base)
+
+    # 함수명     : test_fast_mode_answers_quantity_without_main_call
+    # 함수설명   :
+    #           1. LLM_QUANTITY_MODE=fast 면 수량 질문에 사전 점검 한 번만 호출하고 메인 답변은 로컬 추정으로 만드는지 테스트합니다.
+    #           2. guided 모드는 메인 호출에 [수요 추정] 블록을 넣는지 테스트합니다.
+    @override_settings(LLM_PREFLIGHT_MODE="fused", LLM_SPECULATIVE_ANSWER=False, LLM_CACHE_ENABLED=False)
+    def test_fast_mode_answers_quantity_without_main_call(self):
+        preflight = json.dumps({"in_scope": True, "snapshot": "현재 대상: 참치캔 150g", "prices": [], "product_category": "canned_tuna"})
+        expected = demand_service.estimate_profile(persona_profile.get_profile(self.thrifty), "canned_tuna").base
+
+        client = _FakeClient(preflight)
+        with override_settings(LLM_QUANTITY_MODE="fast"), mock.patch.object(llm_service, "_get_openai_client", return_value=(client, RuntimeError)):
+            text = llm_service.get_llm_response(self.thrifty.id, "참치캔 한 달에 몇 개 살래?")
+        self.assertTrue(text.startswith(f"저는 한 달에 {expected}개"))
+        self.assertEqual(len(client.chat.completions.calls), 1)
+
+        client = _FakeClient(preflight, f"저는 한 달에 {expected}개를 구매할 것 같아요!")
+        with override_settings(LLM_QUANTITY_MODE="guided"), mock.patch.object(llm_service, "_get_openai_client", return_value=(client, RuntimeError)):
+            llm_service.get_llm_response(self.thrifty.id, "참치캔 한 달에 몇 개 살래?")
+        main = client.chat.completions.calls[-1]["messages"]
+        self.assertTrue(any(m["content"].startswith("[수요 추정]") for m in main if m["role"] == "system"))
+
+    # 함수명     : test_guided_mode_skips_speculative_answer
+    # 함수설명   :
+    #           1. 추측 실행이 켜져 있어도 guided 모드의 수량 질문은 추측 답변 대신 [수요 추정] 블록을 넣은 메인 호출로 답하는지 테스트합니다.
+    @override_settings(LLM_PREFLIGHT_MODE="fused", LLM_SPECULATIVE_ANSWER=True, LLM_QUANTITY_MODE="guided", LLM_CACHE_ENABLED=False)
+    def test_guided_mode_skips_speculative_answer(self):
+        preflight = json.dumps({"in_scope": True, "snapshot": "현재 대상: 참치캔 150g", "prices": [], "product_category": "canned_tuna"})
+        client = _FakeClient(preflight, "저는 한 달에 5개를 구매할 것 같아요!")
+        with mock.patch.object(llm_service, "_get_openai_client", return_value=(client, RuntimeError)), \
+                mock.patch.object(scope_classifier, "decide", return_value=(None, None)):
+            llm_service.get_llm_response(self.thrifty.id, "참치캔 한 달에 몇 개 살래?")
+
+        self.assertEqual(len(client.chat.completions.calls), 2)
+        main = client.chat.completions.calls[-1]["messages"]
+        self.assertTrue(any(m["content"].startswith("[수요 추정]") for m in main if m["role"] == "system"))
+
+
+class SurveyAPITestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username="survey", password="pw")
+        for name, segment, household in (("김하나", "실속형 미식가", "1인 가구"), ("이두리", "실속형 미식가", "1인 가구"), ("박세나", "건강 추구형 소비자", "2세대가족")):
+            Persona.objects.create(name=name, segment=segment, age="30대", gender="여자", job="사무 종사자", household=household, persona_summary_tag=f"{name}, 여자, 30대, {household}")
+        Persona.objects.create(name="최남자", segment="실속형 미식가", age="40대", gender="남자", job="관리자", household="1인 가구", persona_summary_tag="최남자, 남자, 40대, 1인 가구")
+
+    def setUp(self):
+        llm_cache.reset()
+        self.client.force_login(self.user)
+
+    # 함수명     : test_survey_fans_out_with_shared_preflight
+    # 함수설명   :
+    #           1. 조건(여자/30대)에 맞는 페르소나에게만 묻고, 사전 점검은 설문당 한 번만 호출하는지 테스트합니다.
+    #           2. NDJSON 으로 meta → 페르소나별 result → 세그먼트별 분포 summary 순서로 흘려보내는지 테스트합니다.
+    @override_settings(LLM_PREFLIGHT_MODE="fused", LLM_QUANTITY_MODE="guided")
+    def test_survey_fans_out_with_shared_preflight(self):
+        preflight = json.dumps({"in_scope": True, "snapshot": "현재 대상: 참치캔 150g", "prices": [], "product_category": "canned_tuna"})
+        client = _FakeClient(preflight, *["저는 한 달에 5개를 구매할 것 같아요!"] * 3)
+        body = {"question": "참치캔 한 달에 몇 개 살래?", "filter": {"gender": "여자", "age": "30대", "segment": "랜덤"}}
+        with mock.patch.object(llm_service, "_get_openai_client", return_value=(client, RuntimeError)), \
+                mock.patch.object(scope_classifier, "decide", return_value=(None, None)):
+            response = self.client.post(reverse("api:survey_api"), json.dumps(body), content_type="application/json")
+            events = [json.loads(line) for line in b"".join(response.streaming_content).decode("utf-8").splitlines()]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([e["type"] for e in events], ["meta", "result", "result", "result", "summary"])
+        preflight_calls = [c for c in client.chat.completions.calls if c.get("response_format")]
+        self.assertEqual(len(preflight_calls), 1)
+        self.assertEqual(len(client.chat.completions.calls), 4)
+        summary = events[-1]
+        self.assertEqual(summary["segments"]["실속형 미식가"]["n"], 2)
+        self.assertEqual(summary["segments"]["실속형 미식가"]["median"], 5.0)
+        self.assertEqual(summary["overall"]["n"], 3)
+
+    # 함수명     : test_survey_out_of_scope_skips_fan_out
+    # 함수설명   :
+    #           1. 공통 사전 점검이 범위 밖이면 페르소나별 호출 없이 거절 문구로 끝나는지 테스트합니다.
+    @override_settings(LLM_PREFLIGHT_MODE="fused")
+    def test_survey_out_of_scope_skips_fan_out(self):
+        client = _FakeClient(json.dumps({"in_scope": False, "snapshot": "", "prices": [], "product_category": "default"}))
+        with mock.patch.object(llm_service, "_get_openai_client", return_value=(client, RuntimeError)), \
+                mock.patch.object(scope_classifier, "decide", return_value=(None, None)):
+            response = self.client.post(reverse("api:survey_api"), json.dumps({"question": "오늘 날씨 어때?", "format": "json"}), content_type="application/json")
+
+        self.assertEqual(response.json()["results"], [])
+        self.assertEqual(response.json()["summary"]["refusal"], llm_service.REFUSAL_TEXT)
+        self.assertEqual(len(client.chat.completions.calls), 1)
+
+    # 함수명     : test_survey_requires_csrf_token
+    # 함수설명   :
+    #           1. 세션 쿠키만 있고 CSRF 토큰이 없는 요청(다른 사이트에서 보낸 요청)은 설문을 시작하지 않고 403 인지 테스트합니다.
+    def test_survey_requires_csrf_token(self):
+        http = Client(enforce_csrf_checks=True)
+        http.force_login(self.user)
+        with mock.patch.object(survey_service, "run_survey") as run_survey:
+            response = http.post(reverse("api:survey_api"), json.dumps({"question": "참치캔 몇 개 살래?"}), content_type="application/json")
+
+        self.assertEqual(response.status_code, 403)
+        run_survey.assert_not_called()
+
+
+class RateLimiterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "limiter.sqlite3")
+        rate_limiter.reset()
+
+    def tearDown(self):
+        rate_limiter.reset()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    # 함수명     : test_token_buckets_shared_and_batch_reserve
+    # 함수설명   :
+    #           1. RPM 버킷이 비면 기다릴 시간을 돌려주고, 같은 파일을 여는 다른 인스턴스(다른 프로세스)도 같은 잔량을 보는지 테스트합니다.
+    #           2. batch 호출은 버킷의 예약분을 남겨 두어 interactive 호출보다 먼저 막히는지 테스트합니다.
+    def test_token_buckets_shared_and_batch_reserve(self):
+        first, second = rate_limiter.TokenBuckets(self.path), rate_limiter.TokenBuckets(self.path)
+        self.assertEqual(first.take("m", 100, rpm=2, tpm=10000), 0.0)
+        self.assertEqual(second.take("m", 100, rpm=2, tpm=10000), 0.0)
+        self.assertGreater(first.take("m", 100, rpm=2, tpm=10000), 0.0)
+
+        buckets = rate_limiter.TokenBuckets(self.path)
+        self.assertGreater(buckets.take("n", 9000, rpm=100, tpm=10000, reserve=0.2), 0.0)
+        self.assertEqual(buckets.take("n", 9000, rpm=100, tpm=10000), 0.0)
+
+        gate = rate_limiter.AdaptiveGate(initial=2, minimum=1, maximum=4, target_ms=0)
+        gate.waiting["interactive"] = 1
+        self.assertFalse(gate._try_enter("batch"))
+        self.assertTrue(gate._try_enter("interactive"))
+
+    # 함수명     : test_retry_honours_retry_after_and_shrinks_concurrency
+    # 함수설명   :
+    #           1. 429 응답이면 Retry-After 만큼 기다렸다가 다시 호출하고, 적응형 동시성 한도를 절반으로 줄이는지 테스트합니다.
+    #           2. 재시도 대상이 아닌 오류(400)는 바로 올려보내는지 테스트합니다.
+    def test_retry_honours_retry_after_and_shrinks_concurrency(self):
+        from openai import BadRequestError, RateLimitError
+
+        request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+        throttled = RateLimitError("slow down", response=httpx.Response(429, headers={"retry-after-ms": "10"}, request=request), body=None)
+        client = _FakeClient("ok")
+        original = client.chat.completions.create
+        outcomes = [throttled]
+
+        def create(**kwargs):
+            if outcomes:
+                client.chat.completions.calls.append(kwargs)
+                raise outcomes.pop(0)
+            return original(**kwargs)
+
+        client.chat.completions.create = create
+        with override_settings(LLM_LIMITER_ENABLED=True, LLM_LIMITER_PATH=self.path, LLM_LIMITER_INITIAL_CONCURRENCY=8):
+            res = rate_limiter.create(client, "gpt-4o-mini", {"messages": [{"role": "user", "content": "참치캔"}], "max_tokens": 10})
+            stats = rate_limiter.stats()
+
+            self.assertEqual(res.choices[0].message.content, "ok")
+            self.assertEqual(len(client.chat.completions.calls), 2)
+            self.assertEqual((stats["retries"], stats["throttled"]), (1, 1))
+            self.assertLess(stats["concurrency_limit"], 8)
+
+            outcomes.append(BadRequestError("bad", response=httpx.Response(400, request=request), body=None))
+            with self.assertRaises(BadRequestError):
+                rate_limiter.create(client, "gpt-4o-mini", {"messages": [], "max_tokens": 10})
+            self.assertEqual(rate_limiter.stats()["retries"], 1)
+
+    # 함수명     : test_failed_call_and_gate_timeout_refund_buckets
+    # 함수설명   :
+    #           1. 호출이 실패하면 예약한 TPM 토큰과 RPM 요청 1건을 돌려주어 다음 호출이 바로 나가는지 테스트합니다.
+    #           2. 동시성 슬롯을 못 얻어 시간 초과가 나도 RPM/TPM 예약분을 돌려주는지 테스트합니다.
+    def test_failed_call_and_gate_timeout_refund_buckets(self):
+        from openai import APITimeoutError, BadRequestError
+
+        request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+        client = _FakeClient("ok", "ok")
+        original = client.chat.completions.create
+        outcomes = [BadRequestError("bad", response=httpx.Response(400, request=request), body=None)]
+
+        def create(**kwargs):
+            if outcomes:
+                raise outcomes.pop(0)
+            return original(**kwargs)
+
+        client.chat.completions.create = create
+        body = {"messages": [{"role": "user", "content": "참치캔"}], "max_tokens": 10}
+        with override_settings(LLM_LIMITER_ENABLED=True, LLM_LIMITER_PATH=self.path, LLM_LIMITER_RPM=1, LLM_LIMITER_TPM=50, LLM_LIMITER_MAX_WAIT=0.5):
+            with self.assertRaises(BadRequestError):
+                rate_limiter.create(client, "gpt-4o-mini", body)
+            self.assertEqual(rate_limiter.create(client, "gpt-4o-mini", body).choices[0].message.content, "ok")
+
+        # 슬롯 시간 초과는 새 버킷 파일에서 확인한다.
+        with override_settings(LLM_LIMITER_ENABLED=True, LLM_LIMITER_PATH=os.path.join(self.tmp, "gate.sqlite3"), LLM_LIMITER_RPM=1, LLM_LIMITER_TPM=50, LLM_LIMITER_MAX_WAIT=0.5):
+            rate_limiter.reset()
+            gate = rate_limiter._get_gate()
+            gate.inflight = int(gate.limit)
+            with self.assertRaises(APITimeoutError):
+                rate_limiter.create(client, "gpt-4o-mini", body)
+            gate.inflight = 0
+            self.assertEqual(rate_limiter.create(client, "gpt-4o-mini", body).choices[0].message.content, "ok")
+
+    # 함수명     : test_async_create_keeps_bucket_io_off_event_loop
+    # 함수설명   :
+    #           1. 비동기 경로(acreate)가 SQLite 버킷 조작(take/adjust)을 이벤트 루프 스레드가 아닌 별도 스레드에서 하는지 테스트합니다.
+    async def test_async_create_keeps_bucket_io_off_event_loop(self):
+        import threading
+
+        loop_thread = threading.get_ident()
+        seen = []
+        take, adjust = rate_limiter.TokenBuckets.take, rate_limiter.TokenBuckets.adjust
+
+        def recording(fn):
+            def wrapper(*args, **kwargs):
+                seen.append(threading.get_ident())
+                return fn(*args, **kwargs)
+            return wrapper
+
+        client = _FakeClient()
+        client.chat.completions = _FakeAsyncCompletions(["ok"])
+        with override_settings(LLM_LIMITER_ENABLED=True, LLM_LIMITER_PATH=self.path), \
+                mock.patch.object(rate_limiter.TokenBuckets, "take", recording(take)), \
+                mock.patch.object(rate_limiter.TokenBuckets, "adjust", recording(adjust)):
+            res = await rate_limiter.acreate(client, "gpt-4o-mini", {"messages": [{"role": "user", "content": "참치캔"}], "max_tokens": 10})
+
+        self.assertEqual(res.choices[0].message.content, "ok")
+        self.assertTrue(seen)
+        self.assertNotIn(loop_thread, seen)
+
+
+class PersonaMatchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        base = dict(gender="여자", age="30대", job="사무 종사자", household="1인 가구", income_month="200-300만원 미만", segment="실속형 미식가")
+        cls.exact = Persona.objects.create(name="김정확", **base)
+        cls.partial = Persona.objects.create(name="이부분", **dict(base, segment="건강 추구형 소비자", job="학생"))
+        Persona.objects.create(name="박남자", **dict(base, gender="남자"))
+
+    def setUp(self):
+        persona_match_service.reset()
+
+    def tearDown(self):
+        persona_match_service.reset()
+
+    # 함수명     : test_vectorized_match_ranks_by_weights_and_follows_updates
+    # 함수설명   :
+    #           1. 성별/연령은 필수 조건이고 나머지는 가중치 합으로 순위를 매기는지, 일치율이 기존 계산과 같은지 테스트합니다.
+    #           2. 페르소나 저장/삭제가 인덱스를 다시 만들지 않고 해당 행만 갱신하는지 테스트합니다.
+    def test_vectorized_match_ranks_by_weights_and_follows_updates(self):
+        criteria = dict(gender="여자", age="30대", job="사무 종사자", household="1인 가구", income_month="200-300만원 미만", segment="실속형 미식가")
+        matches = persona_match_service.match(criteria)
+
+        self.assertEqual([m.persona_id for m in matches], [self.exact.id, self.partial.id])
+        self.assertEqual(matches[0].percentage, 100.0)
+        self.assertEqual(matches[1].percentage, round(15 / 20 * 100, 1))
+        self.assertEqual(persona_match_service.match(dict(criteria, gender="외계인")), [])
+
+        index = persona_match_service.get_index()
+        self.partial.segment = "실속형 미식가"
+        self.partial.job = "사무 종사자"
+        self.partial.save()
+        self.exact.delete()
+        self.assertIs(persona_match_service.get_index(), index)
+        self.assertEqual(persona_match_service.match(criteria)[0].persona_id, self.partial.id)
+        self.assertEqual(len(index), 2)
+
+    # 함수명     : test_find_and_chat_uses_index
+    # 함수설명   :
+    #           1. find_and_chat_view 가 인덱스의 최고 점수 페르소나와 일치율을 JSON 으로 돌려주는지 테스트합니다.
+    def test_find_and_chat_uses_index(self):
+        params = {"gender": "여자", "age": "30대", "job": "사무 종사자", "household": "1인 가구", "income_month": "200-300만원 미만", "segment": "실속형 미식가"}
+        response = Client().get(reverse("persona:find_and_chat"), params, HTTP_ACCEPT="application/json")
+
+        self.assertEqual(response.json()["persona_id"], self.exact.id)
+        self.assertEqual(response.json()["match_percentage"], 100.0)
+        self.assertEqual(len(response.json()["candidates"]), 2)
+
+
+class SimilarPersonaTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username="panel", password="pw")
+        cls.personas = [Persona.objects.create(name=f"패널{i}", segment="실속형 미식가") for i in range(4)]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        # (특성 값, 클러스터): 0 과 1 은 거의 같은 방향, 2 는 같은 방향이지만 다른 클러스터, 3 은 반대 성향
+        rows = [([0.9, 0.1, 0.8], 0), ([0.85, 0.15, 0.75], 0), ([0.9, 0.1, 0.8], 1), ([0.1, 0.9, 0.1], 0)]
+        source = os.path.join(self.tmp, "weighted.jsonl")
+        with open(source, "w", encoding="utf-8") as f:
+            for persona, (values, cluster) in zip(self.personas, rows):
+                attrs = {f"{k}_scaled": {"value": 0.5, "weight": 0.1} for k in similar_persona_service.TRAIT_KEYS}
+                for key, value in zip(similar_persona_service.TRAIT_KEYS, values):
+                    attrs[f"{key}_scaled"]["value"] = value
+                f.write(json.dumps({"persona_key": persona.id, "attributes": attrs, "meta": {"cluster": cluster, "label": f"C{cluster}"}}) + "\n")
+        self.settings_override = override_settings(SIMILAR_PERSONA_SOURCE=source, SIMILAR_PERSONA_DIR=os.path.join(self.tmp, "store"))
+        self.settings_override.enable()
+        similar_persona_service.reset()
+
+    def tearDown(self):
+        similar_persona_service.reset()
+        self.settings_override.disable()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    # 함수명     : test_exact_top_k_with_cluster_pruning
+    # 함수설명   :
+    #           1. 자기 자신을 빼고 cosine / 가중 L2 로 가까운 순서를 정확히 돌려주는지 테스트합니다.
+    #           2. 같은 클러스터 옵션이 다른 클러스터 페르소나를 후보에서 빼는지 테스트합니다.
+    #           3. 행렬이 읽기 전용 mmap 으로 열리고, 같은 원본이면 다시 만들지 않는지 테스트합니다.
+    def test_exact_top_k_with_cluster_pruning(self):
+        p0, p1, p2, p3 = self.personas
+        cosine = similar_persona_service.similar_to(p0, 3)
+        self.assertEqual([n.persona_id for n in cosine], [p2.id, p1.id, p3.id])
+        self.assertAlmostEqual(cosine[0].score, 1.0, places=5)
+
+        l2 = similar_persona_service.similar_to(p0, 2, "weighted_l2")
+        self.assertEqual([n.persona_id for n in l2], [p2.id, p1.id])
+        self.assertAlmostEqual(l2[0].score, 0.0, places=5)
+
+        same = similar_persona_service.similar_to(p0, 3, same_cluster=True)
+        self.assertEqual([n.persona_id for n in same], [p1.id, p3.id])
+
+        index = similar_persona_service.get_index()
+        self.assertIsInstance(index.vectors, np.memmap)
+        self.assertFalse(index.vectors.flags.writeable)
+        path = index.path
+        similar_persona_service.reset()
+        self.assertEqual(similar_persona_service.build(), path)
+
+    # 함수명     : test_similar_personas_api
+    # 함수설명   :
+    #           1. 로그인한 사용자에게 이름/세그먼트가 붙은 결과를 돌려주고, 잘못된 metric 은 400 으로 거절하는지 테스트합니다.
+    def test_similar_personas_api(self):
+        url = reverse("api:similar_personas_api", args=[self.personas[0].id])
+        http = Client()
+        self.assertEqual(http.get(url).status_code, 403)
+        http.force_login(self.user)
+
+        body = http.get(url, {"k": 1, "cluster": "1"}).json()
+        self.assertEqual(body["results"][0]["persona_id"], self.personas[1].id)
+        self.assertEqual(body["results"][0]["name"], "패널1")
+        self.assertEqual(http.get(url, {"metric": "dot"}).status_code, 400)
+
+
+class ChatSearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username="searcher", password="pw")
+        other = get_user_model().objects.create_user(username="other", password="pw")
+        persona = Persona.objects.create(name="검색용")
+        cls.tuna = ChatThread.objects.create(persona=persona, user=cls.user)
+        cls.ramen = ChatThread.objects.create(persona=persona, user=cls.user)
+        cls.hidden = ChatThread.objects.create(persona=persona, user=other)
+        with cls.captureOnCommitCallbacks(execute=True):
+            ChatMessage.objects.create(thread=cls.tuna, sender="user", message="참치캔 2천원이면 몇 개 살래?")
+            cls.answer = ChatMessage.objects.create(thread=cls.tuna, sender="persona", message="참치캔은 한 달에 참치캔 4개 정도 삽니다.")
+            ChatMessage.objects.create(thread=cls.ramen, sender="user", message="라면이랑 참치캔 같이 사요?")
+            ChatMessage.objects.create(thread=cls.hidden, sender="user", message="참치캔 얘기는 남의 대화")
+
+    # 함수명     : test_ranked_thread_pages_with_snippets
+    # 함수설명   :
+    #           1. 조사가 붙은 단어도 2-gram 색인으로 찾고, 다른 사용자의 대화는 보이지 않는지 테스트합니다.
+    #           2. 일치가 많은 스레드가 먼저 오고, 쿼리 수가 결과 수와 상관없이 고정인지 테스트합니다.
+    #           3. next_cursor 로 다음 페이지 스레드를 이어서 받는지 테스트합니다.
+    @override_settings(CHAT_SEARCH_PAGE_SIZE=1)
+    def test_ranked_thread_pages_with_snippets(self):
+        with self.assertNumQueries(4):
+            first = chat_search.search(self.user.id, "참치캔")
+        self.assertEqual([r["thread_id"] for r in first["results"]], [self.tuna.id])
+        self.assertEqual(first["results"][0]["match_count"], 2)
+        message = first["results"][0]["messages"][0]
+        start, end = message["highlights"][0]
+        self.assertEqual(message["message"][start:end], "참치캔")
+
+        second = chat_search.search(self.user.id, "참치캔", first["next_cursor"])
+        self.assertEqual([r["thread_id"] for r in second["results"]], [self.ramen.id])
+        self.assertIsNone(second["next_cursor"])
+
+        http = Client()
+        http.force_login(self.user)
+        body = http.get(reverse("chat:chat_search"), {"q": "라면"}).json()
+        self.assertEqual([r["thread_id"] for r in body["results"]], [self.ramen.id])
+        self.assertEqual(http.get(reverse("chat:chat_search"), {"q": "참치", "cursor": "!!"}).status_code, 400)
+
+    # 함수명     : test_index_follows_message_changes
+    # 함수설명   :
+    #           1. 메시지 수정 시 해당 메시지 색인만 다시 쓰고, 삭제 시 색인 행도 함께 지워지는지 테스트합니다.
+    #           2. 색인 재생성 명령이 같은 결과를 만드는지 테스트합니다.
+    def test_index_follows_message_changes(self):
+        self.answer.message = "요즘은 닭가슴살을 삽니다."
+        with self.captureOnCommitCallbacks(execute=True):
+            self.answer.save()
+        self.assertEqual(chat_search.search(self.user.id, "닭가슴살")["results"][0]["thread_id"], self.tuna.id)
+        self.assertEqual(chat_search.search(self.user.id, "참치캔")["results"][0]["match_count"], 1)
+
+        before = ChatMessageTerm.objects.count()
+        call_command("rebuild_chat_search_index", stdout=io.StringIO())
+        self.assertEqual(ChatMessageTerm.objects.count(), before)
+
+        self.answer.delete()
+        self.assertFalse(ChatMessageTerm.objects.filter(message_id=self.answer.id).exists())
+        self.assertEqual(chat_search.search(self.user.id, "닭가슴살")["results"], [])
+
+    # 함수명     : test_index_after_commit_with_length_cap
+    # 함수설명   :
+    #           1. 메시지 색인은 저장 트랜잭션 안이 아니라 커밋 후에 쓰이는지 테스트합니다.
+    #           2. CHAT_SEARCH_INDEX_MAX_CHARS 를 넘는 긴 답변은 앞부분만 색인하는지 테스트합니다.
+    @override_settings(CHAT_SEARCH_INDEX_MAX_CHARS=20)
+    def test_index_after_commit_with_length_cap(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            long = ChatMessage.objects.create(thread=self.ramen, sender="persona", message="고등어조림 " + "가나다라마바사 " * 5 + "닭가슴살")
+            self.assertFalse(ChatMessageTerm.objects.filter(message_id=long.id).exists())
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(chat_search.search(self.user.id, "고등어")["results"][0]["thread_id"], self.ramen.id)
+        self.assertEqual(chat_search.search(self.user.id, "닭가슴살")["results"], [])
+
+
+class ThreadStatsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username="lister", password="pw")
+        cls.persona = Persona.objects.create(name="목록용")
+        cls.old = ChatThread.objects.create(persona=cls.persona, user=cls.user)
+        cls.new = ChatThread.objects.create(persona=cls.persona, user=cls.user)
+
+    # 함수명     : test_save_updates_stats_and_recency_order
+    # 함수설명   :
+    #           1. save_chat_messsage 가 메시지 수 / 마지막 시각 / 미리보기를 스레드에 누적하는지 테스트합니다.
+    #           2. 최근 대화 목록이 생성 순이 아니라 마지막 메시지 순이고, 스레드 수와 상관없이 쿼리 한 번인지 테스트합니다.
+    def test_save_updates_stats_and_recency_order(self):
+        request = mock.Mock(user=self.user)
+        chat_service.save_chat_messsage(request, "참치캔 몇 개 살래?", self.persona.id, self.old.id, "한 달에 4개요")
+        chat_service.save_chat_messsage(request, "2천원이면요?", self.persona.id, self.old.id, "  그럼\n5개 살게요  ")
+
+        self.old.refresh_from_db()
+        self.assertEqual(self.old.message_count, 4)
+        self.assertEqual(self.old.last_message_preview, "그럼 5개 살게요")
+        self.assertEqual(self.old.last_message_at, self.old.messages.order_by("-id").first().timestamp)
+        self.assertEqual(chat_service.preview("가" * 300), "가" * 199 + "…")
+
+        from config.context_processors import recent_chats_processor
+        with self.assertNumQueries(1):
+            recent = [(t.id, t.persona.name) for t in recent_chats_processor(mock.Mock(user=self.user))["recent_chats"]]
+        self.assertEqual(recent, [(self.old.id, "목록용"), (self.new.id, "목록용")])
+
+    # 함수명     : test_stale_message_does_not_rewind_last_message
+    # 함수설명   :
+    #           1. 더 이전 시각의 메시지가 늦게 반영되어도 개수만 늘고 마지막 시각/미리보기는 되돌아가지 않는지 테스트합니다.
+    def test_stale_message_does_not_rewind_last_message(self):
+        newer = ChatMessage.objects.create(thread=self.new, sender="persona", message="최근 답변")
+        older = ChatMessage.objects.create(thread=self.new, sender="persona", message="예전 답변")
+        ChatMessage.objects.filter(pk=older.pk).update(timestamp=newer.timestamp - timedelta(seconds=5))
+        older.refresh_from_db()
+
+        chat_service.record_messages(self.new.id, (newer,))
+        chat_service.record_messages(self.new.id, (older,))
+
+        self.new.refresh_from_db()
+        self.assertEqual((self.new.message_count, self.new.last_message_at, self.new.last_message_preview), (2, newer.timestamp, "최근 답변"))
+
+    # 함수명     : test_backfill_recomputes_from_messages
+    # 함수설명   :
+    #           1. 통계 없이 저장된 기존 메시지로부터 backfill 명령이 개수/시각/미리보기를 다시 채우는지 테스트합니다.
+    def test_backfill_recomputes_from_messages(self):
+        ChatMessage.objects.create(thread=self.new, sender="user", message="안녕하세요")
+        last = ChatMessage.objects.create(thread=self.new, sender="persona", message="반갑습니다")
+        call_command("backfill_thread_stats", stdout=io.StringIO())
+
+        self.new.refresh_from_db()
+        self.old.refresh_from_db()
+        self.assertEqual((self.new.message_count, self.new.last_message_preview, self.new.last_message_at), (2, "반갑습니다", last.timestamp))
+        self.assertEqual((self.old.message_count, self.old.last_message_at), (0, self.old.created_at))
+
+    # 함수명     : test_migration_backfills_existing_threads
+    # 함수설명   :
+    #           1. 통계 컬럼을 추가한 뒤의 데이터 마이그레이션이 backfill 명령 없이도 기존 스레드의 개수/시각/미리보기를 채우는지 테스트합니다.
+    def test_migration_backfills_existing_threads(self):
+        import importlib
+        from django.apps import apps
+
+        ChatMessage.objects.create(thread=self.old, sender="user", message="참치캔 몇 개 살래?")
+        last = ChatMessage.objects.create(thread=self.old, sender="persona", message="  한 달에\n4개요 ")
+        migration = importlib.import_module("chat.migrations.0010_backfill_thread_stats")
+        migration.backfill_thread_stats(apps, None)
+
+        self.old.refresh_from_db()
+        self.new.refresh_from_db()
+        self.assertEqual((self.old.message_count, self.old.last_message_preview, self.old.last_message_at), (2, "한 달에 4개요", last.timestamp))
+        self.assertEqual((self.new.message_count, self.new.last_message_at), (0, self.new.created_at))
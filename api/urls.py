@@ -5,5 +5,10 @@ app_name = 'api'
 
 urlpatterns = [
     path('chat/send/', views.chat_message_api, name='chat_message_api'),
-    # path('personas/filter/', views.persona_filter_api, name='persona_filter_api'),
+    path('chat/send/async/', views.chat_message_api_async, name='chat_message_api_async'),
+    path('survey/', views.survey_api, name='survey_api'),
+    path('personas/filter/', views.persona_filter_api, name='persona_filter_api'),
+    path('personas/facets/', views.persona_facets_api, name='persona_facets_api'),
+    path('personas/<int:persona_id>/similar/', views.similar_personas_api, name='similar_personas_api'),
+    path('metrics/', views.metrics_api, name='metrics_api'),
 ]
\ No newline at end of file
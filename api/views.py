@@ -1,11 +1,23 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_GET
 from django.shortcuts import get_object_or_404
-from decouple import config
-from openai import OpenAI
 import json
 
+from api.services import chat_service, demand_service, llm_cache, llm_transport, openai_pool, persona_catalog, persona_match_service, persona_profile, rag_service, rate_limiter, sales_features, similar_persona_service, survey_service, telemetry
+from api.services.history_cache import history_cache
+
 from chat.models import ChatMessage, ChatThread
+from persona.models import Persona
+
+def _build_api_messages(persona, user_message, rag_context):
+    system_prompt = f" 페르소나입니다. 다음 페르소나당신은 {persona.name}입니다. 정보와 참고 데이터를 바탕으로 사용자의 질문에 답변해주세요: {persona.persona_summary_tag}."
+    if rag_context:
+        system_prompt += f" 참고 데이터:\n{rag_context}"
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
 
 @csrf_exempt # 외부 API 호출을 허용하기 위해 CSRF 검증을 비활성화
 def chat_message_api(request):
@@ -24,32 +36,29 @@ def chat_message_api(request):
         persona = thread.persona
         
         # 사용자 메시지 DB에 저장하기
-        ChatMessage.objects.create(
+        user_msg = ChatMessage.objects.create(
             thread=thread,
             sender='user',
             message=user_message
         )
+        chat_service.record_messages(thread.id, [user_msg])
         
-        # RAG 검색
-        # rag_context = get_rag_context(user_message, persona)
-        rag_context = "이 제품은 고단백 저염식 참치로, 건강을 중시하는 소비자에게 인기가 많아"  # 실제 RAG 검색 로직을 구현해야 함
+        # RAG 검색 (ReferenceProduct 로컬 인덱스)
+        rag_context = rag_service.get_rag_context(user_message, persona.segment)
         
         # OpenAI API 호출
-        client = OpenAI(api_key=config('OPENAI_API_KEY'))
-        
-        system_prompt = f" 페르소나입니다. 다음 페르소나당신은 {persona.name}입니다. 정보와 참고 데이터를 바탕으로 사용자의 질문에 답변해주세요: {persona.persona_summary_tag}. 참고 데이터: {rag_context}"
+        client = openai_pool.get_client()
         
-        messages = [{"role": "system", "content": system_prompt}]
-        messages.append({"role": "user", "content": user_message})
+        messages = _build_api_messages(persona, user_message, rag_context)
 
-        completion = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=messages
-        )
+        with telemetry.span("api_main", "gpt-3.5-turbo"):
+            completion = rate_limiter.create(client, "gpt-3.5-turbo", {"messages": messages})
+        telemetry.record_usage("api_main", "gpt-3.5-turbo", getattr(completion, "usage", None))
         persona_response = completion.choices[0].message.content
 
         # 페르소나 답변을 DB에 저장
-        ChatMessage.objects.create(thread=thread, sender='persona', message=persona_response)
+        persona_msg = ChatMessage.objects.create(thread=thread, sender='persona', message=persona_response)
+        chat_service.record_messages(thread.id, [persona_msg])
         
         # 생성된 답변을 채팅창에 JSON 형태로 반환
         return JsonResponse({'response': persona_response})
@@ -61,3 +70,200 @@ def chat_message_api(request):
         return JsonResponse({'error': '존재하지 않는 채팅입니다.'}, status=404)
     except Exception as e:
         return JsonResponse({'error': f'서버 내부 오류: {str(e)}'}, status=500)
+
+
+# 함수명      : chat_message_api_async
+# input       : request(JSON: thread_id, message)
+# output      : JsonResponse
+# 작성일자    : 2026-10-18
+# 함수설명    : chat_message_api 의 ASGI 전용 비동기 버전.
+#               async ORM 으로 스레드 조회/메시지 저장을 하고 AsyncOpenAI 로 답변을 생성합니다.
+@csrf_exempt
+async def chat_message_api_async(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST 요청만 지원합니다'}, status=405)
+    try:
+        data = json.loads(request.body)
+        thread_id = data.get('thread_id')
+        user_message = data.get('message')
+
+        if not thread_id or not user_message:
+            return JsonResponse({'error': 'thread_id와 message는 필수 항목입니다'}, status=400)
+
+        thread = await ChatThread.objects.select_related('persona').aget(id=thread_id)
+        persona = thread.persona
+
+        user_msg = await ChatMessage.objects.acreate(thread=thread, sender='user', message=user_message)
+        await chat_service.arecord_messages(thread.id, [user_msg])
+
+        rag_context = await rag_service.aget_rag_context(user_message, persona.segment)
+
+        client = openai_pool.get_async_client()
+        with telemetry.span("api_main", "gpt-3.5-turbo"):
+            completion = await rate_limiter.acreate(
+                client, "gpt-3.5-turbo", {"messages": _build_api_messages(persona, user_message, rag_context)},
+            )
+        telemetry.record_usage("api_main", "gpt-3.5-turbo", getattr(completion, "usage", None))
+        persona_response = completion.choices[0].message.content
+
+        persona_msg = await ChatMessage.objects.acreate(thread=thread, sender='persona', message=persona_response)
+        await chat_service.arecord_messages(thread.id, [persona_msg])
+
+        return JsonResponse({'response': persona_response})
+
+    except json.JSONDecodeError:
+        return JsonResponse({'error': '잘못된 JSON 형식입니다.'}, status=400)
+    except ChatThread.DoesNotExist:
+        return JsonResponse({'error': '존재하지 않는 채팅입니다.'}, status=404)
+    except Exception as e:
+        return JsonResponse({'error': f'서버 내부 오류: {str(e)}'}, status=500)
+
+
+def _ndjson(events):
+    for event in events:
+        yield json.dumps(event, ensure_ascii=False) + "\n"
+
+
+def _sse(events):
+    for event in events:
+        yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+# 함수명      : survey_api
+# input       : request(JSON: question, model, filter{gender/age/job/household/income_month/segment/region}, persona_ids, limit, format)
+# output      : StreamingHttpResponse (format=ndjson 기본, sse) 또는 JsonResponse (format=json)
+# 작성일자    : 2026-10-18
+# 함수설명    : 질문 하나를 조건에 맞는 페르소나 여러 명에게 동시에 묻고, 끝나는 순서대로 페르소나별 결과를 흘려보낸 뒤
+#               세그먼트별 예상 수량 분포를 마지막 이벤트로 보냅니다. 로그인한 사용자만 호출할 수 있습니다.
+#               세션 인증이라 CSRF 검사를 받습니다 (채팅 화면처럼 X-CSRFToken 헤더로 토큰을 보냅니다).
+#               대화 기록(ChatThread)은 남기지 않습니다.
+def survey_api(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST 요청만 지원합니다'}, status=405)
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': '로그인이 필요합니다.'}, status=403)
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': '잘못된 JSON 형식입니다.'}, status=400)
+    question = (data.get('question') or '').strip()
+    if not question:
+        return JsonResponse({'error': 'question은 필수 항목입니다'}, status=400)
+    try:
+        personas = survey_service.select_personas(data.get('filter') or {}, data.get('persona_ids'), data.get('limit'))
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'persona_ids와 limit은 숫자여야 합니다'}, status=400)
+    if not personas:
+        return JsonResponse({'error': '조건에 맞는 페르소나가 없습니다.'}, status=404)
+
+    events = survey_service.run_survey(personas, question, data.get('model') or 'gpt-4o-mini')
+    output = data.get('format') or 'ndjson'
+    if output == 'json':
+        results, summary = [], {}
+        for event in events:
+            if event['type'] == 'result':
+                results.append(event)
+            elif event['type'] == 'summary':
+                summary = event
+        return JsonResponse({'results': results, 'summary': summary})
+    # 스트림 본문은 미들웨어가 끝난 뒤 돌기 때문에 request id 를 단계마다 다시 심고 되돌린다.
+    if output == 'sse':
+        body, content_type = _sse(events), 'text/event-stream; charset=utf-8'
+    else:
+        body, content_type = _ndjson(events), 'application/x-ndjson; charset=utf-8'
+    response = StreamingHttpResponse(telemetry.iter_with_request_id(body, telemetry.get_request_id()), content_type=content_type)
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# 함수명      : persona_filter_api
+# input       : request (GET: gender, age, job, household, income_month, segment, region — 여러 번 주면 IN, size, cursor)
+# output      : JsonResponse (페르소나 목록). 다음 페이지가 있으면 X-Next-Cursor / Link(rel="next") 헤더
+# 작성일자    : 2026-10-18
+# 함수설명    : 조건에 맞는 페르소나를 id 순으로 한 페이지씩 반환합니다. 다음 페이지는 cursor=<X-Next-Cursor> 로 요청합니다.
+@require_GET
+def persona_filter_api(request):
+    try:
+        cursor = int(request.GET.get('cursor') or 0)
+        size = persona_catalog.page_size(request.GET.get('size'))
+    except ValueError:
+        return JsonResponse({'error': 'cursor와 size는 숫자여야 합니다'}, status=400)
+    rows, next_cursor = persona_catalog.page(persona_catalog.parse_filters(request.GET), cursor, size)
+    response = JsonResponse(rows, safe=False)
+    if next_cursor is not None:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        response['X-Next-Cursor'] = str(next_cursor)
+        response['Link'] = f'<{request.path}?{params.urlencode()}>; rel="next"'
+    return response
+
+
+# 함수명      : persona_facets_api
+# input       : request (GET, If-None-Match)
+# output      : JsonResponse ({"total", "facets": {필드: [{"value", "count"}]}}) 또는 304
+# 작성일자    : 2026-10-18
+# 함수설명    : 조건 선택지(persona/options.py)별 페르소나 수를 반환합니다. 개수가 바뀌지 않았으면 ETag 로 304 를 돌려줍니다.
+@require_GET
+@condition(etag_func=persona_catalog.facets_etag)
+def persona_facets_api(request):
+    payload, _ = persona_catalog.facets()
+    response = JsonResponse(payload)
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+# 함수명      : similar_personas_api
+# input       : request (GET: k, metric=cosine|weighted_l2, cluster=1 이면 같은 클러스터 안에서만), persona_id
+# output      : JsonResponse
+# 작성일자    : 2026-10-18
+# 함수설명    : 가중 특성 벡터가 가까운 페르소나 k 명을 가까운 순으로 반환합니다. 테스트 패널을 넓힐 때 씁니다.
+#               score 는 cosine 이면 유사도(클수록 가까움), weighted_l2 면 거리(작을수록 가까움)입니다.
+@require_GET
+def similar_personas_api(request, persona_id):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': '로그인이 필요합니다.'}, status=403)
+    persona = get_object_or_404(Persona, pk=persona_id)
+    metric = request.GET.get('metric') or 'cosine'
+    if metric not in similar_persona_service.METRICS:
+        return JsonResponse({'error': 'metric은 cosine 또는 weighted_l2 입니다'}, status=400)
+    try:
+        k = int(request.GET.get('k') or 0) or None
+    except ValueError:
+        return JsonResponse({'error': 'k는 숫자여야 합니다'}, status=400)
+    same_cluster = request.GET.get('cluster') in ('1', 'true')
+    neighbors = similar_persona_service.similar_to(persona, k, metric, same_cluster)
+    found = Persona.objects.only('id', 'name', 'segment').in_bulk([n.persona_id for n in neighbors])
+    results = [
+        {'persona_id': n.persona_id, 'name': found[n.persona_id].name, 'segment': found[n.persona_id].segment,
+         'score': n.score, 'cluster': n.cluster}
+        for n in neighbors if n.persona_id in found
+    ]
+    return JsonResponse({'persona_id': persona.pk, 'metric': metric, 'results': results})
+
+
+# 함수명      : metrics_api
+# input       : request (GET)
+# output      : JsonResponse
+# 작성일자    : 2026-10-18
+# 함수설명    : 워커 프로세스의 단계별 지연(p50/p95/p99), 모델별 토큰 사용량, 커넥션 풀/캐시 통계를 반환합니다.
+#               staff 계정만 조회할 수 있습니다. (통계는 워커 프로세스 단위)
+@require_GET
+def metrics_api(request):
+    if not (request.user.is_authenticated and request.user.is_staff):
+        return JsonResponse({'error': '권한이 없습니다.'}, status=403)
+    return JsonResponse({
+        'telemetry': telemetry.snapshot(),
+        'openai_pool': openai_pool.pool_stats(),
+        'llm_cache': llm_cache.stats(),
+        'history_cache': history_cache.stats(),
+        'persona_profile': persona_profile.profile_cache.stats(),
+        'llm_transport': llm_transport.stats(),
+        'rag': rag_service.stats(),
+        'sales_features': sales_features.stats(),
+        'demand': demand_service.stats(),
+        'rate_limiter': rate_limiter.stats(),
+        'persona_match': persona_match_service.stats(),
+        'persona_catalog': persona_catalog.stats(),
+        'similar_persona': similar_persona_service.stats(),
+    })
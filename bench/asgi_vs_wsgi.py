@@ -0,0 +1,132 @@
+# bench/asgi_vs_wsgi.py
+# 함수설명 : 같은 채팅 턴을 WSGI(동기 ChatView, 스레드 풀)와 ASGI(비동기 chat_message_async, 이벤트 루프)로
+#            동시 사용자 수를 늘려가며 실행하고 처리량/지연시간을 비교한다.
+#            LLM 호출은 고정 지연을 가진 로컬 가짜 OpenAI 서버(bench/fake_openai.py)로 보내
+#            실제 HTTP 커넥션 풀/직렬화 비용까지 포함해 네트워크 대기를 흉내 낸다.
+#
+# 사용법 : python -m bench.asgi_vs_wsgi --users 8,32,128 --latency 0.8 --wsgi-threads 8
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench import fake_openai
+
+
+def _args():
+    parser = argparse.ArgumentParser(description="WSGI vs ASGI 동시 사용자 처리량 비교")
+    parser.add_argument("--users", default="8,32,128", help="동시 사용자 수 목록 (쉼표 구분)")
+    parser.add_argument("--latency", type=float, default=0.8, help="가짜 LLM 호출 1회 지연(초)")
+    parser.add_argument("--wsgi-threads", type=int, default=8, help="WSGI 워커 스레드 수 (gunicorn gthread 가정)")
+    return parser.parse_args()
+
+
+# LLM 호출은 같은 프로세스에 띄운 가짜 OpenAI 서버(고정 지연)로 보낸다. 설정이 읽히기 전에 주소를 지정해야 한다.
+ARGS = _args()
+SERVER = fake_openai.start_in_thread(fake_openai.FakeConfig(latency=f"fixed:{ARGS.latency}"))
+os.environ["OPENAI_BASE_URL"] = SERVER.base_url
+os.environ.setdefault("TELEMETRY_LOG_LEVEL", "WARNING")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bench.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.test import AsyncClient, Client  # noqa: E402
+
+from api.services import llm_cache  # noqa: E402
+from persona.models import Persona  # noqa: E402
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def _setup_fixtures():
+    call_command("migrate", verbosity=0, interactive=False)
+    User = get_user_model()
+    user, _ = User.objects.get_or_create(username="bench")
+    persona, _ = Persona.objects.get_or_create(
+        name="벤치",
+        defaults={
+            "segment": "실속형 미식가", "gender": "여자", "age": "30대", "household": "1인 가구",
+            "job": "사무 종사자", "persona_summary_tag": "벤치, 여자, 30대, 1인 가구",
+        },
+    )
+    return user, persona
+
+
+def _payload(persona, i):
+    return json.dumps({
+        "message": f"참치캔 150g 한 달에 몇 개 살래? ({i})",
+        "model": "gpt-4o-mini",
+        "persona_id": persona.id,
+        "thread_id": None,
+    })
+
+
+def run_wsgi(user, persona, users, threads):
+    # 지연시간은 제출 시점부터 잰다 (워커 스레드 대기열에서 기다린 시간 포함)
+    def one(i):
+        client = Client()
+        client.force_login(user)
+        resp = client.post(f"/chat/{persona.id}/0/", _payload(persona, i), content_type="application/json")
+        return time.perf_counter() - start, resp.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(one, range(users)))
+    return time.perf_counter() - start, results
+
+
+async def _run_asgi(user, persona, users):
+    client = AsyncClient()
+    await client.aforce_login(user)
+
+    async def one(i):
+        resp = await client.post(f"/chat/{persona.id}/0/async/", _payload(persona, i), content_type="application/json")
+        return time.perf_counter() - start, resp.status_code
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(users)))
+    return time.perf_counter() - start, results
+
+
+def run_asgi(user, persona, users):
+    return asyncio.run(_run_asgi(user, persona, users))
+
+
+def _report(mode, users, elapsed, results):
+    latencies = [lat for lat, _ in results]
+    errors = sum(1 for _, status in results if status != 200)
+    print(
+        f"{mode:<5} users={users:<5} elapsed={elapsed:7.2f}s  throughput={users / elapsed:7.2f} turn/s  "
+        f"p50={statistics.median(latencies):6.2f}s  p99={_percentile(latencies, 99):6.2f}s  errors={errors}"
+    )
+
+
+def main():
+    user, persona = _setup_fixtures()
+    for users in [int(u) for u in ARGS.users.split(",") if u.strip()]:
+        # 같은 질문을 반복하므로 캐시 적중이 비교를 흐리지 않도록 매번 비운다.
+        llm_cache.reset()
+        elapsed, results = run_wsgi(user, persona, users, ARGS.wsgi_threads)
+        _report("wsgi", users, elapsed, results)
+        llm_cache.reset()
+        elapsed, results = run_asgi(user, persona, users)
+        _report("asgi", users, elapsed, results)
+    SERVER.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# bench/driver.py
+# 함수설명 : 채팅 스택 부하 벤치마크 드라이버.
+#            로컬 가짜 OpenAI 서버(bench/fake_openai.py)를 띄우고, 여러 턴짜리 대화를 동시 사용자 수를 늘려가며
+#            ChatView.post(/chat/<persona_id>/<thread_id>/) 와 /api/chat/send/ 에 재생한다. DB 는 임시 SQLite(bench.settings).
+#            단계별로 처리량, 턴 지연 p50/p99, 턴당 DB 쿼리 수, 턴당 LLM 호출 수(단계별)를 출력한다.
+#            파이프라인을 바꾼 뒤 배포 전에 같은 옵션으로 전후를 비교하는 용도.
+#
+# 사용법 : python -m bench.driver --concurrency 1,4,16 --targets chat,api --latency lognormal:0.5,0.4 --tokens-per-sec 60
+#          python -m bench.driver --openai-url http://127.0.0.1:8901/v1      # 따로 띄운 가짜 서버 사용
+#          python -m bench.driver --conversation-file convs.jsonl            # 한 줄에 {"turns": ["...", "..."]}
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from bench import fake_openai
+
+DEFAULT_CONVERSATIONS = [
+    ["참치캔 150g 한 달에 몇 개 살래?", "가격이 3,000원이면?", "그럼 2+1 행사하면 더 살 거야?"],
+    ["스팸 340g 한 달에 몇 개 정도 사?", "200g 짜리랑 비교하면 어떤 규격이 나아?", "명절 선물세트로는 어때?"],
+    ["즉석밥 한 달에 몇 개 먹어?", "가격 1,200원이면 적당해?", "잡곡밥 버전이 나오면 살래?"],
+    ["초코우유 250ml 락토프리 나오면 살 거야?", "1,500원이면 한 달에 몇 개?", "친환경 포장이면 더 끌려?"],
+]
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def _load_conversations(path):
+    if not path:
+        return DEFAULT_CONVERSATIONS
+    conversations = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            turns = item.get("turns") if isinstance(item, dict) else item
+            if turns:
+                conversations.append([str(t) for t in turns])
+    if not conversations:
+        raise SystemExit(f"대화가 없습니다: {path}")
+    return conversations
+
+
+class LLMStats:
+    """가짜 서버의 호출 통계 (같은 프로세스면 직접, 아니면 GET /stats)."""
+
+    def __init__(self, server=None, url=None):
+        self.server = server
+        self.url = url
+
+    def snapshot(self):
+        if self.server is not None:
+            return self.server.stats.snapshot()
+        with urllib.request.urlopen(self.url.rstrip("/") + "/stats", timeout=5) as resp:
+            return json.loads(resp.read())
+
+    def settle(self, timeout=10.0, quiet=0.3):
+        # 백그라운드 요약 갱신 호출이 끝날 때까지 호출 수가 멈추기를 기다린다.
+        deadline = time.monotonic() + timeout
+        last = self.snapshot()
+        while time.monotonic() < deadline:
+            time.sleep(quiet)
+            cur = self.snapshot()
+            if cur["calls"] == last["calls"]:
+                return cur
+            last = cur
+        return last
+
+
+def _delta(after, before):
+    kinds = set(after["by_kind"]) | set(before["by_kind"])
+    return {
+        "calls": after["calls"] - before["calls"],
+        "by_kind": {k: after["by_kind"].get(k, 0) - before["by_kind"].get(k, 0) for k in sorted(kinds)},
+        "errors": sum(v for s, v in after["by_status"].items() if s != "200") - sum(v for s, v in before["by_status"].items() if s != "200"),
+    }
+
+
+def _setup_fixtures():
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+    from persona.models import Persona
+
+    call_command("migrate", verbosity=0, interactive=False)
+    user, _ = get_user_model().objects.get_or_create(username="bench")
+    persona, _ = Persona.objects.get_or_create(
+        name="벤치",
+        defaults={
+            "segment": "실속형 미식가", "gender": "여자", "age": "30대", "household": "1인 가구",
+            "job": "사무 종사자", "persona_summary_tag": "벤치, 여자, 30대, 1인 가구, health_orientation: 0.8",
+        },
+    )
+    return user, persona
+
+
+# 함수명 : _run_conversation
+# input : target('chat' | 'api'), user, persona, turns, model
+# output : 턴별 (지연 초, 상태 코드, DB 쿼리 수) 목록
+# 함수 설명 : 대화 하나를 순서대로 재생한다. 이 스레드의 DB 연결에 execute_wrapper 를 걸어 턴별 쿼리 수를 센다.
+#               chat : 첫 턴은 /chat/<persona_id>/0/, 이후는 응답의 thread_id 로 이어간다 (로그인 세션)
+#               api  : 미리 만든 스레드로 /api/chat/send/ 호출
+def _run_conversation(target, user, persona, turns, model):
+    from django.db import connection
+    from django.test import Client
+
+    from chat.models import ChatThread
+
+    queries = [0]
+
+    def count(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    client = Client()
+    results = []
+    try:
+        if target == "chat":
+            client.force_login(user)
+            thread_id = None
+        else:
+            thread_id = ChatThread.objects.create(persona=persona, user=user).id
+        for text in turns:
+            queries[0] = 0
+            start = time.perf_counter()
+            with connection.execute_wrapper(count):
+                if target == "chat":
+                    body = {"message": text, "model": model, "persona_id": persona.id, "thread_id": thread_id}
+                    resp = client.post(f"/chat/{persona.id}/{thread_id or 0}/", json.dumps(body), content_type="application/json")
+                    if resp.status_code == 200:
+                        thread_id = resp.json().get("thread_id") or thread_id
+                else:
+                    body = {"thread_id": thread_id, "message": text}
+                    resp = client.post("/api/chat/send/", json.dumps(body), content_type="application/json")
+            results.append((time.perf_counter() - start, resp.status_code, queries[0]))
+    finally:
+        connection.close()
+    return results
+
+
+def run_level(target, concurrency, n_conversations, conversations, user, persona, model, llm_stats):
+    from api.services import llm_cache
+
+    # 단계마다 같은 대화를 다시 재생하므로 이전 단계의 캐시 결과가 섞이지 않게 비운다.
+    llm_cache.reset()
+    jobs = [conversations[i % len(conversations)] for i in range(n_conversations)]
+    before = llm_stats.snapshot()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        per_conv = list(pool.map(lambda turns: _run_conversation(target, user, persona, turns, model), jobs))
+    elapsed = time.perf_counter() - start
+    llm = _delta(llm_stats.settle(), before)
+    rows = [r for conv in per_conv for r in conv]
+    return elapsed, rows, llm
+
+
+def _report(target, concurrency, elapsed, rows, llm):
+    turns = len(rows) or 1
+    latencies = [lat for lat, _, _ in rows]
+    errors = sum(1 for _, status, _ in rows if status != 200)
+    kinds = " ".join(f"{k}={v / turns:.2f}" for k, v in llm["by_kind"].items() if v)
+    print(
+        f"{target:<4} c={concurrency:<4} turns={len(rows):<5} {len(rows) / elapsed:7.2f} turn/s  "
+        f"p50={statistics.median(latencies) if latencies else 0:6.3f}s  p99={_percentile(latencies, 99):6.3f}s  "
+        f"errors={errors}  db={sum(q for _, _, q in rows) / turns:5.1f} q/turn  "
+        f"llm={llm['calls'] / turns:4.2f}/turn ({kinds})  llm_errors={llm['errors']}"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="채팅 스택 부하 벤치마크 (가짜 OpenAI 서버 + SQLite)")
+    parser.add_argument("--concurrency", default="1,4,16", help="동시 대화 수 목록 (쉼표 구분)")
+    parser.add_argument("--conversations", type=int, default=0, help="단계별 재생할 대화 수 (0 이면 동시 대화 수의 2배)")
+    parser.add_argument("--targets", default="chat,api", help="chat(ChatView.post) / api(/api/chat/send/)")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--conversation-file", default=None, help='JSONL, 한 줄에 {"turns": [...]} 또는 문자열 배열')
+    parser.add_argument("--openai-url", default=None, help="이미 떠 있는 가짜 서버 주소 (없으면 같은 프로세스에서 띄운다)")
+    parser.add_argument("--no-cache", action="store_true", help="LLM 결과 캐시 끄기")
+    parser.add_argument("--summary-inline", action="store_true", help="누적 요약 갱신을 요청 안에서 실행")
+    fake_openai.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.openai_url:
+        base_url = args.openai_url
+    else:
+        server = fake_openai.start_in_thread(fake_openai.config_from_args(args))
+        base_url = server.base_url
+
+    # 설정은 django.setup() 때 환경변수에서 읽히므로 그 전에 지정한다.
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bench.settings")
+    os.environ.setdefault("TELEMETRY_LOG_LEVEL", "WARNING")
+    if args.no_cache:
+        os.environ["LLM_CACHE_ENABLED"] = "False"
+    if args.summary_inline:
+        os.environ["CHAT_SUMMARY_BACKGROUND"] = "False"
+
+    import django
+
+    django.setup()
+    from django.conf import settings
+
+    conversations = _load_conversations(args.conversation_file)
+    user, persona = _setup_fixtures()
+    llm_stats = LLMStats(server=server, url=base_url)
+    print(f"openai={base_url} latency={args.latency} tokens/s={args.tokens_per_sec} error_rate={args.error_rate} "
+          f"conversations={len(conversations)} db={settings.DATABASES['default']['NAME']}")
+
+    try:
+        for concurrency in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+            n = args.conversations or concurrency * 2
+            for target in [t.strip() for t in args.targets.split(",") if t.strip()]:
+                if target not in ("chat", "api"):
+                    print(f"알 수 없는 대상: {target}", file=sys.stderr)
+                    continue
+                elapsed, rows, llm = run_level(target, concurrency, n, conversations, user, persona, args.model, llm_stats)
+                _report(target, concurrency, elapsed, rows, llm)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
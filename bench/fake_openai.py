@@ -0,0 +1,340 @@
+# bench/fake_openai.py
+# 함수설명 : 벤치마크용 로컬 OpenAI 호환 서버 (표준 라이브러리만 사용, Django 불필요).
+#            POST /v1/chat/completions 에 대해 지연 분포, 토큰 생성 속도, 오류 주입을 흉내 낸다.
+#              - 지연(첫 토큰까지): fixed:0.3 | uniform:0.1,0.5 | normal:0.4,0.1 | lognormal:0.4,0.5 (중앙값, sigma)
+#              - 토큰 속도: 초당 completion 토큰 수 (스트리밍은 SSE 청크 단위로 흘려보낸다)
+#              - 오류 주입: 비율 + 상태 코드 목록 (429 는 Retry-After 헤더 포함)
+#            요청 모양을 보고 파이프라인 단계별로 그럴듯한 응답을 고른다.
+#              json_schema → preflight JSON, json_object → 요약 JSON, max_tokens=2 → '예',
+#              max_tokens=120 → 스냅샷 문장, 그 외 → 페르소나 답변
+#            GET /stats 로 단계별 호출 수/토큰 수를, POST /reset 으로 초기화한다.
+#
+# 사용법 : python -m bench.fake_openai --port 8901 --latency lognormal:0.5,0.4 --tokens-per-sec 60 --error-rate 0.02
+#          앱 쪽에서는 OPENAI_BASE_URL=http://127.0.0.1:8901/v1 로 가리킨다.
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFLIGHT_JSON = {
+    "in_scope": True,
+    "snapshot": "현재 대상: 참치캔 150g, 기간 1개월",
+    "prices": [],
+    "product_category": "canned_tuna",
+}
+SUMMARY_JSON = {
+    "summary": "사용자는 참치캔 150g 의 한 달 구매 수량을 물었고 페르소나는 4개 정도라고 답했다.",
+    "product": "참치캔",
+    "size": "150g",
+    "price": "",
+    "period": "1개월",
+}
+SNAPSHOT_TEXT = "현재 대상: 참치캔 150g, 기간 1개월."
+ANSWER_TEXT = (
+    "저는 한 달에 4개(150g 기준)를 구매할 것 같아요!\n"
+    "내 기준:\n"
+    "· 취향/식단: 샐러드나 김밥에 자주 넣어 먹어요\n"
+    "· 가구/생활: 1인 가구라 주 2~3회 간단히 요리해요\n"
+    "· 예산: 평균 예산 가정, 가공식품 비중은 15% 정도예요\n"
+    "제품의 장점:\n"
+    "· 단백질이 많고 보관이 편해요\n"
+    "· 바로 먹을 수 있어요\n"
+    "제품의 단점:\n"
+    "· 나트륨이 조금 걱정돼요\n"
+    "이렇게 되면 더 좋아요:\n"
+    "· 저염 라인이 있으면 더 좋아요"
+)
+
+
+# 함수명 : parse_latency
+# input : spec (예: 'fixed:0.3', 'uniform:0.1,0.5', 'normal:0.4,0.1', 'lognormal:0.4,0.5')
+# output : 호출할 때마다 지연(초)을 뽑아 주는 함수
+# 함수 설명 : 지연 분포 문자열을 파싱한다. 음수는 0 으로 자른다.
+def parse_latency(spec):
+    kind, _, rest = (spec or "fixed:0").partition(":")
+    nums = [float(x) for x in rest.split(",") if x.strip()] if rest else []
+    kind = kind.strip().lower()
+    if kind == "fixed":
+        value = nums[0] if nums else 0.0
+        return lambda: max(0.0, value)
+    if kind == "uniform" and len(nums) == 2:
+        return lambda: max(0.0, random.uniform(nums[0], nums[1]))
+    if kind == "normal" and len(nums) == 2:
+        return lambda: max(0.0, random.gauss(nums[0], nums[1]))
+    if kind == "lognormal" and len(nums) == 2 and nums[0] > 0:
+        mu = math.log(nums[0])
+        return lambda: random.lognormvariate(mu, nums[1])
+    raise ValueError(f"지원하지 않는 지연 분포입니다: {spec}")
+
+
+def estimate_tokens(text):
+    # api.services.tokens.estimate_tokens 와 같은 감각의 근사치 (한글은 글자당 1토큰, 그 외 4글자당 1토큰)
+    text = text or ""
+    hangul = sum(1 for ch in text if "가" <= ch <= "힣")
+    return hangul + max(0, len(text) - hangul) // 4 + 1
+
+
+class FakeConfig:
+    def __init__(self, latency="fixed:0.3", tokens_per_sec=0.0, error_rate=0.0, error_codes=(429, 500, 503),
+                 retry_after=0.2, chunk_chars=4, seed=None):
+        self.latency_spec = latency
+        self.latency = parse_latency(latency)
+        self.tokens_per_sec = float(tokens_per_sec or 0.0)  # 0 이면 생성 시간 없음
+        self.error_rate = float(error_rate or 0.0)
+        self.error_codes = tuple(int(c) for c in error_codes) or (500,)
+        self.retry_after = float(retry_after)
+        self.chunk_chars = max(1, int(chunk_chars))
+        if seed is not None:
+            random.seed(seed)
+
+
+class FakeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.streamed = 0
+            self.by_kind = defaultdict(int)
+            self.by_status = defaultdict(int)
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+
+    def record(self, kind, status, stream, prompt_tokens=0, completion_tokens=0):
+        with self._lock:
+            self.calls += 1
+            self.streamed += int(bool(stream))
+            self.by_kind[kind] += 1
+            self.by_status[str(status)] += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "streamed": self.streamed,
+                "by_kind": dict(self.by_kind),
+                "by_status": dict(self.by_status),
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+            }
+
+
+# 함수명 : classify_request
+# input : body (chat.completions 요청 JSON)
+# output : (단계 이름, 응답 본문 문자열)
+# 함수 설명 : llm_service / summary_service 가 보내는 요청 모양으로 단계를 추정해 응답을 고른다.
+def classify_request(body):
+    fmt = (body.get("response_format") or {}).get("type")
+    if fmt == "json_schema":
+        return "preflight", json.dumps(PREFLIGHT_JSON, ensure_ascii=False)
+    if fmt == "json_object":
+        return "summary", json.dumps(SUMMARY_JSON, ensure_ascii=False)
+    max_tokens = body.get("max_tokens")
+    if max_tokens == 2:
+        return "scope", "예"
+    if max_tokens == 120:
+        return "snapshot", SNAPSHOT_TEXT
+    return "answer", ANSWER_TEXT
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeOpenAI/1.0"
+
+    def log_message(self, format, *args):  # noqa: A002 - 요청마다 stderr 로그를 남기지 않는다
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    @property
+    def stats(self):
+        return self.server.stats
+
+    def _path(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        return path[3:] if path.startswith("/v1") else path
+
+    def _send_json(self, status, data, headers=None):
+        raw = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_GET(self):
+        if self._path() == "/stats":
+            self._send_json(200, self.stats.snapshot())
+        else:
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        path = self._path()
+        if path == "/reset":
+            self.stats.reset()
+            self._send_json(200, {"ok": True})
+            return
+        if path != "/chat/completions":
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid json", "type": "invalid_request_error"}})
+            return
+        self._chat_completions(body)
+
+    def _chat_completions(self, body):
+        cfg = self.config
+        kind, content = classify_request(body)
+        stream = bool(body.get("stream"))
+        time.sleep(cfg.latency())
+
+        if cfg.error_rate and random.random() < cfg.error_rate:
+            status = random.choice(cfg.error_codes)
+            headers = {}
+            if status == 429:
+                headers = {"Retry-After": f"{cfg.retry_after:g}", "retry-after-ms": str(int(cfg.retry_after * 1000))}
+            self.stats.record(kind, status, stream)
+            self._send_json(status, {"error": {"message": f"injected {status}", "type": "fake_error", "code": status}}, headers)
+            return
+
+        prompt_tokens = sum(estimate_tokens(str(m.get("content") or "")) + 4 for m in body.get("messages") or []) + 2
+        completion_tokens = estimate_tokens(content)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        model = body.get("model") or "gpt-4o-mini"
+        cid = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        self.stats.record(kind, 200, stream, prompt_tokens, completion_tokens)
+
+        if not stream:
+            if cfg.tokens_per_sec > 0:
+                time.sleep(completion_tokens / cfg.tokens_per_sec)
+            self._send_json(200, {
+                "id": cid,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        self._stream(cid, model, content, usage if include_usage else None)
+
+    def _stream(self, cid, model, content, usage):
+        cfg = self.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def chunk(delta, finish_reason=None, usage_data=None, choices=True):
+            data = {"id": cid, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if choices else []}
+            if usage_data is not None:
+                data["usage"] = usage_data
+            self.wfile.write(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            chunk({"role": "assistant", "content": ""})
+            for i in range(0, len(content), cfg.chunk_chars):
+                piece = content[i:i + cfg.chunk_chars]
+                if cfg.tokens_per_sec > 0:
+                    time.sleep(estimate_tokens(piece) / cfg.tokens_per_sec)
+                chunk({"content": piece})
+            chunk({}, finish_reason="stop")
+            if usage is not None:
+                chunk(None, usage_data=usage, choices=False)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 클라이언트가 스트림을 중간에 끊은 경우 (추측 실행 취소 등)
+            pass
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, address, config=None):
+        super().__init__(address, _Handler)
+        self.config = config or FakeConfig()
+        self.stats = FakeStats()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+# 함수명 : start_in_thread
+# input : config(FakeConfig), host, port(0 이면 빈 포트 자동 선택)
+# output : FakeOpenAIServer (server.base_url 로 주소 확인, server.shutdown() 으로 종료)
+# 함수 설명 : 벤치마크 드라이버가 같은 프로세스 안에서 가짜 서버를 띄울 때 사용한다.
+def start_in_thread(config=None, host="127.0.0.1", port=0):
+    server = FakeOpenAIServer((host, port), config)
+    thread = threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True)
+    thread.start()
+    return server
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", default="lognormal:0.5,0.4", help="첫 토큰까지 지연 분포 (fixed/uniform/normal/lognormal)")
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0, help="초당 completion 토큰 수 (0 이면 즉시)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="오류 주입 비율 (0~1)")
+    parser.add_argument("--error-codes", default="429,500,503", help="주입할 HTTP 상태 코드 (쉼표 구분)")
+    parser.add_argument("--retry-after", type=float, default=0.2, help="429 응답의 Retry-After(초)")
+    parser.add_argument("--seed", type=int, default=None, help="난수 시드 (재현용)")
+
+
+def config_from_args(args):
+    return FakeConfig(
+        latency=args.latency,
+        tokens_per_sec=args.tokens_per_sec,
+        error_rate=args.error_rate,
+        error_codes=[int(c) for c in args.error_codes.split(",") if c.strip()],
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="로컬 OpenAI 호환 가짜 서버")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer((args.host, args.port), config_from_args(args))
+    print(f"fake openai listening on {server.base_url} (latency={args.latency}, tokens/s={args.tokens_per_sec}, errors={args.error_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# bench/settings.py
+# 벤치마크 전용 설정. config.settings 를 그대로 쓰되 DB만 임시 SQLite 파일로 바꾼다.
+# 사용법: DJANGO_SETTINGS_MODULE=bench.settings python -m bench.<스크립트>
+
+import os
+import tempfile
+
+for _key, _default in (
+    ("SECRET_KEY", "bench-secret-key"),
+    ("OPENAI_API_KEY", "sk-bench"),
+    ("DB_NAME", "bench"),
+    ("DB_USER", "bench"),
+    ("DB_PW", "bench"),
+    ("DB_HOST", "localhost"),
+    ("DB_PORT", "3306"),
+):
+    os.environ.setdefault(_key, _default)
+
+from config.settings import *  # noqa: E402,F401,F403
+
+DEBUG = False
+ALLOWED_HOSTS = ["*"]
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.environ.get("BENCH_DB_PATH", os.path.join(tempfile.gettempdir(), "chill_tuna_bench.sqlite3")),
+        # 동시 쓰기 시 'database is locked' 를 피하기 위해 WAL + IMMEDIATE 트랜잭션 사용
+        "OPTIONS": {
+            "timeout": 30,
+            "transaction_mode": "IMMEDIATE",
+            "init_command": "PRAGMA journal_mode=WAL;",
+        },
+    }
+}
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 01:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_chatmessage_token_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='referenceproduct',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
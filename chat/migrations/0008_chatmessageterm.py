@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_referenceproduct_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatMessageTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=2)),
+                ('thread_id', models.BigIntegerField()),
+                ('user_id', models.BigIntegerField(null=True)),
+                ('tf', models.PositiveSmallIntegerField(default=1)),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='chat.chatmessage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', 'term', 'message'], name='chat_term_user_term_idx')],
+            },
+        ),
+    ]
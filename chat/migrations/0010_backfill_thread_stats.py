@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:40
+# 0009 에서 추가한 ChatThread 통계(message_count / last_message_at / last_message_preview)를 기존 메시지로 채운다.
+# manage.py backfill_thread_stats 와 같은 계산이며, 그 명령은 이후 값이 어긋났을 때 다시 맞추는 용도로 남겨 둔다.
+# (마이그레이션은 이 시점의 모델로 돌아야 하므로 chat_service 를 import 하지 않고 미리보기 규칙을 그대로 적는다.)
+
+from django.db import migrations
+from django.db.models import Count, Max, OuterRef, Subquery
+
+PREVIEW_CHARS = 200
+BATCH_SIZE = 500
+
+
+def _preview(text):
+    text = " ".join((text or "").split())
+    return text if len(text) <= PREVIEW_CHARS else text[:PREVIEW_CHARS - 1] + "…"
+
+
+def backfill_thread_stats(apps, schema_editor):
+    ChatThread = apps.get_model("chat", "ChatThread")
+    ChatMessage = apps.get_model("chat", "ChatMessage")
+    last_message = ChatMessage.objects.filter(thread=OuterRef("pk")).order_by("-id").values("message")[:1]
+    last_id = 0
+    while True:
+        rows = list(
+            ChatThread.objects.filter(id__gt=last_id).order_by("id")
+            .annotate(n=Count("messages"), last_at=Max("messages__timestamp"), last_text=Subquery(last_message))
+            .only("id", "created_at")[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        for thread in rows:
+            thread.message_count = thread.n
+            thread.last_message_at = thread.last_at or thread.created_at
+            thread.last_message_preview = _preview(thread.last_text)
+        ChatThread.objects.bulk_update(rows, ["message_count", "last_message_at", "last_message_preview"])
+        last_id = rows[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_chatthread_stats'),
+    ]
+
+    operations = [
+        # 되돌릴 때는 0009 가 컬럼을 지우므로 여기서는 할 일이 없다.
+        migrations.RunPython(backfill_thread_stats, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from persona.models import Persona  # 페르소나 완성 되면 그때 사용
 from django.conf import settings
+from django.utils import timezone
 
 class ChatThread(models.Model):
     # id = models.IntegerField(auto_created=True, primary_key=True)
@@ -11,9 +12,32 @@ class ChatThread(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
-    
+
+    # 누적 대화 요약 (매 턴 새 메시지 한 쌍만 반영해 갱신) - 다음 턴의 스냅샷으로 재사용
+    summary = models.TextField(blank=True, default="")
+
+    # 슬롯 상태 (예: {"product": "참치캔", "size": "150g", "price": "3,000원", "period": "한 달"})
+    slot_state = models.JSONField(default=dict, blank=True)
+
+    # 요약에 마지막으로 반영된 ChatMessage id
+    summary_message_id = models.BigIntegerField(null=True, blank=True)
+
+    # 스레드 목록용 비정규화 통계 - chat_service.record_messages 가 메시지 저장과 같은 트랜잭션에서 UPDATE 한 번으로 갱신
+    # (기존 데이터는 manage.py backfill_thread_stats). last_message_at 은 메시지가 없으면 생성 시각이다.
+    last_message_at = models.DateTimeField(default=timezone.now)
+    message_count = models.PositiveIntegerField(default=0)
+    last_message_preview = models.CharField(max_length=200, blank=True, default="")
+
+    PREVIEW_CHARS = 200
+
     def __str__(self):
         return f"ChatThread with {self.persona}"
+
+    class Meta:
+        # 사용자별 최근 대화 순 목록 (AllChatsView, recent_chats_processor)
+        indexes = [
+            models.Index(fields=["user", "-last_message_at", "-id"], name="chat_thread_user_recent_idx"),
+        ]
     
 
 
@@ -30,11 +54,33 @@ class ChatMessage(models.Model):
     
     # 메시지가 생성된 시간
     timestamp = models.DateTimeField(auto_now_add=True)
-    
+
+    # 메시지 토큰 수 (저장 시 api/signals 의 pre_save 에서 계산) - 히스토리 토큰 예산 계산에 사용
+    token_count = models.PositiveIntegerField(null=True, blank=True)
+
     def __str__(self):
         return f"Message from {self.sender} in thread {self.thread.id}"
 
 
+class ChatMessageTerm(models.Model):
+    # 채팅 검색용 역색인 (api/services/chat_search.py). 메시지 본문의 글자 2-gram 하나당 한 행.
+    # ChatMessage 저장 시 signals 에서 다시 만들고, 메시지/스레드 삭제 시 CASCADE 로 함께 지워진다.
+    term = models.CharField(max_length=2)
+    message = models.ForeignKey(ChatMessage, on_delete=models.CASCADE, related_name='search_terms')
+
+    # 검색은 항상 사용자 단위라 스레드/사용자를 비정규화해 두고 (user, term) 인덱스로 바로 찾는다.
+    thread_id = models.BigIntegerField()
+    user_id = models.BigIntegerField(null=True)
+
+    # 메시지 안 등장 횟수 (랭킹의 tf)
+    tf = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user_id", "term", "message"], name="chat_term_user_term_idx"),
+        ]
+
+
 class ReferenceProduct(models.Model):
     # RAG 검색에 사용될 제품 정보를 담는 모델
     product_id = models.CharField(max_length=100, unique=True)
@@ -57,6 +103,9 @@ class ReferenceProduct(models.Model):
     
     # RAG에 사용할 요약 문장
     summary = models.TextField()
+
+    # 마지막 수정 시각 - 워커별 RAG 인덱스가 다른 워커의 변경을 알아채는 데 사용
+    updated_at = models.DateTimeField(auto_now=True, null=True)
     
     def __str__(self):
         return self.name
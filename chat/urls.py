@@ -4,6 +4,10 @@ from . import views
 app_name = "chat"
 urlpatterns = [
     path("<int:persona_id>/<int:thread_id>/", views.ChatView.as_view(), name="chat_view"),
+    path("<int:persona_id>/<int:thread_id>/stream/", views.ChatStreamView.as_view(), name="chat_stream"),
+    # ASGI 전용 비동기 채팅 경로
+    path("<int:persona_id>/<int:thread_id>/async/", views.chat_message_async, name="chat_async"),
+    path("<int:persona_id>/<int:thread_id>/async/stream/", views.chat_stream_async, name="chat_stream_async"),
     path("all/", views.AllChatsView.as_view(), name="all_chats"),
     path("search/", views.ChatSearchView.as_view(), name="chat_search"), # New URL pattern for search
     path("thread/<int:thread_id>/delete/", views.DeleteChatThreadView.as_view(), name="delete_chat_thread"),
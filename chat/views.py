@@ -1,15 +1,16 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.decorators import login_required
 from .models import ChatThread, ChatMessage, Persona
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 import json
 import api.services.chat_service as chat_service
 import api.services.llm_service as llm_service
+from api.services import chat_search, telemetry
+from api.services.history_cache import history_cache
 from django.forms.models import model_to_dict
 from django.views import View
-from datetime import datetime # Added this line
-from django.db.models import Max # Import Max for ordering
 
 
 # Create your views here.
@@ -74,10 +75,11 @@ class ChatView(LoginRequiredMixin, View):
         thread_id = payload.get("thread_id")
 
         # 2) LLM 답변이 온 뒤에 db에 저장. chatthread db, chatmessage db
-        llm_output = llm_service.get_llm_response(request, persona_id, user_input, selected_model)
-        chat_thread, error_message = None, None
-        if llm_output:
-            chat_thread, error_message = chat_service.save_chat_messsage(request, user_input, persona_id, thread_id, llm_output)
+        with telemetry.span("view", selected_model, view="chat"):
+            llm_output = llm_service.get_llm_response(request, persona_id, user_input, selected_model)
+            chat_thread, error_message = None, None
+            if llm_output:
+                chat_thread, error_message = chat_service.save_chat_messsage(request, user_input, persona_id, thread_id, llm_output)
 
         if error_message:
             return JsonResponse({"error": error_message, "redirect_to_home": True}, status=404)
@@ -96,11 +98,148 @@ class ChatView(LoginRequiredMixin, View):
 
 
 
+# 함수명      : _sse_event
+# input       : dict
+# output      : SSE 한 건 (str)
+# 함수설명    : dict를 Server-Sent Events 형식(data: ...\n\n)으로 직렬화합니다.
+def _sse_event(payload):
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+class ChatStreamView(LoginRequiredMixin, View):
+    login_url = '/users/login/'
+
+    # 함수명      : post
+    # input       : 사용자 입력 request(message, model, persona_id, thread_id)
+    # output      : LLM 답변 스트림 (text/event-stream)
+    # 작성일자    : 2026-10-18
+    # 함수설명    : ChatView.post 와 같은 입력을 받아 LLM 답변을 토큰 단위로 흘려보냅니다.
+    #               1. LLM 델타가 도착하는 대로 {"type": "delta"} 이벤트로 전달.
+    #               2. 스트림이 끝나면 최종 답변을 chatthread db, chatmessage db 에 저장.
+    #               3. 저장 결과를 {"type": "done"} 또는 {"type": "error"} 이벤트로 전달.
+    def post(self, request, *args, **kwargs):
+        payload = json.loads(request.body.decode('utf-8'))
+        user_input = payload.get("message")
+        selected_model = payload.get("model")
+        persona_id = payload.get("persona_id")
+        thread_id = payload.get("thread_id")
+
+        request_id = getattr(request, "request_id", None)
+
+        def event_stream():
+            chunks = []
+            try:
+                for delta in llm_service.stream_llm_response(persona_id, user_input, selected_model, thread_id=thread_id):
+                    chunks.append(delta)
+                    yield _sse_event({"type": "delta", "text": delta})
+            except Exception as e:
+                yield _sse_event({"type": "error", "error": str(e)})
+                return
+
+            llm_output = "".join(chunks).strip()
+            chat_thread, error_message = None, None
+            if llm_output:
+                chat_thread, error_message = chat_service.save_chat_messsage(request, user_input, persona_id, thread_id, llm_output)
+
+            if error_message:
+                yield _sse_event({"type": "error", "error": error_message, "redirect_to_home": True})
+            elif chat_thread:
+                yield _sse_event({"type": "done", "thread_id": chat_thread.id, "is_new_thread": not thread_id})
+            else:
+                yield _sse_event({"type": "error", "error": "메시지 저장에 실패했습니다."})
+
+        # 스트림 본문은 미들웨어가 끝난 뒤 돌기 때문에 request id 를 단계마다 다시 심고 되돌린다.
+        response = StreamingHttpResponse(telemetry.iter_with_request_id(event_stream(), request_id), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+# 함수명      : chat_message_async
+# input       : 사용자 입력 request(message, model, persona_id, thread_id)
+# output      : LLM 답변 전달 (JSON)
+# 작성일자    : 2026-10-18
+# 함수설명    : ChatView.post 의 ASGI 전용 비동기 버전.
+#               AsyncOpenAI 와 async ORM 을 사용하므로 LLM 응답을 기다리는 동안 워커 스레드를 점유하지 않습니다.
+@login_required(login_url='/users/login/')
+async def chat_message_async(request, persona_id, thread_id):
+    if request.method != "POST":
+        return JsonResponse({"error": "POST 요청만 지원합니다"}, status=405)
+    payload = json.loads(request.body.decode('utf-8'))
+    user_input = payload.get("message")
+    selected_model = payload.get("model")
+    persona_id = payload.get("persona_id")
+    thread_id = payload.get("thread_id")
+
+    llm_output = await llm_service.aget_llm_response(persona_id, user_input, selected_model, thread_id=thread_id)
+    chat_thread, error_message = None, None
+    if llm_output:
+        chat_thread, error_message = await chat_service.asave_chat_messsage(request, user_input, persona_id, thread_id, llm_output)
+
+    if error_message:
+        return JsonResponse({"error": error_message, "redirect_to_home": True}, status=404)
+
+    if chat_thread:
+        return JsonResponse({
+            "persona_msg": llm_output,
+            "thread_id": chat_thread.id,
+            "is_new_thread": not thread_id,
+        })
+    return JsonResponse({"error": "메시지 저장에 실패했습니다."}, status=500)
+
+
+# 함수명      : chat_stream_async
+# input       : 사용자 입력 request(message, model, persona_id, thread_id)
+# output      : LLM 답변 스트림 (text/event-stream)
+# 작성일자    : 2026-10-18
+# 함수설명    : ChatStreamView.post 의 ASGI 전용 비동기 버전. 이벤트 형식은 동일합니다.
+@login_required(login_url='/users/login/')
+async def chat_stream_async(request, persona_id, thread_id):
+    if request.method != "POST":
+        return JsonResponse({"error": "POST 요청만 지원합니다"}, status=405)
+    payload = json.loads(request.body.decode('utf-8'))
+    user_input = payload.get("message")
+    selected_model = payload.get("model")
+    persona_id = payload.get("persona_id")
+    thread_id = payload.get("thread_id")
+
+    async def event_stream():
+        chunks = []
+        try:
+            async for delta in llm_service.astream_llm_response(persona_id, user_input, selected_model, thread_id=thread_id):
+                chunks.append(delta)
+                yield _sse_event({"type": "delta", "text": delta})
+        except Exception as e:
+            yield _sse_event({"type": "error", "error": str(e)})
+            return
+
+        llm_output = "".join(chunks).strip()
+        chat_thread, error_message = None, None
+        if llm_output:
+            chat_thread, error_message = await chat_service.asave_chat_messsage(request, user_input, persona_id, thread_id, llm_output)
+
+        if error_message:
+            yield _sse_event({"type": "error", "error": error_message, "redirect_to_home": True})
+        elif chat_thread:
+            yield _sse_event({"type": "done", "thread_id": chat_thread.id, "is_new_thread": not thread_id})
+        else:
+            yield _sse_event({"type": "error", "error": "메시지 저장에 실패했습니다."})
+
+    # 미들웨어(__acall__)가 request id 를 되돌린 뒤에 본문이 돌기 때문에 단계마다 다시 심고 되돌린다.
+    response = StreamingHttpResponse(
+        telemetry.aiter_with_request_id(event_stream(), getattr(request, "request_id", None)), content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
 class AllChatsView(LoginRequiredMixin, View):
     login_url = '/users/login/'
 
     def get(self, request):
-        all_chats = ChatThread.objects.filter(user=request.user).order_by('-created_at')
+        # 최근 대화 순 (user, -last_message_at, -id 인덱스). 미리보기/개수는 비정규화 컬럼이라 스레드별 추가 쿼리가 없다.
+        all_chats = ChatThread.objects.filter(user=request.user).select_related('persona').order_by('-last_message_at', '-id')
         context = {
             'all_chats': all_chats
         }
@@ -110,53 +249,23 @@ class AllChatsView(LoginRequiredMixin, View):
 class ChatSearchView(LoginRequiredMixin, View):
     login_url = '/users/login/'
 
+    # 검색은 api/services/chat_search.py 의 2-gram 역색인으로 하고, 스레드 단위로 CHAT_SEARCH_PAGE_SIZE 개씩 나눠 준다.
+    # 다음 페이지는 응답의 next_cursor 를 cursor 로 다시 보낸다.
     def get(self, request):
         query = request.GET.get('q', '')
-        results_data = []
-
-        if query:
-            # Get all chat messages for the current user that match the query
-            matching_messages = ChatMessage.objects.filter(
-                thread__user=request.user,
-                message__icontains=query
-            ).order_by('timestamp') # Order by timestamp to get messages in chronological order within a thread
-
-            # Group messages by thread
-            threads_with_matches = {}
-            for msg in matching_messages:
-                thread_id = msg.thread.id
-                if thread_id not in threads_with_matches:
-                    threads_with_matches[thread_id] = {
-                        'thread_id': thread_id,
-                        'persona_id': msg.thread.persona.id,
-                        'persona_name': msg.thread.persona.name,
-                        'last_message_date': (msg.thread.messages.aggregate(Max('timestamp'))['timestamp__max'] or datetime.now()).strftime("%Y년 %m월 %d일 %H:%M"), # Get last message date of the thread
-                        'messages': []
-                    }
-                threads_with_matches[thread_id]['messages'].append({
-                    'sender': msg.sender,
-                    'message': msg.message,
-                    'timestamp': msg.timestamp.strftime("%Y년 %m월 %d일 %H:%M")
-                })
-            
-            # Convert dictionary to list and sort by last message date of the thread
-            # (This sorting is already done by the aggregate Max('timestamp') and then by the loop order)
-            # For consistent ordering, we might want to sort the threads_with_matches by last_message_date
-            # However, the current structure groups by thread_id, so let's just convert to list
-            # and ensure messages within each thread are chronological (which they are due to initial filter)
-            
-            # Sort threads by their last message date (descending)
-            sorted_threads = sorted(threads_with_matches.values(), key=lambda x: x['last_message_date'], reverse=True)
-
-            results_data = sorted_threads
-
-        return JsonResponse({'results': results_data})
+        if not query.strip():
+            return JsonResponse({'results': [], 'next_cursor': None})
+        try:
+            return JsonResponse(chat_search.search(request.user.id, query, request.GET.get('cursor')))
+        except (ValueError, UnicodeDecodeError):
+            return JsonResponse({'error': '잘못된 cursor 입니다.'}, status=400)
 
 class DeleteChatThreadView(LoginRequiredMixin, View):
     def post(self, request, thread_id):
         try:
             chat_thread = ChatThread.objects.get(id=thread_id, user=request.user)
             chat_thread.delete()
+            history_cache.invalidate(thread_id)
             return JsonResponse({'status': 'success', 'message': '채팅이 삭제되었습니다.'})
         except ChatThread.DoesNotExist:
             return JsonResponse({'status': 'error', 'message': '채팅을 찾을 수 없거나 권한이 없습니다.'}, status=404)
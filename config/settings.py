@@ -52,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.RequestIdMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -127,6 +128,158 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 OPENAI_API_KEY = config('OPENAI_API_KEY')
+# OpenAI 호환 API 주소. 비우면 공식 API. 벤치마크 시 로컬 가짜 서버(bench/fake_openai.py)를 가리킨다.
+OPENAI_BASE_URL = config('OPENAI_BASE_URL', default='')
+
+# LLM 사전 판별(도메인 판별 + 컨텍스트 스냅샷) 방식
+#   fused  : 한 번의 JSON 스키마 호출로 in_scope/snapshot/가격/카테고리를 함께 판별
+#   legacy : 기존 방식(판별기 → 분류기 → 스냅샷 순차 호출)
+LLM_PREFLIGHT_MODE = config('LLM_PREFLIGHT_MODE', default='fused')
+
+# 사전 판별과 본 답변 생성을 동시에 시작(추측 실행). OUT 판정이나 가격 가드가 걸리면 본 답변은 버린다.
+# 추측 실행된 본 답변에는 컨텍스트 스냅샷 대신 대화 히스토리만 들어간다.
+# 수량 질문은 [수요 추정] 블록이 필요해 추측 실행하지 않는다 (LLM_QUANTITY_MODE=llm 제외).
+LLM_SPECULATIVE_ANSWER = config('LLM_SPECULATIVE_ANSWER', default=False, cast=bool)
+LLM_SPECULATIVE_WORKERS = config('LLM_SPECULATIVE_WORKERS', default=16, cast=int)
+
+# OpenAI 클라이언트 커넥션 풀 (워커 프로세스당 1회 생성 후 재사용)
+OPENAI_POOL_MAX_CONNECTIONS = config('OPENAI_POOL_MAX_CONNECTIONS', default=100, cast=int)
+OPENAI_POOL_MAX_KEEPALIVE = config('OPENAI_POOL_MAX_KEEPALIVE', default=20, cast=int)
+OPENAI_POOL_KEEPALIVE_EXPIRY = config('OPENAI_POOL_KEEPALIVE_EXPIRY', default=30.0, cast=float)
+OPENAI_POOL_TIMEOUT = config('OPENAI_POOL_TIMEOUT', default=60.0, cast=float)
+OPENAI_POOL_CONNECT_TIMEOUT = config('OPENAI_POOL_CONNECT_TIMEOUT', default=5.0, cast=float)
+OPENAI_POOL_HTTP2 = config('OPENAI_POOL_HTTP2', default=False, cast=bool)  # h2 패키지 필요
+OPENAI_MAX_RETRIES = config('OPENAI_MAX_RETRIES', default=2, cast=int)
+
+# OpenAI 호출 속도 제한기 (api/services/rate_limiter.py). 켜면 SDK 재시도는 끄고 제한기가 재시도한다.
+# RPM/TPM 버킷은 LLM_LIMITER_PATH 의 SQLite 파일로 같은 서버의 워커 프로세스가 공유한다 (모델별).
+LLM_LIMITER_ENABLED = config('LLM_LIMITER_ENABLED', default=False, cast=bool)
+LLM_LIMITER_PATH = config('LLM_LIMITER_PATH', default=str(BASE_DIR / 'var' / 'llm_limiter.sqlite3'))
+LLM_LIMITER_RPM = config('LLM_LIMITER_RPM', default=500, cast=int)
+LLM_LIMITER_TPM = config('LLM_LIMITER_TPM', default=200000, cast=int)
+LLM_LIMITER_BATCH_RESERVE = config('LLM_LIMITER_BATCH_RESERVE', default=0.2, cast=float)  # 설문/요약이 남겨 둘 버킷 비율
+# 적응형 동시성(AIMD, 워커 프로세스별): 429 또는 목표 지연 초과 시 절반, 정상 응답마다 조금씩 증가
+LLM_LIMITER_INITIAL_CONCURRENCY = config('LLM_LIMITER_INITIAL_CONCURRENCY', default=8, cast=int)
+LLM_LIMITER_MIN_CONCURRENCY = config('LLM_LIMITER_MIN_CONCURRENCY', default=1, cast=int)
+LLM_LIMITER_MAX_CONCURRENCY = config('LLM_LIMITER_MAX_CONCURRENCY', default=64, cast=int)
+LLM_LIMITER_TARGET_LATENCY_MS = config('LLM_LIMITER_TARGET_LATENCY_MS', default=8000, cast=float)
+# 재시도: Retry-After 헤더 우선, 없으면 지터 지수 백오프. 슬롯 대기 + 재시도는 LLM_LIMITER_MAX_WAIT 초 안에서만
+LLM_LIMITER_MAX_RETRIES = config('LLM_LIMITER_MAX_RETRIES', default=3, cast=int)
+LLM_LIMITER_BASE_BACKOFF = config('LLM_LIMITER_BASE_BACKOFF', default=0.5, cast=float)
+LLM_LIMITER_MAX_BACKOFF = config('LLM_LIMITER_MAX_BACKOFF', default=20.0, cast=float)
+LLM_LIMITER_MAX_WAIT = config('LLM_LIMITER_MAX_WAIT', default=30.0, cast=float)
+
+# LLM 트래픽 기록/재생 (api/services/llm_transport.py)
+#   passthrough : 그대로 호출 / record : 요청·응답을 JSONL 로 기록 / replay : 기록에서 응답 재생 (네트워크 없음)
+LLM_TRANSPORT_MODE = config('LLM_TRANSPORT_MODE', default='passthrough')
+LLM_RECORD_DIR = config('LLM_RECORD_DIR', default=str(BASE_DIR / 'var' / 'llm_records'))
+# 파일 하나의 최대 크기(넘으면 새 파일), 몇 건마다 디스크에 쓸지
+LLM_RECORD_MAX_BYTES = config('LLM_RECORD_MAX_BYTES', default=50 * 1024 * 1024, cast=int)
+LLM_RECORD_FLUSH_EVERY = config('LLM_RECORD_FLUSH_EVERY', default=32, cast=int)
+
+# 로컬 도메인(scope) 분류기. 확률이 밴드 (하한, 상한) 밖이면 LLM 판별 없이 바로 결정한다.
+# 재학습: python manage.py train_scope_classifier
+SCOPE_CLASSIFIER_ENABLED = config('SCOPE_CLASSIFIER_ENABLED', default=True, cast=bool)
+SCOPE_CLASSIFIER_PATH = config('SCOPE_CLASSIFIER_PATH', default=str(BASE_DIR / 'var' / 'scope_classifier.npz'))
+SCOPE_CLASSIFIER_BAND = (
+    config('SCOPE_CLASSIFIER_BAND_LOW', default=0.2, cast=float),
+    config('SCOPE_CLASSIFIER_BAND_HIGH', default=0.85, cast=float),
+)
+# LLM 판별 결과를 ScopeVerdict 로 기록 (분류기 학습/평가용)
+SCOPE_VERDICT_LOGGING = config('SCOPE_VERDICT_LOGGING', default=True, cast=bool)
+
+# 스레드별 최근 메시지 캐시 (워커 프로세스 단위). 캐시할 스레드 수 / 스레드당 보관할 메시지 수
+HISTORY_CACHE_THREADS = config('HISTORY_CACHE_THREADS', default=1024, cast=int)
+HISTORY_CACHE_ROWS = config('HISTORY_CACHE_ROWS', default=32, cast=int)
+
+# ChatThread 누적 요약(rolling summary). 저장 후 새 메시지 한 쌍만으로 갱신하고 다음 턴 스냅샷으로 재사용한다.
+CHAT_ROLLING_SUMMARY = config('CHAT_ROLLING_SUMMARY', default=True, cast=bool)
+CHAT_SUMMARY_MODEL = config('CHAT_SUMMARY_MODEL', default='gpt-4o-mini')
+# True 면 요약 갱신을 백그라운드 스레드에서 실행 (응답 지연에 포함되지 않음)
+CHAT_SUMMARY_BACKGROUND = config('CHAT_SUMMARY_BACKGROUND', default=True, cast=bool)
+CHAT_SUMMARY_WORKERS = config('CHAT_SUMMARY_WORKERS', default=2, cast=int)
+
+# LLM 결과 캐시 (scope / snapshot / answer 네임스페이스, 워커 프로세스 단위 TTL + LRU)
+# 네임스페이스별로 LLM_CACHE_ANSWER_TTL, LLM_CACHE_SCOPE_MAXSIZE 처럼 따로 지정할 수도 있다.
+LLM_CACHE_ENABLED = config('LLM_CACHE_ENABLED', default=True, cast=bool)
+LLM_CACHE_TTL = config('LLM_CACHE_TTL', default=3600, cast=int)
+LLM_CACHE_MAXSIZE = config('LLM_CACHE_MAXSIZE', default=2048, cast=int)
+# 같은 질문에도 매번 다른(temperature > 0) 답변을 원하면 False 로 답변 캐시만 끈다.
+LLM_CACHE_ANSWERS = config('LLM_CACHE_ANSWERS', default=True, cast=bool)
+
+# 프롬프트 토큰 예산. 본 답변 프롬프트는 min(이 값, 모델 컨텍스트 윈도우 - 답변 max_tokens) 안에서
+# 시스템 프롬프트/스냅샷/최신 발화를 먼저 잡고 남는 만큼 최신 히스토리부터 채운다.
+# 모델별 컨텍스트 윈도우는 LLM_CONTEXT_WINDOWS = {'모델명': 토큰 수} 로 덮어쓸 수 있다.
+LLM_PROMPT_TOKEN_BUDGET = config('LLM_PROMPT_TOKEN_BUDGET', default=3000, cast=int)
+# 사전 판별(preflight)에 넘기는 히스토리 토큰 상한
+LLM_PREFLIGHT_HISTORY_TOKENS = config('LLM_PREFLIGHT_HISTORY_TOKENS', default=800, cast=int)
+
+# ReferenceProduct 로컬 검색(RAG). 글자 n-gram 해시 TF-IDF + 코사인 상위 k 개를 페르소나 프롬프트에 넣는다.
+RAG_ENABLED = config('RAG_ENABLED', default=True, cast=bool)
+RAG_TOP_K = config('RAG_TOP_K', default=3, cast=int)
+RAG_MIN_SCORE = config('RAG_MIN_SCORE', default=0.08, cast=float)  # 이보다 낮은 유사도는 버림
+RAG_HASH_DIM = config('RAG_HASH_DIM', default=4096, cast=int)
+RAG_CONTEXT_CHARS = config('RAG_CONTEXT_CHARS', default=600, cast=int)
+# 다른 워커에서 바뀐 제품을 확인하는 주기(초). 같은 워커의 저장/삭제는 즉시 반영된다.
+RAG_REFRESH_SECONDS = config('RAG_REFRESH_SECONDS', default=60, cast=int)
+
+# 수량 질문 처리 방식 (api/services/demand_service.py)
+#   llm    : 메인 LLM 이 수량을 계산 (이후 수량 가드로 범위만 보정)
+#   guided : 로컬 추정값(보수/기준/공격)을 [수요 추정] 블록으로 넣고 LLM 은 표현만
+#   fast   : 수량 질문은 LLM 호출 없이 로컬 추정으로 바로 답변
+LLM_QUANTITY_MODE = config('LLM_QUANTITY_MODE', default='guided')
+
+# 다중 페르소나 설문 (/api/survey/). 페르소나별 메인 답변을 병렬 호출하는 워커 수 / 한 번에 묻는 최대 페르소나 수
+SURVEY_WORKERS = config('SURVEY_WORKERS', default=8, cast=int)
+SURVEY_MAX_PERSONAS = config('SURVEY_MAX_PERSONAS', default=100, cast=int)
+
+# 페르소나 매칭 인덱스 (api/services/persona_match_service.py, find_and_chat_view)
+# 다른 워커의 추가/삭제 확인 주기(초), 값 수정까지 반영하는 전체 재생성 주기(초), 후보 수
+PERSONA_MATCH_REFRESH_SECONDS = config('PERSONA_MATCH_REFRESH_SECONDS', default=60, cast=int)
+PERSONA_MATCH_MAX_AGE = config('PERSONA_MATCH_MAX_AGE', default=600, cast=int)
+PERSONA_MATCH_TOP_K = config('PERSONA_MATCH_TOP_K', default=5, cast=int)
+
+# 페르소나 카탈로그 API (/api/personas/filter/, /api/personas/facets/)
+# 기본 / 최대 페이지 크기, 패싯 개수: 다른 워커의 추가/삭제 확인 주기(초), 값 수정까지 반영하는 전체 재집계 주기(초)
+PERSONA_CATALOG_PAGE_SIZE = config('PERSONA_CATALOG_PAGE_SIZE', default=50, cast=int)
+PERSONA_CATALOG_MAX_PAGE_SIZE = config('PERSONA_CATALOG_MAX_PAGE_SIZE', default=200, cast=int)
+PERSONA_CATALOG_REFRESH_SECONDS = config('PERSONA_CATALOG_REFRESH_SECONDS', default=60, cast=int)
+PERSONA_CATALOG_MAX_AGE = config('PERSONA_CATALOG_MAX_AGE', default=600, cast=int)
+
+# 채팅 기록 검색 (api/services/chat_search.py, 2-gram 역색인)
+# 한 페이지 스레드 수 / 스레드별 스니펫 메시지 수 / 한 번에 점수화하는 최대 후보 메시지 수
+CHAT_SEARCH_PAGE_SIZE = config('CHAT_SEARCH_PAGE_SIZE', default=10, cast=int)
+CHAT_SEARCH_MESSAGES_PER_THREAD = config('CHAT_SEARCH_MESSAGES_PER_THREAD', default=3, cast=int)
+CHAT_SEARCH_MAX_CANDIDATES = config('CHAT_SEARCH_MAX_CANDIDATES', default=5000, cast=int)
+# 메시지당 색인하는 최대 글자 수 (긴 답변은 앞부분만 색인)
+CHAT_SEARCH_INDEX_MAX_CHARS = config('CHAT_SEARCH_INDEX_MAX_CHARS', default=2000, cast=int)
+
+# 비슷한 페르소나 검색 (api/services/similar_persona_service.py, /api/personas/<id>/similar/)
+# 가중 특성 원본 JSONL / .npy 행렬 저장 위치 (원본이 바뀌면 하위 버전 디렉터리를 새로 만든다)
+SIMILAR_PERSONA_SOURCE = config('SIMILAR_PERSONA_SOURCE', default=str(BASE_DIR / '07_chat_Persona_attributes_weighted.jsonl'))
+SIMILAR_PERSONA_DIR = config('SIMILAR_PERSONA_DIR', default=str(BASE_DIR / 'var' / 'similar_personas'))
+# 기본 / 최대 결과 수
+SIMILAR_PERSONA_TOP_K = config('SIMILAR_PERSONA_TOP_K', default=10, cast=int)
+SIMILAR_PERSONA_MAX_K = config('SIMILAR_PERSONA_MAX_K', default=200, cast=int)
+
+# 단계별 지연 통계(p50/p95/p99)에 쓰는 최근 샘플 수 (단계 x 모델별). 조회: /api/metrics/ (staff 전용)
+LLM_METRICS_WINDOW = config('LLM_METRICS_WINDOW', default=1024, cast=int)
+# 채팅 파이프라인 구간/토큰 로그 레벨 (INFO: JSON 구조화 로그 출력, WARNING: 끔)
+TELEMETRY_LOG_LEVEL = config('TELEMETRY_LOG_LEVEL', default='INFO')
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "api.services.telemetry.JsonFormatter"},
+    },
+    "handlers": {
+        "telemetry": {"class": "logging.StreamHandler", "formatter": "json"},
+    },
+    "loggers": {
+        "chat.telemetry": {"handlers": ["telemetry"], "level": TELEMETRY_LOG_LEVEL, "propagate": False},
+    },
+}
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -34,4 +34,13 @@ class Persona(models.Model):
         return f"{self.segment} - 페르소나 {self.id} {self.name}"
 
     class Meta:
-        verbose_name_plural = "페르소나" # Django 관리자 페이지에서 보여지는 이름
\ No newline at end of file
+        verbose_name_plural = "페르소나" # Django 관리자 페이지에서 보여지는 이름
+        # 카탈로그 API(/api/personas/filter/) 용: 필터 컬럼 + id 로 조건과 keyset 페이지(id > cursor ORDER BY id)를 같이 처리
+        indexes = [
+            models.Index(fields=["gender", "age", "id"], name="persona_gender_age_id_idx"),
+            models.Index(fields=["segment", "id"], name="persona_segment_id_idx"),
+            models.Index(fields=["job", "id"], name="persona_job_id_idx"),
+            models.Index(fields=["household", "id"], name="persona_household_id_idx"),
+            models.Index(fields=["income_month", "id"], name="persona_income_id_idx"),
+            models.Index(fields=["region", "id"], name="persona_region_id_idx"),
+        ]
\ No newline at end of file
@@ -0,0 +1,30 @@
+# persona/options.py
+# 페르소나 조건 선택지 카탈로그 (조건 선택 페이지, 랜덤 생성, 매칭, 카탈로그 API 가 모두 여기 목록을 쓴다)
+# 순서는 화면에 보이는 순서다. '랜덤' 은 선택지가 아니라 "조건 없음" 표시라 목록에 넣지 않는다.
+
+RANDOM = "랜덤"
+# 필터에서 "조건 없음" 으로 보는 값
+ANY_VALUES = ("", RANDOM, "전체")
+
+OPTIONS = {
+    "gender": ["남자", "여자"],
+    "age": ["20대", "30대", "40대", "50대", "60대 이상"],
+    "job": ["관리자", "군인", "기능원 및 관련 기능 종사자", "농림어업 숙련 종사자", "단순노무 종사자", "사무 종사자",
+            "서비스 종사자", "전문가 및 관련 종사자", "판매 종사자", "장치·기계 조작 및 조립 종사자", "주부", "취업 준비 중", "학생"],
+    "household": ["1인 가구", "1세대가족", "2세대가족"],
+    "income_month": ["100만원 미만", "100-200만원 미만", "200-300만원 미만", "300-400만원 미만", "400-500만원 미만",
+                     "500-600만원 미만", "600-700만원 미만", "700-800만원 미만", "800-900만원 미만", "900-1000만원 미만", "1,000만원 이상"],
+    "segment": ["실속형 미식가", "건강 추구형 소비자", "트렌드 주도형 소비자"],
+    # 거주 지역은 고정 목록이 없어 카탈로그 API 가 DB 값으로 채운다.
+    "region": [],
+}
+
+# 카탈로그 API 의 필터 필드 (조건 선택 화면의 필드 + 지역)
+FILTER_FIELDS = tuple(OPTIONS)
+# 조건 선택 화면에 나오는 필드
+CHOICE_FIELDS = ("gender", "age", "job", "household", "income_month", "segment")
+
+
+def with_random(field):
+    """화면용 선택지: 맨 앞에 '랜덤'."""
+    return [RANDOM] + OPTIONS[field]
@@ -1,9 +1,11 @@
 from django.shortcuts import render, redirect
 from django.http import JsonResponse
 from .models import Persona
+from . import options
 import json
 import random
 from django.contrib.auth.decorators import login_required      
+from api.services import persona_match_service
 
 
 # 함수명      : create_persona
@@ -16,16 +18,7 @@ from django.contrib.auth.decorators import login_required
 #               2. 해당 페이지의 버튼/폼에 필요한 선택 옵션 목록을 context를 통해 전달
 # @login_required
 def create_persona(request):
-    context = {
-        "age_options": ["랜덤", "20대", "30대", "40대", "50대", "60대 이상"],
-        "gender_options": ["랜덤", "남자", "여자"],
-        "job_options": ["랜덤", "관리자", "군인", "기능원 및 관련 기능 종사자", "농림어업 숙련 종사자", "단순노무 종사자", "사무 종사자",
-            "서비스 종사자", "전문가 및 관련 종사자", "판매 종사자", "장치·기계 조작 및 조립 종사자", "주부", "취업 준비 중", "학생"],
-        "household_options": ["랜덤", "1인 가구", "1세대가족", "2세대가족"],
-        "income_month_options": ["랜덤", "100만원 미만", "100-200만원 미만", "200-300만원 미만", "300-400만원 미만", "400-500만원 미만", 
-            "500-600만원 미만", "600-700만원 미만", "700-800만원 미만", "800-900만원 미만", "900-1000만원 미만", "1,000만원 이상"],
-        "segment_options": ["랜덤", "실속형 미식가", "건강 추구형 소비자", "트렌드 주도형 소비자"],
-    }
+    context = {f"{field}_options": options.with_random(field) for field in options.CHOICE_FIELDS}
     return render(request, "persona/create_persona.html", context)
     
 
@@ -37,34 +30,21 @@ def create_persona(request):
 # 함수설명    : 
 
 def build_persona(request):
-    options_map = {
-        "age": ["랜덤", "20대", "30대", "40대", "50대", "60대 이상"],
-        "gender": ["랜덤", "남자", "여자"],
-        "job": ["랜덤", "관리자", "군인", "기능원 및 관련 기능 종사자", "농림어업 숙련 종사자", "단순노무 종사자", "사무 종사자",
-            "서비스 종사자", "전문가 및 관련 종사자", "판매 종사자", "장치·기계 조작 및 조립 종사자", "주부", "취업 준비 중", "학생"],
-        "household": ["랜덤", "1인 가구", "1세대가족", "2세대가족"],
-        "income_month": ["랜덤", "100만원 미만", "100-200만원 미만", "200-300만원 미만", "300-400만원 미만", "400-500만원 미만", 
-            "500-600만원 미만", "600-700만원 미만", "700-800만원 미만", "800-900만원 미만", "900-1000만원 미만", "1,000만원 이상"],
-        "segment": ["랜덤", "실속형 미식가", "건강 추구형 소비자", "트렌드 주도형 소비자"],
-    }
-    
     # 랜덤 선택 헬퍼
-    def pick_random_single(options):
-        pure = [option for option in options if option != "랜덤"]
-        return random.choice(pure) if pure else None
+    def pick_random_single(choices):
+        return random.choice(choices) if choices else None
 
     # 단일 처리
     def resolve_single(param_name):
         value = request.GET.get(param_name)
-        options = options_map[param_name]
-        if not value or value.lower() == "랜덤":
-            return pick_random_single(options)
+        if not value or value.lower() == options.RANDOM:
+            return pick_random_single(options.OPTIONS[param_name])
         return value
 
     # 모든 항목 처리
     persona_data = {
         "성별": resolve_single("gender"),
-        "나이": resolve_single("age_group"),       
+        "나이": resolve_single("age"),
         "직업": resolve_single("job"),
         "가족구성": resolve_single("household"), 
         "소득": resolve_single("income_month"),
@@ -96,7 +76,7 @@ def chat_persona_view(request, persona_id):
 # 작성일자    : 2025-08-28
 # 함수설명    : 
 #               1. 사용자가 조건 선택 페이지에서 선택한 조건들을 GET 파라미터로 입력받고 가중치를 계산함
-#               2. 가중치가 페르소나를 '최적 페르소나'로 선정함
+#               2. 가중치가 페르소나를 '최적 페르소나'로 선정함 (persona_match_service 인덱스에서 전체 페르소나를 한 번에 점수화)
 #               3. 선정된 최적 페르소나의 채팅 페이지로 이동해서 인터뷰를 시작
 
 # 페르소나를 찾아 채팅으로 바로 연결하는 함수
@@ -110,78 +90,23 @@ def find_and_chat_view(request):
         'segment': request.GET.get('segment'),
     }
 
-    RANDOM_OPTIONS = {
-        'gender': ['남자', '여자'],
-        'age': ['20대', '30대', '40대', '50대', '60대 이상'],
-        'job': ["관리자", "군인", "기능원 및 관련 기능 종사자", "농림어업 숙련 종사자", "단순노무 종사자", "사무 종사자",
-                "서비스 종사자", "전문가 및 관련 종사자", "판매 종사자", "장치·기계 조작 및 조립 종사자", "주부", "취업 준비 중", "학생"],
-        'household': ["1인 가구", "1세대가족", "2세대가족"],
-        'income_month': ["100만원 미만", "100-200만원 미만", "200-300만원 미만", "300-400만원 미만", "400-500만원 미만", 
-                         "500-600만원 미만", "600-700만원 미만", "700-800만원 미만", "800-900만원 미만", "900-1000만원 미만", "1,000만원 이상"],
-        'segment': ["실속형 미식가", "건강 추구형 소비자", "트렌드 주도형 소비자"],
-    }
-
     for key, value in selected_criteria.items():
-        if value == '랜덤' or not value:
-            selected_criteria[key] = random.choice(RANDOM_OPTIONS[key])
-
-    fixed_keys = ['gender', 'age']
-    fixed_weights = {'gender': 5, 'age': 5}
-
-    flexible_weights = {
-        'job': 1,
-        'household': 3,
-        'income_month': 2,
-        'segment': 4,
-    }
+        if value == options.RANDOM or not value:
+            selected_criteria[key] = random.choice(options.OPTIONS[key])
 
-    all_personas = Persona.objects.all()
-
-    if not all_personas.exists():
+    # 가중치 점수화는 워커 메모리의 매칭 인덱스에서 한 번에 한다 (fixed: gender/age 필수, flexible: job/household/income_month/segment)
+    matches = persona_match_service.match(selected_criteria)
+    if not matches:
+        # 페르소나가 없거나 gender/age 일치 대상이 없을 때
         return redirect('persona:create_persona')
-    
-    filtered = all_personas
-    for key in fixed_keys:
-        value = selected_criteria.get(key)
-        if value:
-            filtered = filtered.filter(**{key: value})
 
-    if not filtered.exists():
+    # 인덱스가 다른 워커의 삭제를 아직 모를 수 있으므로 상위 후보 중 실제로 있는 첫 페르소나를 쓴다.
+    found = Persona.objects.in_bulk([m.persona_id for m in matches])
+    best = next((m for m in matches if m.persona_id in found), None)
+    if best is None:
         return redirect('persona:create_persona')
-
-    sorted_flexible_keys = sorted(flexible_weights, key=lambda k: -flexible_weights[k])
-    for loosen_level in range(len(sorted_flexible_keys) + 1):
-        active_keys = sorted_flexible_keys[:len(sorted_flexible_keys) - loosen_level]
-        temp_filtered = filtered
-
-        for key in active_keys:
-            value = selected_criteria.get(key)
-            if value:
-                temp_filtered = temp_filtered.filter(**{key: value})
-
-        if temp_filtered.exists():
-            best_persona = random.choice(temp_filtered)
-            break
-        else:
-        # flexible 조건까지 모두 불일치할 경우 → gender/age 일치 대상 중 랜덤
-            best_persona = random.choice(list(filtered))
-
-    matched_fixed_score = sum(
-        fixed_weights[key]
-        for key in fixed_keys
-        if selected_criteria.get(key) and getattr(best_persona, key) == selected_criteria[key]
-    )
-
-    matched_flexible_score = sum(
-        flexible_weights[key]
-        for key in flexible_weights
-        if selected_criteria.get(key) and getattr(best_persona, key) == selected_criteria[key]
-    )
-
-    total_score_possible = sum(fixed_weights.values()) + sum(flexible_weights.values())
-    matched_total_score = matched_fixed_score + matched_flexible_score
-
-    match_percentage = round((matched_total_score / total_score_possible) * 100, 1)
+    best_persona = found[best.persona_id]
+    match_percentage = best.percentage
 
     if request.headers.get("x-requested-with") == "XMLHttpRequest" or request.headers.get("Accept", "").startswith("application/json"):
         return JsonResponse({
@@ -201,7 +126,8 @@ def find_and_chat_view(request):
                 "marriage" : best_persona.marriage,
                 "segment": best_persona.segment,
                 # "persona_summary_tag": best_persona.persona_summary_tag 
-            }
+            },
+            "candidates": [{"persona_id": m.persona_id, "match_percentage": m.percentage} for m in matches],
         })
 
     return redirect('chat:chat_view', persona_id=best_persona.id, thread_id=0)
\ No newline at end of file